@@ -1,5 +1,3 @@
-from time import time, sleep
-
 from algosdk import account, encoding
 from algosdk.logic import get_application_address
 from loyalty.operations import createLoyaltyOfferApp, setupLoyaltyOfferApp, completeAction, closeLoyaltyOffer
@@ -13,6 +11,8 @@ from loyalty.testing.resources import (
     getTemporaryAccount,
     optInToAsset,
     createDummyAsset,
+    getCurrentTime,
+    waitUntilTimestamp,
 )
 
 
@@ -35,7 +35,7 @@ def simple_loyalty_offer():
     print("Alice is opting into Reward asset with ID", rewardAssetID)
     optInToAsset(client, rewardAssetID, customer1)
 
-    startTime = int(time()) + 10  # start time is 10 seconds in the future
+    startTime = getCurrentTime(client) + 10  # start time is 10 seconds in the future
     endTime = startTime + 30  # end time is 60 seconds after start
     offer1Reward = 100  # 100 "points"
     print("Bob is creating an offer for Alice which lasts 60 seconds")
@@ -70,9 +70,7 @@ def simple_loyalty_offer():
     customerBalancesBefore = getBalances(client, customer1.getAddress())
     print("Alice's balances before offer:", customerBalancesBefore)
 
-    _, lastRoundTime = getLastBlockTimestamp(client)
-    if lastRoundTime < startTime + 5:
-        sleep(startTime + 5 - lastRoundTime)
+    waitUntilTimestamp(client, startTime + 5)
     actualAppBalancesBefore = getBalances(client, get_application_address(offer1ID))
     print("Offer escrow balances:", actualAppBalancesBefore, "\n")
 
@@ -86,7 +84,7 @@ def simple_loyalty_offer():
     if lastRoundTime < endTime + 5:
         waitTime = endTime + 5 - lastRoundTime
         print("Waiting {} seconds for the offer to expire\n".format(waitTime))
-        sleep(waitTime)
+        waitUntilTimestamp(client, endTime + 5)
 
     print("Bob is closing out the offer\n")
     closeLoyaltyOffer(client, offer1ID, creator)
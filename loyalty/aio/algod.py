@@ -0,0 +1,173 @@
+from typing import Any, Dict, List, Optional
+import base64
+import json
+
+import aiohttp
+
+from algosdk import constants, encoding, error
+from algosdk.future import transaction
+
+api_version_path_prefix = "/v2"
+
+
+class AsyncAlgodClient:
+    """A non-blocking algod client for the endpoints used by this package.
+
+    Requests share one aiohttp session with a bounded pool of keep-alive
+    connections, so many coroutines can talk to algod concurrently from a
+    single event loop. Responses and errors match those of
+    algosdk.v2client.algod.AlgodClient.
+    """
+
+    def __init__(
+        self,
+        algod_token: str,
+        algod_address: str,
+        headers: Optional[Dict[str, str]] = None,
+        connectionLimit: int = 100,
+    ) -> None:
+        self.algod_token = algod_token
+        self.algod_address = algod_address
+        self.headers = headers
+        self.connectionLimit = connectionLimit
+        self.session: Optional[aiohttp.ClientSession] = None
+
+    def getSession(self) -> aiohttp.ClientSession:
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.connectionLimit)
+            )
+        return self.session
+
+    async def close(self) -> None:
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def __aenter__(self) -> "AsyncAlgodClient":
+        return self
+
+    async def __aexit__(self, *args: Any) -> None:
+        await self.close()
+
+    async def algod_request(
+        self,
+        method: str,
+        requrl: str,
+        params: Optional[Dict[str, Any]] = None,
+        data: Optional[bytes] = None,
+        headers: Optional[Dict[str, str]] = None,
+        response_format: str = "json",
+    ) -> Any:
+        header: Dict[str, str] = {}
+
+        if self.headers:
+            header.update(self.headers)
+
+        if headers:
+            header.update(headers)
+
+        if requrl not in constants.no_auth:
+            header.update({constants.algod_auth_header: self.algod_token})
+
+        if requrl not in constants.unversioned_paths:
+            requrl = api_version_path_prefix + requrl
+
+        async with self.getSession().request(
+            method, self.algod_address + requrl, params=params, data=data, headers=header
+        ) as resp:
+            body = await resp.read()
+
+        if resp.status >= 400:
+            message = body.decode("utf-8")
+            try:
+                message = json.loads(message)["message"]
+            except (ValueError, KeyError, TypeError):
+                # not a JSON error response, so the body is the message
+                pass
+            raise error.AlgodHTTPError(message, resp.status)
+
+        if response_format == "json":
+            try:
+                return json.loads(body)
+            except Exception as e:
+                raise error.AlgodResponseError(
+                    "Failed to parse JSON response from algod"
+                ) from e
+        return body
+
+    async def account_info(self, address: str) -> Dict[str, Any]:
+        return await self.algod_request("GET", "/accounts/" + address)
+
+    async def application_info(self, application_id: int) -> Dict[str, Any]:
+        return await self.algod_request("GET", "/applications/" + str(application_id))
+
+    async def block_info(self, block: int) -> Dict[str, Any]:
+        return await self.algod_request(
+            "GET", "/blocks/" + str(block), params={"format": "json"}
+        )
+
+    async def status(self) -> Dict[str, Any]:
+        return await self.algod_request("GET", "/status")
+
+    async def status_after_block(self, block_num: int) -> Dict[str, Any]:
+        return await self.algod_request(
+            "GET", "/status/wait-for-block-after/" + str(block_num)
+        )
+
+    async def pending_transaction_info(self, transaction_id: str) -> Dict[str, Any]:
+        return await self.algod_request(
+            "GET", "/transactions/pending/" + transaction_id, params={"format": "json"}
+        )
+
+    async def health(self) -> None:
+        return await self.algod_request("GET", "/health")
+
+    async def send_raw_transaction(self, txn: bytes) -> str:
+        response = await self.algod_request(
+            "POST",
+            "/transactions",
+            data=txn,
+            headers={"Content-Type": "application/x-binary"},
+        )
+        return response["txId"]
+
+    async def send_transaction(self, txn: Any) -> str:
+        assert not isinstance(
+            txn, transaction.Transaction
+        ), "Attempt to send UNSIGNED transaction {}".format(txn)
+        return await self.send_raw_transaction(
+            base64.b64decode(encoding.msgpack_encode(txn))
+        )
+
+    async def send_transactions(self, txns: List[Any]) -> str:
+        serialized = []
+        for txn in txns:
+            assert not isinstance(
+                txn, transaction.Transaction
+            ), "Attempt to send UNSIGNED transaction {}".format(txn)
+            serialized.append(base64.b64decode(encoding.msgpack_encode(txn)))
+
+        return await self.send_raw_transaction(b"".join(serialized))
+
+    async def suggested_params(self) -> transaction.SuggestedParams:
+        res = await self.algod_request("GET", "/transactions/params")
+
+        return transaction.SuggestedParams(
+            res["fee"],
+            res["last-round"],
+            res["last-round"] + 1000,
+            res["genesis-hash"],
+            res["genesis-id"],
+            False,
+            res["consensus-version"],
+            res["min-fee"],
+        )
+
+    async def compile(self, source: str) -> Dict[str, Any]:
+        return await self.algod_request(
+            "POST",
+            "/teal/compile",
+            data=source.encode("utf-8"),
+            headers={"Content-Type": "application/x-binary"},
+        )
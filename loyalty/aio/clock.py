@@ -0,0 +1,82 @@
+"""The asyncio counterpart of loyalty.clock.
+
+An AsyncTimestampOracle caches the timestamps of the rounds it has seen and
+reads new ones from block headers only, like loyalty.clock.TimestampOracle.
+"""
+from typing import Dict, Tuple
+import collections
+import weakref
+
+from algosdk.error import AlgodHTTPError
+
+from ..clock import MAX_SAMPLES
+from ..util import decodeBlock
+from .algod import AsyncAlgodClient
+
+
+class AsyncTimestampOracle:
+    """Caches round timestamps of a chain.
+
+    Args:
+        client: An async algod client.
+        maxSamples: The number of round timestamps to keep.
+    """
+
+    def __init__(self, client: AsyncAlgodClient, maxSamples: int = MAX_SAMPLES) -> None:
+        self.client = client
+        self.maxSamples = maxSamples
+        # round -> timestamp, in the order they were added
+        self.samples: "collections.OrderedDict[int, int]" = collections.OrderedDict()
+        # whether algod accepts header-only block requests; older nodes don't
+        self.headerOnly = True
+
+    def record(self, round: int, timestamp: int) -> None:
+        self.samples[round] = timestamp
+        while len(self.samples) > self.maxSamples:
+            self.samples.popitem(last=False)
+
+    async def fetchTimestamp(self, round: int) -> int:
+        params: Dict[str, str] = {"format": "msgpack"}
+        if self.headerOnly:
+            params["header-only"] = "true"
+
+        try:
+            raw = await self.client.algod_request(
+                "GET", "/blocks/{}".format(round), params, response_format="msgpack"
+            )
+        except AlgodHTTPError as e:
+            if not self.headerOnly or e.code != 400:
+                raise
+            self.headerOnly = False
+            return await self.fetchTimestamp(round)
+
+        return decodeBlock(raw)["ts"]
+
+    async def getTimestamp(self, round: int) -> int:
+        """Get the timestamp of a round, reading its block header only if it isn't cached."""
+        timestamp = self.samples.get(round)
+        if timestamp is None:
+            timestamp = await self.fetchTimestamp(round)
+            self.record(round, timestamp)
+        return timestamp
+
+    async def latest(self) -> Tuple[int, int]:
+        """Get the latest round and its timestamp, the chain time offer contracts see.
+        Costs a status call, and a block header read if the round is new.
+        """
+        round = (await self.client.status())["last-round"]
+        return round, await self.getTimestamp(round)
+
+
+oracles: "weakref.WeakKeyDictionary[AsyncAlgodClient, AsyncTimestampOracle]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def getTimestampOracle(client: AsyncAlgodClient) -> AsyncTimestampOracle:
+    """Get the timestamp oracle shared by all users of a client."""
+    oracle = oracles.get(client)
+    if oracle is None:
+        oracle = AsyncTimestampOracle(weakref.proxy(client))
+        oracles[client] = oracle
+    return oracle
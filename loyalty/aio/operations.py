@@ -0,0 +1,143 @@
+from typing import Tuple, Optional
+
+from .. import operations
+from ..account import Account
+from ..artifacts import getTeal
+from ..programcache import ProgramCache, getDefaultProgramCache
+from ..operations import (
+    LoyaltyOffer,
+    buildCreateTxn,
+    buildSetupTxns,
+    buildActionTxn,
+    buildDeleteTxn,
+)
+from ..state import OfferState
+from .algod import AsyncAlgodClient
+from .util import waitForTransaction, compileProgram
+
+
+async def getContracts(
+    client: Optional[AsyncAlgodClient],
+    cache: Optional[ProgramCache] = None,
+    offline: bool = False,
+) -> Tuple[bytes, bytes]:
+    """Get the compiled TEAL contracts for the offer.
+    The compiled programs are shared with loyalty.operations.getContracts.
+    Args:
+        client: An async algod client that has the ability to compile TEAL
+            programs. This may be None in offline mode.
+        cache: The on-disk cache of compiled programs. Defaults to the cache
+            named by the LOYALTY_PROGRAM_CACHE_DIR environment variable, if any.
+        offline: If True, never call algod and fail if either program is not
+            already in the cache.
+    Returns:
+        A tuple of 2 byte strings. The first is the approval program, and the
+        second is the clear state program.
+    """
+    if len(operations.APPROVAL_PROGRAM) == 0:
+        if cache is None:
+            cache = getDefaultProgramCache()
+
+        if offline or client is None:
+            # programs compiled before, or the shipped bytecode, without calling algod
+            return operations.getContracts(None, cache, offline=True)
+
+        approval = await compileProgram(client, getTeal("offer_approval"), cache)
+        clear = await compileProgram(client, getTeal("offer_clear"), cache)
+        operations.APPROVAL_PROGRAM, operations.CLEAR_STATE_PROGRAM = approval, clear
+
+    return operations.APPROVAL_PROGRAM, operations.CLEAR_STATE_PROGRAM
+
+
+async def createLoyaltyOfferApp(
+    client: AsyncAlgodClient,
+    sender: Account,
+    customer: str,
+    startTime: int,
+    endTime: int,
+    rewardAssetID: int,
+    rewardAmount: int,
+    actionID: int,
+) -> int:
+    """Create a new loyalty offer.
+    See loyalty.operations.createLoyaltyOfferApp.
+    Returns:
+        The ID of the newly created offer app.
+    """
+    approval, clear = await getContracts(client)
+
+    offer = LoyaltyOffer(
+        customer=customer,
+        startTime=startTime,
+        endTime=endTime,
+        rewardAssetID=rewardAssetID,
+        rewardAmount=rewardAmount,
+        actionID=actionID,
+    )
+
+    txn = buildCreateTxn(sender, offer, approval, clear, await client.suggested_params())
+
+    signedTxn = txn.sign(sender.getPrivateKey())
+
+    await client.send_transaction(signedTxn)
+
+    response = await waitForTransaction(client, signedTxn.get_txid())
+    assert response.applicationIndex is not None and response.applicationIndex > 0
+    return response.applicationIndex
+
+
+async def setupLoyaltyOfferApp(
+    client: AsyncAlgodClient,
+    appID: int,
+    funder: Account,
+    rewardAssetID: int,
+    rewardAmount: int,
+) -> None:
+    """Finish setting up an offer.
+    See loyalty.operations.setupLoyaltyOfferApp.
+    """
+    txns = buildSetupTxns(
+        funder, appID, rewardAssetID, rewardAmount, await client.suggested_params()
+    )
+
+    signedTxns = [txn.sign(funder.getPrivateKey()) for txn in txns]
+
+    await client.send_transactions(signedTxns)
+
+    await waitForTransaction(client, signedTxns[0].get_txid())
+
+
+async def completeAction(
+    client: AsyncAlgodClient, owner: Account, appID: int, actionID: int
+) -> None:
+    """Complete an offer action requirement.
+    See loyalty.operations.completeAction.
+    """
+    appGlobalState = OfferState.FromApplicationInfo(await client.application_info(appID))
+
+    appCallTxn = buildActionTxn(
+        owner, appID, actionID, appGlobalState, await client.suggested_params()
+    )
+
+    signedAppCallTxn = appCallTxn.sign(owner.getPrivateKey())
+
+    await client.send_transactions([signedAppCallTxn])
+
+    await waitForTransaction(client, appCallTxn.get_txid())
+
+
+async def closeLoyaltyOffer(client: AsyncAlgodClient, appID: int, closer: Account) -> None:
+    """Close a loyalty offer.
+    See loyalty.operations.closeLoyaltyOffer.
+    """
+    appGlobalState = OfferState.FromApplicationInfo(await client.application_info(appID))
+
+    deleteTxn = buildDeleteTxn(
+        closer, appID, appGlobalState, await client.suggested_params()
+    )
+
+    signedDeleteTxn = deleteTxn.sign(closer.getPrivateKey())
+
+    await client.send_transaction(signedDeleteTxn)
+
+    await waitForTransaction(client, signedDeleteTxn.get_txid())
@@ -0,0 +1,121 @@
+import asyncio
+
+from algosdk.logic import get_application_address
+
+from .. import operations
+from ..util import getAppGlobalState, getBalances
+from ..testing.setup import getAlgodClient, getAsyncAlgodClient
+from ..testing.resources import (
+    createDummyAsset,
+    getCurrentTime,
+    getTemporaryAccount,
+    optInAccountsToAsset,
+    waitUntilTimestamp,
+)
+from .operations import (
+    closeLoyaltyOffer,
+    completeAction,
+    createLoyaltyOfferApp,
+    setupLoyaltyOfferApp,
+)
+
+LIFECYCLES = 4
+
+
+def comparableState(client, appID):
+    # the customers differ between the two paths
+    state = getAppGlobalState(client, appID)
+    del state[b"customer_account"]
+    return state
+
+
+def test_lifecycles_match_sync_api():
+    client = getAlgodClient()
+
+    creator = getTemporaryAccount(client)
+    tokenID = createDummyAsset(client, 1_000, creator)
+    syncCustomers = [getTemporaryAccount(client) for _ in range(LIFECYCLES)]
+    asyncCustomers = [getTemporaryAccount(client) for _ in range(LIFECYCLES)]
+    optInAccountsToAsset(client, tokenID, syncCustomers + asyncCustomers)
+
+    startTime = getCurrentTime(client) + 10
+    endTime = startTime + 30
+    # every other offer has its action completed, the others expire
+    rewardAmounts = [10 + i for i in range(LIFECYCLES)]
+    completed = [i % 2 == 0 for i in range(LIFECYCLES)]
+
+    syncIDs = []
+    for customer, rewardAmount in zip(syncCustomers, rewardAmounts):
+        appID = operations.createLoyaltyOfferApp(
+            client, creator, customer.getAddress(), startTime, endTime, tokenID, rewardAmount, 101
+        )
+        operations.setupLoyaltyOfferApp(client, appID, creator, tokenID, rewardAmount)
+        syncIDs.append(appID)
+
+    async def run():
+        asyncClient = getAsyncAlgodClient()
+
+        asyncIDs = await asyncio.gather(
+            *(
+                createLoyaltyOfferApp(
+                    asyncClient,
+                    creator,
+                    customer.getAddress(),
+                    startTime,
+                    endTime,
+                    tokenID,
+                    rewardAmount,
+                    101,
+                )
+                for customer, rewardAmount in zip(asyncCustomers, rewardAmounts)
+            )
+        )
+        await asyncio.gather(
+            *(
+                setupLoyaltyOfferApp(asyncClient, appID, creator, tokenID, rewardAmount)
+                for appID, rewardAmount in zip(asyncIDs, rewardAmounts)
+            )
+        )
+
+        waitUntilTimestamp(client, startTime)
+        for appID, done in zip(syncIDs, completed):
+            if done:
+                operations.completeAction(client, creator, appID, 101)
+        await asyncio.gather(
+            *(
+                completeAction(asyncClient, creator, appID, 101)
+                for appID, done in zip(asyncIDs, completed)
+                if done
+            )
+        )
+
+        states = [comparableState(client, appID) for appID in syncIDs]
+        assert [comparableState(client, appID) for appID in asyncIDs] == states
+
+        waitUntilTimestamp(client, endTime + 5)
+        for appID in syncIDs:
+            operations.closeLoyaltyOffer(client, appID, creator)
+        await asyncio.gather(
+            *(closeLoyaltyOffer(asyncClient, appID, creator) for appID in asyncIDs)
+        )
+        return asyncIDs
+
+    asyncIDs = asyncio.run(run())
+
+    def balances(customers, appIDs):
+        return [
+            (
+                getBalances(client, customer.getAddress()).get(tokenID),
+                getBalances(client, get_application_address(appID)),
+            )
+            for customer, appID in zip(customers, appIDs)
+        ]
+
+    results = balances(syncCustomers, syncIDs)
+    assert balances(asyncCustomers, asyncIDs) == results
+    assert [tokens for tokens, _ in results] == [
+        rewardAmount if done else 0 for rewardAmount, done in zip(rewardAmounts, completed)
+    ]
+    # the rewards of the offers that expired went back to the creator
+    spent = 2 * sum(amount for amount, done in zip(rewardAmounts, completed) if done)
+    assert getBalances(client, creator.getAddress())[tokenID] == 1_000 - spent
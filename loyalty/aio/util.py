@@ -0,0 +1,205 @@
+from typing import List, Tuple, Dict, Any, Optional, Union, Sequence, TYPE_CHECKING
+from base64 import b64decode
+import asyncio
+import weakref
+
+from .. import metrics
+from ..holdings import decodeBalances
+from ..programcache import ProgramCache
+from ..util import (
+    PendingTxnResponse,
+    TEAL_VERSION,
+    contractTeal,
+    decodeState,
+    notifyConfirmation,
+)
+from .algod import AsyncAlgodClient
+
+if TYPE_CHECKING:
+    from pyteal import Expr
+
+
+class AsyncConfirmationTracker:
+    """Waits for many pending transactions from one event loop task.
+
+    This is the asyncio counterpart of loyalty.util.ConfirmationTracker. Every
+    tracked transaction is checked concurrently once per round, and the task
+    waits for the next block with a single status_after_block call.
+    """
+
+    def __init__(self, client: AsyncAlgodClient) -> None:
+        self.client = client
+        self.lastRound: Optional[int] = None
+        # txID -> list of [future, timeout, deadline round]
+        self.waiters: Dict[str, List[List[Any]]] = dict()
+        self.task: Optional["asyncio.Task[None]"] = None
+
+    def track(self, txID: str, timeout: int = 10) -> "asyncio.Future[PendingTxnResponse]":
+        future: "asyncio.Future[PendingTxnResponse]" = (
+            asyncio.get_running_loop().create_future()
+        )
+
+        deadline = self.lastRound + timeout if self.lastRound is not None else None
+        self.waiters.setdefault(txID, []).append([future, timeout, deadline])
+
+        if self.task is None:
+            self.task = asyncio.ensure_future(self.run())
+
+        return future
+
+    async def run(self) -> None:
+        try:
+            while len(self.waiters) > 0:
+                try:
+                    await self.step()
+                except Exception as e:
+                    waiters, self.waiters = self.waiters, dict()
+                    self.lastRound = None
+                    for entries in waiters.values():
+                        for entry in entries:
+                            if not entry[0].done():
+                                entry[0].set_exception(e)
+        finally:
+            self.task = None
+            # rounds pass while idle, so the next waiter starts from a fresh status
+            self.lastRound = None
+
+    async def step(self) -> None:
+        if self.lastRound is None:
+            self.lastRound = (await self.client.status())["last-round"]
+
+        lastRound = self.lastRound
+        txIDs = list(self.waiters.keys())
+
+        infos = await asyncio.gather(
+            *(self.client.pending_transaction_info(txID) for txID in txIDs),
+            return_exceptions=True,
+        )
+
+        for txID, pending_txn in zip(txIDs, infos):
+            entries = self.waiters.pop(txID, [])
+            entries = [entry for entry in entries if not entry[0].done()]
+
+            if isinstance(pending_txn, BaseException):
+                for entry in entries:
+                    entry[0].set_exception(pending_txn)
+                continue
+
+            if pending_txn.get("confirmed-round", 0) > 0:
+                response = PendingTxnResponse(pending_txn)
+                for entry in entries:
+                    notifyConfirmation(entry, lastRound, pending_txn["confirmed-round"])
+                    entry[0].set_result(response)
+                continue
+
+            if pending_txn["pool-error"]:
+                metrics.notify("poolError", pending_txn["pool-error"])
+                for entry in entries:
+                    entry[0].set_exception(
+                        Exception("Pool error: {}".format(pending_txn["pool-error"]))
+                    )
+                continue
+
+            remaining = []
+            for entry in entries:
+                if entry[2] is None:
+                    entry[2] = lastRound + entry[1]
+                if lastRound >= entry[2]:
+                    entry[0].set_exception(
+                        Exception(
+                            "Transaction {} not confirmed after {} rounds".format(
+                                txID, entry[1]
+                            )
+                        )
+                    )
+                else:
+                    remaining.append(entry)
+
+            if len(remaining) > 0:
+                self.waiters.setdefault(txID, []).extend(remaining)
+
+        if len(self.waiters) == 0:
+            return
+
+        lastStatus = await self.client.status_after_block(lastRound)
+        self.lastRound = max(lastRound + 1, lastStatus["last-round"])
+
+
+trackers: "weakref.WeakKeyDictionary[AsyncAlgodClient, AsyncConfirmationTracker]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def getConfirmationTracker(client: AsyncAlgodClient) -> AsyncConfirmationTracker:
+    """Get the confirmation tracker shared by all waiters on a client."""
+    tracker = trackers.get(client)
+    if tracker is None:
+        tracker = AsyncConfirmationTracker(weakref.proxy(client))
+        trackers[client] = tracker
+    return tracker
+
+
+async def waitForTransaction(
+    client: AsyncAlgodClient, txID: str, timeout: int = 10
+) -> PendingTxnResponse:
+    return await getConfirmationTracker(client).track(txID, timeout)
+
+
+async def waitForTransactions(
+    client: AsyncAlgodClient, txIDs: Sequence[str], timeout: int = 10
+) -> List[PendingTxnResponse]:
+    tracker = getConfirmationTracker(client)
+    return list(await asyncio.gather(*(tracker.track(txID, timeout) for txID in txIDs)))
+
+
+async def fullyCompileContract(
+    client: Optional[AsyncAlgodClient],
+    contract: "Expr",
+    cache: Optional[ProgramCache] = None,
+    offline: bool = False,
+) -> bytes:
+    return await compileProgram(client, contractTeal(contract), cache, offline)
+
+
+async def compileProgram(
+    client: Optional[AsyncAlgodClient],
+    teal: str,
+    cache: Optional[ProgramCache] = None,
+    offline: bool = False,
+) -> bytes:
+    if cache is not None:
+        program = cache.get(teal, TEAL_VERSION)
+        if program is not None:
+            return program
+
+    if offline or client is None:
+        raise Exception("Compiled program not found in cache and offline mode is enabled")
+
+    response = await client.compile(teal)
+    program = b64decode(response["result"])
+
+    if cache is not None:
+        cache.put(teal, TEAL_VERSION, program)
+
+    return program
+
+
+async def getAppGlobalState(
+    client: AsyncAlgodClient, appID: int
+) -> Dict[bytes, Union[int, bytes]]:
+    appInfo = await client.application_info(appID)
+    return decodeState(appInfo["params"]["global-state"])
+
+
+async def getBalances(client: AsyncAlgodClient, account: str) -> Dict[int, int]:
+    """Get the balances of an account, keyed by asset ID, with 0 for Algo."""
+    return decodeBalances(await client.account_info(account))
+
+
+async def getLastBlockTimestamp(client: AsyncAlgodClient) -> Tuple[int, int]:
+    """Get the latest round and its timestamp from the client's timestamp oracle.
+    Only the block header of a round that isn't cached yet is read.
+    """
+    from .clock import getTimestampOracle
+
+    return await getTimestampOracle(client).latest()
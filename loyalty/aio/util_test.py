@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+
+from ..clock import getTimestampOracle
+from ..testing.setup import getAlgodClient, getAsyncAlgodClient
+from .util import AsyncConfirmationTracker, getLastBlockTimestamp, waitForTransactions
+
+
+class AsyncRoundCounter:
+    """A minimal async algod stand-in that confirms each transaction at a fixed round."""
+
+    def __init__(self, confirmations) -> None:
+        self.round = 1
+        self.confirmations = confirmations
+        self.statusCalls = 0
+
+    async def status(self):
+        self.statusCalls += 1
+        return {"last-round": self.round}
+
+    async def status_after_block(self, block_num):
+        self.statusCalls += 1
+        self.round = block_num + 1
+        return {"last-round": self.round}
+
+    async def pending_transaction_info(self, txID):
+        confirmedRound = self.confirmations.get(txID)
+        if confirmedRound is None:
+            return {"pool-error": "transaction rejected", "txn": {}}
+        if confirmedRound <= self.round:
+            return {"pool-error": "", "txn": {}, "confirmed-round": confirmedRound}
+        return {"pool-error": "", "txn": {}}
+
+
+def test_tracker_shares_rounds():
+    client = AsyncRoundCounter({"tx{}".format(i): 2 + i % 3 for i in range(1000)})
+
+    async def run():
+        tracker = AsyncConfirmationTracker(client)
+        return await asyncio.gather(*(tracker.track("tx{}".format(i)) for i in range(1000)))
+
+    responses = asyncio.run(run())
+
+    assert [r.confirmedRound for r in responses] == [2 + i % 3 for i in range(1000)]
+    assert client.statusCalls <= 4
+
+
+def test_waitForTransactions_errors():
+    client = AsyncRoundCounter({"late": 100, "ok": 2})
+
+    with pytest.raises(Exception, match="Pool error"):
+        asyncio.run(waitForTransactions(client, ["ok", "rejected"]))
+
+    with pytest.raises(Exception, match="not confirmed after 2 rounds"):
+        asyncio.run(waitForTransactions(client, ["late"], timeout=2))
+
+
+def test_tracker_restarts_from_fresh_round():
+    client = AsyncRoundCounter({"a": 3})
+
+    async def run():
+        tracker = AsyncConfirmationTracker(client)
+        first = await tracker.track("a")
+        await asyncio.sleep(0)
+
+        # rounds pass while nothing is tracked
+        client.round += 15
+        client.confirmations["b"] = client.round + 5
+
+        return first, await tracker.track("b")
+
+    first, second = asyncio.run(run())
+
+    assert first.confirmedRound == 3
+    assert second.confirmedRound == client.confirmations["b"]
+
+
+def test_getLastBlockTimestamp():
+    async def run():
+        client = getAsyncAlgodClient()
+        try:
+            return await getLastBlockTimestamp(client), (await client.status())["last-round"]
+        finally:
+            await client.close()
+
+    (round, timestamp), lastRound = asyncio.run(run())
+
+    assert round <= lastRound
+    assert timestamp > 0
+    assert getTimestampOracle(getAlgodClient()).getTimestamp(round) == timestamp
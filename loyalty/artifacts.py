@@ -0,0 +1,214 @@
+"""Prebuilt TEAL and bytecode for the contracts in loyalty.contracts.
+
+Generating TEAL means importing PyTeal, which takes longer than the rest of
+the package together. The TEAL of every contract is therefore shipped in the
+programs directory next to this module, and operations load it from there.
+Bytecode compiled by algod can be shipped in the same directory as
+ProgramCache entries, for processes that run offline. A process with a client
+still compiles the TEAL with its node, so the programs it deploys are always
+the ones algod assembles.
+
+After changing loyalty.contracts, regenerate the artifacts with
+
+    python -m loyalty.artifacts --algod-address http://localhost:4001
+
+Without a node only the TEAL is regenerated. --check fails if the TEAL is out
+of date, and with --algod-address also if the shipped bytecode is missing or
+differs from what the node compiles.
+"""
+from typing import Dict, List, Optional
+from base64 import b64decode
+import argparse
+import os
+import sys
+
+from algosdk.v2client.algod import AlgodClient
+
+from .programcache import ProgramCache, tealKey
+from .util import TEAL_VERSION, compileProgram
+
+PROGRAMS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "programs")
+
+# artifact name -> the function of loyalty.contracts that generates it
+CONTRACTS = {
+    "offer_approval": "approval_program",
+    "offer_clear": "clear_state_program",
+    "registry_approval": "registry_approval_program",
+    "registry_clear": "registry_clear_state_program",
+}
+
+tealSources: Dict[str, str] = dict()
+
+prebuiltPrograms = ProgramCache(PROGRAMS_DIR)
+
+
+def tealPath(name: str, directory: str = PROGRAMS_DIR) -> str:
+    return os.path.join(directory, name + ".teal")
+
+
+def getTeal(name: str) -> str:
+    """Get the prebuilt TEAL source of a contract.
+    Args:
+        name: The artifact name of the contract, a key of CONTRACTS.
+    Returns:
+        The TEAL source, as generated by generateTeal when the artifacts were built.
+    """
+    teal = tealSources.get(name)
+    if teal is None:
+        if name not in CONTRACTS:
+            raise Exception("Unknown contract: {}".format(name))
+        with open(tealPath(name), "r") as f:
+            teal = f.read()
+        tealSources[name] = teal
+    return teal
+
+
+def generateTeal(name: str) -> str:
+    """Generate the TEAL source of a contract with PyTeal."""
+    from . import contracts
+    from .util import contractTeal
+
+    return contractTeal(getattr(contracts, CONTRACTS[name])())
+
+
+def getPrebuiltProgram(teal: str) -> Optional[bytes]:
+    """Get the shipped bytecode of a TEAL program, if there is any."""
+    return prebuiltPrograms.get(teal, TEAL_VERSION)
+
+
+def compileArtifact(
+    client: Optional[AlgodClient],
+    name: str,
+    cache: Optional[ProgramCache] = None,
+    offline: bool = False,
+) -> bytes:
+    """Get the bytecode of a contract without importing PyTeal.
+    The prebuilt TEAL is compiled like util.compileProgram does. The shipped
+    bytecode is only used when algod can't be asked, and the program isn't in
+    the cache.
+    Args:
+        client: An algod client that has the ability to compile TEAL programs.
+            This may be None in offline mode.
+        name: The artifact name of the contract, a key of CONTRACTS.
+        cache: The on-disk cache of compiled programs.
+        offline: If True, never call algod.
+    Returns:
+        The compiled program.
+    """
+    teal = getTeal(name)
+    if client is not None and not offline:
+        return compileProgram(client, teal, cache)
+    if cache is not None:
+        program = cache.get(teal, TEAL_VERSION)
+        if program is not None:
+            return program
+    program = getPrebuiltProgram(teal)
+    if program is not None:
+        return program
+    return compileProgram(client, teal, cache, offline)
+
+
+def compileWithAlgod(client: AlgodClient, teal: str) -> bytes:
+    """Compile a TEAL program with algod, bypassing every cache."""
+    return b64decode(client.compile(teal)["result"])
+
+
+def findPrebuiltTeal(program: bytes) -> Optional[str]:
+    """Get the TEAL source of shipped bytecode, or None if it isn't shipped."""
+    for name in CONTRACTS:
+        teal = getTeal(name)
+        if getPrebuiltProgram(teal) == program:
+            return teal
+    return None
+
+
+def staleArtifacts(
+    directory: str = PROGRAMS_DIR, client: Optional[AlgodClient] = None
+) -> List[str]:
+    """List the contracts whose artifacts in directory are out of date.
+    Args:
+        directory: Where the artifacts are.
+        client: An algod client. If it is given, the bytecode in directory is
+            also checked against what it compiles, and missing bytecode counts
+            as out of date.
+    Returns:
+        The artifact names of the contracts whose TEAL differs from what
+        PyTeal generates, or whose bytecode is missing or wrong.
+    """
+    cache = ProgramCache(directory)
+    stale = []
+    for name in CONTRACTS:
+        try:
+            with open(tealPath(name, directory), "r") as f:
+                teal: Optional[str] = f.read()
+        except OSError:
+            teal = None
+        if teal is None or teal != generateTeal(name):
+            stale.append(name)
+        elif client is not None and cache.get(teal, TEAL_VERSION) != compileWithAlgod(
+            client, teal
+        ):
+            stale.append(name)
+    return stale
+
+
+def buildArtifacts(client: Optional[AlgodClient], directory: str = PROGRAMS_DIR) -> None:
+    """Generate the TEAL of every contract and write it to directory.
+    Args:
+        client: An algod client to compile the programs with. If it is given,
+            the bytecode is written to directory as well. Otherwise only the
+            bytecode of unchanged TEAL is kept.
+        directory: Where to write the artifacts.
+    """
+    os.makedirs(directory, exist_ok=True)
+    cache = ProgramCache(directory)
+    entries = set()
+    # TEAL -> bytecode compiled in this build, since contracts can share programs
+    compiled: Dict[str, bytes] = dict()
+
+    for name in CONTRACTS:
+        teal = generateTeal(name)
+        with open(tealPath(name, directory), "w") as f:
+            f.write(teal)
+        if client is not None and teal not in compiled:
+            compiled[teal] = compileWithAlgod(client, teal)
+            cache.put(teal, TEAL_VERSION, compiled[teal])
+        entries.add(os.path.basename(cache.path(tealKey(teal, TEAL_VERSION))))
+
+    # bytecode of TEAL that is no longer generated
+    for filename in os.listdir(directory):
+        if filename.endswith(".json") and filename not in entries:
+            os.unlink(os.path.join(directory, filename))
+
+    tealSources.clear()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Build the prebuilt contract artifacts.")
+    parser.add_argument(
+        "--algod-address", help="also compile the programs with this node, or check them with it"
+    )
+    parser.add_argument("--algod-token", default=os.environ.get("ALGOD_TOKEN", ""))
+    parser.add_argument("--directory", default=PROGRAMS_DIR)
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="fail if the artifacts are out of date instead",
+    )
+    args = parser.parse_args(argv)
+
+    client = None
+    if args.algod_address:
+        client = AlgodClient(args.algod_token, args.algod_address)
+
+    if args.check:
+        stale = staleArtifacts(args.directory, client)
+        if len(stale) != 0:
+            sys.exit("Out of date: " + ", ".join(stale))
+        return
+
+    buildArtifacts(client, args.directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import os
+from base64 import b64encode
+
+from .artifacts import CONTRACTS, buildArtifacts, compileArtifact, getTeal, staleArtifacts, tealPath
+from .programcache import ProgramCache, tealKey
+from .util import TEAL_VERSION
+
+
+class CompileCounter:
+    def __init__(self) -> None:
+        self.calls = 0
+
+    def compile(self, source):
+        self.calls += 1
+        program = bytes([TEAL_VERSION]) + source.encode()
+        return {"result": b64encode(program).decode("ascii"), "hash": ""}
+
+
+def test_artifacts_are_current():
+    # run `python -m loyalty.artifacts` after changing loyalty.contracts
+    assert staleArtifacts() == []
+
+
+def test_buildArtifacts(tmp_path):
+    directory = str(tmp_path)
+    with open(os.path.join(directory, "0" * 64 + ".json"), "w") as f:
+        f.write("{}")
+
+    client = CompileCounter()
+    buildArtifacts(client, directory)
+
+    # the clear state programs are the same, so they are compiled once
+    sources = set(getTeal(name) for name in CONTRACTS)
+    assert client.calls == len(sources)
+    assert staleArtifacts(directory) == []
+
+    cache = ProgramCache(directory)
+    for name in CONTRACTS:
+        with open(tealPath(name, directory)) as f:
+            teal = f.read()
+        assert teal == getTeal(name)
+        assert cache.get(teal, TEAL_VERSION) == bytes([TEAL_VERSION]) + teal.encode()
+
+    # only the TEAL and the bytecode of each contract are left
+    assert len(os.listdir(directory)) == len(CONTRACTS) + len(sources)
+
+
+def test_check_compares_bytecode_with_algod(tmp_path):
+    directory = str(tmp_path)
+    buildArtifacts(CompileCounter(), directory)
+    assert staleArtifacts(directory, CompileCounter()) == []
+
+    # bytecode that algod doesn't produce, or no bytecode at all
+    cache = ProgramCache(directory)
+    teal = getTeal("offer_approval")
+    cache.put(teal, TEAL_VERSION, b"not what algod compiles")
+    os.unlink(cache.path(tealKey(getTeal("registry_approval"), TEAL_VERSION)))
+    assert staleArtifacts(directory) == []
+    assert staleArtifacts(directory, CompileCounter()) == ["offer_approval", "registry_approval"]
+
+    # without a node only the TEAL is written, and bytecode of unchanged TEAL is kept
+    buildArtifacts(None, directory)
+    assert cache.get(teal, TEAL_VERSION) == b"not what algod compiles"
+
+
+def test_compileArtifact_prefers_algod(tmp_path):
+    cache = ProgramCache(str(tmp_path))
+    client = CompileCounter()
+
+    program = compileArtifact(client, "offer_clear", cache)
+    assert program == bytes([TEAL_VERSION]) + getTeal("offer_clear").encode()
+    assert client.calls == 1
+
+    # then served from the cache, also offline
+    assert compileArtifact(client, "offer_clear", cache) == program
+    assert compileArtifact(None, "offer_clear", cache, offline=True) == program
+    assert client.calls == 1
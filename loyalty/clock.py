@@ -0,0 +1,169 @@
+"""The chain's clock, read without fetching whole blocks.
+
+Offer contracts compare their start and end times with the timestamp of the
+latest block, so that timestamp, not the local clock, decides whether an offer
+has started or ended. A TimestampOracle caches the timestamps of the rounds it
+has seen, reads new ones from block headers only, and estimates the block
+interval from the rounds it has cached. Waiting for a chain time follows rounds
+with status_after_block, and skips reading the timestamps of the rounds that
+are expected to come before it.
+"""
+from typing import Optional, Tuple
+import collections
+import math
+import threading
+import time
+import weakref
+
+from algosdk.error import AlgodHTTPError
+from algosdk.v2client.algod import AlgodClient
+
+from .util import decodeBlock
+
+# seconds, used until two rounds have been seen
+DEFAULT_BLOCK_INTERVAL = 4.5
+
+# round timestamps kept
+MAX_SAMPLES = 256
+
+# the share of the rounds expected before a timestamp that a wait skips over,
+# so that a block interval that shortens doesn't make it overshoot
+SKIP_FRACTION = 0.9
+
+
+class TimestampOracle:
+    """Caches round timestamps of a chain and estimates its current time.
+
+    Args:
+        client: An algod client.
+        maxSamples: The number of round timestamps to keep.
+    """
+
+    def __init__(self, client: AlgodClient, maxSamples: int = MAX_SAMPLES) -> None:
+        self.client = client
+        self.maxSamples = maxSamples
+        self.lock = threading.Lock()
+        # round -> timestamp, in the order they were added
+        self.samples: "collections.OrderedDict[int, int]" = collections.OrderedDict()
+        # whether algod accepts header-only block requests; older nodes don't
+        self.headerOnly = True
+
+    def record(self, round: int, timestamp: int) -> None:
+        with self.lock:
+            self.samples[round] = timestamp
+            while len(self.samples) > self.maxSamples:
+                self.samples.popitem(last=False)
+
+    def fetchTimestamp(self, round: int) -> int:
+        params = {"format": "msgpack"}
+        if self.headerOnly:
+            params["header-only"] = "true"
+
+        try:
+            raw = self.client.algod_request(
+                "GET", "/blocks/{}".format(round), params, response_format="msgpack"
+            )
+        except AlgodHTTPError as e:
+            if not self.headerOnly or e.code != 400:
+                raise
+            self.headerOnly = False
+            return self.fetchTimestamp(round)
+
+        return decodeBlock(raw)["ts"]
+
+    def getTimestamp(self, round: int) -> int:
+        """Get the timestamp of a round, reading its block header only if it isn't cached."""
+        with self.lock:
+            timestamp = self.samples.get(round)
+        if timestamp is None:
+            timestamp = self.fetchTimestamp(round)
+            self.record(round, timestamp)
+        return timestamp
+
+    def latest(self) -> Tuple[int, int]:
+        """Get the latest round and its timestamp, the chain time offer contracts see.
+        Costs a status call, and a block header read if the round is new.
+        """
+        round, timestamp, _ = self.latestWithAge()
+        return round, timestamp
+
+    def latestWithAge(self) -> Tuple[int, int, float]:
+        status = self.client.status()
+        round = status["last-round"]
+        return round, self.getTimestamp(round), status.get("time-since-last-round", 0) / 1e9
+
+    def blockInterval(self) -> float:
+        """Estimate the seconds between blocks from the cached rounds."""
+        with self.lock:
+            if len(self.samples) < 2:
+                return DEFAULT_BLOCK_INTERVAL
+            rounds = sorted(self.samples)
+            first, last = rounds[0], rounds[-1]
+            elapsed = self.samples[last] - self.samples[first]
+        return max(elapsed / (last - first), 0.0)
+
+    def estimateTime(self) -> float:
+        """Estimate the current time on the chain's clock: the timestamp of the
+        latest block plus the time since algod saw it.
+        """
+        _, timestamp, age = self.latestWithAge()
+        return timestamp + age
+
+    def estimateRound(self, timestamp: int) -> int:
+        """Estimate the first round whose timestamp is at least timestamp."""
+        round, latestTimestamp = self.latest()
+        if latestTimestamp >= timestamp:
+            return round
+        interval = self.blockInterval()
+        if interval <= 0:
+            return round + 1
+        return round + max(1, math.ceil((timestamp - latestTimestamp) / interval))
+
+    def waitUntil(self, timestamp: int, timeout: Optional[float] = None) -> Tuple[int, int]:
+        """Wait until the latest block timestamp is at least timestamp.
+        Rounds are followed with status_after_block. Only the timestamps of
+        the rounds that may reach the timestamp are read.
+        Args:
+            timestamp: The UNIX timestamp to wait for.
+            timeout: Seconds to wait at most. Waits as long as it takes by default.
+        Returns:
+            The round and timestamp of the first block seen at or after timestamp.
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+
+        round, latestTimestamp = self.latest()
+        while latestTimestamp < timestamp:
+            if deadline is not None and time.monotonic() >= deadline:
+                raise Exception(
+                    "Chain time {} not reached after {} seconds".format(timestamp, timeout)
+                )
+
+            interval = self.blockInterval()
+            skip = 1
+            if interval > 0:
+                skip = max(1, int(SKIP_FRACTION * (timestamp - latestTimestamp) / interval))
+
+            target = round + skip
+            while round < target:
+                # on a timeout, algod answers with the same round
+                round = self.client.status_after_block(round)["last-round"]
+                if deadline is not None and time.monotonic() >= deadline:
+                    break
+
+            latestTimestamp = self.getTimestamp(round)
+
+        return round, latestTimestamp
+
+
+oracles: "weakref.WeakKeyDictionary[AlgodClient, TimestampOracle]" = weakref.WeakKeyDictionary()
+oraclesLock = threading.Lock()
+
+
+def getTimestampOracle(client: AlgodClient) -> TimestampOracle:
+    """Get the timestamp oracle shared by all users of a client."""
+    with oraclesLock:
+        oracle = oracles.get(client)
+        if oracle is None:
+            oracle = TimestampOracle(weakref.proxy(client))
+            oracles[client] = oracle
+        return oracle
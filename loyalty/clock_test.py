@@ -0,0 +1,103 @@
+import threading
+
+import pytest
+from algosdk.error import AlgodHTTPError
+
+from .clock import DEFAULT_BLOCK_INTERVAL, TimestampOracle
+from .testing.fake import FakeAlgodClient, FakeNetwork
+
+
+def countBlockReads(client, rejectHeaderOnly=False):
+    reads = []
+    algodRequest = client.algod_request
+
+    def countingRequest(method, requrl, params=None, *args, **kwargs):
+        if requrl.startswith("/blocks/"):
+            if rejectHeaderOnly and "header-only" in (params or {}):
+                raise AlgodHTTPError("unknown parameter header-only", 400)
+            reads.append(requrl)
+        return algodRequest(method, requrl, params, *args, **kwargs)
+
+    client.algod_request = countingRequest
+    return reads
+
+
+def test_latest_is_cached():
+    network = FakeNetwork()
+    client = FakeAlgodClient(network)
+    reads = countBlockReads(client)
+    oracle = TimestampOracle(client)
+
+    round, timestamp = oracle.latest()
+    assert round == client.status()["last-round"]
+    assert timestamp == network.latestTimestamp()
+
+    assert oracle.latest() == (round, timestamp)
+    assert len(reads) == 1
+
+    network.advanceTime(60)
+    assert oracle.latest() == (round + 1, network.latestTimestamp())
+    assert len(reads) == 2
+
+    assert oracle.estimateTime() >= network.latestTimestamp()
+
+
+def test_header_only_fallback():
+    network = FakeNetwork()
+    client = FakeAlgodClient(network)
+    reads = countBlockReads(client, rejectHeaderOnly=True)
+    oracle = TimestampOracle(client)
+
+    _, timestamp = oracle.latest()
+    assert timestamp == network.latestTimestamp()
+    assert not oracle.headerOnly
+    assert len(reads) == 1
+
+
+def test_block_interval():
+    oracle = TimestampOracle(FakeAlgodClient(FakeNetwork()))
+    assert oracle.blockInterval() == DEFAULT_BLOCK_INTERVAL
+
+    oracle.record(100, 1_000)
+    oracle.record(110, 1_045)
+    assert oracle.blockInterval() == pytest.approx(4.5)
+
+
+def test_wait_until():
+    network = FakeNetwork()
+    client = FakeAlgodClient(network)
+    reads = countBlockReads(client)
+    oracle = TimestampOracle(client)
+
+    startRound, startTimestamp = oracle.latest()
+    target = startTimestamp + 60
+
+    # blocks are produced while the oracle waits for them; make each one a second apart
+    stop = threading.Event()
+
+    def tick():
+        while not stop.wait(0.002):
+            with network.lock:
+                network.timeOffset += 1
+
+    ticker = threading.Thread(target=tick, daemon=True)
+    ticker.start()
+    try:
+        round, timestamp = oracle.waitUntil(target, timeout=30)
+    finally:
+        stop.set()
+        ticker.join()
+
+    assert timestamp >= target
+    assert oracle.getTimestamp(round) == timestamp
+    # only a few of the rounds that passed had their timestamp read
+    assert len(reads) < round - startRound
+
+
+def test_wait_until_timeout():
+    network = FakeNetwork()
+    oracle = TimestampOracle(FakeAlgodClient(network))
+
+    _, timestamp = oracle.latest()
+    with pytest.raises(Exception, match="not reached"):
+        oracle.waitUntil(timestamp + 3_600, timeout=0.05)
@@ -167,6 +167,238 @@ def clear_state_program():
     return Approve()
 
 
+def registry_approval_program():
+    offer_count_key = Bytes("count")
+
+    # Each offer is stored under an 8 byte offer key as a 72 byte value:
+    # customer account (32) | start (8) | end (8) | reward asset ID (8)
+    # | reward amount (8) | action ID (8)
+    offer_key_length = Int(8)
+    offer_value_length = Int(72)
+
+    def offer_customer(value: Expr) -> Expr:
+        return Extract(value, Int(0), Int(32))
+
+    def offer_start(value: Expr) -> Expr:
+        return ExtractUint64(value, Int(32))
+
+    def offer_end(value: Expr) -> Expr:
+        return ExtractUint64(value, Int(40))
+
+    def offer_reward_asset_id(value: Expr) -> Expr:
+        return ExtractUint64(value, Int(48))
+
+    def offer_reward_amount(value: Expr) -> Expr:
+        return ExtractUint64(value, Int(56))
+
+    def offer_action_id(value: Expr) -> Expr:
+        return ExtractUint64(value, Int(64))
+
+    @Subroutine(TealType.none)
+    def transferReward(assetID: Expr, amount: Expr, account: Expr) -> Expr:
+        return Seq(
+            InnerTxnBuilder.Begin(),
+            InnerTxnBuilder.SetFields(
+                {
+                    TxnField.type_enum: TxnType.AssetTransfer,
+                    TxnField.xfer_asset: assetID,
+                    TxnField.asset_amount: amount,
+                    TxnField.asset_receiver: account,
+                }
+            ),
+            InnerTxnBuilder.Submit(),
+        )
+
+    @Subroutine(TealType.bytes)
+    def loadOffer(key: Expr) -> Expr:
+        existing = App.globalGetEx(Int(0), key)
+        return Seq(existing, Assert(existing.hasValue()), existing.value())
+
+    @Subroutine(TealType.none)
+    def removeOffer(key: Expr) -> Expr:
+        return Seq(
+            App.globalDel(key),
+            App.globalPut(offer_count_key, App.globalGet(offer_count_key) - Int(1)),
+        )
+
+    i = ScratchVar(TealType.uint64)
+    offer_key = ScratchVar(TealType.bytes)
+    offer_value = ScratchVar(TealType.bytes)
+
+    is_creator = Txn.sender() == Global.creator_address()
+
+    on_create = Seq(
+        App.globalPut(offer_count_key, Int(0)),
+        Approve(),
+    )
+
+    # opt into every reward asset passed in the foreign assets array
+    on_setup = Seq(
+        Assert(is_creator),
+        For(i.store(Int(0)), i.load() < Txn.assets.length(), i.store(i.load() + Int(1))).Do(
+            Seq(
+                InnerTxnBuilder.Begin(),
+                InnerTxnBuilder.SetFields(
+                    {
+                        TxnField.type_enum: TxnType.AssetTransfer,
+                        TxnField.xfer_asset: Txn.assets[i.load()],
+                        TxnField.asset_receiver: Global.current_application_address(),
+                    }
+                ),
+                InnerTxnBuilder.Submit(),
+            )
+        ),
+        Approve(),
+    )
+
+    # args: "add", key, value, key, value, ...
+    existing_offer = App.globalGetEx(Int(0), offer_key.load())
+    on_add = Seq(
+        Assert(And(is_creator, Txn.application_args.length() % Int(2) == Int(1))),
+        For(i.store(Int(1)), i.load() < Txn.application_args.length(), i.store(i.load() + Int(2))).Do(
+            Seq(
+                offer_key.store(Txn.application_args[i.load()]),
+                offer_value.store(Txn.application_args[i.load() + Int(1)]),
+                existing_offer,
+                Assert(
+                    And(
+                        Len(offer_key.load()) == offer_key_length,
+                        Len(offer_value.load()) == offer_value_length,
+                        Not(existing_offer.hasValue()),
+                        Global.latest_timestamp() < offer_start(offer_value.load()),
+                        offer_start(offer_value.load()) < offer_end(offer_value.load()),
+                    )
+                ),
+                App.globalPut(offer_key.load(), offer_value.load()),
+                App.globalPut(offer_count_key, App.globalGet(offer_count_key) + Int(1)),
+            )
+        ),
+        Approve(),
+    )
+
+    # args: "complete", key, action ID, key, action ID, ...
+    on_complete = Seq(
+        Assert(And(is_creator, Txn.application_args.length() % Int(2) == Int(1))),
+        For(i.store(Int(1)), i.load() < Txn.application_args.length(), i.store(i.load() + Int(2))).Do(
+            Seq(
+                offer_key.store(Txn.application_args[i.load()]),
+                offer_value.store(loadOffer(offer_key.load())),
+                Assert(
+                    And(
+                        # the offer has started
+                        offer_start(offer_value.load()) <= Global.latest_timestamp(),
+                        # the offer has not ended
+                        Global.latest_timestamp() < offer_end(offer_value.load()),
+                    )
+                ),
+                If(
+                    Btoi(Txn.application_args[i.load() + Int(1)]) == offer_action_id(offer_value.load())
+                ).Then(
+                    Seq(
+                        # a completed offer is removed so it can't be completed again
+                        removeOffer(offer_key.load()),
+                        # pay out the offer reward to the customer address
+                        transferReward(
+                            offer_reward_asset_id(offer_value.load()),
+                            offer_reward_amount(offer_value.load()),
+                            offer_customer(offer_value.load()),
+                        ),
+                    )
+                ),
+            )
+        ),
+        Approve(),
+    )
+
+    # args: "expire", key, key, ...
+    on_expire = Seq(
+        For(i.store(Int(1)), i.load() < Txn.application_args.length(), i.store(i.load() + Int(1))).Do(
+            Seq(
+                offer_key.store(Txn.application_args[i.load()]),
+                offer_value.store(loadOffer(offer_key.load())),
+                If(
+                    Global.latest_timestamp() < offer_start(offer_value.load()),
+                    # the offer has not yet started, only the creator may cancel it
+                    Assert(is_creator),
+                    # otherwise anyone may expire it once it has ended
+                    Assert(offer_end(offer_value.load()) <= Global.latest_timestamp()),
+                ),
+                removeOffer(offer_key.load()),
+                # return the reward back to the registry creator
+                transferReward(
+                    offer_reward_asset_id(offer_value.load()),
+                    offer_reward_amount(offer_value.load()),
+                    Global.creator_address(),
+                ),
+            )
+        ),
+        Approve(),
+    )
+
+    on_call_method = Txn.application_args[0]
+    on_call = Cond(
+        [on_call_method == Bytes("setup"), on_setup],
+        [on_call_method == Bytes("add"), on_add],
+        [on_call_method == Bytes("complete"), on_complete],
+        [on_call_method == Bytes("expire"), on_expire],
+    )
+
+    # the registry can only be deleted by its creator once it holds no offers,
+    # closing out every reward asset passed in the foreign assets array
+    on_delete = Seq(
+        Assert(And(is_creator, App.globalGet(offer_count_key) == Int(0))),
+        For(i.store(Int(0)), i.load() < Txn.assets.length(), i.store(i.load() + Int(1))).Do(
+            Seq(
+                InnerTxnBuilder.Begin(),
+                InnerTxnBuilder.SetFields(
+                    {
+                        TxnField.type_enum: TxnType.AssetTransfer,
+                        TxnField.xfer_asset: Txn.assets[i.load()],
+                        TxnField.asset_close_to: Global.creator_address(),
+                    }
+                ),
+                InnerTxnBuilder.Submit(),
+            )
+        ),
+        If(Balance(Global.current_application_address()) != Int(0)).Then(
+            Seq(
+                InnerTxnBuilder.Begin(),
+                InnerTxnBuilder.SetFields(
+                    {
+                        TxnField.type_enum: TxnType.Payment,
+                        TxnField.close_remainder_to: Global.creator_address(),
+                    }
+                ),
+                InnerTxnBuilder.Submit(),
+            )
+        ),
+        Approve(),
+    )
+
+    program = Cond(
+        [Txn.application_id() == Int(0), on_create],
+        [Txn.on_completion() == OnComplete.NoOp, on_call],
+        [
+            Txn.on_completion() == OnComplete.DeleteApplication,
+            on_delete,
+        ],
+        [
+            Or(
+                Txn.on_completion() == OnComplete.OptIn,
+                Txn.on_completion() == OnComplete.CloseOut,
+                Txn.on_completion() == OnComplete.UpdateApplication,
+            ),
+            Reject(),
+        ],
+    )
+
+    return program
+
+
+def registry_clear_state_program():
+    return Approve()
+
+
 if __name__ == "__main__":
     with open("offer_approval.teal", "w") as f:
         compiled = compileTeal(approval_program(), mode=Mode.Application, version=5)
@@ -175,3 +407,11 @@ if __name__ == "__main__":
     with open("offer_clear_state.teal", "w") as f:
         compiled = compileTeal(clear_state_program(), mode=Mode.Application, version=5)
         f.write(compiled)
+
+    with open("registry_approval.teal", "w") as f:
+        compiled = compileTeal(registry_approval_program(), mode=Mode.Application, version=5)
+        f.write(compiled)
+
+    with open("registry_clear_state.teal", "w") as f:
+        compiled = compileTeal(registry_clear_state_program(), mode=Mode.Application, version=5)
+        f.write(compiled)
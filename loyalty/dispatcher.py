@@ -0,0 +1,565 @@
+"""Completes offer actions from a stream of events.
+
+An ActionDispatcher matches each ActionEvent to the open offers of its
+customer and action ID, and completes them with grouped completeAction calls,
+keeping several groups in flight at once. Events are acknowledged only after
+every completion they caused has been confirmed or has failed, so together
+with a StreamCheckpoint a line-numbered event stream is delivered at least
+once across restarts.
+
+    dispatcher = ActionDispatcher(client, owner, OfferIndex.FromStateCache(cache), cache)
+    dispatchEvents(dispatcher, readEvents(stream))
+
+It also runs as a service with python -m loyalty.dispatcher.
+"""
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    TextIO,
+    Tuple,
+    cast,
+)
+from concurrent.futures import Future
+import argparse
+import json
+import os
+import queue
+import sys
+import tempfile
+import threading
+import time
+
+from algosdk.v2client.algod import AlgodClient
+from algosdk.future import transaction
+from algosdk import encoding
+
+from .account import Account
+from .ledger import OfferLedger
+from .operations import MAX_GROUP_SIZE, buildActionTxn
+from .params import SuggestedParamsProvider
+from .signer import TransactionSigner, signTransactions
+from .state import OfferStateCache, OfferStatus
+from .transport import createAlgodClient
+from .util import PendingTxnResponse, getConfirmationTracker
+
+
+class ActionEvent(NamedTuple):
+    """A report that a customer performed an action."""
+
+    customer: str
+    actionID: int
+    # a caller chosen identifier, such as the line number in the input stream
+    sequence: int = 0
+
+
+class OfferIndex:
+    """An in-memory index from (customer, action ID) to open offer app IDs."""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.offers: Dict[Tuple[str, int], Set[int]] = dict()
+
+    def add(self, appID: int, customer: str, actionID: int) -> None:
+        with self.lock:
+            self.offers.setdefault((customer, actionID), set()).add(appID)
+
+    def remove(self, appID: int, customer: str, actionID: int) -> None:
+        with self.lock:
+            appIDs = self.offers.get((customer, actionID))
+            if appIDs is not None:
+                appIDs.discard(appID)
+                if len(appIDs) == 0:
+                    del self.offers[(customer, actionID)]
+
+    def lookup(self, customer: str, actionID: int) -> List[int]:
+        with self.lock:
+            return sorted(self.offers.get((customer, actionID), ()))
+
+    def __len__(self) -> int:
+        with self.lock:
+            return sum(len(appIDs) for appIDs in self.offers.values())
+
+    @classmethod
+    def FromStateCache(cls, stateCache: OfferStateCache) -> "OfferIndex":
+        """Index every offer in a state cache that has not been completed."""
+        index = cls()
+        with stateCache.lock:
+            states = list(stateCache.states.items())
+        for appID, state in states:
+            if state.get(b"status") == OfferStatus.COMPLETED:
+                continue
+            customer = encoding.encode_address(state[b"customer_account"])
+            index.add(appID, customer, cast(int, state[b"action_id"]))
+        return index
+
+
+class DispatcherStats:
+    """Throughput and completion latency counters of a dispatcher."""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.startedAt = time.monotonic()
+        self.events = 0
+        self.unmatched = 0
+        self.completions = 0
+        self.failures = 0
+        self.groups = 0
+        self.retries = 0
+        self.latencies: List[float] = []
+
+    def record(self, name: str, count: int = 1) -> None:
+        with self.lock:
+            setattr(self, name, getattr(self, name) + count)
+
+    def recordLatency(self, latency: float) -> None:
+        with self.lock:
+            self.latencies.append(latency)
+
+    def report(self) -> Dict[str, Any]:
+        """Get a machine-readable summary of the counters."""
+        with self.lock:
+            elapsed = time.monotonic() - self.startedAt
+            latencies = sorted(self.latencies)
+            counters = {
+                "events": self.events,
+                "unmatched": self.unmatched,
+                "completions": self.completions,
+                "failures": self.failures,
+                "groups": self.groups,
+                "retries": self.retries,
+            }
+
+        def percentile(p: float) -> Optional[float]:
+            if len(latencies) == 0:
+                return None
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+        return {
+            "elapsed": elapsed,
+            **counters,
+            "completions_per_second": counters["completions"] / elapsed if elapsed > 0 else 0.0,
+            "latency_p50": percentile(0.50),
+            "latency_p95": percentile(0.95),
+            "latency_p99": percentile(0.99),
+        }
+
+
+class Delivery:
+    """Tracks the completions owed for one event until all are resolved."""
+
+    def __init__(self, event: ActionEvent, remaining: int) -> None:
+        self.event = event
+        self.receivedAt = time.monotonic()
+        self.remaining = remaining
+        self.failed = False
+
+
+class Completion:
+    def __init__(self, delivery: Delivery, appID: int) -> None:
+        self.delivery = delivery
+        self.appID = appID
+        self.attempts = 0
+
+
+class ActionDispatcher:
+    """Turns a stream of action events into grouped completeAction calls.
+
+    Events are submitted to a bounded queue, so producers block when the
+    dispatcher falls behind. A worker thread matches each event to open offers
+    through an OfferIndex, coalesces the resulting app calls into transaction
+    groups, and keeps up to maxInFlight groups awaiting confirmation.
+
+    Delivery is at least once: onAck is called for an event only after every
+    completion it caused has been confirmed or has failed maxAttempts times.
+    When a group is rejected, its calls are retried one per group so a single
+    bad offer can't block the others. Events for the same offer that are
+    grouped together share one app call.
+    """
+
+    def __init__(
+        self,
+        client: AlgodClient,
+        owner: Account,
+        index: OfferIndex,
+        stateCache: OfferStateCache,
+        groupSize: int = MAX_GROUP_SIZE,
+        maxQueued: int = 10_000,
+        maxDelay: float = 0.25,
+        maxInFlight: int = 8,
+        maxAttempts: int = 3,
+        paramsProvider: Optional[SuggestedParamsProvider] = None,
+        onAck: Optional[Callable[[ActionEvent, bool], None]] = None,
+        signer: Optional[TransactionSigner] = None,
+    ) -> None:
+        assert 1 <= groupSize <= MAX_GROUP_SIZE
+
+        self.client = client
+        self.owner = owner
+        self.index = index
+        self.stateCache = stateCache
+        self.groupSize = groupSize
+        self.maxDelay = maxDelay
+        self.maxAttempts = maxAttempts
+        self.paramsProvider = paramsProvider or SuggestedParamsProvider(client)
+        self.onAck = onAck
+        self.signer = signer
+
+        self.stats = DispatcherStats()
+        self.events: "queue.Queue[Optional[ActionEvent]]" = queue.Queue(maxsize=maxQueued)
+        self.retries: "queue.Queue[Completion]" = queue.Queue()
+        self.inFlight = threading.BoundedSemaphore(maxInFlight)
+        self.outstanding = 0
+        self.outstandingLock = threading.Condition()
+        self.thread: Optional[threading.Thread] = None
+        self.closed = False
+
+    def start(self) -> None:
+        self.thread = threading.Thread(target=self.run, name="loyalty-dispatcher", daemon=True)
+        self.thread.start()
+
+    def submit(self, event: ActionEvent) -> None:
+        """Queue an event, blocking while the queue is full."""
+        self.stats.record("events")
+        with self.outstandingLock:
+            self.outstanding += 1
+        self.events.put(event)
+
+    def close(self) -> None:
+        """Stop accepting events and wait until every queued event is acknowledged."""
+        self.events.put(None)
+        with self.outstandingLock:
+            while self.outstanding > 0:
+                self.outstandingLock.wait()
+        if self.thread is not None:
+            self.thread.join()
+
+    def run(self) -> None:
+        pending: List[Completion] = []
+        deadline: Optional[float] = None
+
+        while True:
+            # retried calls are never grouped again, so a bad offer only fails itself
+            while not self.retries.empty():
+                self.send([self.retries.get_nowait()])
+
+            if deadline is not None and (
+                len(pending) >= self.groupSize or self.closed or time.monotonic() >= deadline
+            ):
+                group, pending = pending[: self.groupSize], pending[self.groupSize :]
+                deadline = time.monotonic() + self.maxDelay if len(pending) > 0 else None
+                self.send(group)
+                continue
+
+            if self.closed:
+                # wait for in-flight groups, whose failures may still queue retries
+                with self.outstandingLock:
+                    if self.outstanding == 0:
+                        return
+                    self.outstandingLock.wait(timeout=0.05)
+                continue
+
+            timeout = 0.05 if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                event = self.events.get(timeout=timeout)
+            except queue.Empty:
+                continue
+
+            if event is None:
+                self.closed = True
+                continue
+
+            completions = self.match(event)
+            if len(completions) > 0 and deadline is None:
+                deadline = time.monotonic() + self.maxDelay
+            pending.extend(completions)
+
+    def match(self, event: ActionEvent) -> List[Completion]:
+        appIDs = self.index.lookup(event.customer, event.actionID)
+
+        if len(appIDs) == 0:
+            self.stats.record("unmatched")
+            self.acknowledge(Delivery(event, 0))
+            return []
+
+        delivery = Delivery(event, len(appIDs))
+        return [Completion(delivery, appID) for appID in appIDs]
+
+    def send(self, group: List[Completion]) -> None:
+        self.inFlight.acquire()
+
+        # one call per offer, which completes it for every event in the group
+        calls: Dict[int, Completion] = dict()
+        for c in group:
+            calls.setdefault(c.appID, c)
+
+        try:
+            suggestedParams = self.paramsProvider.get()
+            txns: List[transaction.Transaction] = [
+                buildActionTxn(
+                    self.owner,
+                    c.appID,
+                    c.delivery.event.actionID,
+                    self.stateCache.fetch(self.client, c.appID),
+                    suggestedParams,
+                )
+                for c in calls.values()
+            ]
+            if len(txns) > 1:
+                for txn in txns:
+                    txn.group = None
+                transaction.assign_group_id(txns)
+
+            signedTxns = signTransactions(txns, self.owner, self.signer)
+
+            self.client.send_transactions(signedTxns)
+        except Exception as e:
+            self.inFlight.release()
+            self.fail(group, e)
+            return
+
+        self.stats.record("groups")
+        future = getConfirmationTracker(self.client).track(signedTxns[0].get_txid())
+        future.add_done_callback(lambda f: self.confirmed(group, f))
+
+    def confirmed(self, group: List[Completion], future: "Future[PendingTxnResponse]") -> None:
+        self.inFlight.release()
+
+        error = future.exception()
+        if error is not None:
+            self.fail(group, error)
+            return
+
+        for c in group:
+            state = self.stateCache.get(c.appID)
+            if state is not None:
+                state[b"status"] = int(OfferStatus.COMPLETED)
+                self.stateCache.put(c.appID, state)
+                customer = encoding.encode_address(state[b"customer_account"])
+                self.index.remove(c.appID, customer, c.delivery.event.actionID)
+
+            self.stats.record("completions")
+            self.resolve(c.delivery)
+
+    def fail(self, group: List[Completion], error: BaseException) -> None:
+        isolated = len(set(c.appID for c in group)) == 1
+        for c in group:
+            state = self.stateCache.get(c.appID)
+            if state is not None and state.get(b"status") == OfferStatus.COMPLETED:
+                # completed by an earlier call for another event
+                self.stats.record("completions")
+                self.resolve(c.delivery)
+                continue
+
+            # isolate calls from a rejected group before counting it against them
+            if isolated:
+                c.attempts += 1
+            if c.attempts < self.maxAttempts:
+                self.stats.record("retries")
+                self.retries.put(c)
+                continue
+
+            self.stats.record("failures")
+            c.delivery.failed = True
+            self.resolve(c.delivery)
+
+    def resolve(self, delivery: Delivery) -> None:
+        with self.outstandingLock:
+            delivery.remaining -= 1
+            done = delivery.remaining == 0
+        if done:
+            self.stats.recordLatency(time.monotonic() - delivery.receivedAt)
+            self.acknowledge(delivery)
+
+    def acknowledge(self, delivery: Delivery) -> None:
+        if self.onAck is not None:
+            self.onAck(delivery.event, not delivery.failed)
+        with self.outstandingLock:
+            self.outstanding -= 1
+            self.outstandingLock.notify_all()
+
+
+class StreamCheckpoint:
+    """Remembers how much of a line-numbered event stream has been acknowledged.
+
+    Events can be acknowledged out of order, so only the highest line number
+    below which every line is acknowledged is saved. After a restart, lines
+    after that point are delivered again.
+    """
+
+    def __init__(self, path: Optional[str]) -> None:
+        self.path = path
+        self.lock = threading.Lock()
+        self.line = 0
+        self.acked: Set[int] = set()
+
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                self.line = json.load(f)["line"]
+
+    def acknowledge(self, line: int) -> None:
+        with self.lock:
+            self.acked.add(line)
+            advanced = False
+            while self.line + 1 in self.acked:
+                self.line += 1
+                self.acked.discard(self.line)
+                advanced = True
+        if advanced:
+            self.save()
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+
+        with self.lock:
+            line = self.line
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmpPath = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"line": line}, f)
+        os.replace(tmpPath, self.path)
+
+
+def readEvents(
+    stream: TextIO,
+    skip: int = 0,
+    onBlank: Optional[Callable[[int], None]] = None,
+    onInvalid: Optional[Callable[[int, Exception], None]] = None,
+) -> Iterator[ActionEvent]:
+    """Parse JSON lines with customer and action_id fields into events.
+    Args:
+        stream: The event stream.
+        skip: The number of leading lines that were already acknowledged.
+        onBlank: Called with the line number of every blank line, which has
+            no event, so that a checkpoint can acknowledge it.
+        onInvalid: Called with the line number and the error of every line
+            that isn't a valid event. The line is skipped either way.
+    """
+    for line, text in enumerate(stream, start=1):
+        if line <= skip:
+            continue
+        if len(text.strip()) == 0:
+            if onBlank is not None:
+                onBlank(line)
+            continue
+        try:
+            record = json.loads(text)
+            event = ActionEvent(
+                customer=record["customer"], actionID=int(record["action_id"]), sequence=line
+            )
+        except (ValueError, KeyError, TypeError) as e:
+            if onInvalid is not None:
+                onInvalid(line, e)
+            continue
+        yield event
+
+
+def dispatchEvents(
+    dispatcher: ActionDispatcher,
+    events: Iterable[ActionEvent],
+    reportInterval: Optional[float] = None,
+    report: Callable[[Dict[str, Any]], None] = lambda r: None,
+) -> Dict[str, Any]:
+    """Feed events to a dispatcher until they run out, then drain it.
+    Returns:
+        The final statistics report of the dispatcher.
+    """
+    dispatcher.start()
+
+    lastReport = time.monotonic()
+    for event in events:
+        dispatcher.submit(event)
+        if reportInterval is not None and time.monotonic() - lastReport >= reportInterval:
+            report(dispatcher.stats.report())
+            lastReport = time.monotonic()
+
+    dispatcher.close()
+    return dispatcher.stats.report()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Complete loyalty offer actions from a JSONL stream of "
+        '{"customer": ..., "action_id": ...} events.'
+    )
+    parser.add_argument("--input", default="-", help="event file, or - for stdin")
+    parser.add_argument("--checkpoint", help="file that records acknowledged lines")
+    parser.add_argument("--ledger", help="offer ledger database to serve the offers of")
+    parser.add_argument(
+        "--app-id", type=int, action="append", default=[], help="offer app ID to serve"
+    )
+    parser.add_argument(
+        "--algod-address",
+        default=os.environ.get("ALGOD_ADDRESS", "http://localhost:4001"),
+        help="algod URL, or a comma separated list of nodes to fail over between",
+    )
+    parser.add_argument("--algod-token", default=os.environ.get("ALGOD_TOKEN", "a" * 64))
+    parser.add_argument("--group-size", type=int, default=MAX_GROUP_SIZE)
+    parser.add_argument("--max-in-flight", type=int, default=8)
+    parser.add_argument("--report-interval", type=float, default=10.0)
+    args = parser.parse_args(argv)
+
+    mnemonic = os.environ.get("LOYALTY_OWNER_MNEMONIC")
+    if not mnemonic:
+        parser.error("LOYALTY_OWNER_MNEMONIC must hold the offer creator's mnemonic")
+
+    client = createAlgodClient(args.algod_address, args.algod_token)
+    owner = Account.FromMnemonic(mnemonic)
+
+    stateCache = OfferLedger(args.ledger) if args.ledger else OfferStateCache()
+    for appID in args.app_id:
+        stateCache.fetch(client, appID)
+    index = OfferIndex.FromStateCache(stateCache)
+
+    checkpoint = StreamCheckpoint(args.checkpoint if args.input != "-" else None)
+
+    def report(r: Dict[str, Any]) -> None:
+        print(json.dumps(r), file=sys.stderr, flush=True)
+
+    def onInvalid(line: int, error: Exception) -> None:
+        # no event can ever come from it, so the checkpoint moves past it
+        report({"invalid_line": line, "error": repr(error)})
+        checkpoint.acknowledge(line)
+
+    def onAck(event: ActionEvent, ok: bool) -> None:
+        if ok:
+            checkpoint.acknowledge(event.sequence)
+        else:
+            # left unacknowledged, so the event is delivered again after a restart
+            report({"failed_line": event.sequence, "customer": event.customer})
+
+    dispatcher = ActionDispatcher(
+        client,
+        owner,
+        index,
+        stateCache,
+        groupSize=args.group_size,
+        maxInFlight=args.max_in_flight,
+        onAck=onAck,
+    )
+
+    stream = sys.stdin if args.input == "-" else open(args.input)
+    try:
+        final = dispatchEvents(
+            dispatcher,
+            readEvents(stream, checkpoint.line, checkpoint.acknowledge, onInvalid),
+            args.report_interval,
+            report,
+        )
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+    print(json.dumps(final))
+
+
+if __name__ == "__main__":
+    main()
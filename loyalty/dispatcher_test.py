@@ -0,0 +1,207 @@
+import io
+import json
+import threading
+
+from .dispatcher import (
+    ActionDispatcher,
+    ActionEvent,
+    OfferIndex,
+    StreamCheckpoint,
+    dispatchEvents,
+    readEvents,
+)
+from .operations import LoyaltyOffer, createLoyaltyOfferApps, setupLoyaltyOfferApp
+from .state import OfferStateCache, OfferStatus
+from .util import getAppGlobalState
+from .testing.setup import getAlgodClient
+from .testing.resources import (
+    createDummyAsset,
+    getCurrentTime,
+    getTemporaryAccount,
+    optInToAsset,
+    waitUntilTimestamp,
+)
+
+
+def test_readEvents_skips_acknowledged_lines():
+    stream = io.StringIO(
+        '{"customer": "A", "action_id": 1}\n'
+        "\n"
+        '{"customer": "B", "action_id": "2"}\n'
+        '{"customer": "C", "action_id": 3}\n'
+    )
+
+    assert list(readEvents(stream, skip=1)) == [
+        ActionEvent("B", 2, sequence=3),
+        ActionEvent("C", 3, sequence=4),
+    ]
+
+
+def test_checkpoint_only_advances_over_contiguous_acks(tmp_path):
+    path = str(tmp_path / "checkpoint.json")
+    checkpoint = StreamCheckpoint(path)
+
+    checkpoint.acknowledge(2)
+    checkpoint.acknowledge(3)
+    assert checkpoint.line == 0
+
+    checkpoint.acknowledge(1)
+    assert checkpoint.line == 3
+
+    with open(path) as f:
+        assert json.load(f) == {"line": 3}
+    assert StreamCheckpoint(path).line == 3
+
+
+def test_offer_index():
+    index = OfferIndex()
+    index.add(10, "A", 1)
+    index.add(11, "A", 1)
+    index.add(12, "A", 2)
+
+    assert index.lookup("A", 1) == [10, 11]
+    assert len(index) == 3
+
+    index.remove(10, "A", 1)
+    assert index.lookup("A", 1) == [11]
+    assert index.lookup("B", 1) == []
+
+
+def test_readEvents_reports_blank_lines(tmp_path):
+    stream = io.StringIO(
+        '{"customer": "A", "action_id": 1}\n' "\n" "  \n" '{"customer": "B", "action_id": 2}\n'
+    )
+    checkpoint = StreamCheckpoint(str(tmp_path / "checkpoint.json"))
+
+    events = list(readEvents(stream, onBlank=checkpoint.acknowledge))
+    for event in events:
+        checkpoint.acknowledge(event.sequence)
+
+    assert [event.sequence for event in events] == [1, 4]
+    assert checkpoint.line == 4
+
+
+def test_readEvents_skips_invalid_lines():
+    stream = io.StringIO(
+        '{"customer": "A", "action_id": 1}\n'
+        "not json\n"
+        '{"customer": "B"}\n'
+        '{"customer": "C", "action_id": "x"}\n'
+        "[1, 2]\n"
+        '{"customer": "D", "action_id": 4}\n'
+    )
+    invalid = []
+
+    events = list(readEvents(stream, onInvalid=lambda line, e: invalid.append(line)))
+
+    assert events == [ActionEvent("A", 1, sequence=1), ActionEvent("D", 4, sequence=6)]
+    assert invalid == [2, 3, 4, 5]
+
+
+def test_dispatcher_coalesces_events_per_offer():
+    client = getAlgodClient()
+
+    creator = getTemporaryAccount(client)
+    customer = getTemporaryAccount(client)
+    tokenID = createDummyAsset(client, 1_000, creator)
+    optInToAsset(client, tokenID, customer)
+
+    startTime = getCurrentTime(client) + 10
+    offers = [
+        LoyaltyOffer(
+            customer=customer.getAddress(),
+            startTime=startTime,
+            endTime=startTime + 300,
+            rewardAssetID=tokenID,
+            rewardAmount=10,
+            actionID=actionID,
+        )
+        for actionID in (101, 101, 102)
+    ]
+    stateCache = OfferStateCache()
+    appIDs = [result.appID for result in createLoyaltyOfferApps(client, creator, offers)]
+    for appID in appIDs:
+        setupLoyaltyOfferApp(client, appID, creator, tokenID, 10, stateCache=stateCache)
+        stateCache.fetch(client, appID)
+
+    waitUntilTimestamp(client, startTime + 5)
+
+    acks = []
+    dispatcher = ActionDispatcher(
+        client,
+        creator,
+        OfferIndex.FromStateCache(stateCache),
+        stateCache,
+        maxDelay=60,
+        onAck=lambda event, ok: acks.append((event.sequence, ok)),
+    )
+    events = [
+        ActionEvent(customer.getAddress(), 101, sequence=1),
+        ActionEvent(customer.getAddress(), 101, sequence=2),
+        ActionEvent(customer.getAddress(), 102, sequence=3),
+    ]
+    report = dispatchEvents(dispatcher, events)
+
+    # both events for action 101 complete the same two offers with one call each
+    assert sorted(acks) == [(1, True), (2, True), (3, True)]
+    assert report["groups"] == 1
+    assert report["failures"] == 0
+    for appID in appIDs:
+        assert getAppGlobalState(client, appID)[b"status"] == OfferStatus.COMPLETED
+
+
+def test_dispatcher_isolates_failing_offer():
+    client = getAlgodClient()
+
+    creator = getTemporaryAccount(client)
+    customer = getTemporaryAccount(client)
+    tokenID = createDummyAsset(client, 1_000, creator)
+    optInToAsset(client, tokenID, customer)
+
+    startTime = getCurrentTime(client) + 10
+    offers = [
+        LoyaltyOffer(
+            customer=customer.getAddress(),
+            startTime=startTime,
+            endTime=startTime + 300,
+            rewardAssetID=tokenID,
+            rewardAmount=10,
+            actionID=actionID,
+        )
+        for actionID in (101, 102)
+    ]
+    stateCache = OfferStateCache()
+    goodID, badID = [result.appID for result in createLoyaltyOfferApps(client, creator, offers)]
+    # the second offer is never set up, so completing it is rejected
+    setupLoyaltyOfferApp(client, goodID, creator, tokenID, 10, stateCache=stateCache)
+    stateCache.fetch(client, goodID)
+    stateCache.fetch(client, badID)
+
+    waitUntilTimestamp(client, startTime + 5)
+
+    acks = []
+    dispatcher = ActionDispatcher(
+        client,
+        creator,
+        OfferIndex.FromStateCache(stateCache),
+        stateCache,
+        maxDelay=60,
+        onAck=lambda event, ok: acks.append((event.sequence, ok)),
+    )
+    events = [
+        ActionEvent(customer.getAddress(), 101, sequence=1),
+        ActionEvent(customer.getAddress(), 102, sequence=2),
+    ]
+    reports = []
+    thread = threading.Thread(
+        target=lambda: reports.append(dispatchEvents(dispatcher, events)), daemon=True
+    )
+    thread.start()
+    thread.join(timeout=30)
+    assert not thread.is_alive(), "dispatcher never acknowledged every event"
+
+    assert sorted(acks) == [(1, True), (2, False)]
+    assert reports[0]["completions"] == 1
+    assert reports[0]["failures"] == 1
+    assert getAppGlobalState(client, goodID)[b"status"] == OfferStatus.COMPLETED
+    assert getAppGlobalState(client, badID)[b"status"] != OfferStatus.COMPLETED
@@ -0,0 +1,390 @@
+"""Follows the chain block by block and reports what happens to offers.
+
+OfferFollower reads every block in order and picks out the creation, calls
+and deletion of offer apps. It keeps the state of each offer current from the
+global state deltas in the blocks, so following any number of offers costs a
+status_after_block and a block_info call per round, and never reads the state
+of an offer from algod.
+
+Subscribers receive an OfferEvent when an offer is created, set up, completed,
+closed, or when it expires without being completed. The last round whose
+events were delivered can be saved to a checkpoint file, so a restarted
+follower carries on from the next round.
+"""
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+from enum import Enum
+import argparse
+import heapq
+import json
+import os
+import sys
+import tempfile
+import threading
+
+from algosdk import encoding
+from algosdk.error import AlgodHTTPError
+from algosdk.v2client.algod import AlgodClient
+
+from .operations import getContracts
+from .scanner import scanOffers
+from .state import AppState, OfferState, OfferStateCache, OfferStatus, OFFER_STATE_FIELDS
+from .transport import createAlgodClient
+from .util import decodeBlock, decodeBlockStateDelta, getBlockTxID, rawBytes
+
+# on-completion value of an app call that deletes the app
+DELETE_APPLICATION = 5
+
+# seconds to wait before retrying after an error, when errors are reported to a callback
+RETRY_INTERVAL = 1.0
+
+
+class OfferEventType(Enum):
+    CREATED = "created"
+    # the setup call funded the offer
+    SETUP = "setup"
+    # the action was completed and the reward paid out
+    COMPLETED = "completed"
+    # the app was deleted
+    CLOSED = "closed"
+    # the offer ended without being completed
+    EXPIRED = "expired"
+
+
+class OfferEvent(NamedTuple):
+    type: OfferEventType
+    appID: int
+    round: int
+    # the timestamp of the block
+    timestamp: int
+    # the offer's state after the event; for CLOSED, its state before the delete
+    state: OfferState
+    # the transaction that caused the event; None for EXPIRED and for inner transactions
+    txID: Optional[str] = None
+    sender: Optional[str] = None
+
+    def asDict(self) -> Dict[str, Any]:
+        return {
+            "type": self.type.value,
+            "app_id": self.appID,
+            "round": self.round,
+            "timestamp": self.timestamp,
+            "status": self.state.status.name,
+            "tx_id": self.txID,
+            "sender": self.sender,
+        }
+
+
+Subscriber = Callable[[OfferEvent], None]
+
+
+class RoundCheckpoint:
+    """Remembers the last round whose events were all delivered."""
+
+    def __init__(self, path: Optional[str]) -> None:
+        self.path = path
+        self.round: Optional[int] = None
+
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                self.round = json.load(f)["round"]
+
+    def save(self, round: int) -> None:
+        self.round = round
+        if self.path is None:
+            return
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmpPath = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"round": round}, f)
+        os.replace(tmpPath, self.path)
+
+
+def getAppState(state: OfferState) -> AppState:
+    """Decode every field of an offer state into an AppState."""
+    appState: AppState = dict()
+    for slot, key in OFFER_STATE_FIELDS.items():
+        try:
+            appState[key] = state.field(slot)
+        except KeyError:
+            pass
+    return appState
+
+
+class OfferFollower:
+    """Turns the blocks of a chain into offer events.
+
+    Offers created in the rounds that are followed are picked up on their own.
+    Offers created earlier must be added with track, e.g. with the results of
+    scanOffers, to get events for them.
+
+    Args:
+        client: An algod client.
+        startRound: The first round to read. Defaults to the round after the
+            checkpoint, or to the round after the latest one if there is no
+            checkpoint.
+        checkpoint: A file that records the last round whose events were
+            delivered.
+        approval: The compiled offer approval program. Defaults to the program
+            returned by getContracts.
+        stateCache: The cache the offer states are kept in. Pass the cache of
+            another component to keep it current too.
+    """
+
+    def __init__(
+        self,
+        client: AlgodClient,
+        startRound: Optional[int] = None,
+        checkpoint: Optional[str] = None,
+        approval: Optional[bytes] = None,
+        stateCache: Optional[OfferStateCache] = None,
+    ) -> None:
+        if approval is None:
+            approval, _ = getContracts(client)
+
+        self.client = client
+        self.approval = approval
+        self.states = stateCache or OfferStateCache()
+        self.checkpoint = RoundCheckpoint(checkpoint)
+
+        if startRound is None:
+            if self.checkpoint.round is not None:
+                startRound = self.checkpoint.round + 1
+            else:
+                startRound = client.status()["last-round"] + 1
+        self.nextRound = startRound
+
+        self.creators: Dict[int, str] = dict()
+        # (end time, app ID) of the offers that may still expire
+        self.endTimes: List[Tuple[int, int]] = []
+        self.expired: Set[int] = set()
+
+        self.subscribersLock = threading.Lock()
+        self.subscribers: List[Tuple[Subscriber, Optional[Set[OfferEventType]]]] = []
+
+        self.stop = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def subscribe(
+        self, callback: Subscriber, types: Optional[Iterable[OfferEventType]] = None
+    ) -> None:
+        """Call callback with every event, or only with the events of the given types.
+        Callbacks run on the thread following the chain, in order of the events.
+        """
+        with self.subscribersLock:
+            self.subscribers = self.subscribers + [
+                (callback, set(types) if types is not None else None)
+            ]
+
+    def unsubscribe(self, callback: Subscriber) -> None:
+        with self.subscribersLock:
+            self.subscribers = [(cb, types) for cb, types in self.subscribers if cb is not callback]
+
+    def track(self, states: Iterable[OfferState]) -> None:
+        """Follow offers created before the rounds that are followed."""
+        for state in states:
+            if state.appID is None:
+                raise Exception("Only offer states with an app ID can be tracked")
+            self.states.put(state.appID, getAppState(state))
+            if state.creator is not None:
+                self.creators[state.appID] = state.creator
+            heapq.heappush(self.endTimes, (state.endTime, state.appID))
+
+    def getState(self, appID: int) -> OfferState:
+        offerState = OfferState.FromAppState(self.states.get(appID) or {}, appID)
+        offerState.creator = self.creators.get(appID)
+        return offerState
+
+    def processBlock(self, block: Dict[str, Any]) -> List[OfferEvent]:
+        """Update the offer states with a block and get its events.
+        Args:
+            block: The decoded "block" field of a msgpack block_info response.
+        """
+        round = block.get("rnd", 0)
+        timestamp = block.get("ts", 0)
+
+        events: List[OfferEvent] = []
+        for entry in block.get("txns", []):
+            self.processTxn(entry, block, True, events)
+
+        # from the next round on, the contract sees this timestamp and rejects actions
+        while len(self.endTimes) > 0 and self.endTimes[0][0] <= timestamp:
+            _, appID = heapq.heappop(self.endTimes)
+            state = self.states.get(appID)
+            if state is None or appID in self.expired:
+                continue
+            if state.get(b"status") == OfferStatus.COMPLETED:
+                continue
+            self.expired.add(appID)
+            events.append(
+                OfferEvent(OfferEventType.EXPIRED, appID, round, timestamp, self.getState(appID))
+            )
+
+        return events
+
+    def processTxn(
+        self,
+        entry: Dict[str, Any],
+        block: Dict[str, Any],
+        topLevel: bool,
+        events: List[OfferEvent],
+    ) -> None:
+        txn = entry["txn"]
+        applyData = entry.get("dt", {})
+
+        if txn.get("type") == "appl":
+            round = block.get("rnd", 0)
+            timestamp = block.get("ts", 0)
+            sender = encoding.encode_address(txn["snd"])
+            appID = txn.get("apid", 0)
+            delta = decodeBlockStateDelta(applyData.get("gd"))
+
+            def event(eventType: OfferEventType, eventAppID: int) -> None:
+                events.append(
+                    OfferEvent(
+                        eventType,
+                        eventAppID,
+                        round,
+                        timestamp,
+                        self.getState(eventAppID),
+                        # only hashed for the few transactions that make an event
+                        getBlockTxID(entry, block) if topLevel else None,
+                        sender,
+                    )
+                )
+
+            if appID == 0:
+                createdID = entry.get("apid", 0)
+                if createdID != 0 and rawBytes(txn.get("apap", b"")) == self.approval:
+                    state = {key: value for key, value in delta.items() if value is not None}
+                    self.states.put(createdID, state)
+                    self.creators[createdID] = sender
+                    end = state.get(b"end")
+                    # the contract stores the end time as a uint
+                    if isinstance(end, int):
+                        heapq.heappush(self.endTimes, (end, createdID))
+                    event(OfferEventType.CREATED, createdID)
+            elif appID in self.states:
+                if txn.get("apan", 0) == DELETE_APPLICATION:
+                    event(OfferEventType.CLOSED, appID)
+                    self.states.remove(appID)
+                    self.creators.pop(appID, None)
+                    self.expired.discard(appID)
+                else:
+                    before = (self.states.get(appID) or {}).get(b"status")
+                    self.states.update(appID, delta)
+                    after = (self.states.get(appID) or {}).get(b"status")
+                    if after != before and after == OfferStatus.FUNDED:
+                        event(OfferEventType.SETUP, appID)
+                    elif after != before and after == OfferStatus.COMPLETED:
+                        event(OfferEventType.COMPLETED, appID)
+
+        # app calls made by other apps
+        for inner in applyData.get("itx", []):
+            self.processTxn(inner, block, False, events)
+
+    def notify(self, events: List[OfferEvent]) -> None:
+        subscribers = self.subscribers
+        for event in events:
+            for callback, types in subscribers:
+                if types is None or event.type in types:
+                    callback(event)
+
+    def processRound(self, round: int) -> List[OfferEvent]:
+        """Read a round, deliver its events and checkpoint it."""
+        try:
+            raw = self.client.block_info(round, response_format="msgpack")
+        except AlgodHTTPError as e:
+            if e.code == 404:
+                raise Exception(
+                    "Round {} is not available from algod; it may be too old for a "
+                    "non-archival node".format(round)
+                ) from e
+            raise
+
+        events = self.processBlock(decodeBlock(raw))
+        self.notify(events)
+        self.checkpoint.save(round)
+        self.nextRound = round + 1
+        return events
+
+    def poll(self) -> List[OfferEvent]:
+        """Wait for the next round, then process every round up to the latest one.
+        Returns:
+            The events delivered.
+        """
+        status = self.client.status_after_block(self.nextRound - 1)
+
+        events: List[OfferEvent] = []
+        while self.nextRound <= status["last-round"] and not self.stop.is_set():
+            events.extend(self.processRound(self.nextRound))
+        return events
+
+    def run(self, onError: Optional[Callable[[Exception], None]] = None) -> None:
+        """Follow the chain until close is called.
+        Args:
+            onError: Receives the errors raised while following, after which
+                the round is retried. If None, errors end the loop.
+        """
+        while not self.stop.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                if onError is None:
+                    raise
+                onError(e)
+                self.stop.wait(RETRY_INTERVAL)
+
+    def start(self, onError: Optional[Callable[[Exception], None]] = None) -> None:
+        """Follow the chain from a background thread."""
+        if self.thread is not None:
+            raise Exception("The follower is already running")
+        self.stop.clear()
+        self.thread = threading.Thread(
+            target=self.run, args=(onError,), name="loyalty-offer-follower", daemon=True
+        )
+        self.thread.start()
+
+    def close(self) -> None:
+        """Stop following. Waits for the round being processed to finish."""
+        self.stop.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Print loyalty offer events as JSON lines, following the chain."
+    )
+    parser.add_argument(
+        "--creator", action="append", default=[], help="address whose existing offers are followed"
+    )
+    parser.add_argument(
+        "--algod-address",
+        default=os.environ.get("ALGOD_ADDRESS", "http://localhost:4001"),
+        help="algod URL, or a comma separated list of nodes to fail over between",
+    )
+    parser.add_argument("--algod-token", default=os.environ.get("ALGOD_TOKEN", "a" * 64))
+    parser.add_argument("--checkpoint", help="file that records the last delivered round")
+    parser.add_argument("--start-round", type=int, help="first round to read")
+    args = parser.parse_args(argv)
+
+    client = createAlgodClient(args.algod_address, args.algod_token)
+    follower = OfferFollower(client, startRound=args.start_round, checkpoint=args.checkpoint)
+    if len(args.creator) > 0:
+        follower.track(scanOffers(client, args.creator))
+
+    follower.subscribe(lambda event: print(json.dumps(event.asDict()), flush=True))
+
+    def printError(e: Exception) -> None:
+        print("error: {}".format(e), file=sys.stderr, flush=True)
+
+    try:
+        follower.run(printError)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+from .follower import OfferEventType, OfferFollower
+from .operations import (
+    LoyaltyOffer,
+    createLoyaltyOfferApps,
+    setupLoyaltyOfferApp,
+    completeAction,
+    closeLoyaltyOffer,
+)
+from .scanner import scanOffers
+from .state import OfferStatus
+from .testing.setup import getAlgodClient
+from .testing.resources import (
+    getTemporaryAccount,
+    optInToAsset,
+    createDummyAsset,
+    getCurrentTime,
+    waitUntilTimestamp,
+)
+
+
+def test_follow_offer_lifecycles(tmp_path):
+    client = getAlgodClient()
+
+    creator = getTemporaryAccount(client)
+    customer = getTemporaryAccount(client)
+    tokenID = createDummyAsset(client, 1_000, creator)
+    optInToAsset(client, tokenID, customer)
+
+    startRound = client.status()["last-round"] + 1
+    checkpoint = str(tmp_path / "follower.json")
+
+    startTime = getCurrentTime(client) + 10
+    endTime = startTime + 10
+    offers = [
+        # completed
+        LoyaltyOffer(customer.getAddress(), startTime, endTime, tokenID, 10, 1),
+        # expires without being completed
+        LoyaltyOffer(customer.getAddress(), startTime, endTime, tokenID, 20, 2),
+    ]
+    completedID, expiredID = [
+        result.appID for result in createLoyaltyOfferApps(client, creator, offers)
+    ]
+    for appID, offer in zip((completedID, expiredID), offers):
+        setupLoyaltyOfferApp(client, appID, creator, tokenID, offer.rewardAmount)
+
+    waitUntilTimestamp(client, startTime)
+    completeAction(client, creator, completedID, 1)
+    waitUntilTimestamp(client, endTime)
+    closeLoyaltyOffer(client, expiredID, creator)
+    lastRound = client.status()["last-round"]
+
+    follower = OfferFollower(client, startRound=startRound, checkpoint=checkpoint)
+    events = []
+    follower.subscribe(events.append)
+    completions = []
+    follower.subscribe(completions.append, types=[OfferEventType.COMPLETED])
+
+    while follower.nextRound <= lastRound:
+        follower.poll()
+
+    byOffer = {
+        appID: [event.type for event in events if event.appID == appID]
+        for appID in (completedID, expiredID)
+    }
+    assert byOffer[completedID] == [
+        OfferEventType.CREATED,
+        OfferEventType.SETUP,
+        OfferEventType.COMPLETED,
+    ]
+    assert byOffer[expiredID] == [
+        OfferEventType.CREATED,
+        OfferEventType.SETUP,
+        OfferEventType.EXPIRED,
+        OfferEventType.CLOSED,
+    ]
+
+    assert [event.appID for event in completions] == [completedID]
+    completion = completions[0]
+    assert completion.state.status == OfferStatus.COMPLETED
+    assert completion.state.creator == creator.getAddress()
+    assert completion.sender == creator.getAddress()
+    # the transaction ID is rebuilt from the block
+    txnInfo = client.pending_transaction_info(completion.txID)
+    assert txnInfo["confirmed-round"] == completion.round
+
+    expired = [event for event in events if event.type == OfferEventType.EXPIRED][0]
+    assert expired.txID is None
+    assert expired.timestamp >= endTime
+
+    assert len(follower.states) == 1
+    assert completedID in follower.states
+
+    # a new follower carries on after the checkpointed round
+    resumed = OfferFollower(client, checkpoint=checkpoint)
+    assert resumed.nextRound == follower.nextRound
+
+
+def test_track_existing_offers():
+    client = getAlgodClient()
+
+    creator = getTemporaryAccount(client)
+    customer = getTemporaryAccount(client)
+    tokenID = createDummyAsset(client, 1_000, creator)
+    optInToAsset(client, tokenID, customer)
+
+    startTime = getCurrentTime(client) + 10
+    offer = LoyaltyOffer(customer.getAddress(), startTime, startTime + 10, tokenID, 10, 1)
+    [result] = createLoyaltyOfferApps(client, creator, [offer])
+    setupLoyaltyOfferApp(client, result.appID, creator, tokenID, offer.rewardAmount)
+
+    # offers created before the first followed round are only seen once tracked
+    follower = OfferFollower(client)
+    follower.track(scanOffers(client, creator.getAddress()))
+    events = []
+    follower.subscribe(events.append)
+
+    waitUntilTimestamp(client, startTime)
+    completeAction(client, creator, result.appID, 1)
+    lastRound = client.status()["last-round"]
+    while follower.nextRound <= lastRound:
+        follower.poll()
+
+    assert [(event.type, event.appID) for event in events] == [
+        (OfferEventType.COMPLETED, result.appID)
+    ]
@@ -0,0 +1,171 @@
+"""A short-lived cache of account holdings, fetched in bulk.
+
+An offer can only pay out if its customer has opted in to the reward asset.
+Checking that one account at a time costs a round trip per customer, so the
+HoldingsCache fetches the account_info of many accounts concurrently and keeps
+their balances for a few seconds, long enough to check a batch of offers
+before any fees are spent on them.
+"""
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+import weakref
+
+from algosdk.v2client.algod import AlgodClient
+
+if TYPE_CHECKING:
+    from .operations import LoyaltyOffer
+
+# seconds an account's holdings are served from the cache, about one round
+DEFAULT_TTL = 5.0
+
+DEFAULT_MAX_WORKERS = 8
+
+
+def decodeBalances(accountInfo: Dict[str, Any]) -> Dict[int, int]:
+    """Get the balances of an account_info response, keyed by asset ID.
+    Key 0 is the Algo balance. Every asset the account has opted in to has a
+    key, even if its balance is 0.
+    """
+    balances: Dict[int, int] = dict()
+
+    # set key 0 to Algo balance
+    balances[0] = accountInfo["amount"]
+
+    assets: List[Dict[str, Any]] = accountInfo.get("assets", [])
+    for assetHolding in assets:
+        assetID = assetHolding["asset-id"]
+        amount = assetHolding["amount"]
+        balances[assetID] = amount
+
+    return balances
+
+
+class HoldingsCache:
+    """Caches the balances of accounts for a short time.
+
+    Args:
+        client: An algod client.
+        ttl: Seconds an account's balances are served from the cache.
+        maxWorkers: The maximum number of concurrent account_info requests.
+    """
+
+    def __init__(
+        self,
+        client: AlgodClient,
+        ttl: float = DEFAULT_TTL,
+        maxWorkers: int = DEFAULT_MAX_WORKERS,
+    ) -> None:
+        self.client = client
+        self.ttl = ttl
+        self.maxWorkers = maxWorkers
+        self.lock = threading.Lock()
+        # address -> (monotonic time fetched, balances)
+        self.entries: Dict[str, Tuple[float, Dict[int, int]]] = dict()
+
+    def cached(self, address: str) -> Optional[Dict[int, int]]:
+        with self.lock:
+            entry = self.entries.get(address)
+        if entry is None or time.monotonic() - entry[0] >= self.ttl:
+            return None
+        return entry[1]
+
+    def fetch(self, address: str) -> Dict[int, int]:
+        fetchedAt = time.monotonic()
+        balances = decodeBalances(self.client.account_info(address))
+        with self.lock:
+            self.entries[address] = (fetchedAt, balances)
+        return balances
+
+    def prefetch(self, addresses: Iterable[str]) -> None:
+        """Fetch the balances of every account that isn't cached, concurrently."""
+        missing = [
+            address for address in dict.fromkeys(addresses) if self.cached(address) is None
+        ]
+        if len(missing) <= 1:
+            for address in missing:
+                self.fetch(address)
+            return
+
+        with ThreadPoolExecutor(max_workers=min(self.maxWorkers, len(missing))) as executor:
+            # list() raises the first error, if any
+            list(executor.map(self.fetch, missing))
+
+    def getBalances(self, address: str) -> Dict[int, int]:
+        """Get the balances of an account, keyed by asset ID, with 0 for Algo."""
+        balances = self.cached(address)
+        if balances is None:
+            balances = self.fetch(address)
+        return dict(balances)
+
+    def isOptedIn(self, address: str, assetID: int) -> bool:
+        """Tell whether an account can receive an asset. Any account can receive Algo."""
+        if assetID == 0:
+            return True
+        balances = self.cached(address)
+        if balances is None:
+            balances = self.fetch(address)
+        return assetID in balances
+
+    def invalidate(self, addresses: Optional[Iterable[str]] = None) -> None:
+        """Forget the balances of some accounts, or of all of them."""
+        with self.lock:
+            if addresses is None:
+                self.entries.clear()
+                return
+            for address in addresses:
+                self.entries.pop(address, None)
+
+
+def optInErrors(
+    holdings: HoldingsCache, offers: Sequence["LoyaltyOffer"]
+) -> List[Optional[Exception]]:
+    """Check that the customer of every offer has opted in to its reward asset.
+    The holdings of all customers are prefetched at once.
+    Returns:
+        One entry per offer: None if its customer has opted in, else the error.
+    """
+    holdings.prefetch(offer.customer for offer in offers)
+
+    errors: List[Optional[Exception]] = []
+    for offer in offers:
+        if holdings.isOptedIn(offer.customer, offer.rewardAssetID):
+            errors.append(None)
+        else:
+            errors.append(
+                Exception(
+                    "Customer {} has not opted in to asset {}".format(
+                        offer.customer, offer.rewardAssetID
+                    )
+                )
+            )
+    return errors
+
+
+def splitByOptIn(
+    holdings: HoldingsCache, offers: Sequence["LoyaltyOffer"]
+) -> Tuple[List["LoyaltyOffer"], List["LoyaltyOffer"]]:
+    """Split offers into those whose customer has opted in to the reward asset
+    and those whose customer hasn't, which could never pay out.
+    """
+    errors = optInErrors(holdings, offers)
+    ready = [offer for offer, error in zip(offers, errors) if error is None]
+    unfundable = [offer for offer, error in zip(offers, errors) if error is not None]
+    return ready, unfundable
+
+
+holdingsCaches: "weakref.WeakKeyDictionary[AlgodClient, HoldingsCache]" = (
+    weakref.WeakKeyDictionary()
+)
+holdingsCachesLock = threading.Lock()
+
+
+def getHoldingsCache(client: AlgodClient) -> HoldingsCache:
+    """Get the holdings cache shared by all users of a client."""
+    with holdingsCachesLock:
+        holdings = holdingsCaches.get(client)
+        if holdings is None:
+            holdings = HoldingsCache(weakref.proxy(client))
+            holdingsCaches[client] = holdings
+        return holdings
@@ -0,0 +1,73 @@
+from .holdings import HoldingsCache, splitByOptIn
+from .operations import LoyaltyOffer
+from .util import getBalances
+from .testing.setup import getAlgodClient
+from .testing.resources import (
+    createDummyAsset,
+    getTemporaryAccount,
+    optInAccountsToAsset,
+    payAccount,
+)
+
+
+def countAccountInfo(client):
+    calls = []
+    accountInfo = client.account_info
+
+    def countingAccountInfo(address, *args, **kwargs):
+        calls.append(address)
+        return accountInfo(address, *args, **kwargs)
+
+    client.account_info = countingAccountInfo
+    return calls
+
+
+def test_prefetch():
+    client = getAlgodClient()
+    creator = getTemporaryAccount(client)
+    tokenID = createDummyAsset(client, 1_000, creator)
+    accounts = [getTemporaryAccount(client) for _ in range(5)]
+    optInAccountsToAsset(client, tokenID, accounts[:3])
+
+    calls = countAccountInfo(client)
+    holdings = HoldingsCache(client, ttl=60)
+
+    addresses = [a.getAddress() for a in accounts]
+    holdings.prefetch(addresses + addresses[:2])
+    assert sorted(calls) == sorted(addresses)
+
+    assert [holdings.isOptedIn(address, tokenID) for address in addresses] == [
+        True,
+        True,
+        True,
+        False,
+        False,
+    ]
+    assert all(holdings.isOptedIn(address, 0) for address in addresses)
+    assert getBalances(client, addresses[0], holdings)[tokenID] == 0
+    assert len(calls) == len(addresses)
+
+    # cached balances are served until the account is invalidated
+    before = getBalances(client, addresses[0], holdings)[0]
+    payAccount(client, creator, addresses[0], 1_000)
+    assert getBalances(client, addresses[0], holdings)[0] == before
+    holdings.invalidate([addresses[0]])
+    assert getBalances(client, addresses[0], holdings)[0] == before + 1_000
+    assert len(calls) == len(addresses) + 1
+
+
+def test_splitByOptIn():
+    client = getAlgodClient()
+    creator = getTemporaryAccount(client)
+    tokenID = createDummyAsset(client, 1_000, creator)
+    customers = [getTemporaryAccount(client) for _ in range(2)]
+    optInAccountsToAsset(client, tokenID, customers[:1])
+
+    offers = [
+        LoyaltyOffer(customer.getAddress(), 1, 2, tokenID, 10, 101) for customer in customers
+    ]
+    algoOffer = offers[1]._replace(rewardAssetID=0)
+
+    ready, unfundable = splitByOptIn(HoldingsCache(client), offers + [algoOffer])
+    assert ready == [offers[0], algoOffer]
+    assert unfundable == [offers[1]]
@@ -0,0 +1,360 @@
+"""A crash-safe journal of submitted transaction groups.
+
+A SubmissionJournal attached to a SubmissionScheduler appends a line for every
+transaction group before it is sent, with its signed transactions, their IDs
+and validity window, and another once the group is confirmed or has failed.
+Each line is flushed to disk before the scheduler goes on. If the process
+dies, the groups that were in flight are exactly the entries without an
+outcome, and recover() resolves all of them at once:
+
+- groups that algod still remembers are settled with pending_transaction_info,
+- the others are looked for in the blocks of their validity windows only,
+- groups that were not found and can still confirm are sent again, which
+  costs no fees if they were confirmed after all, and the rest are expired.
+
+    journal = SubmissionJournal("campaign.journal")
+    getSubmissionScheduler(client).journal = journal
+    journal.recover(client)
+    for key, offer in campaign:
+        if journal.status(key) != CONFIRMED:
+            ...  # submit with key=key
+"""
+from typing import Any, Dict, List, NamedTuple, Optional, Set, Tuple
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import tempfile
+import threading
+
+from algosdk import encoding
+from algosdk.error import AlgodHTTPError
+from algosdk.future import transaction
+from algosdk.v2client.algod import AlgodClient
+
+from .scheduler import Submission, SubmissionScheduler, getSubmissionScheduler
+from .util import PendingTxnResponse, decodeBlock, getBlockTxID
+
+# the outcomes of a journaled group
+PENDING = "pending"
+CONFIRMED = "confirmed"
+FAILED = "failed"
+EXPIRED = "expired"
+# sent again by recover, as a new entry
+RESENT = "resent"
+# not found in the blocks algod still serves
+UNKNOWN = "unknown"
+
+DEFAULT_MAX_WORKERS = 8
+
+
+class JournalEntry(NamedTuple):
+    """A transaction group as it was last sent."""
+
+    id: int
+    key: Optional[str]
+    txIDs: List[str]
+    trackIndex: int
+    firstValid: int
+    lastValid: int
+    # msgpack and base64 encoded signed transactions
+    group: List[str]
+
+    def signedTxns(self) -> List[transaction.SignedTransaction]:
+        return [encoding.future_msgpack_decode(stxn) for stxn in self.group]
+
+
+class Recovery(NamedTuple):
+    """How recover settled an entry that was in flight."""
+
+    entry: JournalEntry
+    status: str
+    confirmedRound: Optional[int] = None
+    # the submission of a group that was sent again
+    submission: Optional[Submission] = None
+
+
+class SubmissionJournal:
+    """An append-only file of submitted transaction groups and their outcomes.
+
+    Args:
+        path: The journal file. It is created if it doesn't exist, and read
+            back if it does.
+        sync: If True, every line is fsynced before the group is sent.
+    """
+
+    def __init__(self, path: str, sync: bool = True) -> None:
+        self.path = path
+        self.sync = sync
+        self.lock = threading.Lock()
+        self.nextID = 1
+        self.entries: Dict[int, JournalEntry] = dict()
+        # key -> outcome of the last entry with that key
+        self.outcomes: Dict[str, str] = dict()
+
+        if os.path.exists(path):
+            self.load()
+        self.file = open(path, "a")
+
+    def load(self) -> None:
+        with open(self.path) as f:
+            lines = f.read().splitlines()
+
+        for i, line in enumerate(lines):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                if i == len(lines) - 1:
+                    # a line cut short by a crash
+                    break
+                raise Exception("Corrupt journal line {} in {}".format(i + 1, self.path))
+            self.replay(record)
+
+    def replay(self, record: Dict[str, Any]) -> None:
+        if record["type"] == "outcome":
+            self.outcomes[record["key"]] = record["status"]
+            return
+
+        entryID = record["id"]
+        self.nextID = max(self.nextID, entryID + 1)
+
+        if record["type"] == "submit":
+            entry = JournalEntry(
+                id=entryID,
+                key=record.get("key"),
+                txIDs=record["txids"],
+                trackIndex=record["track_index"],
+                firstValid=record["first_valid"],
+                lastValid=record["last_valid"],
+                group=record["group"],
+            )
+            self.entries[entryID] = entry
+            if entry.key is not None:
+                self.outcomes[entry.key] = PENDING
+        else:
+            finished: Optional[JournalEntry] = self.entries.pop(entryID, None)
+            if finished is not None and finished.key is not None:
+                self.outcomes[finished.key] = record["status"]
+
+    def append(self, record: Dict[str, Any]) -> None:
+        # called with the lock held
+        self.file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self.file.flush()
+        if self.sync:
+            os.fsync(self.file.fileno())
+        self.replay(record)
+
+    def close(self) -> None:
+        with self.lock:
+            self.file.close()
+
+    def pending(self) -> List[JournalEntry]:
+        """Get the groups that were sent without a known outcome, oldest first."""
+        with self.lock:
+            return sorted(self.entries.values(), key=lambda entry: entry.id)
+
+    def status(self, key: str) -> Optional[str]:
+        """Get the outcome of the last group submitted with a key, or None if there is none."""
+        with self.lock:
+            return self.outcomes.get(key)
+
+    def recordSubmit(self, submission: Submission) -> None:
+        """Record a group before it is sent. A group sent again unchanged is
+        not recorded again; a rebuilt group replaces the one it was built from.
+        """
+        txIDs = submission.txIDs()
+        with self.lock:
+            if submission.journalID is None:
+                submission.journalID = self.nextID
+            else:
+                entry = self.entries.get(submission.journalID)
+                if entry is not None and entry.txIDs == txIDs:
+                    return
+
+            self.append(
+                {
+                    "type": "submit",
+                    "id": submission.journalID,
+                    "key": submission.key,
+                    "txids": txIDs,
+                    "track_index": submission.trackIndex,
+                    "first_valid": max(
+                        stxn.transaction.first_valid_round for stxn in submission.signedTxns
+                    ),
+                    "last_valid": submission.lastValid(),
+                    "group": [encoding.msgpack_encode(stxn) for stxn in submission.signedTxns],
+                }
+            )
+
+    def recordOutcome(
+        self, entryID: int, status: str, confirmedRound: Optional[int] = None
+    ) -> None:
+        with self.lock:
+            if entryID not in self.entries:
+                return
+            self.append(
+                {"type": "done", "id": entryID, "status": status, "round": confirmedRound}
+            )
+
+    def recordDone(
+        self,
+        submission: Submission,
+        result: Optional[PendingTxnResponse],
+        error: Optional[BaseException],
+    ) -> None:
+        """Record the outcome of a group."""
+        if submission.journalID is None:
+            return
+        if error is None:
+            self.recordOutcome(
+                submission.journalID, CONFIRMED, result.confirmedRound if result else None
+            )
+        else:
+            self.recordOutcome(submission.journalID, FAILED)
+
+    def compact(self) -> None:
+        """Rewrite the journal with only the groups in flight and the outcome of every key.
+        The IDs of the groups in flight are kept, so the journal must not be
+        compacted while they are being sent.
+        """
+        with self.lock:
+            records: List[Dict[str, Any]] = [
+                {"type": "outcome", "key": key, "status": status}
+                for key, status in self.outcomes.items()
+                if status != PENDING
+            ]
+            for entry in sorted(self.entries.values(), key=lambda entry: entry.id):
+                records.append(
+                    {
+                        "type": "submit",
+                        "id": entry.id,
+                        "key": entry.key,
+                        "txids": entry.txIDs,
+                        "track_index": entry.trackIndex,
+                        "first_valid": entry.firstValid,
+                        "last_valid": entry.lastValid,
+                        "group": entry.group,
+                    }
+                )
+
+            directory = os.path.dirname(os.path.abspath(self.path))
+            fd, tmpPath = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+            with os.fdopen(fd, "w") as f:
+                for record in records:
+                    f.write(json.dumps(record, separators=(",", ":")) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self.file.close()
+            os.replace(tmpPath, self.path)
+            self.file = open(self.path, "a")
+
+    def recover(
+        self,
+        client: AlgodClient,
+        scheduler: Optional[SubmissionScheduler] = None,
+        maxWorkers: int = DEFAULT_MAX_WORKERS,
+    ) -> List[Recovery]:
+        """Settle every group that was in flight when the journal was last used.
+        Args:
+            client: An algod client.
+            scheduler: The scheduler to send groups again with. Defaults to the
+                client's scheduler.
+            maxWorkers: The maximum number of concurrent algod requests.
+        Returns:
+            One Recovery per entry that was in flight.
+        """
+        entries = self.pending()
+        if len(entries) == 0:
+            return []
+
+        lastRound = client.status()["last-round"]
+        recoveries: Dict[int, Recovery] = dict()
+
+        def lookup(entry: JournalEntry) -> Optional[Dict[str, Any]]:
+            try:
+                return client.pending_transaction_info(entry.txIDs[entry.trackIndex])
+            except AlgodHTTPError as e:
+                if e.code == 404:
+                    return None
+                raise
+
+        unresolved: List[JournalEntry] = []
+        inPool: List[JournalEntry] = []
+        with ThreadPoolExecutor(max_workers=maxWorkers) as executor:
+            for entry, info in zip(entries, executor.map(lookup, entries)):
+                if info is None:
+                    unresolved.append(entry)
+                elif info.get("confirmed-round", 0) > 0:
+                    recoveries[entry.id] = Recovery(entry, CONFIRMED, info["confirmed-round"])
+                elif info.get("pool-error"):
+                    recoveries[entry.id] = Recovery(entry, FAILED)
+                else:
+                    inPool.append(entry)
+
+            found, missingRounds = findConfirmedRounds(client, unresolved, lastRound, executor)
+
+        for entry in unresolved:
+            if entry.id in found:
+                recoveries[entry.id] = Recovery(entry, CONFIRMED, found[entry.id])
+            elif entry.lastValid > lastRound:
+                inPool.append(entry)
+            elif any(entry.firstValid <= r <= entry.lastValid for r in missingRounds):
+                recoveries[entry.id] = Recovery(entry, UNKNOWN)
+            else:
+                recoveries[entry.id] = Recovery(entry, EXPIRED)
+
+        for recovery in list(recoveries.values()):
+            if recovery.status != UNKNOWN:
+                self.recordOutcome(recovery.entry.id, recovery.status, recovery.confirmedRound)
+
+        if scheduler is None:
+            scheduler = getSubmissionScheduler(client)
+        for entry in inPool:
+            # sending a group that is still in the pool, or was confirmed in
+            # the meantime, is answered as a duplicate and costs nothing
+            self.recordOutcome(entry.id, RESENT)
+            submission = scheduler.submit(
+                entry.signedTxns(), trackIndex=entry.trackIndex, key=entry.key
+            )
+            recoveries[entry.id] = Recovery(entry, RESENT, submission=submission)
+
+        return [recoveries[entry.id] for entry in entries]
+
+
+def findConfirmedRounds(
+    client: AlgodClient,
+    entries: List[JournalEntry],
+    lastRound: int,
+    executor: ThreadPoolExecutor,
+) -> Tuple[Dict[int, int], Set[int]]:
+    """Look for groups in the blocks of their validity windows.
+    Returns:
+        The confirmed round of each entry that was found, keyed by entry ID,
+        and the rounds whose block algod no longer serves.
+    """
+    byTxID = {entry.txIDs[entry.trackIndex]: entry.id for entry in entries}
+    rounds: Set[int] = set()
+    for entry in entries:
+        rounds.update(range(max(entry.firstValid, 1), min(entry.lastValid, lastRound) + 1))
+
+    def fetch(round: int) -> Optional[Dict[str, Any]]:
+        try:
+            return decodeBlock(client.block_info(round, response_format="msgpack"))
+        except AlgodHTTPError as e:
+            if e.code == 404:
+                return None
+            raise
+
+    found: Dict[int, int] = dict()
+    missing: Set[int] = set()
+    orderedRounds = sorted(rounds)
+    for round, block in zip(orderedRounds, executor.map(fetch, orderedRounds)):
+        if block is None:
+            missing.add(round)
+            continue
+        for txn in block.get("txns", []):
+            txID = getBlockTxID(txn, block)
+            entryID = byTxID.get(txID) if txID is not None else None
+            if entryID is not None:
+                found[entryID] = round
+
+    return found, missing
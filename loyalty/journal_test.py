@@ -0,0 +1,96 @@
+from algosdk.error import AlgodHTTPError
+
+from .journal import CONFIRMED, EXPIRED, RESENT, SubmissionJournal
+from .scheduler import Submission, SubmissionScheduler
+from .scheduler_test import signPayment
+from .testing.setup import getAlgodClient
+from .testing.resources import getTemporaryAccount
+
+
+def test_records_groups(tmp_path):
+    client = getAlgodClient()
+    sender = getTemporaryAccount(client)
+    receiver = getTemporaryAccount(client)
+
+    path = str(tmp_path / "campaign.journal")
+    journal = SubmissionJournal(path)
+    scheduler = SubmissionScheduler(client, journal=journal)
+
+    for key in ("a", "b"):
+        amount = 1_000 if key == "a" else 2_000
+        scheduler.submit([signPayment(client, sender, receiver, amount)], key=key).result()
+
+    assert journal.status("a") == CONFIRMED
+    assert journal.status("b") == CONFIRMED
+    assert journal.status("c") is None
+    assert journal.pending() == []
+    journal.close()
+
+    journal = SubmissionJournal(path)
+    assert journal.status("b") == CONFIRMED
+    journal.compact()
+    journal.close()
+
+    with open(path) as f:
+        assert len(f.readlines()) == 2
+    assert SubmissionJournal(path).status("a") == CONFIRMED
+
+
+def test_recover(tmp_path, monkeypatch):
+    client = getAlgodClient()
+    sender = getTemporaryAccount(client)
+    receiver = getTemporaryAccount(client)
+
+    path = str(tmp_path / "campaign.journal")
+    journal = SubmissionJournal(path)
+
+    def journaled(key, signedTxn, send):
+        submission = Submission([signedTxn], None, 0, 10, key)
+        journal.recordSubmit(submission)
+        if send:
+            client.send_transactions([signedTxn])
+        return signedTxn.get_txid()
+
+    lastRound = client.status()["last-round"]
+    expiredParams = client.suggested_params()
+    expiredParams.first = max(1, lastRound - 5)
+    expiredParams.last = lastRound - 1
+
+    # the process dies with four groups in flight
+    journaled("confirmed", signPayment(client, sender, receiver, 1_000), send=True)
+    forgotten = journaled("forgotten", signPayment(client, sender, receiver, 2_000), send=True)
+    journaled("unsent", signPayment(client, sender, receiver, 3_000), send=False)
+    journaled("expired", signPayment(client, sender, receiver, 4_000, expiredParams), send=False)
+    journal.close()
+    with open(path, "a") as f:
+        f.write('{"type": "done", "id"')  # cut short
+
+    # algod no longer remembers one of the confirmed groups
+    pendingTransactionInfo = client.pending_transaction_info
+
+    def forgetful(txID, *args, **kwargs):
+        if txID == forgotten:
+            raise AlgodHTTPError("could not find the transaction", 404)
+        return pendingTransactionInfo(txID, *args, **kwargs)
+
+    monkeypatch.setattr(client, "pending_transaction_info", forgetful)
+
+    journal = SubmissionJournal(path)
+    scheduler = SubmissionScheduler(client, journal=journal)
+    recoveries = journal.recover(client, scheduler)
+
+    assert [(r.entry.key, r.status) for r in recoveries] == [
+        ("confirmed", CONFIRMED),
+        ("forgotten", CONFIRMED),
+        ("unsent", RESENT),
+        ("expired", EXPIRED),
+    ]
+    assert recoveries[1].confirmedRound > lastRound
+    assert recoveries[2].submission.result().confirmedRound is not None
+
+    assert journal.pending() == []
+    assert [journal.status(key) for key in ("confirmed", "unsent", "expired")] == [
+        CONFIRMED,
+        CONFIRMED,
+        EXPIRED,
+    ]
@@ -0,0 +1,328 @@
+"""A local SQLite ledger of offers that mirrors their state on chain.
+
+The OfferLedger is an OfferStateCache that also writes every offer it learns
+about to a SQLite database, indexed by customer and action ID and by end time.
+Passed as the stateCache of the offer operations, the provisioner, the
+dispatcher or the sweeper, it records each offer when it is created and its
+status whenever a confirmed transaction changes it. Subscribed to an
+OfferFollower, it also mirrors what other processes do to the offers. Questions
+such as which open offer a customer completes with an action, or which offers
+end today, are then answered by indexed local queries instead of algod calls.
+
+    ledger = OfferLedger("offers.db")
+    appIDs = ledger.lookup(customer, actionID)
+"""
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Sequence, Set, Union
+import sqlite3
+
+from algosdk import encoding
+from algosdk.v2client.algod import AlgodClient
+
+from .state import (
+    AppState,
+    OFFER_STATE_FIELDS,
+    OfferState,
+    OfferStateCache,
+    OfferStatus,
+)
+
+if TYPE_CHECKING:
+    from .follower import OfferEvent
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS offers (
+    app_id INTEGER PRIMARY KEY,
+    customer TEXT NOT NULL,
+    action_id INTEGER NOT NULL,
+    start_time INTEGER NOT NULL,
+    end_time INTEGER NOT NULL,
+    reward_asset_id INTEGER NOT NULL,
+    reward_amount INTEGER NOT NULL,
+    status INTEGER NOT NULL,
+    -- the address of the account that created the offer, if it is known
+    creator TEXT,
+    -- 1 once the offer app was deleted
+    closed INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS offers_customer_action ON offers (customer, action_id);
+CREATE INDEX IF NOT EXISTS offers_action ON offers (action_id);
+CREATE INDEX IF NOT EXISTS offers_end_time ON offers (end_time);
+"""
+
+COLUMNS = (
+    "app_id",
+    "customer",
+    "action_id",
+    "start_time",
+    "end_time",
+    "reward_asset_id",
+    "reward_amount",
+    "status",
+)
+
+# the columns of an offer's state, and its creator
+SELECTED = ", ".join(COLUMNS + ("creator",))
+
+UPSERT = """
+INSERT INTO offers ({columns}, closed) VALUES ({placeholders}, 0)
+ON CONFLICT (app_id) DO UPDATE SET {updates}, closed = 0
+""".format(
+    columns=", ".join(COLUMNS),
+    placeholders=", ".join("?" for _ in COLUMNS),
+    updates=", ".join("{0} = excluded.{0}".format(column) for column in COLUMNS[1:]),
+)
+
+
+def appStateOf(state: OfferState) -> AppState:
+    """Get the global state of an offer as a dict, like getAppGlobalState returns."""
+    return {
+        key: getattr(state, slot[1:]) if slot != "_status" else int(state.status)
+        for slot, key in OFFER_STATE_FIELDS.items()
+    }
+
+
+def rowOf(appID: int, state: AppState) -> Sequence[Any]:
+    return (
+        appID,
+        encoding.encode_address(state[b"customer_account"]),
+        state[b"action_id"],
+        state[b"start"],
+        state[b"end"],
+        state[b"reward_asset_id"],
+        state[b"reward_amount"],
+        state[b"status"],
+    )
+
+
+def stateOf(row: Sequence[Any]) -> OfferState:
+    """Get the state of an offer from a row of its SELECTED columns."""
+    (
+        appID,
+        customer,
+        actionID,
+        startTime,
+        endTime,
+        rewardAssetID,
+        rewardAmount,
+        status,
+        creator,
+    ) = row
+    return OfferState.FromAppState(
+        {
+            b"customer_account": encoding.decode_address(customer),
+            b"action_id": actionID,
+            b"start": startTime,
+            b"end": endTime,
+            b"reward_asset_id": rewardAssetID,
+            b"reward_amount": rewardAmount,
+            b"status": status,
+        },
+        appID,
+        creator,
+    )
+
+
+class OfferLedger(OfferStateCache):
+    """An offer state cache that is stored in, and can be queried with, SQLite.
+
+    The states of open offers are kept in memory as well, for the operations
+    that read them. Deleted offers stay in the database, marked as closed.
+
+    Args:
+        path: The database file. Defaults to an in-memory database.
+    """
+
+    def __init__(self, path: str = ":memory:") -> None:
+        super().__init__()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        if path != ":memory:":
+            self.db.execute("PRAGMA journal_mode = WAL")
+            self.db.execute("PRAGMA synchronous = NORMAL")
+        self.db.executescript(SCHEMA)
+        columns = [column[1] for column in self.db.execute("PRAGMA table_info(offers)")]
+        if "creator" not in columns:
+            # a database written before creators were recorded
+            self.db.execute("ALTER TABLE offers ADD COLUMN creator TEXT")
+
+        rows = self.db.execute(
+            "SELECT {} FROM offers WHERE closed = 0".format(SELECTED)
+        ).fetchall()
+        for row in rows:
+            state = stateOf(row)
+            self.states[row[0]] = appStateOf(state)
+            if state.creator is not None:
+                self.creators[row[0]] = state.creator
+
+    def close(self) -> None:
+        with self.lock:
+            self.db.close()
+
+    def write(self, appID: int, state: AppState) -> None:
+        # called with the lock held
+        if all(key in state for key in OFFER_STATE_FIELDS.values()):
+            self.db.execute(UPSERT, rowOf(appID, state))
+
+    def put(self, appID: int, state: AppState) -> None:
+        with self.lock:
+            self.states[appID] = dict(state)
+            self.write(appID, state)
+
+    def update(self, appID: int, delta: Dict[bytes, Optional[Union[int, bytes]]]) -> None:
+        super().update(appID, delta)
+        with self.lock:
+            state = self.states.get(appID)
+            if state is not None and len(delta) > 0:
+                self.write(appID, state)
+
+    def writeCreator(self, appID: int, creator: str) -> None:
+        # called with the lock held
+        self.creators[appID] = creator
+        self.db.execute("UPDATE offers SET creator = ? WHERE app_id = ?", (creator, appID))
+
+    def setCreator(self, appID: int, creator: str) -> None:
+        with self.lock:
+            self.writeCreator(appID, creator)
+
+    def remove(self, appID: int) -> None:
+        with self.lock:
+            self.states.pop(appID, None)
+            self.creators.pop(appID, None)
+            self.db.execute("UPDATE offers SET closed = 1 WHERE app_id = ?", (appID,))
+
+    def applyEvent(self, event: "OfferEvent") -> None:
+        """Record an event of an OfferFollower, so that the ledger follows the chain.
+        Subscribe it with follower.subscribe(ledger.applyEvent).
+        """
+        from .follower import OfferEventType
+
+        if event.type == OfferEventType.CLOSED:
+            self.remove(event.appID)
+        elif event.type != OfferEventType.EXPIRED:
+            self.put(event.appID, appStateOf(event.state))
+            if event.state.creator is not None:
+                self.setCreator(event.appID, event.state.creator)
+
+    def lookup(self, customer: str, actionID: int) -> List[int]:
+        """Get the open offers that a customer completes by performing an action."""
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT app_id FROM offers WHERE customer = ? AND action_id = ?"
+                " AND status != ? AND closed = 0 ORDER BY app_id",
+                (customer, actionID, int(OfferStatus.COMPLETED)),
+            ).fetchall()
+        return [appID for appID, in rows]
+
+    def find(
+        self,
+        customer: Optional[str] = None,
+        actionID: Optional[int] = None,
+        status: Optional[Union[OfferStatus, Iterable[OfferStatus]]] = None,
+        endsAfter: Optional[int] = None,
+        endsBefore: Optional[int] = None,
+        includeClosed: bool = False,
+    ) -> List[OfferState]:
+        """Query the offers in the ledger, ordered by end time.
+        Args:
+            customer: Only offers of this customer.
+            actionID: Only offers completed by this action.
+            status: Only offers with this status, or one of these statuses.
+            endsAfter: Only offers that end at or after this UNIX timestamp.
+            endsBefore: Only offers that end before this UNIX timestamp.
+            includeClosed: Include offers whose app has been deleted.
+        Returns:
+            The states of the matching offers.
+        """
+        conditions: List[str] = []
+        params: List[Any] = []
+
+        if customer is not None:
+            conditions.append("customer = ?")
+            params.append(customer)
+        if actionID is not None:
+            conditions.append("action_id = ?")
+            params.append(actionID)
+        if status is not None:
+            statuses = [status] if isinstance(status, OfferStatus) else list(status)
+            conditions.append("status IN ({})".format(", ".join("?" for _ in statuses)))
+            params.extend(int(s) for s in statuses)
+        if endsAfter is not None:
+            conditions.append("end_time >= ?")
+            params.append(endsAfter)
+        if endsBefore is not None:
+            conditions.append("end_time < ?")
+            params.append(endsBefore)
+        if not includeClosed:
+            conditions.append("closed = 0")
+
+        query = "SELECT {} FROM offers".format(SELECTED)
+        if len(conditions) > 0:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY end_time, app_id"
+
+        with self.lock:
+            rows = self.db.execute(query, params).fetchall()
+        return [stateOf(row) for row in rows]
+
+    def reconcile(
+        self,
+        client: AlgodClient,
+        appIDs: Optional[Iterable[int]] = None,
+        creators: Optional[Union[str, Sequence[str]]] = None,
+    ) -> Dict[str, int]:
+        """Bring the ledger in line with the chain.
+        The open offers in the ledger, or the given ones, are read from algod
+        with scanOfferApps; offers that no longer exist are marked as closed.
+        With creators, offers created by them that the ledger doesn't know yet
+        are found with scanOffers and added.
+        Args:
+            client: An algod client.
+            appIDs: The offers to check. Defaults to every open offer in the ledger.
+            creators: The address of a creator, or a list of them, whose offers
+                are listed to find missing ones.
+        Returns:
+            The number of offers checked, updated, closed and added.
+        """
+        from .scanner import scanOfferApps, scanOffers
+
+        if appIDs is None:
+            with self.lock:
+                rows = self.db.execute("SELECT app_id FROM offers WHERE closed = 0").fetchall()
+            appIDs = [appID for appID, in rows]
+        appIDs = list(appIDs)
+
+        found: Dict[int, OfferState] = dict(scanOfferApps(client, appIDs).states)
+        known: Set[int] = set(appIDs)
+        if creators is not None:
+            with self.lock:
+                rows = self.db.execute("SELECT app_id FROM offers").fetchall()
+            known.update(appID for appID, in rows)
+            for appID, offerState in scanOffers(client, creators).states.items():
+                found.setdefault(appID, offerState)
+
+        report = {"checked": len(appIDs), "updated": 0, "closed": 0, "added": 0}
+        with self.lock:
+            self.db.execute("BEGIN")
+            try:
+                for appID in appIDs:
+                    if appID not in found:
+                        self.states.pop(appID, None)
+                        self.db.execute("UPDATE offers SET closed = 1 WHERE app_id = ?", (appID,))
+                        report["closed"] += 1
+
+                for appID, offerState in found.items():
+                    appState = appStateOf(offerState)
+                    if appID not in known:
+                        report["added"] += 1
+                    elif self.states.get(appID) != appState:
+                        report["updated"] += 1
+                    self.states[appID] = appState
+                    self.write(appID, appState)
+                    if offerState.creator is not None:
+                        self.writeCreator(appID, offerState.creator)
+
+                self.db.execute("COMMIT")
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+
+        return report
@@ -0,0 +1,146 @@
+import sqlite3
+
+from algosdk import encoding
+
+from .follower import OfferFollower
+from .ledger import OfferLedger
+from .operations import LoyaltyOffer, closeLoyaltyOffer, completeAction
+from .provisioner import provisionOffers
+from .state import OfferStatus
+from .testing.setup import getAlgodClient
+from .testing.resources import (
+    createDummyAsset,
+    getCurrentTime,
+    getTemporaryAccount,
+    optInAccountsToAsset,
+    waitUntilTimestamp,
+)
+
+ZERO_ADDRESS = encoding.encode_address(bytes(32))
+
+
+def createOffers(client, creator, customers, startTime, stateCache=None):
+    tokenID = createDummyAsset(client, 1_000, creator)
+    optInAccountsToAsset(client, tokenID, customers)
+
+    offers = [
+        LoyaltyOffer(
+            customer=customer.getAddress(),
+            startTime=startTime,
+            endTime=startTime + 60 * (i + 1),
+            rewardAssetID=tokenID,
+            rewardAmount=10,
+            actionID=101 + i % 2,
+        )
+        for i, customer in enumerate(customers)
+    ]
+    results = sorted(
+        provisionOffers(client, creator, offers, stateCache=stateCache),
+        key=lambda result: result.position,
+    )
+    assert all(result.error is None for result in results)
+    return [result.appID for result in results]
+
+
+def test_records_operations(tmp_path):
+    client = getAlgodClient()
+    creator = getTemporaryAccount(client)
+    customers = [getTemporaryAccount(client) for _ in range(3)]
+
+    path = str(tmp_path / "offers.db")
+    ledger = OfferLedger(path)
+
+    startTime = getCurrentTime(client) + 10
+    appIDs = createOffers(client, creator, customers, startTime, stateCache=ledger)
+
+    customer = customers[0].getAddress()
+    assert ledger.lookup(customer, 101) == [appIDs[0]]
+    assert ledger.lookup(customer, 102) == []
+    assert [s.appID for s in ledger.find(actionID=101)] == [appIDs[0], appIDs[2]]
+    assert [s.appID for s in ledger.find(status=OfferStatus.FUNDED)] == appIDs
+    assert [s.appID for s in ledger.find(endsBefore=startTime + 121)] == appIDs[:2]
+
+    waitUntilTimestamp(client, startTime)
+    completeAction(client, creator, appIDs[0], 101, stateCache=ledger)
+    assert ledger.lookup(customer, 101) == []
+    assert ledger.find(customer=customer)[0].status == OfferStatus.COMPLETED
+
+    waitUntilTimestamp(client, startTime + 60)
+    closeLoyaltyOffer(client, appIDs[0], creator, stateCache=ledger)
+    assert ledger.find(customer=customer) == []
+    assert ledger.find(customer=customer, includeClosed=True)[0].appID == appIDs[0]
+    ledger.close()
+
+    # a reopened ledger loads the open offers into memory
+    ledger = OfferLedger(path)
+    assert sorted(ledger.states) == appIDs[1:]
+    assert ledger.get(appIDs[1])[b"status"] == OfferStatus.FUNDED
+    assert ledger.getCreator(appIDs[1]) == creator.getAddress()
+    assert ledger.find(customer=customers[1].getAddress())[0].creator == creator.getAddress()
+
+    # anyone can close an expired offer, which references its recorded creator
+    waitUntilTimestamp(client, startTime + 125)
+    closeLoyaltyOffer(client, appIDs[1], customers[1], stateCache=ledger)
+    assert sorted(ledger.states) == appIDs[2:]
+
+
+def test_adds_creator_column(tmp_path):
+    path = str(tmp_path / "offers.db")
+    db = sqlite3.connect(path)
+    db.execute(
+        "CREATE TABLE offers (app_id INTEGER PRIMARY KEY, customer TEXT NOT NULL,"
+        " action_id INTEGER NOT NULL, start_time INTEGER NOT NULL, end_time INTEGER NOT NULL,"
+        " reward_asset_id INTEGER NOT NULL, reward_amount INTEGER NOT NULL,"
+        " status INTEGER NOT NULL, closed INTEGER NOT NULL DEFAULT 0)"
+    )
+    db.execute("INSERT INTO offers VALUES (1, ?, 101, 10, 20, 5, 10, 2, 0)", (ZERO_ADDRESS,))
+    db.commit()
+    db.close()
+
+    # a ledger written before creators were recorded still opens
+    ledger = OfferLedger(path)
+    assert ledger.get(1)[b"action_id"] == 101
+    assert ledger.getCreator(1) is None
+    ledger.setCreator(1, ZERO_ADDRESS)
+    assert ledger.find()[0].creator == ZERO_ADDRESS
+
+
+def test_reconcile():
+    client = getAlgodClient()
+    creator = getTemporaryAccount(client)
+    customers = [getTemporaryAccount(client) for _ in range(2)]
+
+    startTime = getCurrentTime(client) + 5 * 60
+    appIDs = createOffers(client, creator, customers, startTime)
+
+    ledger = OfferLedger()
+    report = ledger.reconcile(client, creators=creator.getAddress())
+    assert report == {"checked": 0, "updated": 0, "closed": 0, "added": 2}
+    assert ledger.lookup(customers[1].getAddress(), 102) == [appIDs[1]]
+
+    # changes made without the ledger are picked up on the next reconcile
+    closeLoyaltyOffer(client, appIDs[0], creator)
+    report = ledger.reconcile(client)
+    assert report == {"checked": 2, "updated": 0, "closed": 1, "added": 0}
+    assert [s.appID for s in ledger.find()] == [appIDs[1]]
+
+
+def test_follows_events():
+    client = getAlgodClient()
+    creator = getTemporaryAccount(client)
+    customers = [getTemporaryAccount(client) for _ in range(2)]
+
+    startRound = client.status()["last-round"] + 1
+    startTime = getCurrentTime(client) + 5 * 60
+    appIDs = createOffers(client, creator, customers, startTime)
+    closeLoyaltyOffer(client, appIDs[0], creator)
+    lastRound = client.status()["last-round"]
+
+    ledger = OfferLedger()
+    follower = OfferFollower(client, startRound=startRound)
+    follower.subscribe(ledger.applyEvent)
+    while follower.nextRound <= lastRound:
+        follower.poll()
+
+    assert [s.appID for s in ledger.find(includeClosed=True)] == appIDs
+    assert [(s.appID, s.status) for s in ledger.find()] == [(appIDs[1], OfferStatus.FUNDED)]
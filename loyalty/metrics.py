@@ -0,0 +1,357 @@
+"""Latency and error metrics for algod calls and offer operations.
+
+Nothing is measured until a hook is added with addHook. From then on, every
+operation in loyalty.operations reports its latency, every algod request made
+by a client passed to an operation (or to instrumentClient) reports its
+endpoint and latency, and the confirmation trackers report how many rounds
+each transaction took to confirm and any pool errors.
+
+MetricsCollector is a hook that keeps histograms in memory. Its snapshot can
+be read directly, rendered in the Prometheus text format, or served for
+scraping with serveMetrics.
+"""
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, TypeVar, cast
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import asyncio
+import functools
+import threading
+import time
+
+# seconds
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+ROUND_BUCKETS = (1, 2, 3, 4, 5, 6, 8, 10, 15, 20)
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+class MetricsHook:
+    """Receives measurements. Subclasses override the methods they need."""
+
+    def algodRequest(
+        self, method: str, endpoint: str, seconds: float, error: Optional[Exception]
+    ) -> None:
+        pass
+
+    def operation(self, name: str, seconds: float, error: Optional[Exception]) -> None:
+        pass
+
+    def confirmation(self, rounds: int) -> None:
+        pass
+
+    def poolError(self, message: str) -> None:
+        pass
+
+
+hooks: List[MetricsHook] = []
+hooksLock = threading.Lock()
+
+
+def addHook(hook: MetricsHook) -> None:
+    global hooks
+    with hooksLock:
+        # replace the list so notify never iterates over one being changed
+        hooks = hooks + [hook]
+
+
+def removeHook(hook: MetricsHook) -> None:
+    global hooks
+    with hooksLock:
+        hooks = [h for h in hooks if h is not hook]
+
+
+def notify(event: str, *args: Any) -> None:
+    for hook in hooks:
+        getattr(hook, event)(*args)
+
+
+def getEndpoint(requrl: str) -> str:
+    """Replace the IDs, rounds and addresses in a request path with {id}, so
+    requests for different objects are counted together.
+    """
+    segments = requrl.split("?", 1)[0].split("/")
+    return "/".join(
+        "{id}" if segment.isdigit() or (len(segment) >= 52 and segment.isalnum()) else segment
+        for segment in segments
+    )
+
+
+def instrumentClient(client: Any) -> Any:
+    """Report the latency of every algod request made by a client to the hooks.
+    Works for both AlgodClient and AsyncAlgodClient. Instrumenting a client
+    again has no effect.
+    Returns:
+        The same client.
+    """
+    if getattr(client, "loyaltyInstrumented", False):
+        return client
+
+    request = client.algod_request
+
+    if asyncio.iscoroutinefunction(request):
+
+        async def asyncAlgodRequest(method: str, requrl: str, *args: Any, **kwargs: Any) -> Any:
+            if len(hooks) == 0:
+                return await request(method, requrl, *args, **kwargs)
+            start = time.perf_counter()
+            error: Optional[Exception] = None
+            try:
+                return await request(method, requrl, *args, **kwargs)
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                seconds = time.perf_counter() - start
+                notify("algodRequest", method, getEndpoint(requrl), seconds, error)
+
+        client.algod_request = asyncAlgodRequest
+    else:
+
+        def algodRequest(method: str, requrl: str, *args: Any, **kwargs: Any) -> Any:
+            if len(hooks) == 0:
+                return request(method, requrl, *args, **kwargs)
+            start = time.perf_counter()
+            error: Optional[Exception] = None
+            try:
+                return request(method, requrl, *args, **kwargs)
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                seconds = time.perf_counter() - start
+                notify("algodRequest", method, getEndpoint(requrl), seconds, error)
+
+        client.algod_request = algodRequest
+
+    client.loyaltyInstrumented = True
+    return client
+
+
+def instrumented(name: str) -> Callable[[F], F]:
+    """Report the latency of an operation to the hooks. The client, taken from
+    the first argument or the client keyword argument, is instrumented too.
+    """
+
+    def decorate(fn: F) -> F:
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if len(hooks) == 0:
+                return fn(*args, **kwargs)
+
+            client = args[0] if len(args) > 0 else kwargs.get("client")
+            if client is not None:
+                instrumentClient(client)
+
+            start = time.perf_counter()
+            error: Optional[Exception] = None
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                notify("operation", name, time.perf_counter() - start, error)
+
+        return cast(F, wrapper)
+
+    return decorate
+
+
+class Histogram:
+    """Cumulative bucket counts, as in a Prometheus histogram."""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Sequence[float]) -> None:
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "buckets": {str(bound): count for bound, count in zip(self.buckets, self.counts)},
+        }
+
+
+class MetricsCollector(MetricsHook):
+    """Keeps every measurement in in-memory histograms and counters."""
+
+    def __init__(self, latencyBuckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS) -> None:
+        self.lock = threading.Lock()
+        self.latencyBuckets = latencyBuckets
+        # (method, endpoint) -> latency
+        self.algodLatency: Dict[Tuple[str, str], Histogram] = dict()
+        self.algodErrors: Dict[Tuple[str, str], int] = dict()
+        self.operationLatency: Dict[str, Histogram] = dict()
+        self.operationErrors: Dict[str, int] = dict()
+        self.confirmationRounds = Histogram(ROUND_BUCKETS)
+        self.poolErrors = 0
+
+    def algodRequest(
+        self, method: str, endpoint: str, seconds: float, error: Optional[Exception]
+    ) -> None:
+        key = (method, endpoint)
+        with self.lock:
+            histogram = self.algodLatency.get(key)
+            if histogram is None:
+                histogram = self.algodLatency[key] = Histogram(self.latencyBuckets)
+            histogram.observe(seconds)
+            if error is not None:
+                self.algodErrors[key] = self.algodErrors.get(key, 0) + 1
+
+    def operation(self, name: str, seconds: float, error: Optional[Exception]) -> None:
+        with self.lock:
+            histogram = self.operationLatency.get(name)
+            if histogram is None:
+                histogram = self.operationLatency[name] = Histogram(self.latencyBuckets)
+            histogram.observe(seconds)
+            if error is not None:
+                self.operationErrors[name] = self.operationErrors.get(name, 0) + 1
+
+    def confirmation(self, rounds: int) -> None:
+        with self.lock:
+            self.confirmationRounds.observe(rounds)
+
+    def poolError(self, message: str) -> None:
+        with self.lock:
+            self.poolErrors += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Get a JSON serializable copy of every metric."""
+        with self.lock:
+            return {
+                "algod_requests": [
+                    dict(
+                        histogram.snapshot(),
+                        method=method,
+                        endpoint=endpoint,
+                        errors=self.algodErrors.get((method, endpoint), 0),
+                    )
+                    for (method, endpoint), histogram in sorted(self.algodLatency.items())
+                ],
+                "operations": [
+                    dict(histogram.snapshot(), name=name, errors=self.operationErrors.get(name, 0))
+                    for name, histogram in sorted(self.operationLatency.items())
+                ],
+                "confirmation_rounds": self.confirmationRounds.snapshot(),
+                "pool_errors": self.poolErrors,
+            }
+
+    def renderPrometheus(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        lines: List[str] = []
+
+        def histogram(
+            name: str, help: str, series: List[Tuple[Dict[str, str], Histogram]]
+        ) -> None:
+            lines.append("# HELP {} {}".format(name, help))
+            lines.append("# TYPE {} histogram".format(name))
+            for labels, h in series:
+                for bound, count in zip(h.buckets, h.counts):
+                    lines.append(
+                        "{}_bucket{} {}".format(name, formatLabels(labels, le=str(bound)), count)
+                    )
+                lines.append(
+                    "{}_bucket{} {}".format(name, formatLabels(labels, le="+Inf"), h.count)
+                )
+                lines.append("{}_sum{} {}".format(name, formatLabels(labels), h.sum))
+                lines.append("{}_count{} {}".format(name, formatLabels(labels), h.count))
+
+        def counter(name: str, help: str, series: List[Tuple[Dict[str, str], int]]) -> None:
+            lines.append("# HELP {} {}".format(name, help))
+            lines.append("# TYPE {} counter".format(name))
+            for labels, value in series:
+                lines.append("{}{} {}".format(name, formatLabels(labels), value))
+
+        with self.lock:
+            histogram(
+                "loyalty_algod_request_seconds",
+                "Latency of algod requests.",
+                [
+                    ({"method": method, "endpoint": endpoint}, h)
+                    for (method, endpoint), h in sorted(self.algodLatency.items())
+                ],
+            )
+            counter(
+                "loyalty_algod_request_errors_total",
+                "Algod requests that failed.",
+                [
+                    ({"method": method, "endpoint": endpoint}, count)
+                    for (method, endpoint), count in sorted(self.algodErrors.items())
+                ],
+            )
+            histogram(
+                "loyalty_operation_seconds",
+                "Latency of offer operations.",
+                [({"operation": name}, h) for name, h in sorted(self.operationLatency.items())],
+            )
+            counter(
+                "loyalty_operation_errors_total",
+                "Offer operations that raised an error.",
+                [
+                    ({"operation": name}, count)
+                    for name, count in sorted(self.operationErrors.items())
+                ],
+            )
+            histogram(
+                "loyalty_confirmation_rounds",
+                "Rounds between tracking a transaction and its confirmation.",
+                [({}, self.confirmationRounds)],
+            )
+            counter(
+                "loyalty_pool_errors_total",
+                "Tracked transactions rejected from the transaction pool.",
+                [({}, self.poolErrors)],
+            )
+
+        return "\n".join(lines) + "\n"
+
+
+def formatLabels(labels: Dict[str, str], **extra: str) -> str:
+    labels = dict(labels, **extra)
+    if len(labels) == 0:
+        return ""
+    return "{" + ",".join(
+        '{}="{}"'.format(key, value.replace("\\", "\\\\").replace('"', '\\"'))
+        for key, value in labels.items()
+    ) + "}"
+
+
+def serveMetrics(
+    collector: MetricsCollector, port: int = 9464, host: str = ""
+) -> ThreadingHTTPServer:
+    """Serve the metrics of a collector at /metrics from a background thread.
+    Returns:
+        The server. Call shutdown on it to stop serving.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = collector.renderPrometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(
+        target=server.serve_forever, name="loyalty-metrics-server", daemon=True
+    ).start()
+    return server
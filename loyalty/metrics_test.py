@@ -0,0 +1,50 @@
+from .metrics import MetricsCollector, addHook, removeHook, getEndpoint
+from .operations import createLoyaltyOfferApp
+from .testing.setup import getAlgodClient
+from .testing.resources import getTemporaryAccount, createDummyAsset, getCurrentTime
+
+
+def test_getEndpoint():
+    assert getEndpoint("/applications/123") == "/applications/{id}"
+    assert getEndpoint("/status/wait-for-block-after/7") == "/status/wait-for-block-after/{id}"
+    assert getEndpoint("/transactions/pending/" + "A" * 52 + "?format=msgpack") == (
+        "/transactions/pending/{id}"
+    )
+    assert getEndpoint("/transactions/params") == "/transactions/params"
+
+
+def test_collector():
+    client = getAlgodClient()
+    creator = getTemporaryAccount(client)
+    tokenID = createDummyAsset(client, 1_000, creator)
+    startTime = getCurrentTime(client) + 60
+
+    collector = MetricsCollector()
+    addHook(collector)
+    try:
+        createLoyaltyOfferApp(
+            client, creator, creator.getAddress(), startTime, startTime + 60, tokenID, 10, 1
+        )
+    finally:
+        removeHook(collector)
+
+    snapshot = collector.snapshot()
+
+    operations = {op["name"]: op for op in snapshot["operations"]}
+    assert operations["createLoyaltyOfferApp"]["count"] == 1
+    assert operations["getContracts"]["count"] == 1
+
+    endpoints = {(r["method"], r["endpoint"]) for r in snapshot["algod_requests"]}
+    assert ("GET", "/transactions/params") in endpoints
+    assert ("POST", "/transactions") in endpoints
+    # other threads, such as the account pool, may be confirming transactions too
+    assert snapshot["confirmation_rounds"]["count"] >= 1
+    assert snapshot["pool_errors"] == 0
+
+    text = collector.renderPrometheus()
+    assert 'loyalty_operation_seconds_count{operation="createLoyaltyOfferApp"} 1' in text
+    assert (
+        'loyalty_algod_request_seconds_bucket{method="GET",endpoint="/transactions/params",le="+Inf"}'
+        in text
+    )
+    assert "# TYPE loyalty_confirmation_rounds histogram" in text
@@ -1,28 +1,66 @@
-from typing import Tuple, List
+from typing import Tuple, List, Union, Optional, NamedTuple, Sequence, cast
+import functools
 
 from algosdk.v2client.algod import AlgodClient
 from algosdk.future import transaction
 from algosdk.logic import get_application_address
-from algosdk import account, encoding
-
-from pyteal import compileTeal, Mode
+from algosdk import encoding
 
 from .account import Account
-from .contracts import approval_program, clear_state_program
-from .util import (
-    waitForTransaction,
-    fullyCompileContract,
-    getAppGlobalState,
-)
+from .artifacts import compileArtifact
+from .holdings import HoldingsCache, optInErrors
+from .metrics import instrumented
+from .params import SuggestedParamsProvider, getFreshSuggestedParams, getSuggestedParams
+from .signer import TransactionSigner, signTransactions
+from .programcache import ProgramCache, getDefaultProgramCache
+from .scheduler import Submission, getSubmissionScheduler, submitAndWait
+from .state import AppState, OfferState, OfferStateCache, asOfferState, getOfferState
+from .util import getGroupResponses
 
 APPROVAL_PROGRAM = b""
 CLEAR_STATE_PROGRAM = b""
 
+MAX_GROUP_SIZE = 16
+
+
+class LoyaltyOffer(NamedTuple):
+    """The creation arguments of a single loyalty offer."""
+
+    customer: str
+    startTime: int
+    endTime: int
+    rewardAssetID: int
+    rewardAmount: int
+    actionID: int
+
+
+class OfferCreationResult(NamedTuple):
+    """The outcome of creating one offer in a batch.
+    Exactly one of appID and error is set.
+    """
+
+    appID: Optional[int]
+    error: Optional[Exception]
 
-def getContracts(client: AlgodClient) -> Tuple[bytes, bytes]:
+
+@instrumented("getContracts")
+def getContracts(
+    client: Optional[AlgodClient],
+    cache: Optional[ProgramCache] = None,
+    offline: bool = False,
+) -> Tuple[bytes, bytes]:
     """Get the compiled TEAL contracts for the auction.
+    The programs are loaded from loyalty.artifacts, so PyTeal is not imported.
+    Compiled programs are looked up in the program cache before asking algod
+    to compile them, and newly compiled programs are stored in it. Bytecode
+    shipped with the artifacts is only used in offline mode.
     Args:
         client: An algod client that has the ability to compile TEAL programs.
+            This may be None in offline mode.
+        cache: The on-disk cache of compiled programs. Defaults to the cache
+            named by the LOYALTY_PROGRAM_CACHE_DIR environment variable, if any.
+        offline: If True, never call algod and fail if either program is not
+            already in the cache.
     Returns:
         A tuple of 2 byte strings. The first is the approval program, and the
         second is the clear state program.
@@ -31,12 +69,17 @@ def getContracts(client: AlgodClient) -> Tuple[bytes, bytes]:
     global CLEAR_STATE_PROGRAM
 
     if len(APPROVAL_PROGRAM) == 0:
-        APPROVAL_PROGRAM = fullyCompileContract(client, approval_program())
-        CLEAR_STATE_PROGRAM = fullyCompileContract(client, clear_state_program())
+        if cache is None:
+            cache = getDefaultProgramCache()
+
+        approval = compileArtifact(client, "offer_approval", cache, offline)
+        clear = compileArtifact(client, "offer_clear", cache, offline)
+        APPROVAL_PROGRAM, CLEAR_STATE_PROGRAM = approval, clear
 
     return APPROVAL_PROGRAM, CLEAR_STATE_PROGRAM
 
 
+@instrumented("createLoyaltyOfferApp")
 def createLoyaltyOfferApp(
     client: AlgodClient,
     sender: Account,
@@ -46,6 +89,9 @@ def createLoyaltyOfferApp(
     rewardAssetID: int,
     rewardAmount: int,
     actionID: int,
+    paramsProvider: Optional[SuggestedParamsProvider] = None,
+    stateCache: Optional[OfferStateCache] = None,
+    signer: Optional[TransactionSigner] = None,
 ) -> int:
     """Create a new loyalty offer.
     Args:
@@ -60,24 +106,61 @@ def createLoyaltyOfferApp(
             the loyalty customer after completion of the offer action(s).
         actionID: Identifier of action that must be performed to
             fulfill the offer requirement(s).
+        paramsProvider: An optional cache of suggested transaction parameters.
+        stateCache: An optional cache that the new offer's state is added to.
+        signer: An optional batch signer. Transactions are signed inline by default.
     Returns:
         The ID of the newly created auction app.
     """
     approval, clear = getContracts(client)
 
+    offer = LoyaltyOffer(
+        customer=customer,
+        startTime=startTime,
+        endTime=endTime,
+        rewardAssetID=rewardAssetID,
+        rewardAmount=rewardAmount,
+        actionID=actionID,
+    )
+
+    def build(suggestedParams: transaction.SuggestedParams) -> List[transaction.SignedTransaction]:
+        txn = buildCreateTxn(sender, offer, approval, clear, suggestedParams)
+        return signTransactions([txn], sender, signer)
+
+    response = submitAndWait(
+        client,
+        build(getSuggestedParams(client, paramsProvider)),
+        rebuild=lambda: build(getFreshSuggestedParams(client, paramsProvider)),
+    )
+    assert response.applicationIndex is not None and response.applicationIndex > 0
+
+    if stateCache is not None:
+        stateCache.recordCreation(response.applicationIndex, offer, sender.getAddress())
+
+    return response.applicationIndex
+
+
+def buildCreateTxn(
+    sender: Account,
+    offer: LoyaltyOffer,
+    approval: bytes,
+    clear: bytes,
+    suggestedParams: transaction.SuggestedParams,
+) -> transaction.ApplicationCreateTxn:
+    """Build the unsigned application create transaction for an offer."""
     globalSchema = transaction.StateSchema(num_uints=7, num_byte_slices=2)
     localSchema = transaction.StateSchema(num_uints=0, num_byte_slices=0)
 
     app_args = [
-        encoding.decode_address(customer),
-        startTime.to_bytes(8, "big"),
-        endTime.to_bytes(8, "big"),
-        rewardAssetID.to_bytes(8, "big"),
-        rewardAmount.to_bytes(8, "big"),
-        actionID.to_bytes(8, "big"),
+        encoding.decode_address(offer.customer),
+        offer.startTime.to_bytes(8, "big"),
+        offer.endTime.to_bytes(8, "big"),
+        offer.rewardAssetID.to_bytes(8, "big"),
+        offer.rewardAmount.to_bytes(8, "big"),
+        offer.actionID.to_bytes(8, "big"),
     ]
 
-    txn = transaction.ApplicationCreateTxn(
+    return transaction.ApplicationCreateTxn(
         sender=sender.getAddress(),
         on_complete=transaction.OnComplete.NoOpOC,
         approval_program=approval,
@@ -85,24 +168,166 @@ def createLoyaltyOfferApp(
         global_schema=globalSchema,
         local_schema=localSchema,
         app_args=app_args,
-        sp=client.suggested_params(),
+        sp=suggestedParams,
     )
 
-    signedTxn = txn.sign(sender.getPrivateKey())
 
-    client.send_transaction(signedTxn)
+def validateOffer(offer: LoyaltyOffer) -> None:
+    """Check the parts of an offer that can be verified without the chain.
+    Raises:
+        Exception: If the offer can never be created.
+    """
+    if not encoding.is_valid_address(offer.customer):
+        raise Exception("Invalid customer address: {}".format(offer.customer))
 
-    response = waitForTransaction(client, signedTxn.get_txid())
-    assert response.applicationIndex is not None and response.applicationIndex > 0
-    return response.applicationIndex
+    for name in ("startTime", "endTime", "rewardAssetID", "rewardAmount", "actionID"):
+        value = getattr(offer, name)
+        if not 0 <= value < 2 ** 64:
+            raise Exception("{} is not a uint64: {}".format(name, value))
+
+    if offer.startTime >= offer.endTime:
+        raise Exception(
+            "Offer start time {} is not before end time {}".format(
+                offer.startTime, offer.endTime
+            )
+        )
 
 
+@instrumented("createLoyaltyOfferApps")
+def createLoyaltyOfferApps(
+    client: AlgodClient,
+    sender: Account,
+    offers: Sequence[LoyaltyOffer],
+    groupSize: int = MAX_GROUP_SIZE,
+    maxInFlight: int = 8,
+    paramsProvider: Optional[SuggestedParamsProvider] = None,
+    stateCache: Optional[OfferStateCache] = None,
+    signer: Optional[TransactionSigner] = None,
+    holdings: Optional[HoldingsCache] = None,
+) -> List[OfferCreationResult]:
+    """Create many loyalty offers using atomic transaction groups.
+    Offers are packed into groups of up to groupSize application create
+    transactions, and up to maxInFlight groups are awaited concurrently
+    through the client's submission scheduler, which holds groups back while
+    algod is overloaded. Since a group is atomic, a rejected group fails every offer
+    in it, but offers that fail local validation are rejected on their own
+    before any transaction is sent. With a holdings cache, so are offers whose
+    customer has not opted in to the reward asset, since they could never pay out.
+    Args:
+        client: An algod client.
+        sender: The account that will create the loyalty offer applications.
+        offers: The offers to create.
+        groupSize: The maximum number of offers per transaction group.
+        maxInFlight: The maximum number of groups awaiting confirmation.
+        paramsProvider: An optional cache of suggested transaction parameters.
+        stateCache: An optional cache that the new offers' states are added to.
+        signer: An optional batch signer. Transactions are signed inline by default.
+        holdings: An optional holdings cache to check the customers' opt-ins
+            with. The holdings of all customers are fetched at once.
+    Returns:
+        One OfferCreationResult per offer, in the same order as offers.
+    """
+    assert 1 <= groupSize <= MAX_GROUP_SIZE
+
+    results: List[Optional[OfferCreationResult]] = [None] * len(offers)
+
+    pending: List[int] = []
+    for i, offer in enumerate(offers):
+        try:
+            validateOffer(offer)
+        except Exception as e:
+            results[i] = OfferCreationResult(appID=None, error=e)
+        else:
+            pending.append(i)
+
+    if holdings is not None and len(pending) > 0:
+        errors = optInErrors(holdings, [offers[i] for i in pending])
+        for i, error in zip(pending, errors):
+            if error is not None:
+                results[i] = OfferCreationResult(appID=None, error=error)
+        pending = [i for i, error in zip(pending, errors) if error is None]
+
+    if len(pending) > 0:
+        approval, clear = getContracts(client)
+        suggestedParams = getSuggestedParams(client, paramsProvider)
+
+        scheduler = getSubmissionScheduler(client)
+        groups = [pending[i : i + groupSize] for i in range(0, len(pending), groupSize)]
+        inFlight: List[Tuple[List[int], Submission]] = []
+
+        def failGroup(group: List[int], error: Exception) -> None:
+            for i in group:
+                results[i] = OfferCreationResult(appID=None, error=error)
+
+        def finishGroup() -> None:
+            group, submission = inFlight.pop(0)
+            try:
+                # the group may have been rebuilt, so its transaction IDs are read back
+                responses = getGroupResponses(client, submission.result(), submission.txIDs())
+                for i, response in zip(group, responses):
+                    assert response.applicationIndex is not None and response.applicationIndex > 0
+                    if stateCache is not None:
+                        stateCache.recordCreation(
+                            response.applicationIndex, offers[i], sender.getAddress()
+                        )
+                    results[i] = OfferCreationResult(
+                        appID=response.applicationIndex, error=None
+                    )
+            except Exception as e:
+                failGroup(group, e)
+
+        def buildGroup(
+            group: List[int], suggestedParams: transaction.SuggestedParams
+        ) -> List[transaction.Transaction]:
+            txns = [
+                buildCreateTxn(sender, offers[i], approval, clear, suggestedParams)
+                for i in group
+            ]
+            if len(txns) > 1:
+                transaction.assign_group_id(txns)
+            return txns
+
+        def rebuildGroup(group: List[int]) -> List[transaction.SignedTransaction]:
+            txns = buildGroup(group, getFreshSuggestedParams(client, paramsProvider))
+            return signTransactions(txns, sender, signer)
+
+        groupTxns = [buildGroup(group, suggestedParams) for group in groups]
+
+        # sign every group in one batch, so a parallel signer can spread them out
+        allSignedTxns = signTransactions(
+            [txn for txns in groupTxns for txn in txns], sender, signer
+        )
+
+        offset = 0
+        for group in groups:
+            signedTxns = allSignedTxns[offset : offset + len(group)]
+            offset += len(group)
+
+            submission = scheduler.submit(
+                signedTxns, rebuild=functools.partial(rebuildGroup, group)
+            )
+            inFlight.append((group, submission))
+
+            if len(inFlight) >= maxInFlight:
+                finishGroup()
+
+        while len(inFlight) > 0:
+            finishGroup()
+
+    assert all(result is not None for result in results)
+    return cast(List[OfferCreationResult], results)
+
+
+@instrumented("setupLoyaltyOfferApp")
 def setupLoyaltyOfferApp(
     client: AlgodClient,
     appID: int,
     funder: Account,
     rewardAssetID: int,
     rewardAmount: int,
+    paramsProvider: Optional[SuggestedParamsProvider] = None,
+    stateCache: Optional[OfferStateCache] = None,
+    signer: Optional[TransactionSigner] = None,
 ) -> None:
     """Finish setting up an offer.
     This operation funds the app offer escrow account, in one atomic
@@ -116,10 +341,35 @@ def setupLoyaltyOfferApp(
         rewardAssetID: The Reward Asset ID.
         rewardAmount: The number of reward tokens that a customer will recieve
             upon completion of the offer action requirements.
+        paramsProvider: An optional cache of suggested transaction parameters.
+        stateCache: An optional cache of offer states to update.
+        signer: An optional batch signer. Transactions are signed inline by default.
     """
-    appAddr = get_application_address(appID)
+    def build(suggestedParams: transaction.SuggestedParams) -> List[transaction.SignedTransaction]:
+        txns = buildSetupTxns(funder, appID, rewardAssetID, rewardAmount, suggestedParams)
+        return signTransactions(txns, funder, signer)
+
+    response = submitAndWait(
+        client,
+        build(getSuggestedParams(client, paramsProvider)),
+        rebuild=lambda: build(getFreshSuggestedParams(client, paramsProvider)),
+        # the setup call is the only transaction in the group that changes the app state
+        trackIndex=1,
+    )
+
+    if stateCache is not None:
+        stateCache.applyDelta(appID, response.globalStateDelta)
 
-    suggestedParams = client.suggested_params()
+
+def buildSetupTxns(
+    funder: Account,
+    appID: int,
+    rewardAssetID: int,
+    rewardAmount: int,
+    suggestedParams: transaction.SuggestedParams,
+) -> List[transaction.Transaction]:
+    """Build the unsigned fund/setup/asset transfer group for an offer."""
+    appAddr = get_application_address(appID)
 
     fundingAmount = (
         # min account balance
@@ -154,36 +404,57 @@ def setupLoyaltyOfferApp(
         sp=suggestedParams,
     )
 
-    transaction.assign_group_id([fundAppTxn, setupTxn, fundAssetTxn])
-
-    signedFundAppTxn = fundAppTxn.sign(funder.getPrivateKey())
-    signedSetupTxn = setupTxn.sign(funder.getPrivateKey())
-    signedFundAssetTxn = fundAssetTxn.sign(funder.getPrivateKey())
-
-    client.send_transactions([signedFundAppTxn, signedSetupTxn, signedFundAssetTxn])
+    return transaction.assign_group_id([fundAppTxn, setupTxn, fundAssetTxn])
 
-    waitForTransaction(client, signedFundAppTxn.get_txid())
 
-
-def completeAction(client: AlgodClient, owner: Account, appID: int, actionID: int) -> None:
+@instrumented("completeAction")
+def completeAction(
+    client: AlgodClient,
+    owner: Account,
+    appID: int,
+    actionID: int,
+    paramsProvider: Optional[SuggestedParamsProvider] = None,
+    stateCache: Optional[OfferStateCache] = None,
+    signer: Optional[TransactionSigner] = None,
+) -> None:
     """Complete an offer action requirement.
     Args:
         client: An Algod client.
         owner: The offer contract creator.
         appID: The app ID of the auction.
         actionID: The identifier of action that was performed.
+        paramsProvider: An optional cache of suggested transaction parameters.
+        stateCache: An optional cache of offer states. If the offer is in it,
+            its state is not read from algod.
+        signer: An optional batch signer. Transactions are signed inline by default.
     """
-    appGlobalState = getAppGlobalState(client, appID)
+    appGlobalState = getOfferState(client, appID, stateCache)
+
+    def build(suggestedParams: transaction.SuggestedParams) -> List[transaction.SignedTransaction]:
+        appCallTxn = buildActionTxn(owner, appID, actionID, appGlobalState, suggestedParams)
+        return signTransactions([appCallTxn], owner, signer)
+
+    response = submitAndWait(
+        client,
+        build(getSuggestedParams(client, paramsProvider)),
+        rebuild=lambda: build(getFreshSuggestedParams(client, paramsProvider)),
+    )
 
-    rewardTokenID = appGlobalState[b"reward_asset_id"]
+    if stateCache is not None:
+        stateCache.applyDelta(appID, response.globalStateDelta)
 
-    if any(appGlobalState[b"customer_account"]):
-        # if "bid_account" is not the zero address
-        customerAccount = encoding.encode_address(appGlobalState[b"customer_account"])
-    else:
-        customerAccount = None
 
-    suggestedParams = client.suggested_params()
+def buildActionTxn(
+    owner: Account,
+    appID: int,
+    actionID: int,
+    appGlobalState: Union[OfferState, AppState],
+    suggestedParams: transaction.SuggestedParams,
+) -> transaction.ApplicationCallTxn:
+    """Build the unsigned action completion call for an offer."""
+    offerState = asOfferState(appGlobalState)
+    rewardTokenID = offerState.rewardAssetID
+    customerAccount = offerState.customer
 
     appCallTxn = transaction.ApplicationCallTxn(
         sender=owner.getAddress(),
@@ -197,14 +468,18 @@ def completeAction(client: AlgodClient, owner: Account, appID: int, actionID: in
 
     transaction.assign_group_id([appCallTxn])
 
-    signedAppCallTxn = appCallTxn.sign(owner.getPrivateKey())
-
-    client.send_transactions([signedAppCallTxn])
-
-    waitForTransaction(client, appCallTxn.get_txid())
+    return appCallTxn
 
 
-def closeLoyaltyOffer(client: AlgodClient, appID: int, closer: Account):
+@instrumented("closeLoyaltyOffer")
+def closeLoyaltyOffer(
+    client: AlgodClient,
+    appID: int,
+    closer: Account,
+    paramsProvider: Optional[SuggestedParamsProvider] = None,
+    stateCache: Optional[OfferStateCache] = None,
+    signer: Optional[TransactionSigner] = None,
+):
     """Close a loyalty offer.
     This action can only happen before an offer has begun, in which case it is
     cancelled, or after an offer has expired.
@@ -217,22 +492,50 @@ def closeLoyaltyOffer(client: AlgodClient, appID: int, closer: Account):
         closer: The account initiating the close transaction. This must be
             the offer creator if you wish to close the
             offer before it starts. Otherwise, this can be any account.
+        paramsProvider: An optional cache of suggested transaction parameters.
+        stateCache: An optional cache of offer states. If the offer is in it,
+            its state is not read from algod. The offer is removed from it once
+            closed.
+        signer: An optional batch signer. Transactions are signed inline by default.
     """
-    appGlobalState = getAppGlobalState(client, appID)
+    appGlobalState = getOfferState(client, appID, stateCache)
+    if appGlobalState.creator is None:
+        # cached without its creator, who the escrow is closed out to
+        appGlobalState = OfferState.FromApplicationInfo(client.application_info(appID))
+
+    def build(suggestedParams: transaction.SuggestedParams) -> List[transaction.SignedTransaction]:
+        deleteTxn = buildDeleteTxn(closer, appID, appGlobalState, suggestedParams)
+        return signTransactions([deleteTxn], closer, signer)
+
+    submitAndWait(
+        client,
+        build(getSuggestedParams(client, paramsProvider)),
+        rebuild=lambda: build(getFreshSuggestedParams(client, paramsProvider)),
+    )
 
-    rewardAssetID = appGlobalState[b"reward_asset_id"]
+    if stateCache is not None:
+        stateCache.remove(appID)
 
-    accounts: List[str] = [encoding.encode_address(appGlobalState[b"customer_account"])]
 
-    deleteTxn = transaction.ApplicationDeleteTxn(
+def buildDeleteTxn(
+    closer: Account,
+    appID: int,
+    appGlobalState: Union[OfferState, AppState],
+    suggestedParams: transaction.SuggestedParams,
+) -> transaction.ApplicationDeleteTxn:
+    """Build the unsigned delete transaction that closes an offer."""
+    offerState = asOfferState(appGlobalState)
+    rewardAssetID = offerState.rewardAssetID
+
+    accounts: List[str] = [encoding.encode_address(offerState.customerKey)]
+    if offerState.creator is not None and offerState.creator != closer.getAddress():
+        # the escrow is closed out to the creator, who must be referenced if not the sender
+        accounts.append(offerState.creator)
+
+    return transaction.ApplicationDeleteTxn(
         sender=closer.getAddress(),
         index=appID,
         accounts=accounts,
         foreign_assets=[rewardAssetID],
-        sp=client.suggested_params(),
+        sp=suggestedParams,
     )
-    signedDeleteTxn = deleteTxn.sign(closer.getPrivateKey())
-
-    client.send_transaction(signedDeleteTxn)
-
-    waitForTransaction(client, signedDeleteTxn.get_txid())
\ No newline at end of file
@@ -1,14 +1,29 @@
-from time import time, sleep
-
 import pytest
 
 from algosdk import account, encoding
 from algosdk.logic import get_application_address
 
-from .operations import createLoyaltyOfferApp, setupLoyaltyOfferApp, completeAction, closeLoyaltyOffer
+from .operations import (
+    createLoyaltyOfferApp,
+    createLoyaltyOfferApps,
+    setupLoyaltyOfferApp,
+    completeAction,
+    closeLoyaltyOffer,
+    LoyaltyOffer,
+    MAX_GROUP_SIZE,
+)
+from .holdings import HoldingsCache
+from .state import OfferStateCache
 from .util import getBalances, getAppGlobalState, getLastBlockTimestamp
 from .testing.setup import getAlgodClient
-from .testing.resources import getTemporaryAccount, optInToAsset, createDummyAsset
+from .testing.resources import (
+    getTemporaryAccount,
+    optInToAsset,
+    createDummyAsset,
+    getCurrentTime,
+    waitUntilTimestamp,
+    optInAccountsToAsset,
+)
 
 
 def test_create():
@@ -20,7 +35,7 @@ def test_create():
     tokenAmount = 1_000
     tokenID = createDummyAsset(client, tokenAmount, creator)
 
-    startTime = int(time()) + 10  # start time is 10 seconds in the future
+    startTime = getCurrentTime(client) + 10  # start time is 10 seconds in the future
     endTime = startTime + 60  # end time is 1 minute after start
     rewardAmount = 100  # 100 reward tokens
     actionID = 101
@@ -50,6 +65,110 @@ def test_create():
     assert actual == expected
 
 
+def test_create_batch():
+    client = getAlgodClient()
+
+    creator = getTemporaryAccount(client)
+
+    tokenAmount = 1_000
+    tokenID = createDummyAsset(client, tokenAmount, creator)
+
+    startTime = getCurrentTime(client) + 10  # start time is 10 seconds in the future
+    endTime = startTime + 60  # end time is 1 minute after start
+    rewardAmount = 10
+
+    offers = [
+        LoyaltyOffer(
+            customer=account.generate_account()[1],
+            startTime=startTime,
+            endTime=endTime,
+            rewardAssetID=tokenID,
+            rewardAmount=rewardAmount,
+            actionID=100 + i,
+        )
+        for i in range(20)
+    ]
+    # an offer that ends before it starts can never be created
+    offers.insert(3, offers[3]._replace(endTime=startTime - 1))
+
+    results = createLoyaltyOfferApps(client, creator, offers)
+
+    assert len(results) == len(offers)
+    assert results[3].appID is None and results[3].error is not None
+
+    for offer, result in zip(offers[:3] + offers[4:], results[:3] + results[4:]):
+        assert result.error is None
+        state = getAppGlobalState(client, result.appID)
+        assert state[b"customer_account"] == encoding.decode_address(offer.customer)
+        assert state[b"action_id"] == offer.actionID
+
+
+def test_create_batch_reads_block(monkeypatch):
+    client = getAlgodClient()
+
+    creator = getTemporaryAccount(client)
+    tokenID = createDummyAsset(client, 1_000, creator)
+
+    startTime = getCurrentTime(client) + 10
+    offers = [
+        LoyaltyOffer(
+            customer=account.generate_account()[1],
+            startTime=startTime,
+            endTime=startTime + 60,
+            rewardAssetID=tokenID,
+            rewardAmount=10,
+            actionID=100 + i,
+        )
+        for i in range(MAX_GROUP_SIZE + 1)
+    ]
+
+    lookups = []
+    pendingTransactionInfo = client.pending_transaction_info
+
+    def countingLookup(txID, *args, **kwargs):
+        lookups.append(txID)
+        return pendingTransactionInfo(txID, *args, **kwargs)
+
+    monkeypatch.setattr(client, "pending_transaction_info", countingLookup)
+
+    results = createLoyaltyOfferApps(client, creator, offers)
+
+    # the app IDs of a group come from its block, not from a lookup per offer
+    assert len(lookups) <= 2
+    assert len(set(result.appID for result in results)) == len(offers)
+    for offer, result in zip(offers, results):
+        state = getAppGlobalState(client, result.appID)
+        assert state[b"action_id"] == offer.actionID
+
+
+def test_create_batch_skips_unfundable():
+    client = getAlgodClient()
+
+    creator = getTemporaryAccount(client)
+    tokenID = createDummyAsset(client, 1_000, creator)
+
+    customers = [getTemporaryAccount(client) for _ in range(4)]
+    optInAccountsToAsset(client, tokenID, customers[:2])
+
+    startTime = getCurrentTime(client) + 10
+    offers = [
+        LoyaltyOffer(
+            customer=customer.getAddress(),
+            startTime=startTime,
+            endTime=startTime + 60,
+            rewardAssetID=tokenID,
+            rewardAmount=10,
+            actionID=101,
+        )
+        for customer in customers
+    ]
+
+    results = createLoyaltyOfferApps(client, creator, offers, holdings=HoldingsCache(client))
+
+    assert [result.appID is not None for result in results] == [True, True, False, False]
+    assert "not opted in" in str(results[2].error)
+
+
 def test_setup():
     client = getAlgodClient()
 
@@ -59,7 +178,7 @@ def test_setup():
     tokenAmount = 1_000
     tokenID = createDummyAsset(client, tokenAmount, creator)
 
-    startTime = int(time()) + 10  # start time is 10 seconds in the future
+    startTime = getCurrentTime(client) + 10  # start time is 10 seconds in the future
     endTime = startTime + 60  # end time is 1 minute after start
     rewardAmount = 100  # 100 reward tokens (e.g. points, miles, starts etc.)
     actionID = 101
@@ -111,7 +230,7 @@ def test_complete_action_before_start():
     tokenAmount = 1_000
     tokenID = createDummyAsset(client, tokenAmount, creator)
 
-    startTime = int(time()) + 5 * 60  # start time is 5 minutes in the future
+    startTime = getCurrentTime(client) + 5 * 60  # start time is 5 minutes in the future
     endTime = startTime + 60  # end time is 1 minute after start
     rewardAmount = 100  # 100 reward tokens
     actionID = 101
@@ -154,7 +273,7 @@ def test_complete_action():
     # customer opt-in to reward asset
     optInToAsset(client, tokenID, customer)
 
-    startTime = int(time()) + 10  # start time is 10 seconds in the future
+    startTime = getCurrentTime(client) + 10  # start time is 10 seconds in the future
     endTime = startTime + 300  # end time is 5 minutes after start
     rewardAmount = 100  # 1 reward tokens
     actionID = 101
@@ -181,10 +300,7 @@ def test_complete_action():
     appContractBalances = getBalances(client, get_application_address(appID))
     assert appContractBalances == {0: 2 * 100_000 + 2 * 1000, tokenID: rewardAmount}
 
-    _, lastRoundTime = getLastBlockTimestamp(client)
-    if lastRoundTime < startTime + 5:
-        sleep_time = startTime + 5 - lastRoundTime
-        sleep(sleep_time)
+    waitUntilTimestamp(client, startTime + 5)
 
     completeAction(client=client, owner=creator, appID=appID, actionID=actionID)
 
@@ -220,7 +336,7 @@ def test_close_before_start():
     tokenAmount = 1_000
     tokenID = createDummyAsset(client, tokenAmount, creator)
 
-    startTime = int(time()) + 5 * 60  # start time is 5 minutes in the future
+    startTime = getCurrentTime(client) + 5 * 60  # start time is 5 minutes in the future
     endTime = startTime + 60  # end time is 1 minute after start
     rewardAmount = 100  # 100 reward tokens
     actionID = 101
@@ -264,7 +380,7 @@ def test_close_no_action():
     tokenAmount = 1_000
     tokenID = createDummyAsset(client, tokenAmount, creator)
 
-    startTime = int(time()) + 10  # start time is 10 seconds in the future
+    startTime = getCurrentTime(client) + 10  # start time is 10 seconds in the future
     endTime = startTime + 30  # end time is 30 seconds after start
     rewardAmount = 100  # 100 reward tokens
     actionID = 101
@@ -288,9 +404,7 @@ def test_close_no_action():
         rewardAmount=rewardAmount,
     )
 
-    _, lastRoundTime = getLastBlockTimestamp(client)
-    if lastRoundTime < endTime + 5:
-        sleep(endTime + 5 - lastRoundTime)
+    waitUntilTimestamp(client, endTime + 5)
 
     closeLoyaltyOffer(client, appID, creator)
 
@@ -298,3 +412,42 @@ def test_close_no_action():
     expectedAppBalances = {0: 0}
 
     assert actualAppBalances == expectedAppBalances
+
+
+def test_close_cached_offer_as_other_account():
+    client = getAlgodClient()
+
+    creator = getTemporaryAccount(client)
+    closer = getTemporaryAccount(client)
+    customer = getTemporaryAccount(client)
+    tokenID = createDummyAsset(client, 1_000, creator)
+
+    startTime = getCurrentTime(client) + 10
+    endTime = startTime + 10
+    stateCache = OfferStateCache()
+    appIDs = []
+    for actionID in (101, 102):
+        appID = createLoyaltyOfferApp(
+            client=client,
+            sender=creator,
+            customer=customer.getAddress(),
+            startTime=startTime,
+            endTime=endTime,
+            rewardAssetID=tokenID,
+            rewardAmount=100,
+            actionID=actionID,
+            stateCache=stateCache,
+        )
+        setupLoyaltyOfferApp(client, appID, creator, tokenID, 100, stateCache=stateCache)
+        appIDs.append(appID)
+
+    # the second offer is cached without its creator
+    stateCache.creators.pop(appIDs[1])
+
+    waitUntilTimestamp(client, endTime + 5)
+
+    # the reward goes back to the creator, who must be referenced by the closer
+    for appID in appIDs:
+        closeLoyaltyOffer(client, appID, closer, stateCache=stateCache)
+        assert getBalances(client, get_application_address(appID)) == {0: 0}
+    assert getBalances(client, creator.getAddress())[tokenID] == 1_000
@@ -0,0 +1,99 @@
+from typing import Optional
+import copy
+import threading
+import time
+
+from algosdk.v2client.algod import AlgodClient
+from algosdk.future import transaction
+
+from .util import getConfirmationTracker
+
+# a little more than the average block time
+DEFAULT_MAX_AGE = 5.0
+
+DEFAULT_REFRESH_MARGIN = 10
+
+
+class SuggestedParamsProvider:
+    """Caches suggested transaction parameters across operations.
+
+    The cached parameters are refreshed the next time they are requested after
+    the round has advanced past their first valid round, after maxAge seconds,
+    or when fewer than refreshMargin rounds of their validity window are left.
+    New rounds are learned from the client's shared confirmation tracker, so
+    operations that wait for transactions keep the provider current for free.
+    """
+
+    def __init__(
+        self,
+        client: AlgodClient,
+        maxAge: float = DEFAULT_MAX_AGE,
+        refreshMargin: int = DEFAULT_REFRESH_MARGIN,
+    ) -> None:
+        self.client = client
+        self.maxAge = maxAge
+        self.refreshMargin = refreshMargin
+
+        self.lock = threading.Lock()
+        self.params: Optional[transaction.SuggestedParams] = None
+        self.fetchedAt = 0.0
+        self.latestRound = 0
+
+        getConfirmationTracker(client).addRoundListener(self.observeRound)
+
+    def observeRound(self, round: int) -> None:
+        """Record that the chain has reached a round."""
+        with self.lock:
+            if round > self.latestRound:
+                self.latestRound = round
+
+    def invalidate(self) -> None:
+        """Force the next call to get to fetch new parameters."""
+        with self.lock:
+            self.params = None
+
+    def isStale(self) -> bool:
+        if self.params is None:
+            return True
+
+        if time.monotonic() - self.fetchedAt > self.maxAge:
+            return True
+
+        if self.latestRound > self.params.first:
+            return True
+
+        currentRound = max(self.latestRound, self.params.first)
+        return self.params.last - currentRound <= self.refreshMargin
+
+    def get(self) -> transaction.SuggestedParams:
+        """Get suggested parameters, fetching them from algod only if stale.
+        Returns:
+            A copy of the cached parameters that the caller is free to modify.
+        """
+        with self.lock:
+            if self.isStale():
+                self.params = self.client.suggested_params()
+                self.fetchedAt = time.monotonic()
+                self.latestRound = max(self.latestRound, self.params.first)
+            return copy.copy(self.params)
+
+
+def getSuggestedParams(
+    client: AlgodClient, paramsProvider: Optional[SuggestedParamsProvider] = None
+) -> transaction.SuggestedParams:
+    """Get suggested parameters from a provider if one is given, else from algod."""
+    if paramsProvider is not None:
+        return paramsProvider.get()
+    return client.suggested_params()
+
+
+def getFreshSuggestedParams(
+    client: AlgodClient, paramsProvider: Optional[SuggestedParamsProvider] = None
+) -> transaction.SuggestedParams:
+    """Get suggested parameters from algod, refreshing the provider if one is given.
+    Used to rebuild transactions whose validity window has passed.
+    """
+    if paramsProvider is not None:
+        paramsProvider.invalidate()
+        return paramsProvider.get()
+    return client.suggested_params()
@@ -0,0 +1,54 @@
+from algosdk.future import transaction
+
+from .params import SuggestedParamsProvider
+
+
+class ParamsCounter:
+    def __init__(self) -> None:
+        self.round = 10
+        self.calls = 0
+
+    def suggested_params(self):
+        self.calls += 1
+        return transaction.SuggestedParams(
+            1000, self.round, self.round + 1000, "gh", "gen", False, "v1", 1000
+        )
+
+
+def test_provider_refreshes_once_per_round():
+    client = ParamsCounter()
+    provider = SuggestedParamsProvider(client, maxAge=60)
+
+    first = [provider.get() for _ in range(100)]
+    assert client.calls == 1
+    assert all(params.first == 10 for params in first)
+
+    client.round = 11
+    provider.observeRound(11)
+
+    second = [provider.get() for _ in range(100)]
+    assert client.calls == 2
+    assert all(params.first == 11 for params in second)
+
+
+def test_provider_returns_copies():
+    client = ParamsCounter()
+    provider = SuggestedParamsProvider(client, maxAge=60)
+
+    params = provider.get()
+    params.fee = 5000
+    params.flat_fee = True
+
+    assert provider.get().fee == 1000
+    assert client.calls == 1
+
+
+def test_provider_refreshes_near_last_valid():
+    client = ParamsCounter()
+    provider = SuggestedParamsProvider(client, maxAge=60, refreshMargin=10)
+
+    provider.get()
+    provider.params.last = provider.params.first + 5
+
+    provider.get()
+    assert client.calls == 2
@@ -0,0 +1,105 @@
+import os
+import json
+import hashlib
+import tempfile
+from typing import Optional
+from base64 import b64encode, b64decode
+
+PROGRAM_CACHE_DIR_ENV = "LOYALTY_PROGRAM_CACHE_DIR"
+
+
+def tealKey(teal: str, version: int) -> str:
+    """Get the content address of a TEAL program.
+    Args:
+        teal: The TEAL source code of the program.
+        version: The TEAL version the program was generated for.
+    Returns:
+        A hex encoded SHA-256 digest of the version and source code.
+    """
+    digest = hashlib.sha256()
+    digest.update("v{}\n".format(version).encode("utf-8"))
+    digest.update(teal.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ProgramCache:
+    """A content-addressed, on-disk cache of compiled TEAL programs.
+
+    Each entry is stored in its own file named after the hash of the TEAL
+    source and version, together with a hash of the compiled bytecode so that
+    truncated or tampered entries are never returned.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".json")
+
+    def get(self, teal: str, version: int) -> Optional[bytes]:
+        """Load a verified compiled program from the cache.
+        Args:
+            teal: The TEAL source code of the program.
+            version: The TEAL version the program was generated for.
+        Returns:
+            The compiled program, or None if there is no valid entry for it.
+        """
+        key = tealKey(teal, version)
+
+        try:
+            with open(self.path(key), "r") as f:
+                entry = json.load(f)
+            program = b64decode(entry["program"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+        if entry.get("key") != key or entry.get("version") != version:
+            return None
+
+        if entry.get("program_sha256") != hashlib.sha256(program).hexdigest():
+            return None
+
+        return program
+
+    def put(self, teal: str, version: int, program: bytes) -> None:
+        """Atomically store a compiled program in the cache.
+        Args:
+            teal: The TEAL source code of the program.
+            version: The TEAL version the program was generated for.
+            program: The compiled program bytes.
+        """
+        key = tealKey(teal, version)
+        entry = {
+            "key": key,
+            "version": version,
+            "program": b64encode(program).decode("ascii"),
+            "program_sha256": hashlib.sha256(program).hexdigest(),
+        }
+
+        os.makedirs(self.directory, exist_ok=True)
+
+        fd, tmpPath = tempfile.mkstemp(dir=self.directory, prefix=".tmp-", suffix=".json")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(entry, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmpPath, self.path(key))
+        except BaseException:
+            try:
+                os.unlink(tmpPath)
+            except OSError:
+                pass
+            raise
+
+
+def getDefaultProgramCache() -> Optional[ProgramCache]:
+    """Get the program cache configured by the environment.
+    Returns:
+        A ProgramCache rooted at the directory named by the
+        LOYALTY_PROGRAM_CACHE_DIR environment variable, or None if it is not set.
+    """
+    directory = os.environ.get(PROGRAM_CACHE_DIR_ENV)
+    if not directory:
+        return None
+    return ProgramCache(directory)
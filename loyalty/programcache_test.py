@@ -0,0 +1,67 @@
+import os
+import json
+from base64 import b64encode
+
+import pytest
+
+from .programcache import ProgramCache, tealKey
+from .util import compileProgram, TEAL_VERSION
+
+TEAL = "#pragma version 5\nint 1\nreturn\n"
+PROGRAM = b"\x05\x81\x01\x43"
+
+
+class CompileCounter:
+    def __init__(self) -> None:
+        self.calls = 0
+
+    def compile(self, source):
+        self.calls += 1
+        return {"result": b64encode(PROGRAM).decode("ascii"), "hash": ""}
+
+
+def test_roundtrip(tmp_path):
+    cache = ProgramCache(str(tmp_path))
+
+    assert cache.get(TEAL, TEAL_VERSION) is None
+
+    cache.put(TEAL, TEAL_VERSION, PROGRAM)
+
+    assert cache.get(TEAL, TEAL_VERSION) == PROGRAM
+    assert cache.get(TEAL, TEAL_VERSION + 1) is None
+    assert [name for name in os.listdir(tmp_path)] == [tealKey(TEAL, TEAL_VERSION) + ".json"]
+
+
+def test_corrupted_entry(tmp_path):
+    cache = ProgramCache(str(tmp_path))
+    cache.put(TEAL, TEAL_VERSION, PROGRAM)
+
+    path = cache.path(tealKey(TEAL, TEAL_VERSION))
+    with open(path) as f:
+        entry = json.load(f)
+    entry["program"] = b64encode(b"\x05\x81\x00\x43").decode("ascii")
+    with open(path, "w") as f:
+        json.dump(entry, f)
+
+    assert cache.get(TEAL, TEAL_VERSION) is None
+
+
+def test_compileProgram(tmp_path):
+    cache = ProgramCache(str(tmp_path))
+    client = CompileCounter()
+
+    assert compileProgram(client, TEAL, cache) == PROGRAM
+    assert compileProgram(client, TEAL, cache) == PROGRAM
+    assert client.calls == 1
+
+    assert compileProgram(None, TEAL, cache, offline=True) == PROGRAM
+
+
+def test_compileProgram_offline_miss(tmp_path):
+    cache = ProgramCache(str(tmp_path))
+    client = CompileCounter()
+
+    with pytest.raises(Exception):
+        compileProgram(client, TEAL, cache, offline=True)
+
+    assert client.calls == 0
@@ -0,0 +1,317 @@
+"""Creates and sets up a stream of offers as a pipeline.
+
+Provisioning an offer one at a time waits for two confirmations in a row: one
+for the app create, to learn the app ID, and one for the fund/setup/asset
+transfer group. The provisioner keeps many offers between those two steps at
+once. Offers are read from an iterator and packed into groups of app creates,
+and as soon as a create group confirms, the setup groups of its offers are
+sent, while later create groups are still waiting for their rounds. Every
+group goes through the client's submission scheduler, so the number of groups
+in flight follows what the node accepts.
+
+    for result in provisionOffers(client, creator, offers):
+        if result.error is not None:
+            ...
+"""
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+import queue
+
+from algosdk.future import transaction
+from algosdk.v2client.algod import AlgodClient
+
+from .account import Account
+from .operations import (
+    LoyaltyOffer,
+    MAX_GROUP_SIZE,
+    buildCreateTxn,
+    buildSetupTxns,
+    getContracts,
+    validateOffer,
+)
+from .holdings import HoldingsCache, optInErrors
+from .params import SuggestedParamsProvider, getFreshSuggestedParams, getSuggestedParams
+from .scheduler import Submission, getSubmissionScheduler
+from .signer import TransactionSigner, signTransactions
+from .state import OfferStateCache
+from .util import getGroupResponses
+
+DEFAULT_MAX_PENDING = 128
+
+# offers with their position in the input
+Group = List[Tuple[int, LoyaltyOffer]]
+
+SignedTxns = List[transaction.SignedTransaction]
+
+# the kinds of completed submissions
+CREATE = "create"
+SETUP = "setup"
+
+
+class ProvisionResult(NamedTuple):
+    """The outcome of provisioning one offer.
+    The offer is ready if error is None. If appID is set as well as error, the
+    offer was created but could not be set up.
+    """
+
+    position: int
+    offer: LoyaltyOffer
+    appID: Optional[int]
+    error: Optional[Exception]
+
+
+class OfferProvisioner:
+    """Creates offers and sets them up as a two stage pipeline.
+
+    Args:
+        client: An algod client.
+        creator: The account that creates the offer apps.
+        funder: The account that funds the offers and transfers their reward.
+            Defaults to creator.
+        groupSize: The maximum number of app creates per transaction group.
+        maxPending: The maximum number of offers that are created or being
+            created but not set up yet. Offers are read from the input only
+            while there are fewer.
+        paramsProvider: A cache of suggested transaction parameters. Defaults
+            to a new one for the client.
+        stateCache: An optional cache that the new offers' states are added to.
+        signer: An optional batch signer. Transactions are signed inline by default.
+        holdings: An optional holdings cache. If it is given, offers whose
+            customer has not opted in to the reward asset fail before they are
+            created. The holdings of each batch of customers are fetched at once.
+    """
+
+    def __init__(
+        self,
+        client: AlgodClient,
+        creator: Account,
+        funder: Optional[Account] = None,
+        groupSize: int = MAX_GROUP_SIZE,
+        maxPending: int = DEFAULT_MAX_PENDING,
+        paramsProvider: Optional[SuggestedParamsProvider] = None,
+        stateCache: Optional[OfferStateCache] = None,
+        signer: Optional[TransactionSigner] = None,
+        holdings: Optional[HoldingsCache] = None,
+    ) -> None:
+        assert 1 <= groupSize <= MAX_GROUP_SIZE
+        assert maxPending >= 1
+
+        self.client = client
+        self.creator = creator
+        self.funder = funder or creator
+        self.groupSize = groupSize
+        self.maxPending = maxPending
+        self.paramsProvider = paramsProvider or SuggestedParamsProvider(client)
+        self.stateCache = stateCache
+        self.signer = signer
+        self.holdings = holdings
+        self.scheduler = getSubmissionScheduler(client)
+
+        # completed submissions, put by the scheduler's threads
+        self.completions: "queue.Queue[Tuple[str, Group, Submission]]" = queue.Queue()
+        self.pending = 0
+
+        self.stats: Dict[str, int] = {"created": 0, "setup": 0, "failed": 0}
+
+    def report(self) -> Dict[str, Any]:
+        return dict(self.stats, pending=self.pending)
+
+    def provision(self, offers: Iterable[LoyaltyOffer]) -> Iterator[ProvisionResult]:
+        """Create and set up offers.
+        Args:
+            offers: The offers to provision. The iterable is read lazily, in
+                batches of up to groupSize offers.
+        Returns:
+            An iterator over one ProvisionResult per offer, in the order they
+            finished. Each result has the offer's position in offers.
+        """
+        approval, clear = getContracts(self.client)
+        inputs = enumerate(offers)
+        exhausted = False
+
+        while True:
+            while not exhausted and self.pending < self.maxPending:
+                batch: Group = []
+                for position, offer in inputs:
+                    try:
+                        validateOffer(offer)
+                    except Exception as e:
+                        yield self.fail(position, offer, None, e, pending=False)
+                        continue
+                    batch.append((position, offer))
+                    if len(batch) >= min(self.groupSize, self.maxPending - self.pending):
+                        break
+                else:
+                    exhausted = True
+
+                if self.holdings is not None and len(batch) > 0:
+                    try:
+                        errors = optInErrors(self.holdings, [offer for _, offer in batch])
+                    except Exception as e:
+                        # e.g. the holdings couldn't be fetched; only this batch fails
+                        for position, offer in batch:
+                            yield self.fail(position, offer, None, e, pending=False)
+                        continue
+                    for (position, offer), error in zip(batch, errors):
+                        if error is not None:
+                            yield self.fail(position, offer, None, error, pending=False)
+                    batch = [entry for entry, error in zip(batch, errors) if error is None]
+
+                if len(batch) > 0:
+                    self.pending += len(batch)
+                    self.submitCreate(batch, approval, clear)
+
+            if self.pending == 0:
+                return
+
+            kind, group, submission = self.completions.get()
+            if kind == CREATE:
+                yield from self.onCreated(group, submission)
+            else:
+                yield from self.onSetUp(group, submission)
+
+    def submit(
+        self,
+        kind: str,
+        group: Group,
+        signedTxns: SignedTxns,
+        rebuild: Callable[[], SignedTxns],
+        trackIndex: int = 0,
+    ) -> None:
+        submission = self.scheduler.submit(signedTxns, rebuild=rebuild, trackIndex=trackIndex)
+        # runs on the scheduler's threads, which must not be blocked
+        submission.future.add_done_callback(
+            lambda _: self.completions.put((kind, group, submission))
+        )
+
+    def submitCreate(self, group: Group, approval: bytes, clear: bytes) -> None:
+        def build(suggestedParams: transaction.SuggestedParams) -> SignedTxns:
+            txns = [
+                buildCreateTxn(self.creator, offer, approval, clear, suggestedParams)
+                for _, offer in group
+            ]
+            if len(txns) > 1:
+                transaction.assign_group_id(txns)
+            return signTransactions(txns, self.creator, self.signer)
+
+        try:
+            signedTxns = build(getSuggestedParams(self.client, self.paramsProvider))
+            self.submit(
+                CREATE,
+                group,
+                signedTxns,
+                lambda: build(getFreshSuggestedParams(self.client, self.paramsProvider)),
+            )
+        except Exception as e:
+            # reported with the next completions
+            self.completions.put((CREATE, group, failedSubmission(e)))
+
+    def onCreated(self, group: Group, submission: Submission) -> Iterator[ProvisionResult]:
+        created: List[Tuple[int, LoyaltyOffer, int]] = []
+        try:
+            tracked = submission.result()
+            # the group may have been rebuilt, so its transaction IDs are read back
+            responses = getGroupResponses(self.client, tracked, submission.txIDs())
+            for (position, offer), response in zip(group, responses):
+                assert response.applicationIndex is not None and response.applicationIndex > 0
+                created.append((position, offer, response.applicationIndex))
+        except Exception as e:
+            for position, offer in group:
+                yield self.fail(position, offer, None, e)
+            return
+
+        self.stats["created"] += len(created)
+        if self.stateCache is not None:
+            for _, offer, appID in created:
+                self.stateCache.recordCreation(appID, offer, self.creator.getAddress())
+
+        yield from self.submitSetups(created)
+
+    def submitSetups(
+        self, created: List[Tuple[int, LoyaltyOffer, int]]
+    ) -> Iterator[ProvisionResult]:
+        def buildGroups(
+            suggestedParams: transaction.SuggestedParams,
+            offers: List[Tuple[int, LoyaltyOffer, int]],
+        ) -> List[SignedTxns]:
+            groups = [
+                buildSetupTxns(
+                    self.funder, appID, offer.rewardAssetID, offer.rewardAmount, suggestedParams
+                )
+                for _, offer, appID in offers
+            ]
+            # sign every group in one batch, so a parallel signer can spread them out
+            signedTxns = signTransactions(
+                [txn for txns in groups for txn in txns], self.funder, self.signer
+            )
+            return [signedTxns[i : i + 3] for i in range(0, len(signedTxns), 3)]
+
+        try:
+            params = getSuggestedParams(self.client, self.paramsProvider)
+            allSignedTxns = buildGroups(params, created)
+        except Exception as e:
+            for position, offer, appID in created:
+                yield self.fail(position, offer, appID, e)
+            return
+
+        for (position, offer, appID), signedTxns in zip(created, allSignedTxns):
+            entry = (position, offer, appID)
+
+            def rebuild(entry: Tuple[int, LoyaltyOffer, int] = entry) -> SignedTxns:
+                fresh = getFreshSuggestedParams(self.client, self.paramsProvider)
+                return buildGroups(fresh, [entry])[0]
+
+            try:
+                # the setup call is the only transaction in the group that changes the app state
+                self.submit(SETUP, [(position, offer)], signedTxns, rebuild, trackIndex=1)
+            except Exception as e:
+                yield self.fail(position, offer, appID, e)
+
+    def onSetUp(self, group: Group, submission: Submission) -> Iterator[ProvisionResult]:
+        (position, offer), = group
+        appID = submission.signedTxns[1].transaction.index
+        try:
+            response = submission.result()
+        except Exception as e:
+            yield self.fail(position, offer, appID, e)
+            return
+
+        if self.stateCache is not None:
+            self.stateCache.applyDelta(appID, response.globalStateDelta)
+
+        self.pending -= 1
+        self.stats["setup"] += 1
+        yield ProvisionResult(position=position, offer=offer, appID=appID, error=None)
+
+    def fail(
+        self,
+        position: int,
+        offer: LoyaltyOffer,
+        appID: Optional[int],
+        error: Exception,
+        pending: bool = True,
+    ) -> ProvisionResult:
+        if pending:
+            self.pending -= 1
+        self.stats["failed"] += 1
+        return ProvisionResult(position=position, offer=offer, appID=appID, error=error)
+
+
+def failedSubmission(error: Exception) -> Submission:
+    submission = Submission([], None, 0, 0)
+    submission.future.set_exception(error)
+    return submission
+
+
+def provisionOffers(
+    client: AlgodClient,
+    creator: Account,
+    offers: Iterable[LoyaltyOffer],
+    funder: Optional[Account] = None,
+    **kwargs: Any,
+) -> Iterator[ProvisionResult]:
+    """Create and set up offers as a pipeline.
+    See OfferProvisioner for the keyword arguments.
+    Returns:
+        An iterator over one ProvisionResult per offer, in the order they finished.
+    """
+    return OfferProvisioner(client, creator, funder, **kwargs).provision(offers)
@@ -0,0 +1,122 @@
+from algosdk import account
+from algosdk.logic import get_application_address
+
+from .holdings import HoldingsCache
+from .operations import LoyaltyOffer
+from .provisioner import OfferProvisioner
+from .state import OfferStateCache, OfferStatus
+from .util import getAppGlobalState, getBalances
+from .testing.setup import getAlgodClient
+from .testing.resources import getTemporaryAccount, createDummyAsset, getCurrentTime
+
+
+def test_provision():
+    client = getAlgodClient()
+
+    creator = getTemporaryAccount(client)
+    tokenID = createDummyAsset(client, 1_000, creator)
+
+    startTime = getCurrentTime(client) + 60
+    endTime = startTime + 60
+
+    offers = [
+        LoyaltyOffer(
+            customer=account.generate_account()[1],
+            startTime=startTime,
+            endTime=endTime,
+            rewardAssetID=tokenID,
+            rewardAmount=10 + i,
+            actionID=101 + i,
+        )
+        for i in range(7)
+    ]
+    # an offer that ends before it starts can never be created
+    offers[2] = offers[2]._replace(endTime=startTime - 1)
+
+    stateCache = OfferStateCache()
+    provisioner = OfferProvisioner(
+        client, creator, groupSize=3, maxPending=4, stateCache=stateCache
+    )
+    # offers are read lazily from any iterable
+    results = sorted(provisioner.provision(iter(offers)), key=lambda result: result.position)
+
+    assert [result.position for result in results] == list(range(len(offers)))
+    assert results[2].appID is None and results[2].error is not None
+
+    for result in results[:2] + results[3:]:
+        assert result.error is None
+        state = getAppGlobalState(client, result.appID)
+        assert state[b"status"] == 2
+        assert state[b"action_id"] == result.offer.actionID
+        assert stateCache.get(result.appID)[b"status"] == OfferStatus.FUNDED
+        balances = getBalances(client, get_application_address(result.appID))
+        assert balances[tokenID] == result.offer.rewardAmount
+
+    assert provisioner.report() == {"created": 6, "setup": 6, "failed": 1, "pending": 0}
+
+
+def test_provision_setup_failure():
+    client = getAlgodClient()
+
+    creator = getTemporaryAccount(client)
+    funder = getTemporaryAccount(client)  # doesn't hold the reward asset
+    tokenID = createDummyAsset(client, 1_000, creator)
+
+    startTime = getCurrentTime(client) + 60
+    offer = LoyaltyOffer(
+        customer=account.generate_account()[1],
+        startTime=startTime,
+        endTime=startTime + 60,
+        rewardAssetID=tokenID,
+        rewardAmount=10,
+        actionID=101,
+    )
+
+    (result,) = OfferProvisioner(client, creator, funder).provision([offer])
+
+    # the offer was created but can't be set up
+    assert result.appID is not None
+    assert result.error is not None
+    assert getAppGlobalState(client, result.appID)[b"status"] == 1
+
+
+class FailingHoldingsCache(HoldingsCache):
+    def __init__(self, client, failing):
+        super().__init__(client)
+        self.failing = failing
+
+    def fetch(self, address):
+        if address == self.failing:
+            raise Exception("holdings unavailable")
+        return super().fetch(address)
+
+
+def test_provision_holdings_failure():
+    client = getAlgodClient()
+
+    creator = getTemporaryAccount(client)
+    tokenID = createDummyAsset(client, 1_000, creator)
+    unavailable = account.generate_account()[1]
+
+    startTime = getCurrentTime(client) + 60
+    offers = [
+        LoyaltyOffer(
+            customer=customer,
+            startTime=startTime,
+            endTime=startTime + 60,
+            rewardAssetID=tokenID,
+            rewardAmount=10,
+            actionID=101,
+        )
+        for customer in [unavailable, creator.getAddress(), creator.getAddress()]
+    ]
+
+    holdings = FailingHoldingsCache(client, unavailable)
+    provisioner = OfferProvisioner(client, creator, groupSize=1, holdings=holdings)
+    results = sorted(provisioner.provision(offers), key=lambda result: result.position)
+
+    # only the batch whose holdings couldn't be fetched fails
+    assert results[0].appID is None
+    assert "holdings unavailable" in str(results[0].error)
+    assert [result.error for result in results[1:]] == [None, None]
+    assert provisioner.report() == {"created": 2, "setup": 2, "failed": 1, "pending": 0}
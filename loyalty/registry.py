@@ -0,0 +1,494 @@
+from typing import Tuple, List, Dict, Optional, NamedTuple, Sequence, Set, Callable, TypeVar
+from base64 import b64decode
+
+from algosdk.v2client.algod import AlgodClient
+from algosdk.future import transaction
+from algosdk.logic import get_application_address
+from algosdk import encoding
+
+from .account import Account
+from .artifacts import compileArtifact
+from .operations import LoyaltyOffer, MAX_GROUP_SIZE, validateOffer
+from .params import SuggestedParamsProvider, getSuggestedParams
+from .programcache import ProgramCache, getDefaultProgramCache
+from .signer import TransactionSigner, signTransactions
+from .util import waitForTransaction, waitForTransactions
+
+REGISTRY_APPROVAL_PROGRAM = b""
+REGISTRY_CLEAR_STATE_PROGRAM = b""
+
+# one global uint holds the offer count, every other global slot holds an offer
+REGISTRY_CAPACITY = 63
+
+# limits of a single application call
+MAX_APP_ARGS = 16
+MAX_APP_REFERENCES = 8
+MAX_APP_ACCOUNTS = 4
+# expiring an offer costs about 70 opcodes, so more keys per call would run
+# past the 700 opcode budget of an application call
+MAX_EXPIRE_KEYS = 8
+
+# the minimum fee of each inner transaction the registry will send
+INNER_TXN_FEE = 1_000
+
+T = TypeVar("T")
+
+
+class RegistryOffer(NamedTuple):
+    """An offer stored in a loyalty registry app."""
+
+    offerKey: int
+    customer: str
+    startTime: int
+    endTime: int
+    rewardAssetID: int
+    rewardAmount: int
+    actionID: int
+
+
+def encodeRegistryOffer(offer: LoyaltyOffer) -> bytes:
+    """Pack an offer into the 72 byte value stored by the registry contract."""
+    return (
+        encoding.decode_address(offer.customer)
+        + offer.startTime.to_bytes(8, "big")
+        + offer.endTime.to_bytes(8, "big")
+        + offer.rewardAssetID.to_bytes(8, "big")
+        + offer.rewardAmount.to_bytes(8, "big")
+        + offer.actionID.to_bytes(8, "big")
+    )
+
+
+def decodeRegistryOffer(offerKey: int, value: bytes) -> RegistryOffer:
+    """Unpack a value stored by the registry contract."""
+    fields = [int.from_bytes(value[i : i + 8], "big") for i in range(32, 72, 8)]
+    return RegistryOffer(offerKey, encoding.encode_address(value[:32]), *fields)
+
+
+def getRegistryContracts(
+    client: Optional[AlgodClient],
+    cache: Optional[ProgramCache] = None,
+    offline: bool = False,
+) -> Tuple[bytes, bytes]:
+    """Get the compiled TEAL contracts for the registry.
+    Args:
+        client: An algod client that has the ability to compile TEAL programs.
+            This may be None in offline mode.
+        cache: The on-disk cache of compiled programs. Defaults to the cache
+            named by the LOYALTY_PROGRAM_CACHE_DIR environment variable, if any.
+        offline: If True, never call algod and fail if either program is not
+            already in the cache.
+    Returns:
+        A tuple of 2 byte strings. The first is the approval program, and the
+        second is the clear state program.
+    """
+    global REGISTRY_APPROVAL_PROGRAM
+    global REGISTRY_CLEAR_STATE_PROGRAM
+
+    if len(REGISTRY_APPROVAL_PROGRAM) == 0:
+        if cache is None:
+            cache = getDefaultProgramCache()
+
+        approval = compileArtifact(client, "registry_approval", cache, offline)
+        clear = compileArtifact(client, "registry_clear", cache, offline)
+        REGISTRY_APPROVAL_PROGRAM, REGISTRY_CLEAR_STATE_PROGRAM = approval, clear
+
+    return REGISTRY_APPROVAL_PROGRAM, REGISTRY_CLEAR_STATE_PROGRAM
+
+
+def createLoyaltyRegistryApp(
+    client: AlgodClient,
+    sender: Account,
+    paramsProvider: Optional[SuggestedParamsProvider] = None,
+    signer: Optional[TransactionSigner] = None,
+) -> int:
+    """Create a new loyalty registry that can hold up to REGISTRY_CAPACITY offers.
+    Args:
+        client: An algod client.
+        sender: The account that will create and operate the registry.
+        paramsProvider: An optional cache of suggested transaction parameters.
+        signer: An optional batch signer. Transactions are signed inline by default.
+    Returns:
+        The ID of the newly created registry app.
+    """
+    approval, clear = getRegistryContracts(client)
+
+    txn = transaction.ApplicationCreateTxn(
+        sender=sender.getAddress(),
+        on_complete=transaction.OnComplete.NoOpOC,
+        approval_program=approval,
+        clear_program=clear,
+        global_schema=transaction.StateSchema(num_uints=1, num_byte_slices=REGISTRY_CAPACITY),
+        local_schema=transaction.StateSchema(num_uints=0, num_byte_slices=0),
+        sp=getSuggestedParams(client, paramsProvider),
+    )
+
+    signedTxn = signTransactions([txn], sender, signer)[0]
+
+    client.send_transaction(signedTxn)
+
+    response = waitForTransaction(client, signedTxn.get_txid())
+    assert response.applicationIndex is not None and response.applicationIndex > 0
+    return response.applicationIndex
+
+
+def setupLoyaltyRegistryApp(
+    client: AlgodClient,
+    appID: int,
+    funder: Account,
+    rewardAssetIDs: Sequence[int],
+    paramsProvider: Optional[SuggestedParamsProvider] = None,
+    signer: Optional[TransactionSigner] = None,
+) -> None:
+    """Fund a registry and opt it into reward assets, in one atomic group.
+    This can be called again later to add more reward assets.
+    Args:
+        client: An algod client.
+        appID: The app ID of the registry.
+        funder: The registry creator, who provides the funding.
+        rewardAssetIDs: The reward assets the registry should be able to hold.
+        paramsProvider: An optional cache of suggested transaction parameters.
+        signer: An optional batch signer. Transactions are signed inline by default.
+    """
+    appAddr = get_application_address(appID)
+    suggestedParams = getSuggestedParams(client, paramsProvider)
+
+    fundingAmount = (
+        # min account balance
+        100_000
+        # additional min balance and opt in fee for each reward asset
+        + len(rewardAssetIDs) * (100_000 + INNER_TXN_FEE)
+    )
+
+    txns: List[transaction.Transaction] = [
+        transaction.PaymentTxn(
+            sender=funder.getAddress(),
+            receiver=appAddr,
+            amt=fundingAmount,
+            sp=suggestedParams,
+        )
+    ]
+
+    for assetIDs in chunk(list(rewardAssetIDs), MAX_APP_REFERENCES):
+        txns.append(
+            transaction.ApplicationCallTxn(
+                sender=funder.getAddress(),
+                index=appID,
+                on_complete=transaction.OnComplete.NoOpOC,
+                app_args=[b"setup"],
+                foreign_assets=assetIDs,
+                sp=suggestedParams,
+            )
+        )
+
+    assert len(txns) <= MAX_GROUP_SIZE
+    transaction.assign_group_id(txns)
+
+    signedTxns = signTransactions(txns, funder, signer)
+
+    client.send_transactions(signedTxns)
+
+    waitForTransaction(client, signedTxns[0].get_txid())
+
+
+def getRegistryOffers(client: AlgodClient, appID: int) -> Dict[int, RegistryOffer]:
+    """Read every offer held by a registry with a single application_info call.
+    Returns:
+        A dict from offer key to offer.
+    """
+    return decodeRegistryState(client.application_info(appID))
+
+
+def decodeRegistryState(appInfo: Dict) -> Dict[int, RegistryOffer]:
+    offers: Dict[int, RegistryOffer] = dict()
+
+    for pair in appInfo["params"].get("global-state", []):
+        key = b64decode(pair["key"])
+        if len(key) != 8 or pair["value"]["type"] != 1:
+            continue
+
+        offerKey = int.from_bytes(key, "big")
+        offers[offerKey] = decodeRegistryOffer(offerKey, b64decode(pair["value"]["bytes"]))
+
+    return offers
+
+
+def addRegistryOffers(
+    client: AlgodClient,
+    owner: Account,
+    appID: int,
+    offers: Sequence[Tuple[int, LoyaltyOffer]],
+    paramsProvider: Optional[SuggestedParamsProvider] = None,
+    signer: Optional[TransactionSigner] = None,
+) -> None:
+    """Add many offers to a registry and fund their rewards.
+    Offers are added up to 7 per application call. Each group also transfers
+    the rewards of its offers to the registry and pays for the inner
+    transaction that will later pay out or return each reward.
+    Args:
+        client: An algod client.
+        owner: The registry creator.
+        appID: The app ID of the registry.
+        offers: Pairs of offer key and offer. Offer keys must be unique within
+            the registry.
+        paramsProvider: An optional cache of suggested transaction parameters.
+        signer: An optional batch signer. Transactions are signed inline by default.
+    """
+    for _, offer in offers:
+        validateOffer(offer)
+
+    appAddr = get_application_address(appID)
+    suggestedParams = getSuggestedParams(client, paramsProvider)
+
+    calls = chunk(list(offers), (MAX_APP_ARGS - 1) // 2)
+
+    groups: List[List[transaction.Transaction]] = []
+    groupCalls: List[List[Tuple[int, LoyaltyOffer]]] = []
+
+    def flush() -> None:
+        if len(groupCalls) == 0:
+            return
+
+        groupOffers = [offer for call in groupCalls for _, offer in call]
+
+        rewards: Dict[int, int] = dict()
+        for offer in groupOffers:
+            rewards[offer.rewardAssetID] = rewards.get(offer.rewardAssetID, 0) + offer.rewardAmount
+
+        txns: List[transaction.Transaction] = [
+            transaction.PaymentTxn(
+                sender=owner.getAddress(),
+                receiver=appAddr,
+                amt=len(groupOffers) * INNER_TXN_FEE,
+                sp=suggestedParams,
+            )
+        ]
+        for assetID, amount in rewards.items():
+            txns.append(
+                transaction.AssetTransferTxn(
+                    sender=owner.getAddress(),
+                    receiver=appAddr,
+                    index=assetID,
+                    amt=amount,
+                    sp=suggestedParams,
+                )
+            )
+        for call in groupCalls:
+            app_args: List[bytes] = [b"add"]
+            for offerKey, offer in call:
+                app_args.append(offerKey.to_bytes(8, "big"))
+                app_args.append(encodeRegistryOffer(offer))
+            txns.append(
+                transaction.ApplicationCallTxn(
+                    sender=owner.getAddress(),
+                    index=appID,
+                    on_complete=transaction.OnComplete.NoOpOC,
+                    app_args=app_args,
+                    sp=suggestedParams,
+                )
+            )
+
+        groups.append(txns)
+        groupCalls.clear()
+
+    for call in calls:
+        assets: Set[int] = {
+            offer.rewardAssetID for pending in groupCalls + [call] for _, offer in pending
+        }
+        # one payment, one asset transfer per reward asset, one call per chunk
+        if 1 + len(assets) + len(groupCalls) + 1 > MAX_GROUP_SIZE:
+            flush()
+        groupCalls.append(call)
+    flush()
+
+    sendGroups(client, owner, groups, signer)
+
+
+def completeRegistryActions(
+    client: AlgodClient,
+    owner: Account,
+    appID: int,
+    completions: Sequence[Tuple[int, int]],
+    paramsProvider: Optional[SuggestedParamsProvider] = None,
+    signer: Optional[TransactionSigner] = None,
+) -> None:
+    """Complete the actions of many registry offers.
+    The registry state is read once to find the customer and reward asset of
+    every offer, then completions are packed into as few application calls and
+    groups as the foreign account and asset limits allow.
+    Args:
+        client: An algod client.
+        owner: The registry creator.
+        appID: The app ID of the registry.
+        completions: Pairs of offer key and the identifier of the action that
+            was performed.
+        paramsProvider: An optional cache of suggested transaction parameters.
+        signer: An optional batch signer. Transactions are signed inline by default.
+    """
+    offers = getRegistryOffers(client, appID)
+
+    items: List[Tuple[RegistryOffer, int]] = []
+    for offerKey, actionID in completions:
+        if offerKey not in offers:
+            raise Exception("Offer {} not found in registry {}".format(offerKey, appID))
+        items.append((offers[offerKey], actionID))
+
+    def fits(call: List[Tuple[RegistryOffer, int]]) -> bool:
+        accounts = {offer.customer for offer, _ in call}
+        assets = {offer.rewardAssetID for offer, _ in call}
+        return (
+            1 + 2 * len(call) <= MAX_APP_ARGS
+            and len(accounts) <= MAX_APP_ACCOUNTS
+            and len(accounts) + len(assets) <= MAX_APP_REFERENCES
+        )
+
+    suggestedParams = getSuggestedParams(client, paramsProvider)
+
+    txns: List[transaction.Transaction] = []
+    for call in pack(items, fits):
+        app_args: List[bytes] = [b"complete"]
+        for offer, actionID in call:
+            app_args.append(offer.offerKey.to_bytes(8, "big"))
+            app_args.append(actionID.to_bytes(8, "big"))
+        txns.append(
+            transaction.ApplicationCallTxn(
+                sender=owner.getAddress(),
+                index=appID,
+                on_complete=transaction.OnComplete.NoOpOC,
+                app_args=app_args,
+                accounts=sorted({offer.customer for offer, _ in call}),
+                foreign_assets=sorted({offer.rewardAssetID for offer, _ in call}),
+                sp=suggestedParams,
+            )
+        )
+
+    sendGroups(client, owner, chunk(txns, MAX_GROUP_SIZE), signer)
+
+
+def expireRegistryOffers(
+    client: AlgodClient,
+    closer: Account,
+    appID: int,
+    offerKeys: Sequence[int],
+    paramsProvider: Optional[SuggestedParamsProvider] = None,
+    signer: Optional[TransactionSigner] = None,
+) -> None:
+    """Expire or cancel many registry offers and return their rewards to the creator.
+    Offers that have ended can be expired by any account. Offers that have not
+    started yet can only be cancelled by the registry creator.
+    Args:
+        client: An algod client.
+        closer: The account sending the expire calls.
+        appID: The app ID of the registry.
+        offerKeys: The keys of the offers to expire.
+        paramsProvider: An optional cache of suggested transaction parameters.
+        signer: An optional batch signer. Transactions are signed inline by default.
+    """
+    appInfo = client.application_info(appID)
+    creator: str = appInfo["params"]["creator"]
+    offers = decodeRegistryState(appInfo)
+
+    items: List[RegistryOffer] = []
+    for offerKey in offerKeys:
+        if offerKey not in offers:
+            raise Exception("Offer {} not found in registry {}".format(offerKey, appID))
+        items.append(offers[offerKey])
+
+    def fits(call: List[RegistryOffer]) -> bool:
+        assets = {offer.rewardAssetID for offer in call}
+        # the creator account is the only foreign account
+        return len(call) <= MAX_EXPIRE_KEYS and 1 + len(assets) <= MAX_APP_REFERENCES
+
+    suggestedParams = getSuggestedParams(client, paramsProvider)
+
+    txns: List[transaction.Transaction] = []
+    for call in pack(items, fits):
+        txns.append(
+            transaction.ApplicationCallTxn(
+                sender=closer.getAddress(),
+                index=appID,
+                on_complete=transaction.OnComplete.NoOpOC,
+                app_args=[b"expire"] + [offer.offerKey.to_bytes(8, "big") for offer in call],
+                accounts=[creator],
+                foreign_assets=sorted({offer.rewardAssetID for offer in call}),
+                sp=suggestedParams,
+            )
+        )
+
+    sendGroups(client, closer, chunk(txns, MAX_GROUP_SIZE), signer)
+
+
+def closeLoyaltyRegistry(
+    client: AlgodClient,
+    appID: int,
+    closer: Account,
+    rewardAssetIDs: Sequence[int],
+    paramsProvider: Optional[SuggestedParamsProvider] = None,
+    signer: Optional[TransactionSigner] = None,
+) -> None:
+    """Delete an empty registry and return its assets and Algos to the creator.
+    Args:
+        client: An algod client.
+        appID: The app ID of the registry.
+        closer: The registry creator.
+        rewardAssetIDs: Every reward asset the registry is opted into, at most 8.
+        paramsProvider: An optional cache of suggested transaction parameters.
+        signer: An optional batch signer. Transactions are signed inline by default.
+    """
+    deleteTxn = transaction.ApplicationDeleteTxn(
+        sender=closer.getAddress(),
+        index=appID,
+        foreign_assets=list(rewardAssetIDs),
+        sp=getSuggestedParams(client, paramsProvider),
+    )
+    signedDeleteTxn = signTransactions([deleteTxn], closer, signer)[0]
+
+    client.send_transaction(signedDeleteTxn)
+
+    waitForTransaction(client, signedDeleteTxn.get_txid())
+
+
+def chunk(items: List[T], size: int) -> List[List[T]]:
+    return [items[i : i + size] for i in range(0, len(items), size)]
+
+
+def pack(items: List[T], fits: Callable[[List[T]], bool]) -> List[List[T]]:
+    """Greedily split items into consecutive lists that each satisfy fits."""
+    packed: List[List[T]] = []
+    current: List[T] = []
+
+    for item in items:
+        if len(current) > 0 and not fits(current + [item]):
+            packed.append(current)
+            current = []
+        current.append(item)
+
+    if len(current) > 0:
+        packed.append(current)
+
+    return packed
+
+
+def sendGroups(
+    client: AlgodClient,
+    sender: Account,
+    groups: List[List[transaction.Transaction]],
+    signer: Optional[TransactionSigner] = None,
+) -> None:
+    """Sign every group in one batch, submit them, then wait for all of them together."""
+    for txns in groups:
+        if len(txns) > 1:
+            transaction.assign_group_id(txns)
+
+    allSignedTxns = signTransactions([txn for txns in groups for txn in txns], sender, signer)
+
+    txIDs: List[str] = []
+    offset = 0
+    for txns in groups:
+        signedTxns = allSignedTxns[offset : offset + len(txns)]
+        offset += len(txns)
+
+        client.send_transactions(signedTxns)
+
+        txIDs.append(signedTxns[0].get_txid())
+
+    waitForTransactions(client, txIDs)
@@ -0,0 +1,103 @@
+import pytest
+
+from algosdk import account
+from algosdk.logic import get_application_address
+
+from .operations import LoyaltyOffer
+from .registry import (
+    createLoyaltyRegistryApp,
+    setupLoyaltyRegistryApp,
+    addRegistryOffers,
+    completeRegistryActions,
+    expireRegistryOffers,
+    getRegistryOffers,
+    encodeRegistryOffer,
+    decodeRegistryOffer,
+    RegistryOffer,
+)
+from .util import getBalances
+from .testing.setup import getAlgodClient
+from .testing.resources import (
+    getTemporaryAccount,
+    optInToAsset,
+    createDummyAsset,
+    getCurrentTime,
+    waitUntilTimestamp,
+)
+
+
+def test_encode_decode():
+    _, customer = account.generate_account()
+    offer = LoyaltyOffer(customer, 1_000, 2_000, 5, 100, 101)
+
+    value = encodeRegistryOffer(offer)
+
+    assert len(value) == 72
+    assert decodeRegistryOffer(9, value) == RegistryOffer(9, *offer)
+
+
+def test_add():
+    client = getAlgodClient()
+
+    creator = getTemporaryAccount(client)
+    tokenID = createDummyAsset(client, 1_000, creator)
+
+    appID = createLoyaltyRegistryApp(client, creator)
+    setupLoyaltyRegistryApp(client, appID, creator, [tokenID])
+
+    startTime = getCurrentTime(client) + 60
+    offers = [
+        (i, LoyaltyOffer(account.generate_account()[1], startTime, startTime + 60, tokenID, 10, 100 + i))
+        for i in range(20)
+    ]
+
+    addRegistryOffers(client, creator, appID, offers)
+
+    actual = getRegistryOffers(client, appID)
+    expected = {key: RegistryOffer(key, *offer) for key, offer in offers}
+    assert actual == expected
+
+    balances = getBalances(client, get_application_address(appID))
+    assert balances[tokenID] == 20 * 10
+
+    # an offer key can only be used once
+    with pytest.raises(Exception):
+        addRegistryOffers(client, creator, appID, offers[:1])
+
+    # cancel every offer before it starts
+    expireRegistryOffers(client, creator, appID, [key for key, _ in offers])
+
+    assert getRegistryOffers(client, appID) == {}
+    assert getBalances(client, creator.getAddress())[tokenID] == 1_000
+
+
+def test_complete():
+    client = getAlgodClient()
+
+    creator = getTemporaryAccount(client)
+    customers = [getTemporaryAccount(client) for _ in range(5)]
+    tokenID = createDummyAsset(client, 1_000, creator)
+    for customer in customers:
+        optInToAsset(client, tokenID, customer)
+
+    appID = createLoyaltyRegistryApp(client, creator)
+    setupLoyaltyRegistryApp(client, appID, creator, [tokenID])
+
+    startTime = getCurrentTime(client) + 10
+    endTime = startTime + 300
+    offers = [
+        (i, LoyaltyOffer(customer.getAddress(), startTime, endTime, tokenID, 10, 101))
+        for i, customer in enumerate(customers)
+    ]
+    addRegistryOffers(client, creator, appID, offers)
+
+    waitUntilTimestamp(client, startTime + 5)
+
+    # the last offer's action does not match, so it stays open
+    completeRegistryActions(client, creator, appID, [(0, 101), (1, 101), (2, 101), (3, 101), (4, 102)])
+
+    assert list(getRegistryOffers(client, appID).keys()) == [4]
+
+    for customer in customers[:4]:
+        assert getBalances(client, customer.getAddress())[tokenID] == 10
+    assert getBalances(client, customers[4].getAddress())[tokenID] == 0
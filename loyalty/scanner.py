@@ -0,0 +1,179 @@
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+from base64 import b64encode
+from concurrent.futures import ThreadPoolExecutor
+import collections
+
+from algosdk.error import AlgodHTTPError
+from algosdk.v2client.algod import AlgodClient
+
+from .operations import getContracts
+from .state import OfferState, OfferStatus
+
+# the number of concurrent algod requests a scan makes by default
+DEFAULT_MAX_WORKERS = 8
+
+
+class OfferCollection:
+    """A read-only set of offer states, keyed by app ID, that can be filtered."""
+
+    def __init__(self, states: Dict[int, OfferState]) -> None:
+        self.states = states
+
+    def __len__(self) -> int:
+        return len(self.states)
+
+    def __contains__(self, appID: int) -> bool:
+        return appID in self.states
+
+    def __iter__(self) -> Iterator[OfferState]:
+        for appID in sorted(self.states):
+            yield self.states[appID]
+
+    def get(self, appID: int) -> Optional[OfferState]:
+        return self.states.get(appID)
+
+    def appIDs(self) -> List[int]:
+        return sorted(self.states)
+
+    def filter(
+        self,
+        status: Optional[Union[OfferStatus, Iterable[OfferStatus]]] = None,
+        activeAt: Optional[int] = None,
+        overlapping: Optional[Tuple[int, int]] = None,
+        customer: Optional[str] = None,
+        actionID: Optional[int] = None,
+    ) -> "OfferCollection":
+        """Select the offers that match every given condition.
+        Only the fields a condition needs are decoded.
+        Args:
+            status: A status, or several statuses, to keep.
+            activeAt: A UNIX timestamp that must be within [start, end) of the offer.
+            overlapping: A (from, to) UNIX timestamp window that must overlap
+                [start, end) of the offer.
+            customer: The address of the offer's customer.
+            actionID: The offer's action ID.
+        Returns:
+            A new collection with the matching offers.
+        """
+        statuses = None
+        if status is not None:
+            statuses = {status} if isinstance(status, OfferStatus) else set(status)
+
+        def matches(state: OfferState) -> bool:
+            if statuses is not None and state.status not in statuses:
+                return False
+            if actionID is not None and state.actionID != actionID:
+                return False
+            if activeAt is not None and not state.startTime <= activeAt < state.endTime:
+                return False
+            if overlapping is not None:
+                windowStart, windowEnd = overlapping
+                if state.startTime >= windowEnd or state.endTime <= windowStart:
+                    return False
+            if customer is not None and state.customer != customer:
+                return False
+            return True
+
+        return OfferCollection(
+            {appID: state for appID, state in self.states.items() if matches(state)}
+        )
+
+    def countByStatus(self) -> Dict[OfferStatus, int]:
+        return dict(collections.Counter(state.status for state in self.states.values()))
+
+
+def getApprovalProgramKey(client: Optional[AlgodClient], approval: Optional[bytes]) -> str:
+    """Get the base64 encoded offer approval program, as it appears in algod responses."""
+    if approval is None:
+        approval, _ = getContracts(client)
+    return b64encode(approval).decode()
+
+
+def isOfferApp(appInfo: Dict[str, Any], approvalKey: str) -> bool:
+    return appInfo["params"].get("approval-program") == approvalKey
+
+
+def scanOffers(
+    client: AlgodClient,
+    creators: Union[str, Sequence[str]],
+    maxWorkers: int = DEFAULT_MAX_WORKERS,
+    approval: Optional[bytes] = None,
+) -> OfferCollection:
+    """Find every offer created by one or more accounts.
+    The created apps of each creator are listed with one account_info call, and
+    apps running a different approval program are skipped. The global state
+    included in the listing is used as is; only apps listed without it are read
+    with application_info. Requests run on a pool of at most maxWorkers threads.
+    Args:
+        client: An algod client.
+        creators: The address of a creator, or a list of them.
+        maxWorkers: The maximum number of concurrent algod requests.
+        approval: The compiled offer approval program. Defaults to the program
+            returned by getContracts.
+    Returns:
+        An OfferCollection of the offers found. Their fields are decoded lazily.
+    """
+    if isinstance(creators, str):
+        creators = [creators]
+
+    approvalKey = getApprovalProgramKey(client, approval)
+
+    states: Dict[int, OfferState] = dict()
+    missingState: List[int] = []
+
+    with ThreadPoolExecutor(max_workers=maxWorkers) as executor:
+        for accountInfo in executor.map(client.account_info, creators):
+            for appInfo in accountInfo.get("created-apps", []):
+                if not isOfferApp(appInfo, approvalKey):
+                    continue
+                if "global-state" in appInfo["params"]:
+                    states[appInfo["id"]] = OfferState.FromApplicationInfo(appInfo)
+                else:
+                    missingState.append(appInfo["id"])
+
+        if len(missingState) > 0:
+            states.update(fetchOfferStates(client, missingState, executor, approvalKey))
+
+    return OfferCollection(states)
+
+
+def scanOfferApps(
+    client: AlgodClient,
+    appIDs: Iterable[int],
+    maxWorkers: int = DEFAULT_MAX_WORKERS,
+    approval: Optional[bytes] = None,
+) -> OfferCollection:
+    """Read the state of known offer apps.
+    Apps that no longer exist or that are not offers are left out.
+    Args:
+        client: An algod client.
+        appIDs: The app IDs to read.
+        maxWorkers: The maximum number of concurrent application_info calls.
+        approval: The compiled offer approval program. Defaults to the program
+            returned by getContracts.
+    Returns:
+        An OfferCollection of the offers found. Their fields are decoded lazily.
+    """
+    approvalKey = getApprovalProgramKey(client, approval)
+
+    with ThreadPoolExecutor(max_workers=maxWorkers) as executor:
+        return OfferCollection(fetchOfferStates(client, list(appIDs), executor, approvalKey))
+
+
+def fetchOfferStates(
+    client: AlgodClient, appIDs: List[int], executor: ThreadPoolExecutor, approvalKey: str
+) -> Dict[int, OfferState]:
+    def fetch(appID: int) -> Optional[Dict[str, Any]]:
+        try:
+            return client.application_info(appID)
+        except AlgodHTTPError as e:
+            if e.code == 404:
+                # the app was deleted since it was listed
+                return None
+            raise
+
+    states: Dict[int, OfferState] = dict()
+    for appID, appInfo in zip(appIDs, executor.map(fetch, appIDs)):
+        if appInfo is not None and isOfferApp(appInfo, approvalKey):
+            states[appID] = OfferState.FromApplicationInfo(appInfo)
+    return states
@@ -0,0 +1,46 @@
+from algosdk import account
+
+from .operations import LoyaltyOffer, createLoyaltyOfferApps, setupLoyaltyOfferApp
+from .registry import createLoyaltyRegistryApp
+from .scanner import scanOffers, scanOfferApps
+from .state import OfferStatus
+from .testing.setup import getAlgodClient
+from .testing.resources import getTemporaryAccount, createDummyAsset, getCurrentTime
+
+
+def test_scan():
+    client = getAlgodClient()
+
+    creator = getTemporaryAccount(client)
+    tokenID = createDummyAsset(client, 1_000, creator)
+
+    _, customer = account.generate_account()
+    _, otherCustomer = account.generate_account()
+    startTime = getCurrentTime(client) + 60
+    offers = [
+        LoyaltyOffer(customer, startTime, startTime + 60, tokenID, 10, 101),
+        LoyaltyOffer(customer, startTime, startTime + 120, tokenID, 10, 102),
+        LoyaltyOffer(otherCustomer, startTime + 300, startTime + 360, tokenID, 10, 101),
+    ]
+    appIDs = [result.appID for result in createLoyaltyOfferApps(client, creator, offers)]
+    setupLoyaltyOfferApp(client, appIDs[0], creator, tokenID, 10)
+
+    # apps running other programs are not offers
+    registryID = createLoyaltyRegistryApp(client, creator)
+
+    scanned = scanOffers(client, creator.getAddress(), maxWorkers=2)
+
+    assert scanned.appIDs() == sorted(appIDs)
+    assert registryID not in scanned
+    assert scanned.countByStatus() == {OfferStatus.FUNDED: 1, OfferStatus.CREATED: 2}
+
+    assert scanned.filter(status=OfferStatus.FUNDED).appIDs() == [appIDs[0]]
+    assert scanned.filter(customer=customer).appIDs() == sorted(appIDs[:2])
+    assert scanned.filter(actionID=101, activeAt=startTime).appIDs() == [appIDs[0]]
+    assert scanned.filter(overlapping=(startTime + 90, startTime + 400)).appIDs() == sorted(
+        appIDs[1:]
+    )
+
+    rescanned = scanOfferApps(client, appIDs + [registryID, 999_999_999], maxWorkers=2)
+    assert rescanned.appIDs() == sorted(appIDs)
+    assert rescanned.get(appIDs[2]).startTime == startTime + 300
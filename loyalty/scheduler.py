@@ -0,0 +1,357 @@
+"""Admission control for transaction submission.
+
+A SubmissionScheduler sits in front of send_transactions. It caps the number
+of transaction groups that are sent but not yet confirmed, and adapts that cap
+the way TCP adapts its window: it grows a little with every confirmation and
+is halved, at most once per DECREASE_INTERVAL, when algod reports overload,
+either by rejecting a send or by dropping a group from its pool. Callers block
+in submit while the cap is reached, so a bulk campaign runs as fast as the node
+accepts transactions without any tuning.
+
+Transient failures are retried after a jittered exponential backoff. A group
+whose validity window has passed, before it was sent or while it waited in the
+pool, is rebuilt with new parameters if the caller gave a way to rebuild it.
+"""
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Sequence
+from concurrent.futures import Future
+import random
+import threading
+import time
+import weakref
+
+from algosdk.error import AlgodHTTPError
+from algosdk.future import transaction
+from algosdk.v2client.algod import AlgodClient
+
+from .util import ConfirmationTracker, PendingTxnResponse, getConfirmationTracker
+
+if TYPE_CHECKING:
+    from .journal import SubmissionJournal
+
+DEFAULT_INITIAL_LIMIT = 16
+DEFAULT_MIN_LIMIT = 1
+DEFAULT_MAX_LIMIT = 256
+
+DEFAULT_MAX_RETRIES = 5
+
+# seconds; the first retry waits up to this long, doubling with each retry
+DEFAULT_BACKOFF = 0.25
+DEFAULT_MAX_BACKOFF = 5.0
+
+# seconds between two decreases of the limit, so that the many failures of one
+# overload only halve it once
+DECREASE_INTERVAL = 1.0
+
+# what a failed send or a dropped group means for its submission
+DUPLICATE = "duplicate"
+EXPIRED = "expired"
+OVERLOAD = "overload"
+TIMEOUT = "timeout"
+FATAL = "fatal"
+
+DUPLICATE_MESSAGES = ("already in ledger", "already in pool")
+EXPIRED_MESSAGES = ("txn dead", "outside of")
+OVERLOAD_MESSAGES = ("pool is full", "below threshold", "pool full")
+
+SignedTxns = List[transaction.SignedTransaction]
+
+
+def classifyError(e: BaseException) -> str:
+    """Tell how a submission should react to an error from a send or the tracker."""
+    if isinstance(e, AlgodHTTPError) and (e.code == 429 or (e.code or 0) >= 500):
+        return OVERLOAD
+    if isinstance(e, OSError):
+        return OVERLOAD
+
+    message = str(e)
+    if "not confirmed after" in message:
+        return TIMEOUT
+    if any(m in message for m in DUPLICATE_MESSAGES):
+        return DUPLICATE
+    if any(m in message for m in EXPIRED_MESSAGES):
+        return EXPIRED
+    if any(m in message for m in OVERLOAD_MESSAGES):
+        return OVERLOAD
+    return FATAL
+
+
+class Submission:
+    """A transaction group handed to a scheduler.
+
+    Attributes:
+        signedTxns: The group as it was last sent. It changes if the group is rebuilt.
+        key: A caller chosen identifier, recorded in the scheduler's journal.
+        future: Resolves to the PendingTxnResponse of the tracked transaction
+            once the group is confirmed, or fails once it can't be.
+    """
+
+    def __init__(
+        self,
+        signedTxns: SignedTxns,
+        rebuild: Optional[Callable[[], SignedTxns]],
+        trackIndex: int,
+        timeout: int,
+        key: Optional[str] = None,
+    ) -> None:
+        self.signedTxns = signedTxns
+        self.rebuild = rebuild
+        self.trackIndex = trackIndex
+        self.timeout = timeout
+        self.key = key
+        self.retries = 0
+        # the ID of the group's entry in a journal, once it has one
+        self.journalID: Optional[int] = None
+        self.future: "Future[PendingTxnResponse]" = Future()
+
+    def txIDs(self) -> List[str]:
+        return [signedTxn.get_txid() for signedTxn in self.signedTxns]
+
+    def lastValid(self) -> int:
+        return min(signedTxn.transaction.last_valid_round for signedTxn in self.signedTxns)
+
+    def result(self, timeout: Optional[float] = None) -> PendingTxnResponse:
+        return self.future.result(timeout)
+
+
+class SubmissionScheduler:
+    """Sends transaction groups with a self-adjusting cap on unconfirmed groups.
+
+    Args:
+        client: An algod client.
+        initialLimit: The starting cap on groups in flight.
+        minLimit: The cap is never lowered below this.
+        maxLimit: The cap is never raised above this.
+        maxRetries: How many times a group is sent again before it fails.
+        backoff: Seconds the first retry waits at most. Each retry waits a
+            random time up to twice as long as the previous one could.
+        maxBackoff: Seconds a retry waits at most.
+        tracker: The confirmation tracker to wait with. Defaults to the one
+            shared by the client.
+        journal: An optional journal that every group is recorded in before
+            it is sent, and once it is confirmed or has failed. It can also be
+            attached later by setting the journal attribute.
+    """
+
+    def __init__(
+        self,
+        client: AlgodClient,
+        initialLimit: int = DEFAULT_INITIAL_LIMIT,
+        minLimit: int = DEFAULT_MIN_LIMIT,
+        maxLimit: int = DEFAULT_MAX_LIMIT,
+        maxRetries: int = DEFAULT_MAX_RETRIES,
+        backoff: float = DEFAULT_BACKOFF,
+        maxBackoff: float = DEFAULT_MAX_BACKOFF,
+        tracker: Optional[ConfirmationTracker] = None,
+        journal: Optional["SubmissionJournal"] = None,
+    ) -> None:
+        assert 1 <= minLimit <= initialLimit <= maxLimit
+
+        self.client = client
+        self.tracker = tracker or getConfirmationTracker(client)
+        self.minLimit = minLimit
+        self.maxLimit = maxLimit
+        self.maxRetries = maxRetries
+        self.backoff = backoff
+        self.maxBackoff = maxBackoff
+        self.journal = journal
+
+        self.condition = threading.Condition()
+        self.limit = float(initialLimit)
+        self.inFlight = 0
+        self.lastDecrease = 0.0
+
+        self.stats: Dict[str, int] = {
+            "submitted": 0,
+            "confirmed": 0,
+            "failed": 0,
+            "retried": 0,
+            "rebuilt": 0,
+            "overloads": 0,
+        }
+
+    def report(self) -> Dict[str, Any]:
+        with self.condition:
+            return dict(self.stats, limit=self.limit, in_flight=self.inFlight)
+
+    def submit(
+        self,
+        signedTxns: Sequence[transaction.SignedTransaction],
+        rebuild: Optional[Callable[[], SignedTxns]] = None,
+        trackIndex: int = 0,
+        timeout: int = 10,
+        key: Optional[str] = None,
+    ) -> Submission:
+        """Send a transaction group once there is room for it, and track it.
+        Blocks while the cap on groups in flight is reached.
+        Args:
+            signedTxns: The signed transaction group.
+            rebuild: Builds and signs the group again with new suggested
+                parameters. Without it, a group whose validity window has
+                passed fails.
+            trackIndex: The index of the transaction whose PendingTxnResponse
+                the submission resolves to.
+            timeout: The number of rounds to wait for a confirmation before
+                the group is sent again.
+            key: A caller chosen identifier of the group, recorded in the
+                journal so that a restarted process can tell what was done.
+        Returns:
+            The Submission, whose future resolves once the group is confirmed.
+        """
+        submission = Submission(list(signedTxns), rebuild, trackIndex, timeout, key)
+
+        with self.condition:
+            self.condition.wait_for(lambda: self.inFlight < int(self.limit))
+            self.inFlight += 1
+            self.stats["submitted"] += 1
+
+        self.send(submission)
+        return submission
+
+    def send(self, submission: Submission) -> None:
+        try:
+            lastRound = self.tracker.lastRound
+            if lastRound is not None and lastRound >= submission.lastValid():
+                self.handleError(submission, Exception("txn dead: validity window has passed"))
+                return
+
+            if self.journal is not None:
+                self.journal.recordSubmit(submission)
+
+            try:
+                self.client.send_transactions(submission.signedTxns)
+            except Exception as e:
+                if classifyError(e) != DUPLICATE:
+                    self.handleError(submission, e)
+                    return
+
+            txID = submission.signedTxns[submission.trackIndex].get_txid()
+            self.tracker.track(txID, submission.timeout).add_done_callback(
+                lambda future: self.onTracked(submission, future)
+            )
+        except Exception as e:
+            # e.g. a rebuild that failed
+            self.finish(submission, error=e)
+
+    def onTracked(self, submission: Submission, future: "Future[PendingTxnResponse]") -> None:
+        error = future.exception()
+        if error is None:
+            self.finish(submission, result=future.result())
+            return
+
+        # this runs on the tracker's thread, which must not be blocked or re-entered
+        self.retryLater(submission, error, 0.0)
+
+    def handleError(self, submission: Submission, error: Exception) -> None:
+        kind = classifyError(error)
+
+        canRetry = submission.retries < self.maxRetries
+
+        if kind == EXPIRED and submission.rebuild is not None and canRetry:
+            submission.retries += 1
+            submission.signedTxns = submission.rebuild()
+            with self.condition:
+                self.stats["rebuilt"] += 1
+            self.send(submission)
+            return
+
+        if kind in (OVERLOAD, TIMEOUT):
+            # a group that doesn't confirm in time is a sign of congestion too
+            self.decrease()
+            if canRetry:
+                submission.retries += 1
+                delay = random.uniform(
+                    0, min(self.maxBackoff, self.backoff * 2 ** (submission.retries - 1))
+                )
+                with self.condition:
+                    self.stats["retried"] += 1
+                self.retryLater(submission, None, delay)
+                return
+
+        self.finish(submission, error=error)
+
+    def retryLater(
+        self, submission: Submission, error: Optional[BaseException], delay: float
+    ) -> None:
+        def retry() -> None:
+            try:
+                if error is not None:
+                    self.handleError(submission, error)  # type: ignore
+                else:
+                    self.send(submission)
+            except Exception as e:
+                self.finish(submission, error=e)
+
+        timer = threading.Timer(delay, retry)
+        timer.daemon = True
+        timer.start()
+
+    def decrease(self) -> None:
+        with self.condition:
+            self.stats["overloads"] += 1
+            now = time.monotonic()
+            if now - self.lastDecrease >= DECREASE_INTERVAL:
+                self.lastDecrease = now
+                self.limit = max(float(self.minLimit), self.limit / 2)
+
+    def finish(
+        self,
+        submission: Submission,
+        result: Optional[PendingTxnResponse] = None,
+        error: Optional[BaseException] = None,
+    ) -> None:
+        with self.condition:
+            self.inFlight -= 1
+            if error is None:
+                self.stats["confirmed"] += 1
+                # grows by about one for every limit confirmations
+                self.limit = min(float(self.maxLimit), self.limit + 1 / self.limit)
+            else:
+                self.stats["failed"] += 1
+            self.condition.notify_all()
+
+        if self.journal is not None:
+            try:
+                self.journal.recordDone(submission, result, error)
+            except Exception:
+                # the group's outcome stands; recover settles the entry after a restart
+                pass
+
+        if error is not None:
+            submission.future.set_exception(error)
+        else:
+            submission.future.set_result(result)  # type: ignore
+
+
+schedulers: "weakref.WeakKeyDictionary[AlgodClient, SubmissionScheduler]" = (
+    weakref.WeakKeyDictionary()
+)
+schedulersLock = threading.Lock()
+
+
+def getSubmissionScheduler(client: AlgodClient) -> SubmissionScheduler:
+    """Get the scheduler shared by all submissions on a client."""
+    with schedulersLock:
+        scheduler = schedulers.get(client)
+        if scheduler is None:
+            scheduler = SubmissionScheduler(
+                weakref.proxy(client), tracker=getConfirmationTracker(client)
+            )
+            schedulers[client] = scheduler
+        return scheduler
+
+
+def submitAndWait(
+    client: AlgodClient,
+    signedTxns: Sequence[transaction.SignedTransaction],
+    rebuild: Optional[Callable[[], SignedTxns]] = None,
+    trackIndex: int = 0,
+    timeout: int = 10,
+) -> PendingTxnResponse:
+    """Send a transaction group through the client's scheduler and wait for it
+    to be confirmed. See SubmissionScheduler.submit for the arguments.
+    """
+    return (
+        getSubmissionScheduler(client)
+        .submit(signedTxns, rebuild, trackIndex, timeout)
+        .result()
+    )
@@ -0,0 +1,156 @@
+import threading
+
+import pytest
+from algosdk.error import AlgodHTTPError
+from algosdk.future import transaction
+
+from .scheduler import (
+    DUPLICATE,
+    EXPIRED,
+    FATAL,
+    OVERLOAD,
+    TIMEOUT,
+    SubmissionScheduler,
+    classifyError,
+)
+from .testing.setup import getAlgodClient
+from .testing.resources import getTemporaryAccount
+
+
+def signPayment(client, sender, receiver, amount, suggestedParams=None):
+    txn = transaction.PaymentTxn(
+        sender.getAddress(),
+        suggestedParams or client.suggested_params(),
+        receiver.getAddress(),
+        amount,
+    )
+    return txn.sign(sender.getPrivateKey())
+
+
+def test_classifyError():
+    assert classifyError(AlgodHTTPError("transaction pool is full", 400)) == OVERLOAD
+    assert classifyError(AlgodHTTPError("busy", 503)) == OVERLOAD
+    assert classifyError(ConnectionRefusedError()) == OVERLOAD
+    assert classifyError(AlgodHTTPError("txn dead: round 10 outside of 1--9", 400)) == EXPIRED
+    assert classifyError(AlgodHTTPError("transaction already in ledger: X", 400)) == DUPLICATE
+    assert classifyError(Exception("Transaction X not confirmed after 10 rounds")) == TIMEOUT
+    assert classifyError(Exception("Pool error: logic eval error")) == FATAL
+
+
+def test_retries_overload():
+    client = getAlgodClient()
+    sender = getTemporaryAccount(client)
+    receiver = getTemporaryAccount(client)
+
+    sendTransactions = client.send_transactions
+    rejections = [AlgodHTTPError("TransactionPool.Remember: transaction pool is full", 400)] * 2
+
+    def overloadedSend(signedTxns):
+        if len(rejections) > 0:
+            raise rejections.pop()
+        return sendTransactions(signedTxns)
+
+    client.send_transactions = overloadedSend
+
+    scheduler = SubmissionScheduler(client, initialLimit=16, backoff=0.01)
+    response = scheduler.submit([signPayment(client, sender, receiver, 1_000)]).result()
+    assert response.confirmedRound is not None
+
+    report = scheduler.report()
+    assert report["retried"] == 2
+    assert report["overloads"] == 2
+    assert report["confirmed"] == 1
+    assert report["in_flight"] == 0
+    # both rejections come from one overload, so the limit is only halved once
+    assert report["limit"] == pytest.approx(8 + 1 / 8)
+
+
+def test_fails_after_retries():
+    client = getAlgodClient()
+    sender = getTemporaryAccount(client)
+    receiver = getTemporaryAccount(client)
+
+    def overloadedSend(signedTxns):
+        raise AlgodHTTPError("busy", 503)
+
+    client.send_transactions = overloadedSend
+
+    scheduler = SubmissionScheduler(client, maxRetries=2, backoff=0.01)
+    submission = scheduler.submit([signPayment(client, sender, receiver, 1_000)])
+    with pytest.raises(AlgodHTTPError):
+        submission.result()
+    assert scheduler.report()["failed"] == 1
+    assert scheduler.report()["in_flight"] == 0
+
+
+def test_rebuilds_expired_groups():
+    client = getAlgodClient()
+    sender = getTemporaryAccount(client)
+    receiver = getTemporaryAccount(client)
+
+    expiredParams = client.suggested_params()
+    expiredParams.first = max(1, expiredParams.first - 10)
+    expiredParams.last = expiredParams.first + 1
+
+    scheduler = SubmissionScheduler(client)
+
+    submission = scheduler.submit([signPayment(client, sender, receiver, 1_000, expiredParams)])
+    with pytest.raises(Exception, match="txn dead"):
+        submission.result()
+
+    submission = scheduler.submit(
+        [signPayment(client, sender, receiver, 1_000, expiredParams)],
+        rebuild=lambda: [signPayment(client, sender, receiver, 1_000)],
+    )
+    assert submission.result().confirmedRound is not None
+    assert submission.signedTxns[0].transaction.last_valid_round > expiredParams.last
+    assert scheduler.report()["rebuilt"] == 1
+
+
+def test_duplicate_is_confirmed():
+    client = getAlgodClient()
+    sender = getTemporaryAccount(client)
+    receiver = getTemporaryAccount(client)
+
+    scheduler = SubmissionScheduler(client)
+    signedTxn = signPayment(client, sender, receiver, 1_000)
+    first = scheduler.submit([signedTxn]).result()
+    second = scheduler.submit([signedTxn]).result()
+    assert first.confirmedRound == second.confirmedRound
+
+
+def test_caps_groups_in_flight():
+    client = getAlgodClient()
+    sender = getTemporaryAccount(client)
+    receiver = getTemporaryAccount(client)
+
+    scheduler = SubmissionScheduler(client, initialLimit=2, maxLimit=2)
+
+    sendTransactions = client.send_transactions
+    seenInFlight = []
+
+    def recordingSend(signedTxns):
+        seenInFlight.append(scheduler.inFlight)
+        return sendTransactions(signedTxns)
+
+    client.send_transactions = recordingSend
+
+    params = client.suggested_params()
+    signedTxns = [signPayment(client, sender, receiver, 1_000 + i, params) for i in range(8)]
+
+    submissions = []
+    threads = [
+        threading.Thread(target=lambda s=s: submissions.append(scheduler.submit([s])))
+        for s in signedTxns
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for submission in submissions:
+        submission.result()
+
+    assert len(seenInFlight) == 8
+    assert max(seenInFlight) <= 2
+    assert scheduler.report()["confirmed"] == 8
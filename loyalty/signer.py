@@ -0,0 +1,130 @@
+from typing import List, Optional, Sequence, Tuple, Union
+from concurrent.futures import ProcessPoolExecutor
+import os
+import threading
+
+from algosdk.future import transaction
+
+from .account import Account
+
+# the number of transactions sent to a worker process at a time
+DEFAULT_CHUNK_SIZE = 256
+
+# batches smaller than this are signed inline, since handing them to other
+# processes costs more than signing them
+DEFAULT_MIN_PARALLEL = 64
+
+# (transaction, private key)
+SigningRequest = Tuple[transaction.Transaction, str]
+
+
+class TransactionSigner:
+    """Signs transactions on the calling thread, one at a time."""
+
+    def signTransactions(
+        self, requests: Sequence[SigningRequest]
+    ) -> List[transaction.SignedTransaction]:
+        """Sign a batch of transactions.
+        Args:
+            requests: Pairs of a transaction and the private key to sign it with.
+        Returns:
+            The signed transactions, in the same order as requests.
+        """
+        return [txn.sign(privateKey) for txn, privateKey in requests]
+
+    def close(self) -> None:
+        pass
+
+
+def signChunk(requests: List[SigningRequest]) -> List[Tuple[str, Optional[str]]]:
+    """Sign a chunk of transactions in a worker process.
+    Only the signatures and authorizing addresses are sent back, since the
+    caller already has the transactions.
+    """
+    results: List[Tuple[str, Optional[str]]] = []
+    for txn, privateKey in requests:
+        signedTxn = txn.sign(privateKey)
+        results.append((signedTxn.signature, signedTxn.authorizing_address))
+    return results
+
+
+class ProcessPoolSigner(TransactionSigner):
+    """Signs large batches of transactions on a pool of worker processes.
+
+    A batch is split into chunks of chunkSize transactions that are signed in
+    parallel. Batches smaller than minParallel are signed inline. The pool is
+    started by the first batch that needs it and stopped by close.
+    """
+
+    def __init__(
+        self,
+        maxWorkers: Optional[int] = None,
+        chunkSize: int = DEFAULT_CHUNK_SIZE,
+        minParallel: int = DEFAULT_MIN_PARALLEL,
+    ) -> None:
+        assert chunkSize > 0
+        self.maxWorkers = maxWorkers or os.cpu_count() or 1
+        self.chunkSize = chunkSize
+        self.minParallel = minParallel
+
+        self.lock = threading.Lock()
+        self.executor: Optional[ProcessPoolExecutor] = None
+
+    def getExecutor(self) -> ProcessPoolExecutor:
+        with self.lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(max_workers=self.maxWorkers)
+            return self.executor
+
+    def signTransactions(
+        self, requests: Sequence[SigningRequest]
+    ) -> List[transaction.SignedTransaction]:
+        if len(requests) < self.minParallel or self.maxWorkers == 1:
+            return super().signTransactions(requests)
+
+        # use every worker even when the batch is only a few chunks long
+        chunkSize = min(self.chunkSize, -(-len(requests) // self.maxWorkers))
+        chunks = [
+            list(requests[i : i + chunkSize]) for i in range(0, len(requests), chunkSize)
+        ]
+
+        signedTxns: List[transaction.SignedTransaction] = []
+        for chunk, results in zip(chunks, self.getExecutor().map(signChunk, chunks)):
+            for (txn, _), (signature, authorizingAddress) in zip(chunk, results):
+                signedTxns.append(
+                    transaction.SignedTransaction(txn, signature, authorizingAddress)
+                )
+        return signedTxns
+
+    def close(self) -> None:
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown()
+
+
+defaultSigner = TransactionSigner()
+
+
+def signTransactions(
+    txns: Sequence[transaction.Transaction],
+    accounts: Union[Account, Sequence[Account]],
+    signer: Optional[TransactionSigner] = None,
+) -> List[transaction.SignedTransaction]:
+    """Sign transactions with a signer if one is given, else inline.
+    Args:
+        txns: The transactions to sign, which may span several groups.
+        accounts: The account that signs every transaction, or one account per
+            transaction.
+        signer: An optional signer for the batch.
+    Returns:
+        The signed transactions, in the same order as txns.
+    """
+    if isinstance(accounts, Account):
+        privateKey = accounts.getPrivateKey()
+        requests = [(txn, privateKey) for txn in txns]
+    else:
+        assert len(accounts) == len(txns)
+        requests = [(txn, a.getPrivateKey()) for txn, a in zip(txns, accounts)]
+
+    return (signer or defaultSigner).signTransactions(requests)
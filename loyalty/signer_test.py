@@ -0,0 +1,48 @@
+from algosdk import account
+from algosdk.future import transaction
+
+from .account import Account
+from .signer import ProcessPoolSigner, TransactionSigner, signTransactions
+
+
+def paymentGroup(sender: Account, receiver: str, count: int):
+    sp = transaction.SuggestedParams(1000, 10, 1010, "Z2VuZXNpcw==", "gen", True)
+    return transaction.assign_group_id(
+        [
+            transaction.PaymentTxn(sender.getAddress(), sp, receiver, i + 1)
+            for i in range(count)
+        ]
+    )
+
+
+def test_process_pool_matches_inline_signing():
+    sender = Account(account.generate_account()[0])
+    other = Account(account.generate_account()[0])
+
+    # a rekeyed sender is signed by another key and needs an authorizing address
+    txns = paymentGroup(sender, other.getAddress(), 16) + paymentGroup(
+        other, sender.getAddress(), 3
+    )
+    accounts = [sender] * 16 + [sender] * 3
+
+    inline = signTransactions(txns, accounts, TransactionSigner())
+
+    signer = ProcessPoolSigner(maxWorkers=2, chunkSize=4, minParallel=1)
+    try:
+        parallel = signTransactions(txns, accounts, signer)
+    finally:
+        signer.close()
+
+    assert [s.get_txid() for s in parallel] == [txn.get_txid() for txn in txns]
+    assert [s.signature for s in parallel] == [s.signature for s in inline]
+    assert [s.authorizing_address for s in parallel] == [None] * 16 + [sender.getAddress()] * 3
+
+
+def test_small_batches_are_signed_inline():
+    sender = Account(account.generate_account()[0])
+    signer = ProcessPoolSigner(maxWorkers=2)
+
+    signedTxns = signTransactions(paymentGroup(sender, sender.getAddress(), 2), sender, signer)
+
+    assert len(signedTxns) == 2
+    assert signer.executor is None
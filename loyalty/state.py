@@ -0,0 +1,251 @@
+from typing import Dict, Iterable, List, Union, Optional, Any, TYPE_CHECKING
+from base64 import b64encode
+from enum import IntEnum
+import threading
+
+from algosdk.v2client.algod import AlgodClient
+from algosdk import encoding
+
+from .util import decodeState, decodeStateDelta, decodeStateValue
+
+if TYPE_CHECKING:
+    from .operations import LoyaltyOffer
+
+AppState = Dict[bytes, Union[int, bytes]]
+
+
+class OfferStatus(IntEnum):
+    """The values of an offer's status global."""
+
+    # set when the offer app is created
+    CREATED = 1
+    # set by the setup call, once the escrow holds the reward
+    FUNDED = 2
+    # set when the action is completed and the reward is paid out
+    COMPLETED = 3
+
+
+# marks an OfferState field that has not been decoded yet
+UNDECODED: Any = object()
+
+# OfferState slot -> global state key
+OFFER_STATE_FIELDS = {
+    "_customerKey": b"customer_account",
+    "_startTime": b"start",
+    "_endTime": b"end",
+    "_rewardAssetID": b"reward_asset_id",
+    "_rewardAmount": b"reward_amount",
+    "_actionID": b"action_id",
+    "_status": b"status",
+}
+
+# the same keys base64 encoded, as they appear in algod responses
+OFFER_STATE_KEYS = {slot: b64encode(key).decode() for slot, key in OFFER_STATE_FIELDS.items()}
+
+
+class OfferState:
+    """The global state of an offer app.
+
+    A state read from algod keeps the raw global state array and only decodes
+    a field the first time it is read, so reading a couple of fields of many
+    offers doesn't decode the rest. Reading a field that is not set raises
+    KeyError.
+    """
+
+    __slots__ = ("appID", "creator", "globalState") + tuple(OFFER_STATE_FIELDS)
+
+    def __init__(
+        self,
+        globalState: Optional[List[Any]] = None,
+        appID: Optional[int] = None,
+        creator: Optional[str] = None,
+    ) -> None:
+        self.appID = appID
+        self.creator = creator
+        self.globalState = globalState or []
+        for slot in OFFER_STATE_FIELDS:
+            setattr(self, slot, UNDECODED)
+
+    @classmethod
+    def FromApplicationInfo(cls, appInfo: Dict[str, Any]) -> "OfferState":
+        """Wrap the response of an application_info call."""
+        params = appInfo["params"]
+        return cls(params.get("global-state", []), appInfo.get("id"), params.get("creator"))
+
+    @classmethod
+    def FromAppState(
+        cls, state: AppState, appID: Optional[int] = None, creator: Optional[str] = None
+    ) -> "OfferState":
+        """Wrap an already decoded state, such as one from an OfferStateCache."""
+        offerState = cls(appID=appID, creator=creator)
+        for slot, key in OFFER_STATE_FIELDS.items():
+            if key in state:
+                setattr(offerState, slot, state[key])
+        return offerState
+
+    def field(self, slot: str) -> Any:
+        value = getattr(self, slot)
+        if value is UNDECODED:
+            value = decodeStateValue(self.globalState, OFFER_STATE_KEYS[slot])
+            setattr(self, slot, value)
+        return value
+
+    @property
+    def customerKey(self) -> bytes:
+        """The customer's public key, all zeros if the offer has no customer."""
+        return self.field("_customerKey")
+
+    @property
+    def customer(self) -> Optional[str]:
+        """The customer's address, or None if the offer has no customer."""
+        customerKey = self.customerKey
+        return encoding.encode_address(customerKey) if any(customerKey) else None
+
+    @property
+    def startTime(self) -> int:
+        return self.field("_startTime")
+
+    @property
+    def endTime(self) -> int:
+        return self.field("_endTime")
+
+    @property
+    def rewardAssetID(self) -> int:
+        return self.field("_rewardAssetID")
+
+    @property
+    def rewardAmount(self) -> int:
+        return self.field("_rewardAmount")
+
+    @property
+    def actionID(self) -> int:
+        return self.field("_actionID")
+
+    @property
+    def status(self) -> OfferStatus:
+        return OfferStatus(self.field("_status"))
+
+    def __repr__(self) -> str:
+        return "OfferState(appID={}, status={})".format(self.appID, self.status.name)
+
+
+def decodeOfferStates(appInfos: Iterable[Dict[str, Any]]) -> Dict[int, OfferState]:
+    """Wrap many application_info responses, keyed by app ID, without decoding them."""
+    return {appInfo["id"]: OfferState.FromApplicationInfo(appInfo) for appInfo in appInfos}
+
+
+def asOfferState(state: Union[OfferState, AppState]) -> OfferState:
+    if isinstance(state, OfferState):
+        return state
+    return OfferState.FromAppState(state)
+
+
+class OfferStateCache:
+    """Caches the global state of offer apps, keyed by app ID.
+
+    Entries are created from the arguments of the create transaction and kept
+    current by applying the global state deltas of confirmed transactions, so
+    operations on known offers never need to read the state from algod. The
+    creator of each offer is kept next to its state, since closing an offer
+    after it has expired must reference it.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.states: Dict[int, AppState] = dict()
+        self.creators: Dict[int, str] = dict()
+
+    def __len__(self) -> int:
+        return len(self.states)
+
+    def __contains__(self, appID: int) -> bool:
+        return appID in self.states
+
+    def get(self, appID: int) -> Optional[AppState]:
+        """Get a copy of the cached state of an offer, or None if it is unknown."""
+        with self.lock:
+            state = self.states.get(appID)
+            return dict(state) if state is not None else None
+
+    def put(self, appID: int, state: AppState) -> None:
+        with self.lock:
+            self.states[appID] = dict(state)
+
+    def remove(self, appID: int) -> None:
+        with self.lock:
+            self.states.pop(appID, None)
+            self.creators.pop(appID, None)
+
+    def getCreator(self, appID: int) -> Optional[str]:
+        """Get the address of the creator of an offer, or None if it is unknown."""
+        with self.lock:
+            return self.creators.get(appID)
+
+    def setCreator(self, appID: int, creator: str) -> None:
+        with self.lock:
+            self.creators[appID] = creator
+
+    def recordCreation(
+        self, appID: int, offer: "LoyaltyOffer", creator: Optional[str] = None
+    ) -> None:
+        """Add a newly created offer using the arguments it was created with.
+        Args:
+            appID: The app ID of the offer.
+            offer: The offer it was created with.
+            creator: The address of the account that created it.
+        """
+        self.put(
+            appID,
+            {
+                b"customer_account": encoding.decode_address(offer.customer),
+                b"start": offer.startTime,
+                b"end": offer.endTime,
+                b"reward_asset_id": offer.rewardAssetID,
+                b"reward_amount": offer.rewardAmount,
+                b"action_id": offer.actionID,
+                # the offer contract sets status 1 on creation
+                b"status": 1,
+            },
+        )
+        if creator is not None:
+            self.setCreator(appID, creator)
+
+    def applyDelta(self, appID: int, globalStateDelta: Optional[Any]) -> None:
+        """Apply the global state delta of a confirmed transaction to an offer."""
+        self.update(appID, decodeStateDelta(globalStateDelta))
+
+    def update(self, appID: int, delta: Dict[bytes, Optional[Union[int, bytes]]]) -> None:
+        """Apply a decoded delta, where None deletes a key, to a known offer."""
+        if len(delta) == 0:
+            return
+
+        with self.lock:
+            state = self.states.get(appID)
+            if state is None:
+                return
+
+            for key, value in delta.items():
+                if value is None:
+                    state.pop(key, None)
+                else:
+                    state[key] = value
+
+    def fetch(self, client: AlgodClient, appID: int) -> AppState:
+        """Get the state of an offer, reading it from algod only if it is unknown."""
+        state = self.get(appID)
+        if state is None:
+            appInfo = client.application_info(appID)
+            state = decodeState(appInfo["params"]["global-state"])
+            self.put(appID, state)
+            self.setCreator(appID, appInfo["params"]["creator"])
+        return state
+
+
+def getOfferState(
+    client: AlgodClient, appID: int, stateCache: Optional[OfferStateCache] = None
+) -> OfferState:
+    """Get the global state of an offer from a cache if one is given, else from algod."""
+    if stateCache is not None:
+        state = stateCache.fetch(client, appID)
+        return OfferState.FromAppState(state, appID, stateCache.getCreator(appID))
+    return OfferState.FromApplicationInfo(client.application_info(appID))
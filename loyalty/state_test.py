@@ -0,0 +1,104 @@
+from base64 import b64encode
+
+import pytest
+
+from algosdk import account, encoding
+
+from .operations import LoyaltyOffer
+from .state import OfferState, OfferStateCache, OfferStatus, UNDECODED, decodeOfferStates
+
+
+def test_recordCreation_and_applyDelta():
+    _, customer = account.generate_account()
+    offer = LoyaltyOffer(
+        customer=customer,
+        startTime=1_000,
+        endTime=2_000,
+        rewardAssetID=5,
+        rewardAmount=100,
+        actionID=101,
+    )
+
+    cache = OfferStateCache()
+    cache.recordCreation(7, offer)
+
+    assert cache.get(7) == {
+        b"customer_account": encoding.decode_address(customer),
+        b"start": 1_000,
+        b"end": 2_000,
+        b"reward_asset_id": 5,
+        b"reward_amount": 100,
+        b"action_id": 101,
+        b"status": 1,
+    }
+
+    cache.applyDelta(
+        7,
+        [
+            {"key": b64encode(b"status").decode(), "value": {"action": 2, "uint": 3}},
+            {"key": b64encode(b"action_id").decode(), "value": {"action": 3}},
+        ],
+    )
+
+    state = cache.get(7)
+    assert state[b"status"] == 3
+    assert b"action_id" not in state
+
+    # deltas for unknown offers are ignored rather than creating partial entries
+    cache.applyDelta(8, [{"key": b64encode(b"status").decode(), "value": {"action": 2, "uint": 3}}])
+    assert cache.get(8) is None
+
+    cache.remove(7)
+    assert 7 not in cache
+
+
+def test_offer_state_decodes_lazily():
+    _, customer = account.generate_account()
+
+    def uint(key, value):
+        return {"key": b64encode(key).decode(), "value": {"type": 2, "uint": value}}
+
+    appInfo = {
+        "id": 9,
+        "params": {
+            "global-state": [
+                {
+                    "key": b64encode(b"customer_account").decode(),
+                    "value": {
+                        "type": 1,
+                        "bytes": b64encode(encoding.decode_address(customer)).decode(),
+                    },
+                },
+                uint(b"reward_asset_id", 5),
+                uint(b"status", 3),
+                # a malformed value is only noticed if it is read
+                {"key": b64encode(b"start").decode(), "value": {"type": 7}},
+            ]
+        },
+    }
+
+    states = decodeOfferStates([appInfo])
+    state = states[9]
+
+    assert state.appID == 9
+    assert state.rewardAssetID == 5
+    assert state.customer == customer
+    assert state.status is OfferStatus.COMPLETED
+    assert state._endTime is UNDECODED
+
+    with pytest.raises(KeyError):
+        state.endTime
+    with pytest.raises(Exception, match="Unexpected state type"):
+        state.startTime
+
+
+def test_offer_state_from_cache():
+    cache = OfferStateCache()
+    cache.put(7, {b"customer_account": bytes(32), b"reward_asset_id": 5, b"status": 1})
+
+    state = OfferState.FromAppState(cache.get(7), 7)
+
+    assert state.customer is None
+    assert state.rewardAssetID == 5
+    assert state.status is OfferStatus.CREATED
+    assert not hasattr(state, "__dict__")
@@ -0,0 +1,395 @@
+"""Closes offers that are over, or that can still be cancelled, in bulk.
+
+Every offer app keeps its escrow balance and the creator's min balance for the
+app locked until it is deleted. The sweeper finds offers created by some
+accounts that can be deleted, packs their delete calls into transaction
+groups, and keeps several groups in flight at once.
+
+    LOYALTY_OWNER_MNEMONIC="..." python -m loyalty.sweeper --creator ADDR --interval 60
+"""
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from concurrent.futures import Future
+import argparse
+import json
+import os
+import threading
+import time
+
+from algosdk.v2client.algod import AlgodClient
+from algosdk.future import transaction
+
+from .account import Account
+from .operations import MAX_GROUP_SIZE, buildDeleteTxn
+from .params import SuggestedParamsProvider, getFreshSuggestedParams, getSuggestedParams
+from .scanner import scanOffers
+from .signer import TransactionSigner, signTransactions
+from .state import OfferState, OfferStateCache, OfferStatus
+from .transport import createAlgodClient
+from .util import (
+    PendingTxnResponse,
+    getConfirmationTracker,
+    getGroupResponses,
+    getLastBlockTimestamp,
+)
+
+# seconds an unstarted offer must still be from its start to be cancelled,
+# since the delete is checked against the timestamp of a later block
+CANCEL_MARGIN = 30
+
+# the min balance an offer app adds to its creator: 100_000 for the app, plus
+# 28_500 per uint and 50_000 per byte slice of its 7 uint, 2 byte slice schema
+OFFER_APP_MIN_BALANCE = 100_000 + 7 * 28_500 + 2 * 50_000
+
+
+class SweepReport:
+    """Totals of one or more sweeps."""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.closed = 0
+        self.cancelled = 0
+        self.failed = 0
+        self.groups = 0
+        self.fees = 0
+        # Algo returned from offer escrows
+        self.reclaimedAlgo = 0
+        # creator min balance freed by deleting offer apps
+        self.releasedMinBalance = 0
+        # asset ID -> reward tokens returned to the creator
+        self.returnedRewards: Dict[int, int] = dict()
+        self.errors: List[str] = []
+
+    def recordClosed(
+        self, state: OfferState, response: PendingTxnResponse, cancelled: bool
+    ) -> None:
+        with self.lock:
+            self.closed += 1
+            if cancelled:
+                self.cancelled += 1
+            self.fees += response.txn["txn"].get("fee", 0)
+            self.releasedMinBalance += OFFER_APP_MIN_BALANCE
+
+            for inner in response.innerTxns:
+                innerTxn = inner["txn"]["txn"]
+                if innerTxn.get("type") == "pay":
+                    self.reclaimedAlgo += inner.get("closing-amount", 0) + innerTxn.get("amt", 0)
+                elif innerTxn.get("type") == "axfer":
+                    amount = inner.get("asset-closing-amount", 0) + innerTxn.get("aamt", 0)
+                    assetID = innerTxn["xaid"]
+                    if amount > 0:
+                        returned = self.returnedRewards.get(assetID, 0)
+                        self.returnedRewards[assetID] = returned + amount
+
+    def merge(self, other: "SweepReport") -> None:
+        """Add the totals of another report to this one."""
+        with self.lock, other.lock:
+            self.closed += other.closed
+            self.cancelled += other.cancelled
+            self.failed += other.failed
+            self.groups += other.groups
+            self.fees += other.fees
+            self.reclaimedAlgo += other.reclaimedAlgo
+            self.releasedMinBalance += other.releasedMinBalance
+            for assetID, amount in other.returnedRewards.items():
+                self.returnedRewards[assetID] = self.returnedRewards.get(assetID, 0) + amount
+            self.errors = (self.errors + other.errors)[:10]
+
+    def recordFailed(self, state: OfferState, error: Exception) -> None:
+        with self.lock:
+            self.failed += 1
+            if len(self.errors) < 10:
+                self.errors.append("offer {}: {}".format(state.appID, error))
+
+    def report(self) -> Dict[str, Any]:
+        """Get a machine-readable summary of the totals."""
+        with self.lock:
+            return {
+                "closed": self.closed,
+                "cancelled": self.cancelled,
+                "failed": self.failed,
+                "groups": self.groups,
+                "fees": self.fees,
+                "reclaimed_algo": self.reclaimedAlgo,
+                "released_min_balance": self.releasedMinBalance,
+                "returned_rewards": {
+                    str(assetID): amount for assetID, amount in sorted(self.returnedRewards.items())
+                },
+                "errors": list(self.errors),
+            }
+
+
+def isSweepable(state: OfferState, now: int, closer: str, cancelUnstarted: bool = False) -> bool:
+    """Check if an offer can be deleted by closer after a block with timestamp now.
+    Args:
+        state: The state of the offer. It must have been read with its app info,
+            so that the creator is known.
+        now: The timestamp of the latest block.
+        closer: The address that will send the delete call.
+        cancelUnstarted: Also select offers that have not started yet. Only
+            their creator can delete them.
+    """
+    if state.status == OfferStatus.CREATED:
+        # the escrow was never opted into the reward asset, so the contract
+        # can't close it out and the delete would be rejected
+        return False
+
+    if state.endTime <= now:
+        return True
+
+    return cancelUnstarted and closer == state.creator and now + CANCEL_MARGIN < state.startTime
+
+
+def findSweepableOffers(
+    offers: Iterable[OfferState], now: int, closer: str, cancelUnstarted: bool = False
+) -> List[OfferState]:
+    """Select the offers that closer can delete now. See isSweepable."""
+    return [state for state in offers if isSweepable(state, now, closer, cancelUnstarted)]
+
+
+def sweepOffers(
+    client: AlgodClient,
+    closer: Account,
+    offers: Sequence[OfferState],
+    groupSize: int = MAX_GROUP_SIZE,
+    maxInFlight: int = 8,
+    paramsProvider: Optional[SuggestedParamsProvider] = None,
+    signer: Optional[TransactionSigner] = None,
+    stateCache: Optional[OfferStateCache] = None,
+    report: Optional[SweepReport] = None,
+) -> SweepReport:
+    """Delete many offers using atomic transaction groups.
+    Deletes are packed into groups of up to groupSize calls, and up to
+    maxInFlight groups are awaited concurrently through the shared confirmation
+    tracker. When a group is rejected, its offers are retried one per group so
+    that a single offer that can't be closed doesn't block the others.
+    Args:
+        client: An algod client.
+        closer: The account sending the delete calls.
+        offers: The offers to delete, as selected by findSweepableOffers.
+        groupSize: The maximum number of deletes per transaction group.
+        maxInFlight: The maximum number of groups awaiting confirmation.
+        paramsProvider: An optional cache of suggested transaction parameters.
+        signer: An optional batch signer. Transactions are signed inline by default.
+        stateCache: An optional cache of offer states. Deleted offers are removed from it.
+        report: An optional report to add the totals of this sweep to.
+    Returns:
+        The report with the totals of this sweep added.
+    """
+    assert 1 <= groupSize <= MAX_GROUP_SIZE
+
+    if report is None:
+        report = SweepReport()
+
+    sweepable: List[OfferState] = []
+    for state in offers:
+        if state.appID is None:
+            report.recordFailed(state, Exception("Offer state has no app ID"))
+        else:
+            sweepable.append(state)
+
+    if len(sweepable) == 0:
+        return report
+
+    _, now = getLastBlockTimestamp(client)
+    suggestedParams = getSuggestedParams(client, paramsProvider)
+    tracker = getConfirmationTracker(client)
+
+    inFlight: List[Tuple[List[OfferState], List[str], "Future[PendingTxnResponse]"]] = []
+    retries: List[List[OfferState]] = []
+
+    def failGroup(group: List[OfferState], error: Exception) -> None:
+        if len(group) > 1:
+            retries.extend([state] for state in group)
+        else:
+            report.recordFailed(group[0], error)
+
+    def finishGroup() -> None:
+        group, txIDs, future = inFlight.pop(0)
+        try:
+            tracked = future.result()
+        except Exception as e:
+            failGroup(group, e)
+            return
+
+        with report.lock:
+            report.groups += 1
+
+        # every transaction of a group is confirmed with the first
+        for state, response in zip(group, getGroupResponses(client, tracked, txIDs)):
+            report.recordClosed(state, response, cancelled=now < state.startTime)
+            if stateCache is not None:
+                stateCache.remove(appIDOf(state))
+
+    groups = [sweepable[i : i + groupSize] for i in range(0, len(sweepable), groupSize)]
+
+    while len(groups) > 0:
+        groupTxns: List[List[transaction.Transaction]] = []
+        for group in groups:
+            txns = [
+                buildDeleteTxn(closer, appIDOf(state), state, suggestedParams)
+                for state in group
+            ]
+            if len(txns) > 1:
+                transaction.assign_group_id(txns)
+            groupTxns.append(txns)
+
+        allSignedTxns = signTransactions(
+            [txn for txns in groupTxns for txn in txns], closer, signer
+        )
+
+        offset = 0
+        for group in groups:
+            signedTxns = allSignedTxns[offset : offset + len(group)]
+            offset += len(group)
+            txIDs = [signedTxn.get_txid() for signedTxn in signedTxns]
+
+            try:
+                client.send_transactions(signedTxns)
+            except Exception as e:
+                failGroup(group, e)
+                continue
+
+            inFlight.append((group, txIDs, tracker.track(txIDs[0])))
+
+            if len(inFlight) >= maxInFlight:
+                finishGroup()
+
+        while len(inFlight) > 0:
+            finishGroup()
+
+        groups, retries = retries, []
+        if len(groups) > 0:
+            # a long sweep may have outlived the validity window of the first params
+            suggestedParams = getFreshSuggestedParams(client, paramsProvider)
+
+    return report
+
+
+def appIDOf(state: OfferState) -> int:
+    # sweepOffers leaves out states without an app ID
+    assert state.appID is not None
+    return state.appID
+
+
+def sweepCreators(
+    client: AlgodClient,
+    closer: Account,
+    creators: Sequence[str],
+    cancelUnstarted: bool = False,
+    report: Optional[SweepReport] = None,
+    **kwargs: Any,
+) -> SweepReport:
+    """Scan the offers of some creators once and delete every one that closer can.
+    Extra keyword arguments are passed to sweepOffers.
+    """
+    _, now = getLastBlockTimestamp(client)
+    offers = scanOffers(client, creators)
+    sweepable = findSweepableOffers(offers, now, closer.getAddress(), cancelUnstarted)
+    return sweepOffers(client, closer, sweepable, report=report, **kwargs)
+
+
+def runSweeper(
+    client: AlgodClient,
+    closer: Account,
+    creators: Sequence[str],
+    interval: float,
+    cancelUnstarted: bool = False,
+    onReport: Optional[Callable[[Dict[str, Any]], None]] = None,
+    stop: Optional[threading.Event] = None,
+    **kwargs: Any,
+) -> SweepReport:
+    """Sweep the offers of some creators every interval seconds until stop is set.
+    Args:
+        client: An algod client.
+        closer: The account sending the delete calls.
+        creators: The addresses whose offers are swept.
+        interval: Seconds between the start of consecutive sweeps.
+        cancelUnstarted: Also cancel offers that have not started yet.
+        onReport: An optional callback that receives the report of each sweep.
+        stop: An event that ends the loop once set.
+    Returns:
+        The totals of every sweep.
+    """
+    total = SweepReport()
+    paramsProvider = kwargs.pop("paramsProvider", None) or SuggestedParamsProvider(client)
+
+    while stop is None or not stop.is_set():
+        startedAt = time.monotonic()
+
+        sweep = SweepReport()
+        try:
+            sweepCreators(
+                client,
+                closer,
+                creators,
+                cancelUnstarted,
+                report=sweep,
+                paramsProvider=paramsProvider,
+                **kwargs,
+            )
+        except Exception as e:
+            sweep.errors.append(str(e))
+
+        total.merge(sweep)
+        if onReport is not None:
+            onReport(sweep.report())
+
+        remaining = interval - (time.monotonic() - startedAt)
+        if stop is not None:
+            stop.wait(max(remaining, 0))
+        elif remaining > 0:
+            time.sleep(remaining)
+
+    return total
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Delete loyalty offers that have ended, returning their escrow to the creator."
+    )
+    parser.add_argument(
+        "--creator", action="append", default=[], help="address whose offers are swept"
+    )
+    parser.add_argument(
+        "--algod-address",
+        default=os.environ.get("ALGOD_ADDRESS", "http://localhost:4001"),
+        help="algod URL, or a comma separated list of nodes to fail over between",
+    )
+    parser.add_argument("--algod-token", default=os.environ.get("ALGOD_TOKEN", "a" * 64))
+    parser.add_argument("--group-size", type=int, default=MAX_GROUP_SIZE)
+    parser.add_argument("--max-in-flight", type=int, default=8)
+    parser.add_argument(
+        "--cancel-unstarted", action="store_true", help="also cancel offers that have not started"
+    )
+    parser.add_argument("--interval", type=float, default=60.0, help="seconds between sweeps")
+    parser.add_argument("--once", action="store_true", help="sweep once and exit")
+    args = parser.parse_args(argv)
+
+    mnemonic = os.environ.get("LOYALTY_OWNER_MNEMONIC")
+    if not mnemonic:
+        parser.error("LOYALTY_OWNER_MNEMONIC must hold the mnemonic of the closing account")
+
+    client = createAlgodClient(args.algod_address, args.algod_token)
+    closer = Account.FromMnemonic(mnemonic)
+    creators = args.creator or [closer.getAddress()]
+
+    options = dict(groupSize=args.group_size, maxInFlight=args.max_in_flight)
+
+    if args.once:
+        report = sweepCreators(client, closer, creators, args.cancel_unstarted, **options)
+        print(json.dumps(report.report()))
+        return
+
+    def printReport(r: Dict[str, Any]) -> None:
+        print(json.dumps(r), flush=True)
+
+    try:
+        runSweeper(
+            client, closer, creators, args.interval, args.cancel_unstarted, printReport, **options
+        )
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
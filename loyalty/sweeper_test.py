@@ -0,0 +1,86 @@
+from algosdk.logic import get_application_address
+
+from .operations import (
+    LoyaltyOffer,
+    createLoyaltyOfferApps,
+    setupLoyaltyOfferApp,
+    completeAction,
+)
+from .scanner import scanOffers
+from .state import OfferState
+from .sweeper import findSweepableOffers, sweepOffers, sweepCreators, OFFER_APP_MIN_BALANCE
+from .util import getBalances, getLastBlockTimestamp
+from .testing.setup import getAlgodClient
+from .testing.resources import (
+    getTemporaryAccount,
+    optInToAsset,
+    createDummyAsset,
+    getCurrentTime,
+    waitUntilTimestamp,
+)
+
+
+def test_sweep():
+    client = getAlgodClient()
+
+    creator = getTemporaryAccount(client)
+    customer = getTemporaryAccount(client)
+    tokenID = createDummyAsset(client, 1_000, creator)
+    optInToAsset(client, tokenID, customer)
+
+    startTime = getCurrentTime(client) + 10
+    endTime = startTime + 10
+    offers = [
+        # completed, then ended
+        LoyaltyOffer(customer.getAddress(), startTime, endTime, tokenID, 10, 1),
+        # ended without being completed
+        LoyaltyOffer(customer.getAddress(), startTime, endTime, tokenID, 20, 2),
+        # not started, so the creator can cancel it
+        LoyaltyOffer(customer.getAddress(), startTime + 3_600, endTime + 3_600, tokenID, 30, 3),
+        # never set up, so it can't be deleted
+        LoyaltyOffer(customer.getAddress(), startTime, endTime, tokenID, 40, 4),
+    ]
+    appIDs = [result.appID for result in createLoyaltyOfferApps(client, creator, offers)]
+    for appID, offer in zip(appIDs[:3], offers):
+        setupLoyaltyOfferApp(client, appID, creator, tokenID, offer.rewardAmount)
+
+    waitUntilTimestamp(client, startTime)
+    completeAction(client, creator, appIDs[0], 1)
+    waitUntilTimestamp(client, endTime)
+
+    _, now = getLastBlockTimestamp(client)
+    scanned = scanOffers(client, creator.getAddress())
+
+    # anyone may close an offer that has ended, but only the creator can cancel one
+    closer = getTemporaryAccount(client)
+    sweepable = findSweepableOffers(scanned, now, closer.getAddress(), cancelUnstarted=True)
+    assert sorted(state.appID for state in sweepable) == sorted(appIDs[:2])
+
+    # the completed offer only has Algo left to return
+    report = sweepOffers(client, closer, [scanned.get(appIDs[0])])
+    assert report.closed == 1 and report.failed == 0
+    assert report.returnedRewards == dict()
+
+    report = sweepCreators(client, creator, [creator.getAddress()], cancelUnstarted=True)
+
+    assert report.failed == 0
+    assert report.closed == 2
+    assert report.cancelled == 1
+    assert report.releasedMinBalance == 2 * OFFER_APP_MIN_BALANCE
+    assert report.returnedRewards == {tokenID: 20 + 30}
+    assert report.reclaimedAlgo > 0
+
+    for appID in appIDs[:3]:
+        assert getBalances(client, get_application_address(appID)) == {0: 0}
+    assert scanOffers(client, creator.getAddress()).appIDs() == [appIDs[3]]
+
+
+def test_sweep_skips_states_without_app_id():
+    client = getAlgodClient()
+    closer = getTemporaryAccount(client)
+
+    report = sweepOffers(client, closer, [OfferState.FromAppState({b"status": 1})])
+
+    assert report.failed == 1
+    assert report.closed == 0
+    assert "no app ID" in report.errors[0]
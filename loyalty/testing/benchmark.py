@@ -0,0 +1,565 @@
+"""End-to-end offer lifecycle benchmark.
+
+Runs create -> setup -> completeAction -> closeLoyaltyOffer lifecycles against
+the backend selected by LOYALTY_ALGOD_BACKEND (the sandbox, or the in-process
+fake network) and reports where the time goes.
+
+Lifecycles run in waves. In each wave every worker thread creates and sets up
+a batch of offers, then completes their actions, then closes them. Every
+offer of a wave shares the same start and end time, and the block clock is
+moved past them between phases, so the clock waits are reported separately
+from the time spent in the library. Within a phase each operation is split
+into stages: params, build, sign, submit and confirm.
+
+    python -m loyalty.testing.benchmark --backend fake --lifecycles 1000 \\
+        --concurrency 4 --batch-size 16 --output results.json
+
+Passing --baseline with an earlier results file fails the run if throughput
+or any stage got slower by more than --tolerance.
+"""
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence
+from concurrent.futures import Future, ThreadPoolExecutor
+import argparse
+import json
+import os
+import platform
+import sys
+import threading
+import time
+
+from algosdk import account
+from algosdk.future import transaction
+from algosdk.v2client.algod import AlgodClient
+
+from .. import operations
+from ..account import Account
+from ..operations import (
+    LoyaltyOffer,
+    buildCreateTxn,
+    buildSetupTxns,
+    buildActionTxn,
+    buildDeleteTxn,
+    getContracts,
+)
+from ..params import SuggestedParamsProvider, getSuggestedParams
+from ..signer import ProcessPoolSigner, TransactionSigner, signTransactions
+from ..state import OfferStateCache
+from ..util import PendingTxnResponse, getConfirmationTracker
+from .resources import (
+    createDummyAsset,
+    getCurrentTime,
+    optInToAsset,
+    payAccount,
+    waitUntilTimestamp,
+)
+from .setup import BACKEND_ENV_VAR, getAlgodClient, getGenesisAccounts
+
+
+class BenchmarkConfig(NamedTuple):
+    # total number of offer lifecycles to run
+    lifecycles: int = 100
+    # worker threads running lifecycles in parallel
+    concurrency: int = 1
+    # offers each worker submits per phase before waiting for confirmations
+    batchSize: int = 1
+    # seconds between creating the offers of a wave and their start time
+    leadTime: int = 30
+    # seconds between the start and end time of each offer
+    duration: int = 30
+    # share one SuggestedParamsProvider instead of fetching params per batch
+    cacheParams: bool = False
+    # sign batches on a pool of this many processes, or inline if 0
+    signerProcesses: int = 0
+
+
+class StageTimer:
+    """Collects the duration of every timed call, per stage."""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        # stage -> list of (seconds, items)
+        self.samples: Dict[str, List[Any]] = dict()
+
+    def record(self, stage: str, seconds: float, items: int = 1) -> None:
+        with self.lock:
+            self.samples.setdefault(stage, []).append((seconds, items))
+
+    def time(self, stage: str, fn: Callable[..., Any], *args: Any, items: int = 1) -> Any:
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            self.record(stage, time.perf_counter() - start, items)
+
+    def report(self) -> Dict[str, Dict[str, Any]]:
+        with self.lock:
+            samples = {stage: list(values) for stage, values in self.samples.items()}
+
+        report: Dict[str, Dict[str, Any]] = dict()
+        for stage, values in sorted(samples.items()):
+            durations = sorted(seconds for seconds, _ in values)
+            total = sum(durations)
+            items = sum(count for _, count in values)
+            report[stage] = {
+                "calls": len(durations),
+                "items": items,
+                "total_seconds": total,
+                "mean_ms_per_item": 1000 * total / items if items > 0 else None,
+                "p50_ms": 1000 * percentile(durations, 0.50),
+                "p95_ms": 1000 * percentile(durations, 0.95),
+                "p99_ms": 1000 * percentile(durations, 0.99),
+            }
+        return report
+
+
+def percentile(sortedValues: Sequence[float], p: float) -> float:
+    if len(sortedValues) == 0:
+        return 0.0
+    return sortedValues[min(len(sortedValues) - 1, int(p * len(sortedValues)))]
+
+
+class Lifecycle:
+    """One offer moving through the benchmark."""
+
+    def __init__(self, offer: LoyaltyOffer) -> None:
+        self.offer = offer
+        self.appID: Optional[int] = None
+        self.error: Optional[str] = None
+        # seconds spent in library calls, excluding clock waits
+        self.busy = 0.0
+
+
+# an account may not have more than this many applications open at once
+MAX_CREATED_APPS = 10
+
+# algo given to each worker's creator on top of the min balance of its offers
+CREATOR_FUNDING = 10_000_000
+# algo spent per open offer: the app's min balance, the setup funding and fees
+FUNDING_PER_OFFER = 1_000_000
+
+Builder = Callable[[Lifecycle, transaction.SuggestedParams], List[transaction.Transaction]]
+
+
+class Worker:
+    """Runs batches of lifecycles for one creator account."""
+
+    def __init__(
+        self,
+        client: AlgodClient,
+        creator: Account,
+        customer: Account,
+        rewardAssetID: int,
+        timer: StageTimer,
+        stateCache: OfferStateCache,
+        paramsProvider: Optional[SuggestedParamsProvider],
+        signer: Optional[TransactionSigner],
+    ) -> None:
+        self.client = client
+        self.creator = creator
+        self.customer = customer
+        self.rewardAssetID = rewardAssetID
+        self.timer = timer
+        self.stateCache = stateCache
+        self.paramsProvider = paramsProvider
+        self.signer = signer
+
+    def offers(self, count: int, startTime: int, endTime: int) -> List[Lifecycle]:
+        return [
+            Lifecycle(
+                LoyaltyOffer(
+                    customer=self.customer.getAddress(),
+                    startTime=startTime,
+                    endTime=endTime,
+                    rewardAssetID=self.rewardAssetID,
+                    rewardAmount=1,
+                    actionID=i,
+                )
+            )
+            for i in range(count)
+        ]
+
+    def runPhase(
+        self,
+        phase: str,
+        batch: List[Lifecycle],
+        build: Builder,
+        confirmed: Callable[[Lifecycle, PendingTxnResponse], None],
+    ) -> None:
+        """Submit one phase of every live lifecycle in a batch, then wait for all of them."""
+        live = [lifecycle for lifecycle in batch if lifecycle.error is None]
+        if len(live) == 0:
+            return
+
+        phaseStart = time.perf_counter()
+
+        suggestedParams = self.timer.time(
+            phase + ".params", getSuggestedParams, self.client, self.paramsProvider
+        )
+
+        start = time.perf_counter()
+        groups = [build(lifecycle, suggestedParams) for lifecycle in live]
+        self.timer.record(phase + ".build", time.perf_counter() - start, len(live))
+
+        start = time.perf_counter()
+        signedTxns = signTransactions(
+            [txn for txns in groups for txn in txns], self.creator, self.signer
+        )
+        signedGroups = []
+        for txns in groups:
+            signedGroups.append(signedTxns[: len(txns)])
+            signedTxns = signedTxns[len(txns) :]
+        self.timer.record(phase + ".sign", time.perf_counter() - start, len(live))
+
+        tracker = getConfirmationTracker(self.client)
+        futures: List[Optional["Future[PendingTxnResponse]"]] = []
+        start = time.perf_counter()
+        for lifecycle, txns, signedTxns in zip(live, groups, signedGroups):
+            try:
+                self.client.send_transactions(signedTxns)
+                futures.append(tracker.track(signedTxns[appCallIndex(txns)].get_txid()))
+            except Exception as e:
+                lifecycle.error = "{}: {}".format(phase, e)
+                futures.append(None)
+        self.timer.record(phase + ".submit", time.perf_counter() - start, len(live))
+
+        start = time.perf_counter()
+        for lifecycle, future in zip(live, futures):
+            if future is None:
+                continue
+            try:
+                confirmed(lifecycle, future.result())
+            except Exception as e:
+                lifecycle.error = "{}: {}".format(phase, e)
+        self.timer.record(phase + ".confirm", time.perf_counter() - start, len(live))
+
+        elapsed = time.perf_counter() - phaseStart
+        for lifecycle in live:
+            lifecycle.busy += elapsed
+
+    def createAndSetup(self, batch: List[Lifecycle]) -> None:
+        approval, clear = getContracts(self.client)
+
+        def buildCreate(
+            lifecycle: Lifecycle, sp: transaction.SuggestedParams
+        ) -> List[transaction.Transaction]:
+            return [buildCreateTxn(self.creator, lifecycle.offer, approval, clear, sp)]
+
+        def created(lifecycle: Lifecycle, response: PendingTxnResponse) -> None:
+            if response.applicationIndex is None or response.applicationIndex == 0:
+                raise Exception("Offer app was not created")
+            lifecycle.appID = response.applicationIndex
+            self.stateCache.recordCreation(
+                lifecycle.appID, lifecycle.offer, self.creator.getAddress()
+            )
+
+        self.runPhase("create", batch, buildCreate, created)
+
+        def buildSetup(
+            lifecycle: Lifecycle, sp: transaction.SuggestedParams
+        ) -> List[transaction.Transaction]:
+            assert lifecycle.appID is not None
+            return buildSetupTxns(
+                self.creator, lifecycle.appID, self.rewardAssetID, lifecycle.offer.rewardAmount, sp
+            )
+
+        self.runPhase("setup", batch, buildSetup, self.applyDelta)
+
+    def completeActions(self, batch: List[Lifecycle]) -> None:
+        def buildAction(
+            lifecycle: Lifecycle, sp: transaction.SuggestedParams
+        ) -> List[transaction.Transaction]:
+            assert lifecycle.appID is not None
+            state = self.stateCache.fetch(self.client, lifecycle.appID)
+            return [
+                buildActionTxn(self.creator, lifecycle.appID, lifecycle.offer.actionID, state, sp)
+            ]
+
+        self.runPhase("action", batch, buildAction, self.applyDelta)
+
+    def close(self, batch: List[Lifecycle]) -> None:
+        def buildClose(
+            lifecycle: Lifecycle, sp: transaction.SuggestedParams
+        ) -> List[transaction.Transaction]:
+            assert lifecycle.appID is not None
+            state = self.stateCache.fetch(self.client, lifecycle.appID)
+            return [buildDeleteTxn(self.creator, lifecycle.appID, state, sp)]
+
+        def closed(lifecycle: Lifecycle, response: PendingTxnResponse) -> None:
+            assert lifecycle.appID is not None
+            self.stateCache.remove(lifecycle.appID)
+
+        self.runPhase("close", batch, buildClose, closed)
+
+    def applyDelta(self, lifecycle: Lifecycle, response: PendingTxnResponse) -> None:
+        assert lifecycle.appID is not None
+        self.stateCache.applyDelta(lifecycle.appID, response.globalStateDelta)
+
+
+def appCallIndex(txns: List[transaction.Transaction]) -> int:
+    """Get the position of the app call in a group. Its confirmation carries
+    the state delta of the offer.
+    """
+    for i, txn in enumerate(txns):
+        if isinstance(txn, transaction.ApplicationCallTxn):
+            return i
+    return len(txns) - 1
+
+
+def createWorker(
+    client: AlgodClient,
+    funder: Account,
+    config: BenchmarkConfig,
+    timer: StageTimer,
+    stateCache: OfferStateCache,
+    paramsProvider: Optional[SuggestedParamsProvider],
+    signer: Optional[TransactionSigner],
+) -> Worker:
+    """Fund a creator and an opted in customer for one worker."""
+    creator = Account(account.generate_account()[0])
+    customer = Account(account.generate_account()[0])
+
+    payAccount(
+        client,
+        funder,
+        creator.getAddress(),
+        CREATOR_FUNDING + config.batchSize * FUNDING_PER_OFFER,
+        paramsProvider,
+    )
+    payAccount(client, funder, customer.getAddress(), CREATOR_FUNDING, paramsProvider)
+
+    rewardAssetID = createDummyAsset(client, config.lifecycles, creator, paramsProvider)
+    optInToAsset(client, rewardAssetID, customer, paramsProvider)
+
+    return Worker(
+        client, creator, customer, rewardAssetID, timer, stateCache, paramsProvider, signer
+    )
+
+
+def runBenchmark(
+    client: AlgodClient, funder: Account, config: BenchmarkConfig
+) -> Dict[str, Any]:
+    """Run offer lifecycles and report how long each stage took.
+    Args:
+        client: An algod client for the network to benchmark.
+        funder: A funded account that pays for the accounts the benchmark creates.
+        config: The number, concurrency and timing of the lifecycles to run.
+    Returns:
+        A JSON serializable report of the run.
+    """
+    if config.lifecycles <= 0 or config.concurrency <= 0 or config.batchSize <= 0:
+        raise Exception("Lifecycles, concurrency and batch size must be positive")
+    if config.batchSize > MAX_CREATED_APPS:
+        raise Exception(
+            "Batch size must be at most {}, the number of apps an account may create".format(
+                MAX_CREATED_APPS
+            )
+        )
+
+    timer = StageTimer()
+    stateCache = OfferStateCache()
+    paramsProvider = SuggestedParamsProvider(client) if config.cacheParams else None
+    signer = (
+        ProcessPoolSigner(config.signerProcesses, minParallel=1)
+        if config.signerProcesses > 0
+        else None
+    )
+
+    # compile once up front, so the first create batch is not charged for it
+    operations.APPROVAL_PROGRAM = b""
+    operations.CLEAR_STATE_PROGRAM = b""
+    timer.time("compile", getContracts, client)
+
+    workers = [
+        timer.time(
+            "provision",
+            createWorker,
+            client,
+            funder,
+            config,
+            timer,
+            stateCache,
+            paramsProvider,
+            signer,
+        )
+        for _ in range(config.concurrency)
+    ]
+
+    lifecycles: List[Lifecycle] = []
+    waveSize = config.concurrency * config.batchSize
+    clockWait = 0.0
+    startedAt = time.perf_counter()
+
+    try:
+        with ThreadPoolExecutor(max_workers=config.concurrency) as executor:
+
+            def runAll(
+                method: Callable[[Worker, List[Lifecycle]], None],
+                batches: List[List[Lifecycle]],
+            ) -> None:
+                futures = [
+                    executor.submit(method, worker, batch)
+                    for worker, batch in zip(workers, batches)
+                ]
+                for future in futures:
+                    future.result()
+
+            def waitUntil(timestamp: int) -> float:
+                start = time.perf_counter()
+                waitUntilTimestamp(client, timestamp)
+                elapsed = time.perf_counter() - start
+                timer.record("clock_wait", elapsed)
+                return elapsed
+
+            remaining = config.lifecycles
+            while remaining > 0:
+                count = min(remaining, waveSize)
+                remaining -= count
+
+                startTime = getCurrentTime(client) + config.leadTime
+                endTime = startTime + config.duration
+
+                batches = []
+                for i, worker in enumerate(workers):
+                    size = min(config.batchSize, count - i * config.batchSize)
+                    batches.append(worker.offers(max(size, 0), startTime, endTime))
+                for batch in batches:
+                    lifecycles.extend(batch)
+
+                runAll(Worker.createAndSetup, batches)
+                clockWait += waitUntil(startTime)
+                runAll(Worker.completeActions, batches)
+                clockWait += waitUntil(endTime)
+                runAll(Worker.close, batches)
+    finally:
+        if signer is not None:
+            signer.close()
+
+    elapsed = time.perf_counter() - startedAt
+    completed = [lifecycle for lifecycle in lifecycles if lifecycle.error is None]
+    latencies = sorted(lifecycle.busy for lifecycle in completed)
+    busy = elapsed - clockWait
+
+    return {
+        "config": config._asdict(),
+        "backend": os.environ.get(BACKEND_ENV_VAR) or "sandbox",
+        "python": platform.python_version(),
+        "lifecycles": len(lifecycles),
+        "completed": len(completed),
+        "failed": len(lifecycles) - len(completed),
+        "errors": sorted({lifecycle.error for lifecycle in lifecycles if lifecycle.error})[:10],
+        "elapsed_seconds": elapsed,
+        "clock_wait_seconds": clockWait,
+        "lifecycles_per_second": len(completed) / elapsed if elapsed > 0 else 0.0,
+        "lifecycles_per_busy_second": len(completed) / busy if busy > 0 else 0.0,
+        "lifecycle_busy_ms": {
+            "p50": 1000 * percentile(latencies, 0.50),
+            "p95": 1000 * percentile(latencies, 0.95),
+            "p99": 1000 * percentile(latencies, 0.99),
+        },
+        "stages": timer.report(),
+    }
+
+
+def compareReports(
+    baseline: Dict[str, Any], current: Dict[str, Any], tolerance: float = 0.2
+) -> List[str]:
+    """Find regressions between two benchmark reports.
+    Args:
+        baseline: A report from an earlier run.
+        current: A report from this run.
+        tolerance: The fraction by which throughput may drop, or a stage's mean
+            time per item may grow, before it is reported.
+    Returns:
+        A description of each regression, or an empty list if there are none.
+    """
+    regressions: List[str] = []
+
+    if current["failed"] > baseline["failed"]:
+        regressions.append(
+            "failed lifecycles: {} -> {}".format(baseline["failed"], current["failed"])
+        )
+
+    before = baseline["lifecycles_per_busy_second"]
+    after = current["lifecycles_per_busy_second"]
+    if before > 0 and after < before * (1 - tolerance):
+        regressions.append("lifecycles_per_busy_second: {:.2f} -> {:.2f}".format(before, after))
+
+    for stage, stats in sorted(current["stages"].items()):
+        if stage == "clock_wait":
+            continue
+        previous = baseline["stages"].get(stage)
+        if previous is None or not previous["mean_ms_per_item"]:
+            continue
+        if stats["mean_ms_per_item"] > previous["mean_ms_per_item"] * (1 + tolerance):
+            regressions.append(
+                "{} mean_ms_per_item: {:.3f} -> {:.3f}".format(
+                    stage, previous["mean_ms_per_item"], stats["mean_ms_per_item"]
+                )
+            )
+
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    defaults = BenchmarkConfig._field_defaults
+    parser = argparse.ArgumentParser(description="Benchmark loyalty offer lifecycles.")
+    parser.add_argument(
+        "--backend",
+        choices=("sandbox", "fake"),
+        default=os.environ.get(BACKEND_ENV_VAR) or "sandbox",
+    )
+    parser.add_argument("--lifecycles", type=int, default=defaults["lifecycles"])
+    parser.add_argument("--concurrency", type=int, default=defaults["concurrency"])
+    parser.add_argument("--batch-size", type=int, default=defaults["batchSize"])
+    parser.add_argument("--lead-time", type=int, default=defaults["leadTime"], help="seconds")
+    parser.add_argument("--duration", type=int, default=defaults["duration"], help="seconds")
+    parser.add_argument(
+        "--cache-params", action="store_true", help="share one SuggestedParamsProvider"
+    )
+    parser.add_argument(
+        "--signer-processes",
+        type=int,
+        default=defaults["signerProcesses"],
+        help="sign on a pool of this many processes",
+    )
+    parser.add_argument("--output", help="also write the report to this file")
+    parser.add_argument("--baseline", help="report of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    if args.backend == "fake":
+        os.environ[BACKEND_ENV_VAR] = "fake"
+    else:
+        os.environ.pop(BACKEND_ENV_VAR, None)
+
+    config = BenchmarkConfig(
+        lifecycles=args.lifecycles,
+        concurrency=args.concurrency,
+        batchSize=args.batch_size,
+        leadTime=args.lead_time,
+        duration=args.duration,
+        cacheParams=args.cache_params,
+        signerProcesses=args.signer_processes,
+    )
+
+    client = getAlgodClient()
+    report = runBenchmark(client, getGenesisAccounts()[0], config)
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compareReports(baseline, report, args.tolerance)
+        for regression in regressions:
+            print("regression: " + regression, file=sys.stderr)
+        if len(regressions) > 0:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
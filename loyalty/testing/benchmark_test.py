@@ -0,0 +1,42 @@
+from ..account import Account
+from .benchmark import BenchmarkConfig, runBenchmark, compareReports
+from .fake import FakeNetwork, FakeAlgodClient
+
+
+def test_runBenchmark():
+    network = FakeNetwork()
+    client = FakeAlgodClient(network)
+
+    config = BenchmarkConfig(lifecycles=5, concurrency=2, batchSize=2, cacheParams=True)
+    report = runBenchmark(client, Account(network.wallet[0]), config)
+
+    assert report["errors"] == []
+    assert report["completed"] == 5
+    for phase in ("create", "setup", "action", "close"):
+        for stage in ("params", "build", "sign", "submit", "confirm"):
+            assert phase + "." + stage in report["stages"]
+    assert report["stages"]["create.submit"]["items"] == 5
+    assert report["stages"]["compile"]["calls"] == 1
+
+
+def test_compareReports():
+    def report(failed, throughput, createMs):
+        return {
+            "failed": failed,
+            "lifecycles_per_busy_second": throughput,
+            "stages": {
+                "create.sign": {"mean_ms_per_item": createMs},
+                "clock_wait": {"mean_ms_per_item": 1.0},
+            },
+        }
+
+    baseline = report(0, 100.0, 1.0)
+
+    assert compareReports(baseline, report(0, 90.0, 1.1)) == []
+    assert compareReports(baseline, report(1, 100.0, 1.0)) == ["failed lifecycles: 0 -> 1"]
+
+    regressions = compareReports(baseline, report(0, 50.0, 2.0), tolerance=0.2)
+    assert regressions == [
+        "lifecycles_per_busy_second: 100.00 -> 50.00",
+        "create.sign mean_ms_per_item: 1.000 -> 2.000",
+    ]
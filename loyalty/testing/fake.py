@@ -0,0 +1,1319 @@
+"""An in-process stand-in for the sandbox's algod and kmd.
+
+FakeNetwork keeps the whole ledger in memory and evaluates transaction groups
+the way algod does: signatures, group IDs, validity windows, pooled fees,
+minimum balances, payments, assets and applications. Application calls run
+the compiled program with loyalty.testing.teal, including inner transactions
+and global state deltas. Every accepted group is confirmed in a block of its
+own, and the block clock can be moved forward instead of sleeping, so a full
+offer lifecycle takes milliseconds.
+
+FakeAlgodClient, FakeAsyncAlgodClient and FakeKMDClient are drop-in
+replacements for the SDK clients that route requests to a FakeNetwork
+instead of over HTTP. Select them for the test suite with
+LOYALTY_ALGOD_BACKEND=fake.
+"""
+from typing import Any, Dict, List, Optional, Tuple, Union
+from base64 import b64encode, b64decode, b32encode
+from collections import deque
+from time import time
+import asyncio
+import hashlib
+import threading
+import zlib
+
+import msgpack
+from nacl.exceptions import BadSignatureError
+from nacl.signing import VerifyKey
+
+from algosdk import account, encoding, error
+from algosdk.kmd import KMDClient
+from algosdk.v2client.algod import AlgodClient
+
+from ..aio.algod import AsyncAlgodClient
+from ..artifacts import findPrebuiltTeal
+from .setup import KMD_WALLET_NAME, KMD_WALLET_PASSWORD
+from .teal import (
+    APP_CALL_BUDGET,
+    NAMED_INTS,
+    EvalContext,
+    Evaluation,
+    Program,
+    StackValue,
+    TealError,
+)
+
+
+def checksum(data: bytes) -> bytes:
+    # hashlib is much faster than the SDK's pure Python checksum
+    return hashlib.new("sha512_256", data).digest()
+
+
+def encodeAddress(address: bytes) -> str:
+    return b32encode(address + checksum(address)[-4:]).decode().strip("=")
+
+
+GENESIS_ID = "loyalty-fake-v1"
+GENESIS_HASH = checksum(GENESIS_ID.encode())
+CONSENSUS_VERSION = "loyalty-fake"
+
+GENESIS_ACCOUNTS = 3
+GENESIS_BALANCE = 4_000_000_000_000_000
+
+MIN_TXN_FEE = 1000
+MIN_BALANCE = 100_000
+APP_PAGE_MIN_BALANCE = 100_000
+SCHEMA_MIN_BALANCE = 25_000
+SCHEMA_UINT_MIN_BALANCE = 3_500
+SCHEMA_BYTES_MIN_BALANCE = 25_000
+MAX_TXN_LIFE = 1000
+MAX_GROUP_SIZE = 16
+MAX_INNER_TXNS = 16
+MAX_STATE_KEY_LEN = 64
+MAX_STATE_ENTRY_LEN = 128
+# rounds of blocks and transactions kept for lookups
+RETAINED_ROUNDS = 1000
+
+ZERO_ADDRESS = bytes(32)
+
+PROGRAM_MARKER = b"loyalty-fake-teal:"
+
+ADDRESS_KEYS = {
+    "snd",
+    "rcv",
+    "close",
+    "asnd",
+    "arcv",
+    "aclose",
+    "fadd",
+    "rekey",
+    "sgnr",
+    "m",
+    "r",
+    "f",
+    "c",
+}
+
+MISSING = object()
+
+
+def compileFakeProgram(teal: str) -> bytes:
+    """Compile TEAL source for the fake network.
+    The result starts with the version byte like real bytecode, followed by a
+    marker and the compressed source, which FakeNetwork parses on first use.
+    """
+    program = Program(teal)
+    return bytes([program.version]) + PROGRAM_MARKER + zlib.compress(teal.encode())
+
+
+programs: Dict[bytes, Program] = dict()
+
+
+def loadFakeProgram(program: bytes) -> Program:
+    parsed = programs.get(program)
+    if parsed is None:
+        if program[1 : 1 + len(PROGRAM_MARKER)] == PROGRAM_MARKER:
+            teal = zlib.decompress(program[1 + len(PROGRAM_MARKER) :]).decode()
+        else:
+            # real bytecode shipped by loyalty.artifacts runs from its TEAL
+            prebuilt = findPrebuiltTeal(program)
+            if prebuilt is None:
+                raise TealError("program was not compiled by the fake network")
+            teal = prebuilt
+        parsed = Program(teal)
+        programs[program] = parsed
+    return parsed
+
+
+def applicationAddress(appID: int) -> bytes:
+    return checksum(b"appID" + appID.to_bytes(8, "big"))
+
+
+def jsonify(value: Any, key: Optional[str] = None) -> Any:
+    """Convert a msgpack structure to the JSON form algod returns."""
+    if isinstance(value, dict):
+        return {str(k): jsonify(v, str(k)) for k, v in value.items()}
+    if isinstance(value, list):
+        return [jsonify(v, key) for v in value]
+    if isinstance(value, bytes):
+        if key in ADDRESS_KEYS or (key == "apat" and len(value) == 32):
+            return encodeAddress(value)
+        return b64encode(value).decode()
+    return value
+
+
+def omitEmpty(txn: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in sorted(txn.items()) if v not in (None, 0, b"", ZERO_ADDRESS)}
+
+
+class LedgerError(Exception):
+    pass
+
+
+class AccountRecord:
+    __slots__ = ("amount", "assets", "createdApps", "createdAssets", "authAddr")
+
+    def __init__(self) -> None:
+        self.amount = 0
+        # asset ID -> amount held
+        self.assets: Dict[int, int] = dict()
+        self.createdApps: Dict[int, "AppRecord"] = dict()
+        self.createdAssets: Dict[int, "AssetRecord"] = dict()
+        self.authAddr: Optional[bytes] = None
+
+
+class AppRecord:
+    def __init__(self, appID: int, creator: bytes, txn: Dict[str, Any]) -> None:
+        self.id = appID
+        self.creator = creator
+        self.approval: bytes = txn.get("apap", b"")
+        self.clear: bytes = txn.get("apsu", b"")
+        globalSchema = txn.get("apgs", {})
+        localSchema = txn.get("apls", {})
+        self.globalSchema = (globalSchema.get("nui", 0), globalSchema.get("nbs", 0))
+        self.localSchema = (localSchema.get("nui", 0), localSchema.get("nbs", 0))
+        self.extraPages: int = txn.get("apep", 0)
+        self.globalState: Dict[bytes, StackValue] = dict()
+
+    def minBalance(self) -> int:
+        return (
+            APP_PAGE_MIN_BALANCE * (1 + self.extraPages)
+            + (SCHEMA_MIN_BALANCE + SCHEMA_UINT_MIN_BALANCE) * self.globalSchema[0]
+            + (SCHEMA_MIN_BALANCE + SCHEMA_BYTES_MIN_BALANCE) * self.globalSchema[1]
+        )
+
+
+class AssetRecord:
+    def __init__(self, assetID: int, creator: bytes, params: Dict[str, Any]) -> None:
+        self.id = assetID
+        self.creator = creator
+        self.params = params
+
+
+class AppCallContext(EvalContext):
+    """Runs one application call against the ledger."""
+
+    def __init__(
+        self,
+        network: "FakeNetwork",
+        app: AppRecord,
+        group: List[Dict[str, Any]],
+        groupIndex: int,
+        timestamp: int,
+        round: int,
+        groupID: bytes,
+    ) -> None:
+        self.network = network
+        self.app = app
+        self.appID = app.id
+        self.appAddress = applicationAddress(app.id)
+        self.group = group
+        self.txn = group[groupIndex]
+        self.globals = {
+            "MinTxnFee": MIN_TXN_FEE,
+            "MinBalance": MIN_BALANCE,
+            "MaxTxnLife": MAX_TXN_LIFE,
+            "ZeroAddress": ZERO_ADDRESS,
+            "GroupSize": len(group),
+            "LogicSigVersion": 5,
+            "Round": round,
+            "LatestTimestamp": timestamp,
+            "CurrentApplicationID": app.id,
+            "CreatorAddress": app.creator,
+            "CurrentApplicationAddress": self.appAddress,
+            "GroupID": groupID,
+        }
+        self.availableAccounts = set(self.txn["Accounts"])
+        self.availableAccounts.add(self.appAddress)
+        self.innerTxns: List[Tuple[Dict[str, Any], Dict[str, Any]]] = []
+        self.logs: List[bytes] = []
+
+    def globalGet(self, appID: int, key: bytes) -> Optional[StackValue]:
+        if appID == self.appID:
+            return self.app.globalState.get(key)
+        if appID not in self.txn["Applications"]:
+            raise TealError("unavailable App {}".format(appID))
+        app = self.network.apps.get(appID)
+        return None if app is None else app.globalState.get(key)
+
+    def globalPut(self, key: bytes, value: StackValue) -> None:
+        if len(key) > MAX_STATE_KEY_LEN:
+            raise TealError("key too long: length was {}".format(len(key)))
+        if isinstance(value, bytes) and len(key) + len(value) > MAX_STATE_ENTRY_LEN:
+            raise TealError("key/value total too long for key {!r}".format(key))
+        self.network.setItem(self.app.globalState, key, value)
+
+    def globalDel(self, key: bytes) -> None:
+        if key in self.app.globalState:
+            self.network.delItem(self.app.globalState, key)
+
+    def resolveAccount(self, ref: StackValue) -> bytes:
+        if isinstance(ref, int):
+            if ref >= len(self.txn["Accounts"]):
+                raise TealError("invalid Account reference {}".format(ref))
+            return self.txn["Accounts"][ref]
+        if ref not in self.availableAccounts:
+            raise TealError("invalid Account reference {}".format(encodeAddress(ref)))
+        return ref
+
+    def resolveAsset(self, ref: int) -> int:
+        assets = self.txn["Assets"]
+        if ref < len(assets):
+            return assets[ref]
+        if ref not in assets:
+            raise TealError("invalid Asset reference {}".format(ref))
+        return ref
+
+    def balance(self, account: bytes) -> int:
+        record = self.network.accounts.get(account)
+        return 0 if record is None else record.amount
+
+    def minBalance(self, account: bytes) -> int:
+        record = self.network.accounts.get(account)
+        return 0 if record is None else self.network.minBalance(record)
+
+    def assetHolding(self, account: bytes, assetRef: int) -> Optional[int]:
+        assetID = self.resolveAsset(assetRef)
+        record = self.network.accounts.get(account)
+        return None if record is None else record.assets.get(assetID)
+
+    def submitInner(self, fields: Dict[str, Any]) -> None:
+        if len(self.innerTxns) >= MAX_INNER_TXNS:
+            raise TealError("too many inner transactions")
+
+        typeEnum = fields.get("TypeEnum")
+        if typeEnum is None and "Type" in fields:
+            typeEnum = NAMED_INTS.get(fields["Type"].decode(), 0)
+
+        sender = fields.get("Sender", self.appAddress)
+        if sender != self.appAddress:
+            raise TealError("inner transaction sender must be the application account")
+
+        txn: Dict[str, Any] = {
+            "snd": sender,
+            "fee": MIN_TXN_FEE,
+            "fv": self.globals["Round"],
+            "lv": self.globals["Round"],
+            "note": fields.get("Note", b""),
+        }
+
+        if typeEnum == 1:
+            txn.update(
+                type="pay",
+                rcv=fields.get("Receiver", ZERO_ADDRESS),
+                amt=fields.get("Amount", 0),
+                close=fields.get("CloseRemainderTo", ZERO_ADDRESS),
+            )
+            for field in ("Receiver", "CloseRemainderTo"):
+                if field in fields:
+                    self.resolveAccount(fields[field])
+        elif typeEnum == 4:
+            txn.update(
+                type="axfer",
+                xaid=fields.get("XferAsset", 0),
+                aamt=fields.get("AssetAmount", 0),
+                arcv=fields.get("AssetReceiver", ZERO_ADDRESS),
+                aclose=fields.get("AssetCloseTo", ZERO_ADDRESS),
+            )
+            if txn["xaid"] not in self.txn["Assets"]:
+                raise TealError("invalid Asset reference {}".format(txn["xaid"]))
+            for field in ("AssetReceiver", "AssetCloseTo"):
+                if field in fields:
+                    self.resolveAccount(fields[field])
+        else:
+            raise TealError("unsupported inner transaction type {}".format(typeEnum))
+
+        txn = omitEmpty(txn)
+        try:
+            self.network.debit(sender, MIN_TXN_FEE)
+            applyData = self.network.applyTxn(txn)
+        except LedgerError as e:
+            raise TealError("inner transaction failed: {}".format(e))
+        self.innerTxns.append((txn, applyData))
+
+
+class FakeNetwork:
+    """An in-memory ledger with a controllable clock.
+
+    Args:
+        genesisAccounts: The number of funded accounts in the kmd wallet.
+        idleBlockInterval: How long a wait for the next block may block before
+            an empty block is produced, in seconds.
+    """
+
+    def __init__(self, genesisAccounts: int = GENESIS_ACCOUNTS, idleBlockInterval: float = 0.01) -> None:
+        self.lock = threading.RLock()
+        self.newBlock = threading.Condition(self.lock)
+        self.idleBlockInterval = idleBlockInterval
+
+        self.accounts: Dict[bytes, AccountRecord] = dict()
+        self.apps: Dict[int, AppRecord] = dict()
+        self.assets: Dict[int, AssetRecord] = dict()
+        self.nextIndex = 1
+
+        # undo log of the group being evaluated: (container, key, old value)
+        self.journal: List[Tuple[Any, Any, Any]] = []
+        self.touched: set = set()
+        self.closed: set = set()
+
+        self.timeOffset = 0.0
+        self.round = 0
+        self.blocks: Dict[int, Dict[str, Any]] = dict()
+        # txID -> (signed transaction, apply data, confirmed round)
+        self.txns: Dict[str, Tuple[Dict[str, Any], Dict[str, Any], int]] = dict()
+        self.retained: "deque[Tuple[int, List[str]]]" = deque()
+        self.lastBlockTime = time()
+
+        self.wallet: List[str] = []
+        for _ in range(genesisAccounts):
+            sk, address = account.generate_account()
+            record = AccountRecord()
+            record.amount = GENESIS_BALANCE
+            self.accounts[encoding.decode_address(address)] = record
+            self.wallet.append(sk)
+
+        self.produceBlock([])
+
+    # clock
+
+    def now(self) -> int:
+        return int(time() + self.timeOffset)
+
+    def latestTimestamp(self) -> int:
+        return self.blocks[self.round]["ts"]
+
+    def advanceTime(self, seconds: float) -> int:
+        """Move the clock forward and produce a block at the new time.
+        Returns:
+            The timestamp of the new block.
+        """
+        with self.lock:
+            self.timeOffset += seconds
+            self.produceBlock([])
+            return self.latestTimestamp()
+
+    def advanceTo(self, timestamp: int) -> int:
+        """Move the clock forward until the latest block timestamp is at least timestamp.
+        Returns:
+            The timestamp of the latest block.
+        """
+        with self.lock:
+            if self.latestTimestamp() < timestamp:
+                if self.now() < timestamp:
+                    self.timeOffset += timestamp - self.now()
+                self.produceBlock([])
+            return self.latestTimestamp()
+
+    # blocks
+
+    def produceBlock(self, entries: List[Tuple[str, Dict[str, Any], Dict[str, Any]]]) -> None:
+        with self.lock:
+            self.round += 1
+            timestamp = max(self.now(), self.blocks[self.round - 1]["ts"] if self.round > 1 else 0)
+
+            blockTxns = []
+            txIDs = []
+            for txID, stxn, applyData in entries:
+                blockTxns.append(blockTxn(stxn, applyData))
+                self.txns[txID] = (stxn, applyData, self.round)
+                txIDs.append(txID)
+
+            self.blocks[self.round] = {
+                "gen": GENESIS_ID,
+                "gh": GENESIS_HASH,
+                "rnd": self.round,
+                "ts": timestamp,
+                "txns": blockTxns,
+            }
+            self.retained.append((self.round, txIDs))
+
+            while len(self.retained) > 0 and self.retained[0][0] <= self.round - RETAINED_ROUNDS:
+                oldRound, oldTxIDs = self.retained.popleft()
+                self.blocks.pop(oldRound, None)
+                for txID in oldTxIDs:
+                    self.txns.pop(txID, None)
+
+            self.lastBlockTime = time()
+            self.newBlock.notify_all()
+
+    def waitForBlockAfter(self, round: int) -> None:
+        with self.newBlock:
+            if self.round <= round:
+                self.newBlock.wait_for(lambda: self.round > round, timeout=self.idleBlockInterval)
+            while self.round <= round:
+                self.produceBlock([])
+
+    # undo log
+
+    def setItem(self, container: Dict[Any, Any], key: Any, value: Any) -> None:
+        self.journal.append((container, key, container.get(key, MISSING)))
+        container[key] = value
+
+    def delItem(self, container: Dict[Any, Any], key: Any) -> None:
+        self.journal.append((container, key, container[key]))
+        del container[key]
+
+    def setAttr(self, obj: Any, name: str, value: Any) -> None:
+        self.journal.append((obj, name, getattr(obj, name)))
+        setattr(obj, name, value)
+
+    def rollback(self) -> None:
+        while len(self.journal) > 0:
+            container, key, old = self.journal.pop()
+            if isinstance(container, dict):
+                if old is MISSING:
+                    container.pop(key, None)
+                else:
+                    container[key] = old
+            else:
+                setattr(container, key, old)
+
+    # balances
+
+    def getAccount(self, address: bytes) -> AccountRecord:
+        record = self.accounts.get(address)
+        if record is None:
+            record = AccountRecord()
+            self.setItem(self.accounts, address, record)
+        self.touched.add(address)
+        return record
+
+    def minBalance(self, record: AccountRecord) -> int:
+        return (
+            MIN_BALANCE * (1 + len(record.assets))
+            + sum(app.minBalance() for app in record.createdApps.values())
+        )
+
+    def credit(self, address: bytes, amount: int) -> None:
+        if amount == 0:
+            return
+        record = self.getAccount(address)
+        self.setAttr(record, "amount", record.amount + amount)
+
+    def debit(self, address: bytes, amount: int) -> None:
+        record = self.getAccount(address)
+        if record.amount < amount:
+            raise LedgerError(
+                "overspend (account {}, data {} microAlgos, tried to spend {})".format(
+                    encodeAddress(address), record.amount, amount
+                )
+            )
+        self.setAttr(record, "amount", record.amount - amount)
+
+    def moveAsset(self, assetID: int, sender: bytes, receiver: bytes, amount: int) -> None:
+        if amount == 0:
+            return
+        source = self.getAccount(sender)
+        target = self.getAccount(receiver)
+        if assetID not in source.assets:
+            raise LedgerError(
+                "asset {} missing from {}".format(assetID, encodeAddress(sender))
+            )
+        if assetID not in target.assets:
+            raise LedgerError(
+                "receiver error: must optin, asset {} missing from {}".format(
+                    assetID, encodeAddress(receiver)
+                )
+            )
+        if source.assets[assetID] < amount:
+            raise LedgerError(
+                "underflow on subtracting {} from sender amount {}".format(
+                    amount, source.assets[assetID]
+                )
+            )
+        self.setItem(source.assets, assetID, source.assets[assetID] - amount)
+        self.setItem(target.assets, assetID, target.assets[assetID] + amount)
+
+    def checkMinBalances(self) -> None:
+        for address in self.touched:
+            record = self.accounts.get(address)
+            if record is None:
+                continue
+            if (
+                address in self.closed
+                and record.amount == 0
+                and len(record.assets) == 0
+                and len(record.createdApps) == 0
+            ):
+                self.delItem(self.accounts, address)
+                continue
+            minBalance = self.minBalance(record)
+            if record.amount < minBalance:
+                raise LedgerError(
+                    "account {} balance {} below min {} ({} assets)".format(
+                        encodeAddress(address),
+                        record.amount,
+                        minBalance,
+                        len(record.assets),
+                    )
+                )
+
+    # transactions
+
+    def submit(self, raw: bytes) -> str:
+        """Evaluate a signed transaction group and confirm it in a new block.
+        Returns:
+            The ID of the first transaction.
+        """
+        unpacker = msgpack.Unpacker(raw=False)
+        unpacker.feed(raw)
+        stxns: List[Dict[str, Any]] = list(unpacker)
+
+        if len(stxns) == 0:
+            raise error.AlgodHTTPError("empty transaction group", 400)
+        if len(stxns) > MAX_GROUP_SIZE:
+            raise error.AlgodHTTPError("group size {} exceeds maximum".format(len(stxns)), 400)
+
+        with self.lock:
+            txIDs = []
+            for stxn in stxns:
+                txID = b32encode(txnDigest(stxn["txn"])).decode().strip("=")
+                txIDs.append(txID)
+                try:
+                    self.checkTxn(stxn, txID)
+                except LedgerError as e:
+                    raise error.AlgodHTTPError(
+                        "TransactionPool.Remember: transaction {}: {}".format(txID, e), 400
+                    )
+
+            try:
+                applyData = self.evalGroup([stxn["txn"] for stxn in stxns])
+            except (LedgerError, TealError) as e:
+                self.rollback()
+                self.touched.clear()
+                self.closed.clear()
+                raise error.AlgodHTTPError(
+                    "TransactionPool.Remember: transaction {}: {}".format(txIDs[0], e), 400
+                )
+
+            self.journal.clear()
+            self.touched.clear()
+            self.closed.clear()
+            self.produceBlock(list(zip(txIDs, stxns, applyData)))
+
+        return txIDs[0]
+
+    def checkTxn(self, stxn: Dict[str, Any], txID: str) -> None:
+        txn = stxn["txn"]
+
+        if "sig" not in stxn:
+            raise LedgerError("only single signature transactions are supported")
+
+        sender = txn["snd"]
+        record = self.accounts.get(sender)
+        expected = record.authAddr if record is not None and record.authAddr is not None else sender
+        signer = stxn.get("sgnr", sender)
+        if signer != expected:
+            raise LedgerError(
+                "should have been authorized by {} but was actually authorized by {}".format(
+                    encodeAddress(expected), encodeAddress(signer)
+                )
+            )
+        try:
+            VerifyKey(signer).verify(b"TX" + msgpack.packb(txn, use_bin_type=True), stxn["sig"])
+        except BadSignatureError:
+            raise LedgerError("signature validation failed")
+
+        if txn.get("gh") != GENESIS_HASH:
+            raise LedgerError("genesis hash mismatch")
+        if txn.get("gen", GENESIS_ID) != GENESIS_ID:
+            raise LedgerError("genesis ID mismatch")
+
+        nextRound = self.round + 1
+        firstValid, lastValid = txn.get("fv", 0), txn.get("lv", 0)
+        if lastValid - firstValid > MAX_TXN_LIFE:
+            raise LedgerError("validity window too large")
+        if not firstValid <= nextRound <= lastValid:
+            raise LedgerError(
+                "txn dead: round {} outside of {}--{}".format(nextRound, firstValid, lastValid)
+            )
+
+        if txID in self.txns:
+            raise LedgerError("transaction already in ledger: {}".format(txID))
+
+    def evalGroup(self, txns: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        groupID = txns[0].get("grp", b"")
+        if len(txns) > 1 or groupID != b"":
+            expected = groupDigest(txns)
+            if any(txn.get("grp", b"") != expected for txn in txns):
+                raise LedgerError("incomplete group or bad group ID")
+
+        fees = sum(txn.get("fee", 0) for txn in txns)
+        if fees < MIN_TXN_FEE * len(txns):
+            raise LedgerError(
+                "txgroup had {} in fees, which is less than the minimum {}".format(
+                    fees, MIN_TXN_FEE * len(txns)
+                )
+            )
+
+        group: Optional[List[Dict[str, Any]]] = None
+        budget = [APP_CALL_BUDGET * sum(1 for txn in txns if txn["type"] == "appl")]
+
+        results = []
+        for index, txn in enumerate(txns):
+            self.debit(txn["snd"], txn.get("fee", 0))
+
+            if txn["type"] == "appl":
+                if group is None:
+                    group = [txnFields(t, i) for i, t in enumerate(txns)]
+                applyData = self.applyAppCall(txn, group, index, budget, groupID)
+            else:
+                applyData = self.applyTxn(txn)
+
+            if txn.get("rekey", ZERO_ADDRESS) != ZERO_ADDRESS:
+                rekey = txn["rekey"]
+                self.setAttr(
+                    self.getAccount(txn["snd"]), "authAddr", None if rekey == txn["snd"] else rekey
+                )
+
+            results.append(applyData)
+
+        self.checkMinBalances()
+        return results
+
+    def applyTxn(self, txn: Dict[str, Any]) -> Dict[str, Any]:
+        txnType = txn["type"]
+        if txnType == "pay":
+            return self.applyPayment(txn)
+        if txnType == "axfer":
+            return self.applyAssetTransfer(txn)
+        if txnType == "acfg":
+            return self.applyAssetConfig(txn)
+        raise LedgerError("unsupported transaction type {}".format(txnType))
+
+    def applyPayment(self, txn: Dict[str, Any]) -> Dict[str, Any]:
+        sender = txn["snd"]
+        amount = txn.get("amt", 0)
+        self.debit(sender, amount)
+        self.credit(txn.get("rcv", ZERO_ADDRESS), amount)
+
+        applyData: Dict[str, Any] = dict()
+        closeTo = txn.get("close", ZERO_ADDRESS)
+        if closeTo != ZERO_ADDRESS:
+            record = self.getAccount(sender)
+            if len(record.assets) > 0 or len(record.createdApps) > 0:
+                raise LedgerError(
+                    "cannot close account {} while it holds assets or apps".format(
+                        encodeAddress(sender)
+                    )
+                )
+            remaining = record.amount
+            self.debit(sender, remaining)
+            self.credit(closeTo, remaining)
+            self.setAttr(record, "authAddr", None)
+            self.closed.add(sender)
+            applyData["closing-amount"] = remaining
+        return applyData
+
+    def applyAssetTransfer(self, txn: Dict[str, Any]) -> Dict[str, Any]:
+        sender = txn["snd"]
+        assetID = txn.get("xaid", 0)
+        asset = self.assets.get(assetID)
+        if asset is None:
+            raise LedgerError("asset {} does not exist or has been deleted".format(assetID))
+
+        amount = txn.get("aamt", 0)
+        receiver = txn.get("arcv", ZERO_ADDRESS)
+        source = txn.get("asnd", ZERO_ADDRESS)
+        if source != ZERO_ADDRESS:
+            if sender != asset.params.get("c", ZERO_ADDRESS):
+                raise LedgerError("clawback not allowed: sender is not the clawback address")
+        else:
+            source = sender
+
+        senderRecord = self.getAccount(sender)
+        if source == sender and receiver == sender and assetID not in senderRecord.assets:
+            # opt in
+            if amount != 0:
+                raise LedgerError("cannot transfer to an account that has not opted in")
+            self.setItem(senderRecord.assets, assetID, 0)
+            return dict()
+
+        self.moveAsset(assetID, source, receiver, amount)
+
+        applyData: Dict[str, Any] = dict()
+        closeTo = txn.get("aclose", ZERO_ADDRESS)
+        if closeTo != ZERO_ADDRESS:
+            if source != sender:
+                raise LedgerError("cannot close asset by clawback")
+            if sender == asset.creator:
+                raise LedgerError("cannot close asset ID in allocating account")
+            if assetID not in senderRecord.assets:
+                raise LedgerError(
+                    "asset {} missing from {}".format(assetID, encodeAddress(sender))
+                )
+            remaining = senderRecord.assets[assetID]
+            self.moveAsset(assetID, sender, closeTo, remaining)
+            self.delItem(senderRecord.assets, assetID)
+            applyData["asset-closing-amount"] = remaining
+        return applyData
+
+    def applyAssetConfig(self, txn: Dict[str, Any]) -> Dict[str, Any]:
+        sender = txn["snd"]
+        assetID = txn.get("caid", 0)
+        params = txn.get("apar", {})
+
+        if assetID == 0:
+            assetID = self.nextIndex
+            self.setAttr(self, "nextIndex", assetID + 1)
+            asset = AssetRecord(assetID, sender, params)
+            record = self.getAccount(sender)
+            self.setItem(self.assets, assetID, asset)
+            self.setItem(record.createdAssets, assetID, asset)
+            self.setItem(record.assets, assetID, params.get("t", 0))
+            return {"asset-index": assetID}
+
+        existing = self.assets.get(assetID)
+        if existing is None:
+            raise LedgerError("asset {} does not exist or has been deleted".format(assetID))
+        asset = existing
+        if sender != asset.params.get("m", ZERO_ADDRESS):
+            raise LedgerError("this transaction should be issued by the manager")
+
+        if len(params) == 0:
+            creator = self.getAccount(asset.creator)
+            if creator.assets.get(assetID) != asset.params.get("t", 0):
+                raise LedgerError("cannot destroy asset: creator is holding only part of it")
+            self.delItem(creator.assets, assetID)
+            self.delItem(creator.createdAssets, assetID)
+            self.delItem(self.assets, assetID)
+            return dict()
+
+        updated = dict(asset.params)
+        for key in ("m", "r", "f", "c"):
+            if params.get(key, ZERO_ADDRESS) == ZERO_ADDRESS:
+                updated.pop(key, None)
+            else:
+                updated[key] = params[key]
+        self.setAttr(asset, "params", updated)
+        return dict()
+
+    def applyAppCall(
+        self,
+        txn: Dict[str, Any],
+        group: List[Dict[str, Any]],
+        groupIndex: int,
+        budget: List[int],
+        groupID: bytes,
+    ) -> Dict[str, Any]:
+        sender = txn["snd"]
+        appID = txn.get("apid", 0)
+        onComplete = txn.get("apan", 0)
+        applyData: Dict[str, Any] = dict()
+
+        if appID == 0:
+            appID = self.nextIndex
+            self.setAttr(self, "nextIndex", appID + 1)
+            app = AppRecord(appID, sender, txn)
+            self.setItem(self.apps, appID, app)
+            self.setItem(self.getAccount(sender).createdApps, appID, app)
+            applyData["application-index"] = appID
+        else:
+            existing = self.apps.get(appID)
+            if existing is None:
+                raise LedgerError("application {} does not exist".format(appID))
+            app = existing
+
+        if onComplete == NAMED_INTS["ClearState"]:
+            raise LedgerError("local state is not supported, so ClearState can never succeed")
+
+        ctx = AppCallContext(
+            self,
+            app,
+            group,
+            groupIndex,
+            self.latestTimestamp(),
+            self.round + 1,
+            groupID or ZERO_ADDRESS,
+        )
+        before = dict(app.globalState)
+
+        approved = Evaluation(loadFakeProgram(app.approval), ctx, budget).run()
+        if not approved:
+            raise LedgerError("transaction rejected by ApprovalProgram")
+
+        uints = sum(1 for value in app.globalState.values() if isinstance(value, int))
+        if uints > app.globalSchema[0]:
+            raise LedgerError(
+                "store integer count {} exceeds schema integer count {}".format(
+                    uints, app.globalSchema[0]
+                )
+            )
+        byteSlices = len(app.globalState) - uints
+        if byteSlices > app.globalSchema[1]:
+            raise LedgerError(
+                "store bytes count {} exceeds schema bytes count {}".format(
+                    byteSlices, app.globalSchema[1]
+                )
+            )
+
+        if onComplete == NAMED_INTS["UpdateApplication"]:
+            self.setAttr(app, "approval", txn.get("apap", b""))
+            self.setAttr(app, "clear", txn.get("apsu", b""))
+        elif onComplete == NAMED_INTS["DeleteApplication"]:
+            self.delItem(self.apps, appID)
+            creator = self.getAccount(app.creator)
+            self.delItem(creator.createdApps, appID)
+
+        applyData["global-state-delta"] = stateDelta(before, app.globalState)
+        applyData["inner-txns"] = ctx.innerTxns
+        applyData["logs"] = ctx.logs
+        return applyData
+
+    # lookups
+
+    def accountInfo(self, address: str) -> Dict[str, Any]:
+        with self.lock:
+            record = self.accounts.get(encoding.decode_address(address)) or AccountRecord()
+            info: Dict[str, Any] = {
+                "address": address,
+                "amount": record.amount,
+                "amount-without-pending-rewards": record.amount,
+                "min-balance": self.minBalance(record),
+                "pending-rewards": 0,
+                "rewards": 0,
+                "reward-base": 0,
+                "round": self.round,
+                "status": "Offline",
+                "assets": [
+                    {
+                        "asset-id": assetID,
+                        "amount": amount,
+                        "creator": encodeAddress(self.assets[assetID].creator)
+                        if assetID in self.assets
+                        else "",
+                        "is-frozen": False,
+                    }
+                    for assetID, amount in sorted(record.assets.items())
+                ],
+                "created-apps": [
+                    {"id": appID, "params": self.appParams(app)}
+                    for appID, app in sorted(record.createdApps.items())
+                ],
+                "created-assets": [
+                    {"index": assetID, "params": assetParams(asset)}
+                    for assetID, asset in sorted(record.createdAssets.items())
+                ],
+                "apps-local-state": [],
+                "apps-total-schema": {"num-uint": 0, "num-byte-slice": 0},
+            }
+            if record.authAddr is not None:
+                info["auth-addr"] = encodeAddress(record.authAddr)
+            return info
+
+    def appParams(self, app: AppRecord) -> Dict[str, Any]:
+        return {
+            "creator": encodeAddress(app.creator),
+            "approval-program": b64encode(app.approval).decode(),
+            "clear-state-program": b64encode(app.clear).decode(),
+            "global-state": [
+                {
+                    "key": b64encode(key).decode(),
+                    "value": {"type": 2, "uint": value, "bytes": ""}
+                    if isinstance(value, int)
+                    else {"type": 1, "uint": 0, "bytes": b64encode(value).decode()},
+                }
+                for key, value in sorted(app.globalState.items())
+            ],
+            "global-state-schema": {
+                "num-uint": app.globalSchema[0],
+                "num-byte-slice": app.globalSchema[1],
+            },
+            "local-state-schema": {
+                "num-uint": app.localSchema[0],
+                "num-byte-slice": app.localSchema[1],
+            },
+            "extra-program-pages": app.extraPages,
+        }
+
+    def applicationInfo(self, appID: int) -> Dict[str, Any]:
+        with self.lock:
+            app = self.apps.get(appID)
+            if app is None:
+                raise error.AlgodHTTPError("application does not exist", 404)
+            return {"id": appID, "params": self.appParams(app)}
+
+    def assetInfo(self, assetID: int) -> Dict[str, Any]:
+        with self.lock:
+            asset = self.assets.get(assetID)
+            if asset is None:
+                raise error.AlgodHTTPError("asset does not exist", 404)
+            return {"index": assetID, "params": assetParams(asset)}
+
+    def status(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "last-round": self.round,
+                "last-version": CONSENSUS_VERSION,
+                "next-version": CONSENSUS_VERSION,
+                "next-version-round": self.round + 1,
+                "next-version-supported": True,
+                "time-since-last-round": int((time() - self.lastBlockTime) * 1e9),
+                "catchup-time": 0,
+                "stopped-at-unsupported-round": False,
+            }
+
+    def suggestedParams(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "consensus-version": CONSENSUS_VERSION,
+                "fee": 0,
+                "genesis-hash": b64encode(GENESIS_HASH).decode(),
+                "genesis-id": GENESIS_ID,
+                "last-round": self.round,
+                "min-fee": MIN_TXN_FEE,
+            }
+
+    def pendingTransactionInfo(self, txID: str) -> Dict[str, Any]:
+        with self.lock:
+            confirmed = self.txns.get(txID)
+            if confirmed is None:
+                raise error.AlgodHTTPError(
+                    "could not find the transaction in the transaction pool or in the last {} confirmed rounds".format(
+                        RETAINED_ROUNDS
+                    ),
+                    404,
+                )
+            stxn, applyData, confirmedRound = confirmed
+            info = pendingInfo(stxn, applyData)
+            info["confirmed-round"] = confirmedRound
+            return info
+
+    def block(self, round: int) -> Dict[str, Any]:
+        with self.lock:
+            block = self.blocks.get(round)
+            if block is None:
+                raise error.AlgodHTTPError(
+                    "failed to retrieve information from the ledger", 404
+                )
+            return {"block": block}
+
+    # HTTP surface
+
+    def handleAlgodRequest(
+        self,
+        method: str,
+        requrl: str,
+        params: Optional[Dict[str, Any]] = None,
+        data: Optional[bytes] = None,
+        response_format: str = "json",
+    ) -> Any:
+        """Answer an algod REST request the way algod would."""
+        parts = requrl.strip("/").split("/")
+
+        if method == "GET":
+            if parts == ["health"]:
+                return None
+            if parts == ["versions"]:
+                return {
+                    "versions": ["v2"],
+                    "genesis_id": GENESIS_ID,
+                    "genesis_hash_b64": b64encode(GENESIS_HASH).decode(),
+                    "build": {"major": 0, "minor": 0, "build_number": 0, "branch": "fake"},
+                }
+            if parts == ["status"]:
+                return self.status()
+            if parts[:2] == ["status", "wait-for-block-after"] and len(parts) == 3:
+                self.waitForBlockAfter(int(parts[2]))
+                return self.status()
+            if parts == ["transactions", "params"]:
+                return self.suggestedParams()
+            if parts[:2] == ["transactions", "pending"] and len(parts) == 3:
+                info = self.pendingTransactionInfo(parts[2])
+                if response_format == "msgpack":
+                    return msgpack.packb(info, use_bin_type=True)
+                return info
+            if parts[0] == "accounts" and len(parts) == 2:
+                return self.accountInfo(parts[1])
+            if parts[0] == "applications" and len(parts) == 2:
+                return self.applicationInfo(int(parts[1]))
+            if parts[0] == "assets" and len(parts) == 2:
+                return self.assetInfo(int(parts[1]))
+            if parts[0] == "blocks" and len(parts) == 2:
+                block = self.block(int(parts[1]))
+                if response_format == "msgpack":
+                    return msgpack.packb(block, use_bin_type=True)
+                return jsonify(block)
+
+        if method == "POST":
+            if parts == ["transactions"]:
+                return {"txId": self.submit(data or b"")}
+            if parts == ["teal", "compile"]:
+                try:
+                    program = compileFakeProgram((data or b"").decode())
+                except TealError as e:
+                    raise error.AlgodHTTPError(str(e), 400)
+                return {
+                    "hash": encodeAddress(checksum(b"Program" + program)),
+                    "result": b64encode(program).decode(),
+                }
+
+        raise error.AlgodHTTPError(
+            "{} {} is not supported by the fake network".format(method, requrl), 404
+        )
+
+    def handleKmdRequest(
+        self, method: str, requrl: str, data: Optional[Dict[str, Any]] = None
+    ) -> Any:
+        """Answer the kmd requests needed to read the genesis accounts."""
+        data = data or dict()
+
+        if requrl == "/versions":
+            return {"versions": ["v1"]}
+        if requrl == "/wallets":
+            return {"wallets": [{"id": "1", "name": KMD_WALLET_NAME, "driver_name": "sqlite"}]}
+        if requrl == "/wallet/init":
+            if data.get("wallet_id") != "1" or data.get("wallet_password") != KMD_WALLET_PASSWORD:
+                raise error.KMDHTTPError("wrong password")
+            return {"wallet_handle_token": "fake-handle"}
+        if requrl == "/wallet/release":
+            return {}
+        if requrl == "/key/list":
+            return {"addresses": [account.address_from_private_key(sk) for sk in self.wallet]}
+        if requrl == "/key/export":
+            for sk in self.wallet:
+                if account.address_from_private_key(sk) == data.get("address"):
+                    return {"private_key": sk}
+            raise error.KMDHTTPError("key does not exist in this wallet")
+
+        raise error.KMDHTTPError("{} {} is not supported by the fake network".format(method, requrl))
+
+
+def txnDigest(txn: Dict[str, Any]) -> bytes:
+    return checksum(b"TX" + msgpack.packb(txn, use_bin_type=True))
+
+
+def groupDigest(txns: List[Dict[str, Any]]) -> bytes:
+    digests = [txnDigest({k: v for k, v in txn.items() if k != "grp"}) for txn in txns]
+    return checksum(b"TG" + msgpack.packb({"txlist": digests}, use_bin_type=True))
+
+
+def txnFields(txn: Dict[str, Any], groupIndex: int) -> Dict[str, Any]:
+    """The transaction fields visible to TEAL."""
+    sender = txn["snd"]
+    appID = txn.get("apid", 0)
+    accounts = txn.get("apat", [])
+    foreignApps = txn.get("apfa", [])
+    globalSchema = txn.get("apgs", {})
+    localSchema = txn.get("apls", {})
+    return {
+        "Sender": sender,
+        "Fee": txn.get("fee", 0),
+        "FirstValid": txn.get("fv", 0),
+        "LastValid": txn.get("lv", 0),
+        "Note": txn.get("note", b""),
+        "Lease": txn.get("lx", ZERO_ADDRESS),
+        "Receiver": txn.get("rcv", ZERO_ADDRESS),
+        "Amount": txn.get("amt", 0),
+        "CloseRemainderTo": txn.get("close", ZERO_ADDRESS),
+        "Type": txn["type"].encode(),
+        "TypeEnum": NAMED_INTS[txn["type"]],
+        "XferAsset": txn.get("xaid", 0),
+        "AssetAmount": txn.get("aamt", 0),
+        "AssetSender": txn.get("asnd", ZERO_ADDRESS),
+        "AssetReceiver": txn.get("arcv", ZERO_ADDRESS),
+        "AssetCloseTo": txn.get("aclose", ZERO_ADDRESS),
+        "GroupIndex": groupIndex,
+        "TxID": txnDigest(txn),
+        "ApplicationID": appID,
+        "OnCompletion": txn.get("apan", 0),
+        "ApplicationArgs": txn.get("apaa", []),
+        "NumAppArgs": len(txn.get("apaa", [])),
+        "Accounts": [sender] + accounts,
+        "NumAccounts": len(accounts),
+        "Assets": txn.get("apas", []),
+        "NumAssets": len(txn.get("apas", [])),
+        "Applications": [appID] + foreignApps,
+        "NumApplications": len(foreignApps),
+        "ApprovalProgram": txn.get("apap", b""),
+        "ClearStateProgram": txn.get("apsu", b""),
+        "RekeyTo": txn.get("rekey", ZERO_ADDRESS),
+        "ConfigAsset": txn.get("caid", 0),
+        "GlobalNumUint": globalSchema.get("nui", 0),
+        "GlobalNumByteSlice": globalSchema.get("nbs", 0),
+        "LocalNumUint": localSchema.get("nui", 0),
+        "LocalNumByteSlice": localSchema.get("nbs", 0),
+        "ExtraProgramPages": txn.get("apep", 0),
+    }
+
+
+def stateDelta(
+    before: Dict[bytes, StackValue], after: Dict[bytes, StackValue]
+) -> List[Dict[str, Any]]:
+    delta = []
+    for key in sorted(set(before) | set(after)):
+        value = after.get(key)
+        if value == before.get(key):
+            continue
+        if value is None:
+            entry: Dict[str, Any] = {"action": 3}
+        elif isinstance(value, int):
+            entry = {"action": 2, "uint": value}
+        else:
+            entry = {"action": 1, "bytes": b64encode(value).decode()}
+        delta.append({"key": b64encode(key).decode(), "value": entry})
+    return delta
+
+
+def assetParams(asset: AssetRecord) -> Dict[str, Any]:
+    params = asset.params
+    result: Dict[str, Any] = {
+        "creator": encodeAddress(asset.creator),
+        "total": params.get("t", 0),
+        "decimals": params.get("dc", 0),
+        "default-frozen": params.get("df", False),
+    }
+    for key, name in (("un", "unit-name"), ("an", "name"), ("au", "url")):
+        if key in params:
+            result[name] = params[key]
+    if "am" in params:
+        result["metadata-hash"] = b64encode(params["am"]).decode()
+    for key, name in (("m", "manager"), ("r", "reserve"), ("f", "freeze"), ("c", "clawback")):
+        if key in params:
+            result[name] = encodeAddress(params[key])
+    return result
+
+
+def innerApplyData(applyData: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "inner-txns": [
+            dict(innerApplyData(innerData), txn={"txn": jsonify(innerTxn)})
+            for innerTxn, innerData in applyData.get("inner-txns", [])
+        ],
+        **{
+            key: value
+            for key, value in applyData.items()
+            if key not in ("inner-txns", "logs")
+        },
+        **(
+            {"logs": [b64encode(log).decode() for log in applyData["logs"]]}
+            if len(applyData.get("logs", [])) > 0
+            else {}
+        ),
+    }
+
+
+def pendingInfo(stxn: Dict[str, Any], applyData: Dict[str, Any]) -> Dict[str, Any]:
+    info = innerApplyData(applyData)
+    info["pool-error"] = ""
+    info["txn"] = jsonify(stxn)
+    if len(info["inner-txns"]) == 0:
+        del info["inner-txns"]
+    return info
+
+
+def blockTxn(stxn: Dict[str, Any], applyData: Dict[str, Any]) -> Dict[str, Any]:
+    entry = dict(stxn)
+    entry["hgi"] = True
+    if "application-index" in applyData:
+        entry["apid"] = applyData["application-index"]
+    if "asset-index" in applyData:
+        entry["caid"] = applyData["asset-index"]
+    if "closing-amount" in applyData:
+        entry["ca"] = applyData["closing-amount"]
+    if "asset-closing-amount" in applyData:
+        entry["aca"] = applyData["asset-closing-amount"]
+
+    delta: Dict[str, Any] = dict()
+    if len(applyData.get("global-state-delta", [])) > 0:
+        delta["gd"] = {
+            b64decode(pair["key"]): {
+                "at": pair["value"]["action"],
+                **({"bs": b64decode(pair["value"]["bytes"])} if "bytes" in pair["value"] else {}),
+                **({"ui": pair["value"]["uint"]} if "uint" in pair["value"] else {}),
+            }
+            for pair in applyData["global-state-delta"]
+        }
+    if len(applyData.get("inner-txns", [])) > 0:
+        delta["itx"] = [
+            blockTxn({"txn": innerTxn}, innerData)
+            for innerTxn, innerData in applyData["inner-txns"]
+        ]
+    if len(applyData.get("logs", [])) > 0:
+        delta["lg"] = applyData["logs"]
+    if len(delta) > 0:
+        entry["dt"] = delta
+    return entry
+
+
+class FakeAlgodClient(AlgodClient):
+    """An AlgodClient whose requests are answered by a FakeNetwork."""
+
+    def __init__(self, network: FakeNetwork) -> None:
+        super().__init__("", "fake://algod")
+        self.network = network
+
+    def algod_request(
+        self,
+        method: str,
+        requrl: str,
+        params: Optional[Dict[str, Any]] = None,
+        data: Optional[bytes] = None,
+        headers: Optional[Dict[str, str]] = None,
+        response_format: str = "json",
+    ) -> Any:
+        return self.network.handleAlgodRequest(method, requrl, params, data, response_format)
+
+
+class FakeAsyncAlgodClient(AsyncAlgodClient):
+    """An AsyncAlgodClient whose requests are answered by a FakeNetwork."""
+
+    def __init__(self, network: FakeNetwork) -> None:
+        super().__init__("", "fake://algod")
+        self.network = network
+
+    async def algod_request(
+        self,
+        method: str,
+        requrl: str,
+        params: Optional[Dict[str, Any]] = None,
+        data: Optional[bytes] = None,
+        headers: Optional[Dict[str, str]] = None,
+        response_format: str = "json",
+    ) -> Any:
+        if requrl.startswith("/status/wait-for-block-after/"):
+            # this may block until the next block, so keep it off the event loop
+            return await asyncio.get_running_loop().run_in_executor(
+                None,
+                self.network.handleAlgodRequest,
+                method,
+                requrl,
+                params,
+                data,
+                response_format,
+            )
+        return self.network.handleAlgodRequest(method, requrl, params, data, response_format)
+
+
+class FakeKMDClient(KMDClient):
+    """A KMDClient that serves the genesis wallet of a FakeNetwork."""
+
+    def __init__(self, network: FakeNetwork) -> None:
+        super().__init__("", "fake://kmd")
+        self.network = network
+
+    def kmd_request(
+        self,
+        method: str,
+        requrl: str,
+        params: Optional[Dict[str, Any]] = None,
+        data: Optional[Dict[str, Any]] = None,
+    ) -> Any:
+        return self.network.handleKmdRequest(method, requrl, data)
+
+
+defaultNetwork: Optional[FakeNetwork] = None
+
+
+def getFakeNetwork() -> FakeNetwork:
+    """Get the fake network shared by the test clients of this process."""
+    global defaultNetwork
+
+    if defaultNetwork is None:
+        defaultNetwork = FakeNetwork()
+
+    return defaultNetwork
+
+
+def isFakeClient(client: Union[AlgodClient, AsyncAlgodClient]) -> bool:
+    return isinstance(client, (FakeAlgodClient, FakeAsyncAlgodClient))
@@ -0,0 +1,195 @@
+import asyncio
+
+import pytest
+
+from algosdk import account
+from algosdk.error import AlgodHTTPError
+from algosdk.future import transaction
+from algosdk.logic import get_application_address
+
+from ..account import Account
+from ..aio.operations import createLoyaltyOfferApp as createLoyaltyOfferAppAsync
+from ..operations import (
+    createLoyaltyOfferApp,
+    setupLoyaltyOfferApp,
+    completeAction,
+    closeLoyaltyOffer,
+)
+from ..util import getBalances, getAppGlobalState, getLastBlockTimestamp, waitForTransaction
+from .fake import FakeNetwork, FakeAlgodClient, FakeAsyncAlgodClient, FakeKMDClient
+
+
+def fundedAccount(client, network, amount=10_000_000):
+    funder = Account(network.wallet[0])
+    new = Account(account.generate_account()[0])
+    txn = transaction.PaymentTxn(
+        funder.getAddress(), client.suggested_params(), new.getAddress(), amount
+    )
+    client.send_transaction(txn.sign(funder.getPrivateKey()))
+    return new
+
+
+def createAsset(client, creator, total):
+    txn = transaction.AssetCreateTxn(
+        sender=creator.getAddress(),
+        sp=client.suggested_params(),
+        total=total,
+        decimals=0,
+        default_frozen=False,
+        manager=creator.getAddress(),
+        unit_name="PTS",
+        asset_name="Points",
+    )
+    signedTxn = txn.sign(creator.getPrivateKey())
+    client.send_transaction(signedTxn)
+    return waitForTransaction(client, signedTxn.get_txid()).assetIndex
+
+
+def optIn(client, assetID, holder):
+    txn = transaction.AssetOptInTxn(holder.getAddress(), client.suggested_params(), assetID)
+    client.send_transaction(txn.sign(holder.getPrivateKey()))
+
+
+def test_offer_lifecycle():
+    network = FakeNetwork()
+    client = FakeAlgodClient(network)
+
+    creator = fundedAccount(client, network)
+    customer = fundedAccount(client, network)
+    tokenID = createAsset(client, creator, 1_000)
+    optIn(client, tokenID, customer)
+
+    startTime = network.now() + 60
+    endTime = startTime + 60
+
+    appID = createLoyaltyOfferApp(
+        client=client,
+        sender=creator,
+        customer=customer.getAddress(),
+        startTime=startTime,
+        endTime=endTime,
+        rewardAssetID=tokenID,
+        rewardAmount=100,
+        actionID=7,
+    )
+    assert getAppGlobalState(client, appID)[b"status"] == 1
+
+    setupLoyaltyOfferApp(client, appID, creator, tokenID, 100)
+    assert getBalances(client, get_application_address(appID)) == {0: 202_000, tokenID: 100}
+
+    # the offer has not started yet
+    with pytest.raises(AlgodHTTPError):
+        completeAction(client, creator, appID, 7)
+
+    network.advanceTo(startTime)
+    _, lastRoundTime = getLastBlockTimestamp(client)
+    assert lastRoundTime >= startTime
+
+    completeAction(client, creator, appID, 7)
+    assert getBalances(client, customer.getAddress())[tokenID] == 100
+    assert getAppGlobalState(client, appID)[b"status"] == 3
+
+    network.advanceTo(endTime)
+    closeLoyaltyOffer(client, appID, creator)
+
+    assert getBalances(client, get_application_address(appID)) == {0: 0}
+    with pytest.raises(AlgodHTTPError):
+        client.application_info(appID)
+
+
+def test_group_is_atomic():
+    network = FakeNetwork()
+    client = FakeAlgodClient(network)
+
+    sender = fundedAccount(client, network)
+    receiver = Account(account.generate_account()[0])
+
+    sp = client.suggested_params()
+    txns = transaction.assign_group_id(
+        [
+            transaction.PaymentTxn(sender.getAddress(), sp, receiver.getAddress(), 1_000_000),
+            # an opt in to an asset that does not exist fails the whole group
+            transaction.AssetOptInTxn(sender.getAddress(), sp, 999_999),
+        ]
+    )
+
+    with pytest.raises(AlgodHTTPError, match="does not exist"):
+        client.send_transactions([txn.sign(sender.getPrivateKey()) for txn in txns])
+
+    assert getBalances(client, sender.getAddress()) == {0: 10_000_000}
+    assert getBalances(client, receiver.getAddress()) == {0: 0}
+
+
+def test_checks_signatures_and_balances():
+    network = FakeNetwork()
+    client = FakeAlgodClient(network)
+
+    sender = fundedAccount(client, network)
+    other = Account(account.generate_account()[0])
+
+    txn = transaction.PaymentTxn(
+        sender.getAddress(), client.suggested_params(), other.getAddress(), 1_000_000
+    )
+    with pytest.raises(AlgodHTTPError, match="should have been authorized by"):
+        client.send_transaction(txn.sign(other.getPrivateKey()))
+
+    # sending everything but the fee leaves the sender below its minimum balance
+    txn = transaction.PaymentTxn(
+        sender.getAddress(), client.suggested_params(), other.getAddress(), 10_000_000 - 1_000
+    )
+    with pytest.raises(AlgodHTTPError, match="below min"):
+        client.send_transaction(txn.sign(sender.getPrivateKey()))
+
+    signedTxn = transaction.PaymentTxn(
+        sender.getAddress(), client.suggested_params(), other.getAddress(), 1_000_000
+    ).sign(sender.getPrivateKey())
+    client.send_transaction(signedTxn)
+    with pytest.raises(AlgodHTTPError, match="already in ledger"):
+        client.send_transaction(signedTxn)
+
+
+def test_block_clock():
+    network = FakeNetwork()
+    client = FakeAlgodClient(network)
+
+    lastRound = client.status()["last-round"]
+    _, before = getLastBlockTimestamp(client)
+
+    after = network.advanceTime(3_600)
+    assert after >= before + 3_600
+
+    status = client.status_after_block(lastRound + 1)
+    assert status["last-round"] > lastRound + 1
+
+    block = client.block_info(status["last-round"])
+    assert block["block"]["ts"] >= after
+
+
+def test_kmd_wallet():
+    network = FakeNetwork(genesisAccounts=2)
+    kmd = FakeKMDClient(network)
+
+    wallets = kmd.list_wallets()
+    handle = kmd.init_wallet_handle(wallets[0]["id"], "")
+    addresses = kmd.list_keys(handle)
+
+    assert len(addresses) == 2
+    assert [kmd.export_key(handle, "", address) for address in addresses] == network.wallet
+
+
+def test_async_client():
+    network = FakeNetwork()
+    client = FakeAlgodClient(network)
+    creator = fundedAccount(client, network)
+    tokenID = createAsset(client, creator, 1_000)
+    startTime = network.now() + 60
+
+    async def create():
+        asyncClient = FakeAsyncAlgodClient(network)
+        return await createLoyaltyOfferAppAsync(
+            asyncClient, creator, creator.getAddress(), startTime, startTime + 60, tokenID, 10, 1
+        )
+
+    appID = asyncio.run(create())
+
+    assert getAppGlobalState(client, appID)[b"reward_amount"] == 10
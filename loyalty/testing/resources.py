@@ -1,95 +1,293 @@
-from typing import List
+from typing import Dict, List, Optional, Sequence, Tuple
 from random import choice, randint
+import os
+import threading
 
 from algosdk.v2client.algod import AlgodClient
 from algosdk.future import transaction
 from algosdk import account
 
 from ..account import Account
-from ..util import PendingTxnResponse, waitForTransaction
+from ..clock import getTimestampOracle
+from ..holdings import getHoldingsCache
+from ..operations import MAX_GROUP_SIZE
+from ..params import SuggestedParamsProvider, getSuggestedParams
+from ..scheduler import getSubmissionScheduler, submitAndWait
+from ..signer import signTransactions
+from ..util import PendingTxnResponse
+from .fake import FakeAlgodClient
 from .setup import getGenesisAccounts
 
 
+def getCurrentTime(client: AlgodClient) -> int:
+    """Get the current time on the network's clock, which may run ahead of the
+    local clock on a fake network.
+    """
+    if isinstance(client, FakeAlgodClient):
+        return client.network.now()
+
+    return int(getTimestampOracle(client).estimateTime())
+
+
+def waitUntilTimestamp(client: AlgodClient, timestamp: int) -> None:
+    """Wait until the latest block timestamp is at least timestamp.
+    On a fake network the block clock is moved forward instead of waiting for rounds.
+    """
+    if isinstance(client, FakeAlgodClient):
+        client.network.advanceTo(timestamp)
+        return
+
+    getTimestampOracle(client).waitUntil(timestamp)
+
+
 def payAccount(
-    client: AlgodClient, sender: Account, to: str, amount: int
+    client: AlgodClient,
+    sender: Account,
+    to: str,
+    amount: int,
+    paramsProvider: Optional[SuggestedParamsProvider] = None,
 ) -> PendingTxnResponse:
     txn = transaction.PaymentTxn(
         sender=sender.getAddress(),
         receiver=to,
         amt=amount,
-        sp=client.suggested_params(),
+        sp=getSuggestedParams(client, paramsProvider),
     )
     signedTxn = txn.sign(sender.getPrivateKey())
 
-    client.send_transaction(signedTxn)
-    return waitForTransaction(client, signedTxn.get_txid())
+    return submitAndWait(client, [signedTxn])
 
 
 FUNDING_AMOUNT = 100_000_000
 
 
 def fundAccount(
-    client: AlgodClient, address: str, amount: int = FUNDING_AMOUNT
+    client: AlgodClient,
+    address: str,
+    amount: int = FUNDING_AMOUNT,
+    paramsProvider: Optional[SuggestedParamsProvider] = None,
 ) -> PendingTxnResponse:
     fundingAccount = choice(getGenesisAccounts())
-    return payAccount(client, fundingAccount, address, amount)
+    return payAccount(client, fundingAccount, address, amount, paramsProvider)
+
+
+# accounts are funded in full groups of this size
+POOL_GROUP_SIZE = MAX_GROUP_SIZE
+
+# the pool starts funding more accounts when fewer than this many are left
+POOL_LOW_WATER = 16
+
+# the number of accounts the pool keeps ready once it has started funding
+POOL_TARGET = 32
+
+
+class AccountPool:
+    """Hands out funded temporary accounts from a pool that is refilled in the background.
+
+    When fewer than lowWater accounts are ready, a background thread funds new
+    accounts in groups of POOL_GROUP_SIZE payments until target accounts are
+    ready. The payments of each group rotate across all funding accounts. get
+    only blocks when the pool is empty, and reserve waits until enough accounts
+    are ready up front, so load tests never wait for funding while they run.
+    """
+
+    def __init__(
+        self,
+        client: AlgodClient,
+        fundingAccounts: Sequence[Account],
+        amount: int = FUNDING_AMOUNT,
+        lowWater: int = POOL_LOW_WATER,
+        target: int = POOL_TARGET,
+        paramsProvider: Optional[SuggestedParamsProvider] = None,
+    ) -> None:
+        assert len(fundingAccounts) > 0
+        assert 0 <= lowWater <= target
+
+        self.client = client
+        self.fundingAccounts = list(fundingAccounts)
+        self.amount = amount
+        self.lowWater = lowWater
+        self.target = target
+        self.paramsProvider = paramsProvider
+
+        self.lock = threading.Lock()
+        self.ready = threading.Condition(self.lock)
+        self.accounts: List[Account] = []
+        self.thread: Optional[threading.Thread] = None
+        self.error: Optional[Exception] = None
+        self.nextFunder = 0
+
+    def get(self) -> Account:
+        """Take a funded account from the pool, waiting only if it is empty."""
+        with self.lock:
+            while len(self.accounts) == 0:
+                self.refill(self.target)
+                self.raiseError()
+                self.ready.wait()
 
+            account = self.accounts.pop()
+            if len(self.accounts) < self.lowWater:
+                self.refill(self.target)
+            return account
 
-accountList: List[Account] = []
+    def reserve(self, count: int) -> None:
+        """Wait until at least count accounts are ready to be taken."""
+        with self.lock:
+            while len(self.accounts) < count:
+                self.refill(count)
+                self.raiseError()
+                self.ready.wait()
 
+    def raiseError(self) -> None:
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
 
-def getTemporaryAccount(client: AlgodClient) -> Account:
-    global accountList
+    def refill(self, target: int) -> None:
+        """Start funding accounts in the background, unless already funding.
+        Must be called with the lock held.
+        """
+        self.target = max(self.target, target)
+        if self.thread is None and self.error is None:
+            self.thread = threading.Thread(
+                target=self.run, name="loyalty-account-pool", daemon=True
+            )
+            self.thread.start()
+
+    def run(self) -> None:
+        while True:
+            with self.lock:
+                if len(self.accounts) >= self.target:
+                    self.thread = None
+                    return
+
+            try:
+                accounts = self.fundGroup()
+            except Exception as e:
+                with self.lock:
+                    self.error = e
+                    self.thread = None
+                    self.ready.notify_all()
+                return
 
-    if len(accountList) == 0:
-        sks = [account.generate_account()[0] for i in range(16)]
-        accountList = [Account(sk) for sk in sks]
+            with self.lock:
+                self.accounts.extend(accounts)
+                self.ready.notify_all()
 
-        genesisAccounts = getGenesisAccounts()
-        suggestedParams = client.suggested_params()
+    def fundGroup(self) -> List[Account]:
+        accounts = [Account(account.generate_account()[0]) for _ in range(POOL_GROUP_SIZE)]
+
+        funders = [
+            self.fundingAccounts[(self.nextFunder + i) % len(self.fundingAccounts)]
+            for i in range(len(accounts))
+        ]
+        self.nextFunder = (self.nextFunder + len(accounts)) % len(self.fundingAccounts)
 
-        txns: List[transaction.Transaction] = []
-        for i, a in enumerate(accountList):
-            fundingAccount = genesisAccounts[i % len(genesisAccounts)]
-            txns.append(
+        suggestedParams = getSuggestedParams(self.client, self.paramsProvider)
+        txns = transaction.assign_group_id(
+            [
                 transaction.PaymentTxn(
-                    sender=fundingAccount.getAddress(),
+                    sender=funder.getAddress(),
                     receiver=a.getAddress(),
-                    amt=FUNDING_AMOUNT,
+                    amt=self.amount,
                     sp=suggestedParams,
                 )
-            )
+                for funder, a in zip(funders, accounts)
+            ]
+        )
+        signedTxns = signTransactions(txns, funders)
+
+        submitAndWait(self.client, signedTxns)
+
+        return accounts
 
-        txns = transaction.assign_group_id(txns)
-        signedTxns = [
-            txn.sign(genesisAccounts[i % len(genesisAccounts)].getPrivateKey())
-            for i, txn in enumerate(txns)
-        ]
 
-        client.send_transactions(signedTxns)
+# (process ID, algod address, fake network ID) -> pool
+accountPools: Dict[Tuple[int, str, int], AccountPool] = dict()
+accountPoolsLock = threading.Lock()
 
-        waitForTransaction(client, signedTxns[0].get_txid())
 
-    return accountList.pop()
+def getAccountPool(
+    client: AlgodClient, paramsProvider: Optional[SuggestedParamsProvider] = None
+) -> AccountPool:
+    """Get the temporary account pool of the network a client talks to.
+    Tests create a client each, so the clients of one network share a pool,
+    which is funded by the genesis accounts of that network. A forked process
+    gets new pools, so processes never hand out the same account.
+    """
+    network = client.network if isinstance(client, FakeAlgodClient) else None
+    key = (os.getpid(), client.algod_address, id(network))
+
+    with accountPoolsLock:
+        pool = accountPools.get(key)
+        if pool is None:
+            if network is not None:
+                fundingAccounts = [Account(sk) for sk in network.wallet]
+            else:
+                fundingAccounts = getGenesisAccounts()
+            pool = AccountPool(client, fundingAccounts, paramsProvider=paramsProvider)
+            accountPools[key] = pool
+        return pool
+
+
+def getTemporaryAccount(
+    client: AlgodClient, paramsProvider: Optional[SuggestedParamsProvider] = None
+) -> Account:
+    return getAccountPool(client, paramsProvider).get()
 
 
 def optInToAsset(
-    client: AlgodClient, assetID: int, account: Account
+    client: AlgodClient,
+    assetID: int,
+    account: Account,
+    paramsProvider: Optional[SuggestedParamsProvider] = None,
 ) -> PendingTxnResponse:
     txn = transaction.AssetOptInTxn(
         sender=account.getAddress(),
         index=assetID,
-        sp=client.suggested_params(),
+        sp=getSuggestedParams(client, paramsProvider),
     )
     signedTxn = txn.sign(account.getPrivateKey())
 
-    client.send_transaction(signedTxn)
-    return waitForTransaction(client, signedTxn.get_txid())
+    response = submitAndWait(client, [signedTxn])
+    getHoldingsCache(client).invalidate([account.getAddress()])
+    return response
+
 
+def optInAccountsToAsset(
+    client: AlgodClient,
+    assetID: int,
+    accounts: Sequence[Account],
+    paramsProvider: Optional[SuggestedParamsProvider] = None,
+) -> None:
+    """Opt many accounts in to an asset, with all of their transactions in flight at once."""
+    suggestedParams = getSuggestedParams(client, paramsProvider)
+    scheduler = getSubmissionScheduler(client)
 
-def createDummyAsset(client: AlgodClient, total: int, account: Account = None) -> int:
+    submissions = []
+    for optInAccount in accounts:
+        txn = transaction.AssetOptInTxn(
+            sender=optInAccount.getAddress(), index=assetID, sp=suggestedParams
+        )
+        submissions.append(scheduler.submit([txn.sign(optInAccount.getPrivateKey())]))
+
+    try:
+        for submission in submissions:
+            submission.result()
+    finally:
+        getHoldingsCache(client).invalidate(
+            optInAccount.getAddress() for optInAccount in accounts
+        )
+
+
+def createDummyAsset(
+    client: AlgodClient,
+    total: int,
+    account: Account = None,
+    paramsProvider: Optional[SuggestedParamsProvider] = None,
+) -> int:
     if account is None:
-        account = getTemporaryAccount(client)
+        account = getTemporaryAccount(client, paramsProvider)
 
     randomNumber = randint(0, 999)
     # this random note reduces the likelihood of this transaction looking like a duplicate
@@ -108,12 +306,10 @@ def createDummyAsset(client: AlgodClient, total: int, account: Account = None) -
         asset_name=f"Dummy {randomNumber}",
         url=f"https://dummy.asset/{randomNumber}",
         note=randomNote,
-        sp=client.suggested_params(),
+        sp=getSuggestedParams(client, paramsProvider),
     )
     signedTxn = txn.sign(account.getPrivateKey())
 
-    client.send_transaction(signedTxn)
-
-    response = waitForTransaction(client, signedTxn.get_txid())
+    response = submitAndWait(client, [signedTxn])
     assert response.assetIndex is not None and response.assetIndex > 0
-    return response.assetIndex
\ No newline at end of file
+    return response.assetIndex
@@ -0,0 +1,47 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from ..account import Account
+from ..util import getBalances
+from .fake import FakeNetwork, FakeAlgodClient
+from .resources import AccountPool, POOL_GROUP_SIZE, getAccountPool, getTemporaryAccount
+
+
+def test_account_pool_is_shared_by_threads():
+    network = FakeNetwork()
+    client = FakeAlgodClient(network)
+    funders = [Account(sk) for sk in network.wallet]
+    pool = AccountPool(client, funders, amount=1_000_000, lowWater=8, target=16)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        batches = list(executor.map(lambda _: [pool.get() for _ in range(10)], range(8)))
+
+    addresses = [a.getAddress() for batch in batches for a in batch]
+    assert len(set(addresses)) == 80
+    assert all(getBalances(client, address) == {0: 1_000_000} for address in addresses)
+
+
+def test_account_pool_reserve():
+    network = FakeNetwork()
+    client = FakeAlgodClient(network)
+    funders = [Account(sk) for sk in network.wallet]
+    pool = AccountPool(client, funders, amount=1_000_000, lowWater=0, target=0)
+
+    pool.reserve(20)
+
+    # accounts are funded in full groups
+    assert len(pool.accounts) == 2 * POOL_GROUP_SIZE
+    assert pool.get().getAddress() not in {a.getAddress() for a in pool.accounts}
+
+
+def test_account_pool_per_network():
+    network = FakeNetwork()
+    client = FakeAlgodClient(network)
+    pool = getAccountPool(client)
+
+    # a client of the same network shares its pool, a client of another network doesn't
+    assert getAccountPool(FakeAlgodClient(network)) is pool
+    other = FakeAlgodClient(FakeNetwork())
+    assert getAccountPool(other) is not pool
+
+    assert getBalances(client, getTemporaryAccount(client).getAddress())[0] > 0
+    assert getBalances(other, getTemporaryAccount(other).getAddress())[0] > 0
@@ -1,16 +1,72 @@
 from typing import Optional, List
+import os
+import urllib.request
 
 from algosdk.v2client.algod import AlgodClient
 from algosdk.kmd import KMDClient
 
 from ..account import Account
+from ..aio.algod import AsyncAlgodClient
+from ..transport import createAlgodClient
 
 ALGOD_ADDRESS = "http://localhost:4001"
 ALGOD_TOKEN = "aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa"
 
+# a comma separated list of algod nodes to spread requests over, instead of ALGOD_ADDRESS
+ADDRESSES_ENV_VAR = "ALGOD_ADDRESSES"
+
+# set to "fake" to run against the in-process network in loyalty.testing.fake, or
+# to "sandbox"; if it isn't set, the sandbox is used when it answers
+BACKEND_ENV_VAR = "LOYALTY_ALGOD_BACKEND"
+
+# seconds to wait for the sandbox to answer before falling back to the fake network
+SANDBOX_PROBE_TIMEOUT = 1.0
+
+sandboxRunning: Optional[bool] = None
+
+
+def isSandboxRunning() -> bool:
+    """Tell whether an algod answers at the sandbox address. Only asked once."""
+    global sandboxRunning
+
+    if sandboxRunning is None:
+        try:
+            with urllib.request.urlopen(
+                ALGOD_ADDRESS + "/health", timeout=SANDBOX_PROBE_TIMEOUT
+            ):
+                sandboxRunning = True
+        except OSError:
+            sandboxRunning = False
+
+    return sandboxRunning
+
+
+def usingFakeBackend() -> bool:
+    backend = os.environ.get(BACKEND_ENV_VAR)
+    if backend:
+        return backend == "fake"
+    if os.environ.get(ADDRESSES_ENV_VAR):
+        # nodes were configured explicitly
+        return False
+    return not isSandboxRunning()
+
 
 def getAlgodClient() -> AlgodClient:
-    return AlgodClient(ALGOD_TOKEN, ALGOD_ADDRESS)
+    if usingFakeBackend():
+        from .fake import FakeAlgodClient, getFakeNetwork
+
+        return FakeAlgodClient(getFakeNetwork())
+
+    return createAlgodClient(os.environ.get(ADDRESSES_ENV_VAR, ALGOD_ADDRESS), ALGOD_TOKEN)
+
+
+def getAsyncAlgodClient() -> AsyncAlgodClient:
+    if usingFakeBackend():
+        from .fake import FakeAsyncAlgodClient, getFakeNetwork
+
+        return FakeAsyncAlgodClient(getFakeNetwork())
+
+    return AsyncAlgodClient(ALGOD_TOKEN, ALGOD_ADDRESS)
 
 
 KMD_ADDRESS = "http://localhost:4002"
@@ -18,6 +74,11 @@ KMD_TOKEN = "aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa"
 
 
 def getKmdClient() -> KMDClient:
+    if usingFakeBackend():
+        from .fake import FakeKMDClient, getFakeNetwork
+
+        return FakeKMDClient(getFakeNetwork())
+
     return KMDClient(KMD_TOKEN, KMD_ADDRESS)
 
 
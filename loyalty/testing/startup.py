@@ -0,0 +1,113 @@
+"""Cold start benchmark for importing loyalty modules.
+
+Each run imports the given modules in a new interpreter with -X importtime,
+like a CLI or a serverless handler would on a cold start, and reports the
+wall time of the import, the modules that took longest, and whether PyTeal
+was imported:
+
+    python -m loyalty.testing.startup --runs 10 loyalty.operations loyalty.contracts
+
+loyalty.operations should not import PyTeal; loyalty.contracts does, so it
+shows what the prebuilt artifacts save.
+"""
+from typing import Any, Dict, List, Optional, Sequence
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# the code run by each interpreter; prints the import wall time and whether
+# PyTeal was imported, so the benchmark doesn't count interpreter startup
+PROBE = """
+import sys, time
+start = time.perf_counter()
+for name in sys.argv[1:]:
+    __import__(name)
+elapsed = time.perf_counter() - start
+print(elapsed, any(m == "pyteal" or m.startswith("pyteal.") for m in sys.modules))
+"""
+
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def parseImportTimes(stderr: str) -> Dict[str, int]:
+    """Parse -X importtime output into the cumulative microseconds of each module."""
+    cumulative: Dict[str, int] = dict()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:") :].split("|")
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        cumulative[fields[2].strip()] = int(fields[1])
+    return cumulative
+
+
+def measureImport(modules: Sequence[str]) -> Dict[str, Any]:
+    """Import modules in a new interpreter and time it."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE, *modules],
+        cwd=PACKAGE_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    elapsed, importedPyteal = result.stdout.split()
+    return {
+        "seconds": float(elapsed),
+        "pyteal": importedPyteal == "True",
+        "modules": parseImportTimes(result.stderr),
+    }
+
+
+def runStartupBenchmark(modules: Sequence[str], runs: int = 5, top: int = 10) -> Dict[str, Any]:
+    """Measure the cold import of modules over several runs.
+    Args:
+        modules: The modules to import, in order.
+        runs: The number of interpreters to start.
+        top: The number of slowest modules to report.
+    Returns:
+        A JSON serializable report with the median, min and max import time in
+        milliseconds, whether PyTeal was imported, and the slowest modules of
+        the median run by cumulative import time.
+    """
+    if runs <= 0:
+        raise Exception("Runs must be positive")
+
+    measurements = [measureImport(modules) for _ in range(runs)]
+    measurements.sort(key=lambda m: m["seconds"])
+    median = measurements[len(measurements) // 2]
+    slowest = sorted(median["modules"].items(), key=lambda item: item[1], reverse=True)
+
+    return {
+        "modules": list(modules),
+        "runs": runs,
+        "median_ms": statistics.median(m["seconds"] for m in measurements) * 1000,
+        "min_ms": measurements[0]["seconds"] * 1000,
+        "max_ms": measurements[-1]["seconds"] * 1000,
+        "pyteal": any(m["pyteal"] for m in measurements),
+        "slowest_ms": {name: micros / 1000 for name, micros in slowest[:top]},
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark cold imports of loyalty modules.")
+    parser.add_argument("modules", nargs="*", default=["loyalty.operations"])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="slowest modules to report")
+    parser.add_argument("--output", help="also write the report to this file")
+    args = parser.parse_args(argv)
+
+    # each module is measured on its own, so they can be compared
+    reports = [runStartupBenchmark([module], args.runs, args.top) for module in args.modules]
+    output = json.dumps(reports, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
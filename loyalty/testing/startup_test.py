@@ -0,0 +1,21 @@
+from .startup import parseImportTimes, runStartupBenchmark
+
+
+def test_parseImportTimes():
+    stderr = "\n".join(
+        [
+            "import time: self [us] | cumulative | imported package",
+            "import time:       120 |        120 |   loyalty.account",
+            "import time:       300 |        420 | loyalty.operations",
+        ]
+    )
+    assert parseImportTimes(stderr) == {"loyalty.account": 120, "loyalty.operations": 420}
+
+
+def test_operations_skip_pyteal():
+    report = runStartupBenchmark(["loyalty.operations"], runs=1)
+    assert report["pyteal"] is False
+    assert "loyalty.operations" in report["slowest_ms"]
+
+    report = runStartupBenchmark(["loyalty.contracts"], runs=1)
+    assert report["pyteal"] is True
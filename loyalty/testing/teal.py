@@ -0,0 +1,716 @@
+"""A small TEAL interpreter used by the in-process algod stand-in.
+
+It parses TEAL source as generated by PyTeal and evaluates it against an
+EvalContext supplied by the fake ledger. Only the opcodes and fields that the
+contracts in this package need (and their close relatives) are supported;
+anything else fails loudly with a TealError instead of being silently wrong.
+"""
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+from base64 import b64decode, b32decode
+import hashlib
+
+from algosdk import encoding
+
+StackValue = Union[int, bytes]
+
+MAX_UINT64 = 2 ** 64 - 1
+
+# opcode budget of a single application call
+APP_CALL_BUDGET = 700
+
+NAMED_INTS = {
+    # OnComplete
+    "NoOp": 0,
+    "OptIn": 1,
+    "CloseOut": 2,
+    "ClearState": 3,
+    "UpdateApplication": 4,
+    "DeleteApplication": 5,
+    # TypeEnum
+    "unknown": 0,
+    "pay": 1,
+    "keyreg": 2,
+    "acfg": 3,
+    "axfer": 4,
+    "afrz": 5,
+    "appl": 6,
+}
+
+
+class TealError(Exception):
+    pass
+
+
+class EvalContext:
+    """The ledger view a program runs against. Implemented by the fake ledger."""
+
+    # fields of the current transaction, by TEAL field name
+    txn: Dict[str, Any]
+    globals: Dict[str, Any]
+    appID: int
+    # the transactions of the group, as field dicts
+    group: List[Dict[str, Any]]
+    logs: List[bytes]
+
+    def globalGet(self, appID: int, key: bytes) -> Optional[StackValue]:
+        raise NotImplementedError
+
+    def globalPut(self, key: bytes, value: StackValue) -> None:
+        raise NotImplementedError
+
+    def globalDel(self, key: bytes) -> None:
+        raise NotImplementedError
+
+    def resolveAccount(self, ref: StackValue) -> bytes:
+        raise NotImplementedError
+
+    def balance(self, account: bytes) -> int:
+        raise NotImplementedError
+
+    def minBalance(self, account: bytes) -> int:
+        raise NotImplementedError
+
+    def assetHolding(self, account: bytes, assetRef: int) -> Optional[int]:
+        raise NotImplementedError
+
+    def submitInner(self, fields: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+
+class Program:
+    """A parsed TEAL program."""
+
+    def __init__(self, source: str) -> None:
+        self.source = source
+        self.version = 1
+        self.ops: List[Tuple[Callable[..., Optional[int]], Tuple[Any, ...], str]] = []
+        self.labels: Dict[str, int] = dict()
+
+        pendingBranches: List[Tuple[int, str]] = []
+
+        for lineNumber, line in enumerate(source.splitlines(), start=1):
+            tokens = tokenize(line)
+            if len(tokens) == 0:
+                continue
+
+            if tokens[0] == "#pragma":
+                if len(tokens) == 3 and tokens[1] == "version":
+                    self.version = int(tokens[2])
+                    continue
+                raise TealError("line {}: unknown pragma {}".format(lineNumber, line))
+
+            if tokens[0].endswith(":") and len(tokens) == 1:
+                self.labels[tokens[0][:-1]] = len(self.ops)
+                continue
+
+            name, args = tokens[0], tokens[1:]
+            spec = OPS.get(name)
+            if spec is None:
+                raise TealError("line {}: unsupported opcode {}".format(lineNumber, name))
+
+            fn, parse = spec
+            try:
+                immediates = parse(args)
+            except (ValueError, KeyError, IndexError) as e:
+                raise TealError("line {}: bad arguments for {}: {}".format(lineNumber, name, e))
+
+            if name in ("b", "bz", "bnz", "callsub"):
+                pendingBranches.append((len(self.ops), immediates[0]))
+
+            self.ops.append((fn, immediates, name))
+
+        for index, label in pendingBranches:
+            if label not in self.labels:
+                raise TealError("reference to undefined label {}".format(label))
+            fn, _, name = self.ops[index]
+            self.ops[index] = (fn, (self.labels[label],), name)
+
+
+def tokenize(line: str) -> List[str]:
+    tokens: List[str] = []
+    i = 0
+    while i < len(line):
+        c = line[i]
+        if c.isspace():
+            i += 1
+        elif line.startswith("//", i):
+            break
+        elif c == '"':
+            j = i + 1
+            while j < len(line) and line[j] != '"':
+                j += 2 if line[j] == "\\" else 1
+            tokens.append(line[i : j + 1])
+            i = j + 1
+        else:
+            j = i
+            while j < len(line) and not line[j].isspace():
+                j += 1
+            tokens.append(line[i:j])
+            i = j
+    return tokens
+
+
+def parseInt(token: str) -> int:
+    if token in NAMED_INTS:
+        return NAMED_INTS[token]
+    return int(token, 0)
+
+
+def parseBytes(args: List[str]) -> bytes:
+    if len(args) == 1:
+        token = args[0]
+        if token.startswith('"'):
+            return token[1:-1].encode("latin-1").decode("unicode_escape").encode("latin-1")
+        if token.startswith("0x"):
+            return bytes.fromhex(token[2:])
+        for prefix in ("base64(", "b64("):
+            if token.startswith(prefix):
+                return b64decode(token[len(prefix) : -1])
+        for prefix in ("base32(", "b32("):
+            if token.startswith(prefix):
+                return decodeBase32(token[len(prefix) : -1])
+    if len(args) == 2:
+        if args[0] in ("base64", "b64"):
+            return b64decode(args[1])
+        if args[0] in ("base32", "b32"):
+            return decodeBase32(args[1])
+    raise ValueError("cannot parse byte constant {}".format(" ".join(args)))
+
+
+def decodeBase32(value: str) -> bytes:
+    return b32decode(value + "=" * (-len(value) % 8))
+
+
+class Evaluation:
+    """The machine state of one program run."""
+
+    def __init__(self, program: Program, ctx: EvalContext, budget: List[int]) -> None:
+        self.program = program
+        self.ctx = ctx
+        # shared with the other app calls of the group
+        self.budget = budget
+        self.stack: List[StackValue] = []
+        self.scratch: List[StackValue] = [0] * 256
+        self.callStack: List[int] = []
+        self.inner: Optional[Dict[str, Any]] = None
+        self.pc = 0
+
+    def pop(self) -> StackValue:
+        if len(self.stack) == 0:
+            raise TealError("stack underflow")
+        return self.stack.pop()
+
+    def popInt(self) -> int:
+        value = self.pop()
+        if not isinstance(value, int):
+            raise TealError("expected uint64, got bytes")
+        return value
+
+    def popBytes(self) -> bytes:
+        value = self.pop()
+        if not isinstance(value, bytes):
+            raise TealError("expected bytes, got uint64")
+        return value
+
+    def push(self, value: StackValue) -> None:
+        if isinstance(value, bool):
+            value = int(value)
+        if isinstance(value, int) and not 0 <= value <= MAX_UINT64:
+            raise TealError("uint64 overflow")
+        if isinstance(value, bytes) and len(value) > 4096:
+            raise TealError("byte array too long")
+        self.stack.append(value)
+
+    def run(self) -> bool:
+        ops = self.program.ops
+        pc = 0
+        while True:
+            if pc >= len(ops):
+                break
+
+            self.budget[0] -= 1
+            if self.budget[0] < 0:
+                raise TealError("dynamic cost budget exceeded")
+
+            fn, immediates, name = ops[pc]
+            self.pc = pc
+            try:
+                nextPC = fn(self, *immediates)
+            except Return as r:
+                return r.approved
+            pc = pc + 1 if nextPC is None else nextPC
+
+        if len(self.stack) != 1:
+            raise TealError("stack must have exactly one value at the end of the program")
+        result = self.stack[0]
+        if not isinstance(result, int):
+            raise TealError("program returned bytes")
+        return result != 0
+
+
+class Return(Exception):
+    def __init__(self, approved: bool) -> None:
+        self.approved = approved
+
+
+def txnField(ctx: EvalContext, txn: Dict[str, Any], field: str, index: Optional[int] = None) -> StackValue:
+    if field not in txn:
+        raise TealError("unsupported txn field {}".format(field))
+    value = txn[field]
+    if index is not None:
+        if not isinstance(value, list):
+            raise TealError("txn field {} is not an array".format(field))
+        if index >= len(value):
+            raise TealError("invalid {} index {}".format(field, index))
+        value = value[index]
+    elif isinstance(value, list):
+        raise TealError("txn field {} is an array".format(field))
+    return value
+
+
+# opcode implementations; each returns the next pc or None to continue
+
+
+def op_int(e: Evaluation, value: int) -> None:
+    e.push(value)
+
+
+def op_byte(e: Evaluation, value: bytes) -> None:
+    e.push(value)
+
+
+def op_txn(e: Evaluation, field: str) -> None:
+    e.push(txnField(e.ctx, e.ctx.txn, field))
+
+
+def op_txna(e: Evaluation, field: str, index: int) -> None:
+    e.push(txnField(e.ctx, e.ctx.txn, field, index))
+
+
+def op_txnas(e: Evaluation, field: str) -> None:
+    e.push(txnField(e.ctx, e.ctx.txn, field, e.popInt()))
+
+
+def op_gtxn(e: Evaluation, groupIndex: int, field: str) -> None:
+    if groupIndex >= len(e.ctx.group):
+        raise TealError("gtxn index out of range")
+    e.push(txnField(e.ctx, e.ctx.group[groupIndex], field))
+
+
+def op_gtxns(e: Evaluation, field: str) -> None:
+    groupIndex = e.popInt()
+    if groupIndex >= len(e.ctx.group):
+        raise TealError("gtxns index out of range")
+    e.push(txnField(e.ctx, e.ctx.group[groupIndex], field))
+
+
+def op_global(e: Evaluation, field: str) -> None:
+    if field not in e.ctx.globals:
+        raise TealError("unsupported global field {}".format(field))
+    e.push(e.ctx.globals[field])
+
+
+def binaryInt(fn: Callable[[int, int], int]) -> Callable[[Evaluation], None]:
+    def op(e: Evaluation) -> None:
+        b = e.popInt()
+        a = e.popInt()
+        e.push(fn(a, b))
+
+    return op
+
+
+def divide(a: int, b: int) -> int:
+    if b == 0:
+        raise TealError("division by zero")
+    return a // b
+
+
+def modulo(a: int, b: int) -> int:
+    if b == 0:
+        raise TealError("modulo by zero")
+    return a % b
+
+
+def op_eq(e: Evaluation) -> None:
+    b = e.pop()
+    a = e.pop()
+    if type(a) is not type(b):
+        raise TealError("cannot compare uint64 to bytes")
+    e.push(a == b)
+
+
+def op_neq(e: Evaluation) -> None:
+    b = e.pop()
+    a = e.pop()
+    if type(a) is not type(b):
+        raise TealError("cannot compare uint64 to bytes")
+    e.push(a != b)
+
+
+def op_not(e: Evaluation) -> None:
+    e.push(e.popInt() == 0)
+
+
+def op_bitnot(e: Evaluation) -> None:
+    e.push(MAX_UINT64 ^ e.popInt())
+
+
+def op_len(e: Evaluation) -> None:
+    e.push(len(e.popBytes()))
+
+
+def op_itob(e: Evaluation) -> None:
+    e.push(e.popInt().to_bytes(8, "big"))
+
+
+def op_btoi(e: Evaluation) -> None:
+    value = e.popBytes()
+    if len(value) > 8:
+        raise TealError("btoi arg too long")
+    e.push(int.from_bytes(value, "big"))
+
+
+def op_concat(e: Evaluation) -> None:
+    b = e.popBytes()
+    a = e.popBytes()
+    e.push(a + b)
+
+
+def substring(value: bytes, start: int, end: int) -> bytes:
+    if end < start or end > len(value):
+        raise TealError("substring range {}-{} out of bounds".format(start, end))
+    return value[start:end]
+
+
+def op_substring(e: Evaluation, start: int, end: int) -> None:
+    e.push(substring(e.popBytes(), start, end))
+
+
+def op_substring3(e: Evaluation) -> None:
+    end = e.popInt()
+    start = e.popInt()
+    e.push(substring(e.popBytes(), start, end))
+
+
+def op_extract(e: Evaluation, start: int, length: int) -> None:
+    value = e.popBytes()
+    if length == 0:
+        length = len(value) - start
+    e.push(substring(value, start, start + length))
+
+
+def op_extract3(e: Evaluation) -> None:
+    length = e.popInt()
+    start = e.popInt()
+    e.push(substring(e.popBytes(), start, start + length))
+
+
+def extractUint(size: int) -> Callable[[Evaluation], None]:
+    def op(e: Evaluation) -> None:
+        start = e.popInt()
+        e.push(int.from_bytes(substring(e.popBytes(), start, start + size), "big"))
+
+    return op
+
+
+def op_getbyte(e: Evaluation) -> None:
+    index = e.popInt()
+    value = e.popBytes()
+    if index >= len(value):
+        raise TealError("getbyte index out of bounds")
+    e.push(value[index])
+
+
+def op_sha256(e: Evaluation) -> None:
+    e.push(hashlib.sha256(e.popBytes()).digest())
+
+
+def op_sha512_256(e: Evaluation) -> None:
+    e.push(hashlib.new("sha512_256", e.popBytes()).digest())
+
+
+def op_pop(e: Evaluation) -> None:
+    e.pop()
+
+
+def op_dup(e: Evaluation) -> None:
+    value = e.pop()
+    e.push(value)
+    e.push(value)
+
+
+def op_dup2(e: Evaluation) -> None:
+    b = e.pop()
+    a = e.pop()
+    for value in (a, b, a, b):
+        e.push(value)
+
+
+def op_swap(e: Evaluation) -> None:
+    b = e.pop()
+    a = e.pop()
+    e.push(b)
+    e.push(a)
+
+
+def op_select(e: Evaluation) -> None:
+    condition = e.popInt()
+    b = e.pop()
+    a = e.pop()
+    e.push(b if condition != 0 else a)
+
+
+def op_store(e: Evaluation, slot: int) -> None:
+    e.scratch[slot] = e.pop()
+
+
+def op_load(e: Evaluation, slot: int) -> None:
+    e.push(e.scratch[slot])
+
+
+def op_b(e: Evaluation, target: int) -> int:
+    return target
+
+
+def op_bz(e: Evaluation, target: int) -> Optional[int]:
+    return target if e.popInt() == 0 else None
+
+
+def op_bnz(e: Evaluation, target: int) -> Optional[int]:
+    return target if e.popInt() != 0 else None
+
+
+def op_callsub(e: Evaluation, target: int) -> int:
+    if len(e.callStack) >= 1024:
+        raise TealError("callsub stack overflow")
+    e.callStack.append(e.pc + 1)
+    return target
+
+
+def op_retsub(e: Evaluation) -> int:
+    if len(e.callStack) == 0:
+        raise TealError("retsub with empty callstack")
+    return e.callStack.pop()
+
+
+def op_return(e: Evaluation) -> None:
+    raise Return(e.popInt() != 0)
+
+
+def op_err(e: Evaluation) -> None:
+    raise TealError("err opcode executed")
+
+
+def op_assert(e: Evaluation) -> None:
+    if e.popInt() == 0:
+        raise TealError("assert failed")
+
+
+def op_app_global_get(e: Evaluation) -> None:
+    value = e.ctx.globalGet(e.ctx.appID, e.popBytes())
+    e.push(0 if value is None else value)
+
+
+def op_app_global_get_ex(e: Evaluation) -> None:
+    key = e.popBytes()
+    appRef = e.popInt()
+    if appRef == 0:
+        appID = e.ctx.appID
+    elif appRef <= len(e.ctx.txn["Applications"]) - 1:
+        appID = e.ctx.txn["Applications"][appRef]
+    else:
+        appID = appRef
+    value = e.ctx.globalGet(appID, key)
+    e.push(0 if value is None else value)
+    e.push(value is not None)
+
+
+def op_app_global_put(e: Evaluation) -> None:
+    value = e.pop()
+    key = e.popBytes()
+    e.ctx.globalPut(key, value)
+
+
+def op_app_global_del(e: Evaluation) -> None:
+    e.ctx.globalDel(e.popBytes())
+
+
+def op_balance(e: Evaluation) -> None:
+    e.push(e.ctx.balance(e.ctx.resolveAccount(e.pop())))
+
+
+def op_min_balance(e: Evaluation) -> None:
+    e.push(e.ctx.minBalance(e.ctx.resolveAccount(e.pop())))
+
+
+def op_asset_holding_get(e: Evaluation, field: str) -> None:
+    assetRef = e.popInt()
+    account = e.ctx.resolveAccount(e.pop())
+    amount = e.ctx.assetHolding(account, assetRef)
+    if field == "AssetBalance":
+        e.push(0 if amount is None else amount)
+    elif field == "AssetFrozen":
+        e.push(0)
+    else:
+        raise TealError("unsupported asset_holding_get field {}".format(field))
+    e.push(amount is not None)
+
+
+def op_itxn_begin(e: Evaluation) -> None:
+    if e.inner is not None:
+        raise TealError("itxn_begin without itxn_submit")
+    e.inner = dict()
+
+
+def op_itxn_field(e: Evaluation, field: str) -> None:
+    if e.inner is None:
+        raise TealError("itxn_field without itxn_begin")
+    value = e.pop()
+    if field in ("TypeEnum", "Amount", "Fee", "XferAsset", "AssetAmount", "ConfigAssetTotal", "ConfigAssetDecimals"):
+        if not isinstance(value, int):
+            raise TealError("itxn_field {} must be uint64".format(field))
+    elif field in ("Receiver", "CloseRemainderTo", "AssetReceiver", "AssetCloseTo", "Sender", "AssetSender"):
+        if not isinstance(value, bytes) or len(value) != 32:
+            raise TealError("itxn_field {} must be an address".format(field))
+    elif field not in ("Note", "Type"):
+        raise TealError("unsupported itxn_field {}".format(field))
+    e.inner[field] = value
+
+
+def op_itxn_submit(e: Evaluation) -> None:
+    if e.inner is None:
+        raise TealError("itxn_submit without itxn_begin")
+    fields, e.inner = e.inner, None
+    e.ctx.submitInner(fields)
+
+
+def op_log(e: Evaluation) -> None:
+    e.ctx.logs.append(e.popBytes())
+
+
+def immediateNone(args: List[str]) -> Tuple[Any, ...]:
+    if len(args) != 0:
+        raise ValueError("unexpected immediates")
+    return ()
+
+
+def immediateInts(count: int) -> Callable[[List[str]], Tuple[Any, ...]]:
+    def parse(args: List[str]) -> Tuple[Any, ...]:
+        if len(args) != count:
+            raise ValueError("expected {} immediates".format(count))
+        return tuple(parseInt(arg) for arg in args)
+
+    return parse
+
+
+def immediateField(args: List[str]) -> Tuple[Any, ...]:
+    if len(args) != 1:
+        raise ValueError("expected a field name")
+    return (args[0],)
+
+
+def immediateLabel(args: List[str]) -> Tuple[Any, ...]:
+    if len(args) != 1:
+        raise ValueError("expected a label")
+    return (args[0],)
+
+
+def parseTxna(args: List[str]) -> Tuple[Any, ...]:
+    if len(args) != 2:
+        raise ValueError("expected a field and an index")
+    return (args[0], int(args[1]))
+
+
+def parseGtxn(args: List[str]) -> Tuple[Any, ...]:
+    if len(args) != 2:
+        raise ValueError("expected a group index and a field")
+    return (int(args[0]), args[1])
+
+
+def parseIntConstant(args: List[str]) -> Tuple[Any, ...]:
+    if len(args) != 1:
+        raise ValueError("expected one value")
+    return (parseInt(args[0]),)
+
+
+def parseByteConstant(args: List[str]) -> Tuple[Any, ...]:
+    return (parseBytes(args),)
+
+
+def parseAddr(args: List[str]) -> Tuple[Any, ...]:
+    if len(args) != 1:
+        raise ValueError("expected an address")
+    return (encoding.decode_address(args[0]),)
+
+
+OPS: Dict[str, Tuple[Callable[..., Optional[int]], Callable[[List[str]], Tuple[Any, ...]]]] = {
+    "int": (op_int, parseIntConstant),
+    "pushint": (op_int, parseIntConstant),
+    "byte": (op_byte, parseByteConstant),
+    "pushbytes": (op_byte, parseByteConstant),
+    "addr": (op_byte, parseAddr),
+    "txn": (op_txn, immediateField),
+    "txna": (op_txna, parseTxna),
+    "txnas": (op_txnas, immediateField),
+    "gtxn": (op_gtxn, parseGtxn),
+    "gtxns": (op_gtxns, immediateField),
+    "global": (op_global, immediateField),
+    "+": (binaryInt(lambda a, b: a + b), immediateNone),
+    "-": (binaryInt(lambda a, b: a - b), immediateNone),
+    "*": (binaryInt(lambda a, b: a * b), immediateNone),
+    "/": (binaryInt(divide), immediateNone),
+    "%": (binaryInt(modulo), immediateNone),
+    "<": (binaryInt(lambda a, b: int(a < b)), immediateNone),
+    ">": (binaryInt(lambda a, b: int(a > b)), immediateNone),
+    "<=": (binaryInt(lambda a, b: int(a <= b)), immediateNone),
+    ">=": (binaryInt(lambda a, b: int(a >= b)), immediateNone),
+    "&&": (binaryInt(lambda a, b: int(a != 0 and b != 0)), immediateNone),
+    "||": (binaryInt(lambda a, b: int(a != 0 or b != 0)), immediateNone),
+    "&": (binaryInt(lambda a, b: a & b), immediateNone),
+    "|": (binaryInt(lambda a, b: a | b), immediateNone),
+    "^": (binaryInt(lambda a, b: a ^ b), immediateNone),
+    "==": (op_eq, immediateNone),
+    "!=": (op_neq, immediateNone),
+    "!": (op_not, immediateNone),
+    "~": (op_bitnot, immediateNone),
+    "len": (op_len, immediateNone),
+    "itob": (op_itob, immediateNone),
+    "btoi": (op_btoi, immediateNone),
+    "concat": (op_concat, immediateNone),
+    "substring": (op_substring, immediateInts(2)),
+    "substring3": (op_substring3, immediateNone),
+    "extract": (op_extract, immediateInts(2)),
+    "extract3": (op_extract3, immediateNone),
+    "extract_uint16": (extractUint(2), immediateNone),
+    "extract_uint32": (extractUint(4), immediateNone),
+    "extract_uint64": (extractUint(8), immediateNone),
+    "getbyte": (op_getbyte, immediateNone),
+    "sha256": (op_sha256, immediateNone),
+    "sha512_256": (op_sha512_256, immediateNone),
+    "pop": (op_pop, immediateNone),
+    "dup": (op_dup, immediateNone),
+    "dup2": (op_dup2, immediateNone),
+    "swap": (op_swap, immediateNone),
+    "select": (op_select, immediateNone),
+    "store": (op_store, immediateInts(1)),
+    "load": (op_load, immediateInts(1)),
+    "b": (op_b, immediateLabel),
+    "bz": (op_bz, immediateLabel),
+    "bnz": (op_bnz, immediateLabel),
+    "callsub": (op_callsub, immediateLabel),
+    "retsub": (op_retsub, immediateNone),
+    "return": (op_return, immediateNone),
+    "err": (op_err, immediateNone),
+    "assert": (op_assert, immediateNone),
+    "app_global_get": (op_app_global_get, immediateNone),
+    "app_global_get_ex": (op_app_global_get_ex, immediateNone),
+    "app_global_put": (op_app_global_put, immediateNone),
+    "app_global_del": (op_app_global_del, immediateNone),
+    "balance": (op_balance, immediateNone),
+    "min_balance": (op_min_balance, immediateNone),
+    "asset_holding_get": (op_asset_holding_get, immediateField),
+    "itxn_begin": (op_itxn_begin, immediateNone),
+    "itxn_field": (op_itxn_field, immediateField),
+    "itxn_submit": (op_itxn_submit, immediateNone),
+    "log": (op_log, immediateNone),
+}
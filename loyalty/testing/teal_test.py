@@ -0,0 +1,79 @@
+from typing import Dict, Union
+
+import pytest
+
+from .teal import Program, Evaluation, EvalContext, TealError
+
+
+class StaticContext(EvalContext):
+    def __init__(self) -> None:
+        self.txn = {"ApplicationArgs": [b"add", (7).to_bytes(8, "big")], "NumAppArgs": 2}
+        self.globals = {"LatestTimestamp": 1_000}
+        self.appID = 1
+        self.group = [self.txn]
+        self.logs = []
+        self.state: Dict[bytes, Union[int, bytes]] = dict()
+
+    def globalGet(self, appID, key):
+        return self.state.get(key)
+
+    def globalPut(self, key, value):
+        self.state[key] = value
+
+
+def run(source, ctx=None, budget=700):
+    return Evaluation(Program(source), ctx or StaticContext(), [budget]).run()
+
+
+def test_arithmetic():
+    assert run("#pragma version 5\nint 2\nint 3\n+\nint 5\n==")
+    assert not run("#pragma version 5\nint 2\nint 3\n*\nint 5\n==")
+
+    with pytest.raises(TealError):
+        run("#pragma version 5\nint 0\nint 1\n-")
+
+
+def test_subroutines_and_args():
+    source = """#pragma version 5
+txna ApplicationArgs 1
+btoi
+callsub double
+int 14
+==
+return
+double: // doubles the top of the stack
+int 2
+*
+retsub
+"""
+    assert run(source)
+
+
+def test_state_and_bytes():
+    ctx = StaticContext()
+    source = """#pragma version 5
+byte "count"
+byte 0x0102
+extract 1 1
+btoi
+app_global_put
+byte "count"
+app_global_get
+int 2
+==
+assert
+int 1
+"""
+    assert run(source, ctx)
+    assert ctx.state == {b"count": 2}
+
+
+def test_budget():
+    loop = "#pragma version 5\nloop:\nb loop\n"
+    with pytest.raises(TealError, match="budget"):
+        run(loop, budget=50)
+
+
+def test_unsupported_opcode():
+    with pytest.raises(TealError, match="unsupported opcode"):
+        Program("#pragma version 5\nint 1\nnot_an_op\n")
@@ -0,0 +1,437 @@
+"""An algod client with persistent connections and failover across nodes.
+
+AlgodClient opens a new HTTP connection for every request and only knows one
+node. PooledAlgodClient keeps keep-alive connections open to each of several
+nodes and spreads requests over the healthy ones in turn.
+
+Reads are retried on the next node when a node can't be reached or answers
+with a server error, and that node is left out of the rotation for a cooldown.
+A submitted transaction group is only sent to another node if it could not be
+sent at all, and the node that accepted it is remembered for every transaction
+of the group, so that their pending transaction lookups go to the node that
+has them in its pool.
+"""
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+from collections import OrderedDict
+from urllib import parse
+import http.client
+import json
+import queue
+import threading
+import time
+
+import msgpack
+from algosdk import constants, error
+from algosdk.future import transaction
+from algosdk.v2client.algod import AlgodClient, api_version_path_prefix
+
+# seconds a node that failed is left out of the rotation
+DEFAULT_COOLDOWN = 5.0
+
+# seconds to wait for a response; status_after_block waits for up to a round
+DEFAULT_TIMEOUT = 30.0
+
+# idle keep-alive connections kept open per node
+DEFAULT_MAX_IDLE = 16
+
+# seconds after which an idle connection is closed instead of reused, so that
+# it isn't used just as the node closes it
+DEFAULT_IDLE_TIMEOUT = 10.0
+
+# transaction IDs whose submitting node is remembered
+MAX_PINNED_TXIDS = 100_000
+
+# POST requests that don't change anything, and so can be sent to another node
+IDEMPOTENT_POSTS = ("/teal/compile", "/teal/dryrun")
+
+SUBMIT_PATH = "/transactions"
+
+PENDING_PREFIX = "/transactions/pending/"
+
+HEALTH_PATH = "/health"
+
+
+class AlgodNode:
+    """One algod node and its idle keep-alive connections.
+
+    Args:
+        address: The URL of the node, e.g. http://localhost:4001.
+        timeout: Seconds to wait for a connection or a response.
+        maxIdle: The most idle connections kept open.
+        idleTimeout: Seconds an idle connection may be reused for.
+    """
+
+    def __init__(
+        self,
+        address: str,
+        timeout: float = DEFAULT_TIMEOUT,
+        maxIdle: int = DEFAULT_MAX_IDLE,
+        idleTimeout: float = DEFAULT_IDLE_TIMEOUT,
+    ) -> None:
+        url = parse.urlsplit(address)
+        if url.scheme not in ("http", "https") or not url.hostname:
+            raise Exception("Invalid algod address: {}".format(address))
+
+        self.address = address
+        self.timeout = timeout
+        self.idleTimeout = idleTimeout
+        self.https = url.scheme == "https"
+        self.host = url.hostname
+        self.port = url.port
+        self.basePath = url.path.rstrip("/")
+
+        # (connection, time it became idle); the most recently used is reused first
+        self.idle: "queue.LifoQueue[Tuple[http.client.HTTPConnection, float]]" = queue.LifoQueue(
+            maxIdle
+        )
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.unhealthyUntil = 0.0
+        self.connectionsOpened = 0
+
+    def isHealthy(self, now: Optional[float] = None) -> bool:
+        return self.unhealthyUntil <= (time.monotonic() if now is None else now)
+
+    def markFailed(self, cooldown: float) -> None:
+        with self.lock:
+            self.failures += 1
+            self.unhealthyUntil = time.monotonic() + cooldown
+        self.close()
+
+    def markHealthy(self) -> None:
+        if self.unhealthyUntil == 0.0 and self.failures == 0:
+            return
+        with self.lock:
+            self.failures = 0
+            self.unhealthyUntil = 0.0
+
+    def newConnection(self) -> http.client.HTTPConnection:
+        with self.lock:
+            self.connectionsOpened += 1
+        if self.https:
+            return http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout)
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def getIdleConnection(self) -> Optional[http.client.HTTPConnection]:
+        now = time.monotonic()
+        while True:
+            try:
+                conn, idleSince = self.idle.get_nowait()
+            except queue.Empty:
+                return None
+            if now - idleSince < self.idleTimeout:
+                return conn
+            conn.close()
+
+    def releaseConnection(self, conn: http.client.HTTPConnection) -> None:
+        try:
+            self.idle.put_nowait((conn, time.monotonic()))
+        except queue.Full:
+            conn.close()
+
+    def close(self) -> None:
+        """Close the idle connections. Connections in use are closed when released."""
+        while True:
+            try:
+                conn, _ = self.idle.get_nowait()
+            except queue.Empty:
+                return
+            conn.close()
+
+    def request(
+        self,
+        method: str,
+        path: str,
+        data: Optional[bytes],
+        headers: Dict[str, str],
+        idempotent: bool,
+    ) -> Tuple[int, bytes]:
+        """Send a request and read the whole response.
+        An idempotent request that fails on a reused connection, which the node
+        may have just closed, is sent again once on a new connection.
+        Returns:
+            The status code and body of the response.
+        Raises:
+            ConnectionError: If no connection to the node could be opened, so
+                the request was not sent.
+            OSError, http.client.HTTPException: If the request may have been
+                sent, but no response was read.
+        """
+        conn = self.getIdleConnection()
+        if conn is not None:
+            try:
+                return self.send(conn, method, path, data, headers)
+            except (OSError, http.client.HTTPException):
+                if not idempotent:
+                    raise
+
+        conn = self.newConnection()
+        try:
+            conn.connect()
+        except OSError as e:
+            conn.close()
+            raise ConnectionError("Could not connect to {}: {}".format(self.address, e)) from e
+
+        return self.send(conn, method, path, data, headers)
+
+    def send(
+        self,
+        conn: http.client.HTTPConnection,
+        method: str,
+        path: str,
+        data: Optional[bytes],
+        headers: Dict[str, str],
+    ) -> Tuple[int, bytes]:
+        try:
+            conn.request(method, self.basePath + path, body=data, headers=headers)
+            resp = conn.getresponse()
+            body = resp.read()
+        except BaseException:
+            conn.close()
+            raise
+
+        if resp.will_close:
+            conn.close()
+        else:
+            self.releaseConnection(conn)
+        return resp.status, body
+
+
+class PooledAlgodClient(AlgodClient):
+    """An AlgodClient that reuses connections and fails over between nodes.
+
+    Args:
+        algod_token: The API token of the nodes.
+        algod_addresses: The URLs of one or more nodes serving the same network.
+        headers: Extra headers sent with every request.
+        timeout: Seconds to wait for a connection or a response.
+        cooldown: Seconds a failed node is left out of the rotation.
+        maxIdle: The most idle connections kept open to each node.
+        healthCheckInterval: If greater than 0, the /health endpoint of every
+            node is checked from a background thread this often, in seconds,
+            so nodes leave and rejoin the rotation without failing requests.
+    """
+
+    def __init__(
+        self,
+        algod_token: str,
+        algod_addresses: Sequence[str],
+        headers: Optional[Dict[str, str]] = None,
+        timeout: float = DEFAULT_TIMEOUT,
+        cooldown: float = DEFAULT_COOLDOWN,
+        maxIdle: int = DEFAULT_MAX_IDLE,
+        healthCheckInterval: float = 0,
+    ) -> None:
+        if len(algod_addresses) == 0:
+            raise Exception("At least one algod address is required")
+
+        super().__init__(algod_token, algod_addresses[0], headers)
+        self.nodes = [AlgodNode(address, timeout, maxIdle) for address in algod_addresses]
+        self.cooldown = cooldown
+
+        self.lock = threading.Lock()
+        self.nextNode = 0
+        # transaction ID -> the node it was submitted to
+        self.pinned: "OrderedDict[str, AlgodNode]" = OrderedDict()
+
+        self.stopHealthChecks = threading.Event()
+        self.healthChecker: Optional[threading.Thread] = None
+        if healthCheckInterval > 0:
+            self.healthChecker = threading.Thread(
+                target=self.runHealthChecks,
+                args=(healthCheckInterval,),
+                name="loyalty-algod-health",
+                daemon=True,
+            )
+            self.healthChecker.start()
+
+    def close(self) -> None:
+        """Stop the health checks and close every idle connection."""
+        self.stopHealthChecks.set()
+        if self.healthChecker is not None:
+            self.healthChecker.join()
+            self.healthChecker = None
+        for node in self.nodes:
+            node.close()
+
+    def __enter__(self) -> "PooledAlgodClient":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def checkHealth(self) -> List[bool]:
+        """Check the /health endpoint of every node, and take the nodes that
+        fail out of the rotation.
+        Returns:
+            Whether each node is healthy, in the order of the addresses.
+        """
+        results = []
+        for node in self.nodes:
+            try:
+                header = self.buildHeaders(HEALTH_PATH, None)
+                status, _ = node.request("GET", HEALTH_PATH, None, header, True)
+                healthy = status == 200
+            except (OSError, http.client.HTTPException):
+                healthy = False
+
+            if healthy:
+                node.markHealthy()
+            else:
+                node.markFailed(self.cooldown)
+            results.append(healthy)
+        return results
+
+    def runHealthChecks(self, interval: float) -> None:
+        while not self.stopHealthChecks.wait(interval):
+            self.checkHealth()
+
+    def buildHeaders(self, requrl: str, headers: Optional[Dict[str, str]]) -> Dict[str, str]:
+        header: Dict[str, str] = {}
+        if self.headers:
+            header.update(self.headers)
+        if headers:
+            header.update(headers)
+        if requrl not in constants.no_auth:
+            header[constants.algod_auth_header] = self.algod_token
+        return header
+
+    def orderNodes(self, preferred: Optional[AlgodNode]) -> List[AlgodNode]:
+        """Get the nodes to try a request on, in order: the preferred node, then
+        the healthy nodes in turn, then the unhealthy nodes as a last resort.
+        """
+        with self.lock:
+            start = self.nextNode
+            self.nextNode = (self.nextNode + 1) % len(self.nodes)
+
+        now = time.monotonic()
+        rotation = self.nodes[start:] + self.nodes[:start]
+        healthy = [node for node in rotation if node.isHealthy(now) and node is not preferred]
+        unhealthy = [node for node in rotation if not node.isHealthy(now) and node is not preferred]
+
+        ordered = [preferred] if preferred is not None else []
+        return ordered + healthy + unhealthy
+
+    def pin(self, txid: str, node: AlgodNode) -> None:
+        with self.lock:
+            self.pinned[txid] = node
+            self.pinned.move_to_end(txid)
+            while len(self.pinned) > MAX_PINNED_TXIDS:
+                self.pinned.popitem(last=False)
+
+    def getPinnedNode(self, requrl: str) -> Optional[AlgodNode]:
+        if not requrl.startswith(PENDING_PREFIX):
+            return None
+        with self.lock:
+            return self.pinned.get(requrl[len(PENDING_PREFIX) :])
+
+    def algod_request(
+        self,
+        method: str,
+        requrl: str,
+        params: Optional[Dict[str, Any]] = None,
+        data: Optional[bytes] = None,
+        headers: Optional[Dict[str, str]] = None,
+        response_format: str = "json",
+    ) -> Any:
+        header = self.buildHeaders(requrl, headers)
+
+        path = requrl
+        if requrl not in constants.unversioned_paths:
+            path = api_version_path_prefix + requrl
+        if params:
+            path = path + "?" + parse.urlencode(params)
+
+        submit = method == "POST" and requrl == SUBMIT_PATH
+        idempotent = method == "GET" or requrl in IDEMPOTENT_POSTS
+
+        # a node's answer is a better error to raise than another node being down
+        lastError: Optional[Exception] = None
+        serverError: Optional[error.AlgodHTTPError] = None
+        for node in self.orderNodes(self.getPinnedNode(requrl)):
+            try:
+                status, body = node.request(method, path, data, header, idempotent)
+            except ConnectionError as e:
+                # nothing was sent, so any request can go to the next node
+                node.markFailed(self.cooldown)
+                lastError = e
+                continue
+            except (OSError, http.client.HTTPException) as e:
+                node.markFailed(self.cooldown)
+                if not idempotent:
+                    raise
+                lastError = e
+                continue
+
+            if status >= 500:
+                node.markFailed(self.cooldown)
+                serverError = httpError(body, status)
+                if idempotent:
+                    continue
+                raise serverError
+
+            node.markHealthy()
+
+            if status >= 400:
+                raise httpError(body, status)
+
+            if response_format != "json":
+                return body
+
+            try:
+                result = json.loads(body)
+            except Exception as e:
+                raise error.AlgodResponseError("Failed to parse JSON response from algod") from e
+
+            if submit:
+                # the response only has the first ID, but any member of the group may be looked up
+                for txid in set(submittedTxIDs(data)).union([result["txId"]]):
+                    self.pin(txid, node)
+
+            return result
+
+        if serverError is not None:
+            raise serverError
+        assert lastError is not None
+        raise lastError
+
+
+def submittedTxIDs(data: Optional[bytes]) -> List[str]:
+    """Get the IDs of the signed transactions in the body of a submit request."""
+    txids: List[str] = []
+    if not data:
+        return txids
+
+    unpacker = msgpack.Unpacker(raw=False, strict_map_key=False, unicode_errors="surrogateescape")
+    unpacker.feed(data)
+    try:
+        for signedTxn in unpacker:
+            txids.append(transaction.Transaction.undictify(signedTxn["txn"]).get_txid())
+    except Exception:
+        # algod has rejected anything it couldn't decode, so this isn't expected
+        pass
+    return txids
+
+
+def httpError(body: bytes, code: int) -> error.AlgodHTTPError:
+    message = body.decode("utf-8", errors="replace")
+    try:
+        message = json.loads(message)["message"]
+    except Exception:
+        pass
+    return error.AlgodHTTPError(message, code)
+
+
+def createAlgodClient(
+    addresses: Union[str, Sequence[str]], token: str, **kwargs: Any
+) -> PooledAlgodClient:
+    """Create a pooled algod client for one or more nodes.
+    Args:
+        addresses: The URL of a node, a comma separated list of them, or a list
+            of them. The nodes must serve the same network.
+        token: The API token of the nodes.
+        kwargs: Passed on to PooledAlgodClient.
+    """
+    if isinstance(addresses, str):
+        addresses = [address.strip() for address in addresses.split(",") if address.strip()]
+    return PooledAlgodClient(token, list(addresses), **kwargs)
@@ -0,0 +1,230 @@
+from typing import Any, Dict, List, Optional
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib import parse
+import json
+import socket
+import threading
+
+import pytest
+from algosdk import account
+from algosdk.error import AlgodHTTPError
+from algosdk.future import transaction
+
+from .transport import PooledAlgodClient, createAlgodClient
+from .testing.fake import FakeNetwork
+from .util import waitForTransaction
+
+
+class FakeAlgodServer:
+    """Serves the algod REST API of a FakeNetwork over HTTP on localhost."""
+
+    def __init__(self, network: FakeNetwork, failWith: Optional[int] = None) -> None:
+        self.requests: List[str] = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def serve(self) -> None:
+                length = int(self.headers.get("Content-Length", 0))
+                data = self.rfile.read(length) if length > 0 else None
+
+                url = parse.urlsplit(self.path)
+                path = url.path[len("/v2") :] if url.path.startswith("/v2/") else url.path
+                params: Dict[str, Any] = dict(parse.parse_qsl(url.query))
+                server.requests.append("{} {}".format(self.command, path))
+
+                if failWith is not None:
+                    self.reply(failWith, {"message": "failing on purpose"})
+                    return
+
+                responseFormat = "msgpack" if params.get("format") == "msgpack" else "json"
+                try:
+                    result = network.handleAlgodRequest(
+                        self.command, path, params, data, responseFormat
+                    )
+                except AlgodHTTPError as e:
+                    self.reply(e.code or 500, {"message": str(e)})
+                    return
+
+                if responseFormat == "msgpack":
+                    self.reply(200, result, raw=True)
+                else:
+                    self.reply(200, result)
+
+            def reply(self, code: int, result: Any, raw: bool = False) -> None:
+                body = result if raw else json.dumps(result).encode()
+                self.send_response(code)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = serve
+            do_POST = serve
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.address = "http://127.0.0.1:{}".format(self.httpd.server_address[1])
+        threading.Thread(
+            target=self.httpd.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+        ).start()
+
+    def shutdown(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def getDeadAddress() -> str:
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return "http://127.0.0.1:{}".format(port)
+
+
+@pytest.fixture
+def network():
+    return FakeNetwork(genesisAccounts=1)
+
+
+@pytest.fixture
+def servers(network):
+    started: List[FakeAlgodServer] = []
+
+    def start(failWith: Optional[int] = None) -> FakeAlgodServer:
+        server = FakeAlgodServer(network, failWith)
+        started.append(server)
+        return server
+
+    yield start
+
+    for server in started:
+        server.shutdown()
+
+
+def sendPayment(client: PooledAlgodClient, network: FakeNetwork) -> str:
+    sender = account.address_from_private_key(network.wallet[0])
+    txn = transaction.PaymentTxn(
+        sender, client.suggested_params(), account.generate_account()[1], 100_000
+    )
+    return client.send_transaction(txn.sign(network.wallet[0]))
+
+
+def test_reuses_connections(servers):
+    server = servers()
+    with createAlgodClient(server.address, "") as client:
+        for _ in range(5):
+            client.status()
+        client.suggested_params()
+
+        assert client.nodes[0].connectionsOpened == 1
+    assert len(server.requests) == 6
+
+
+def test_fails_over_unreachable_node(servers):
+    server = servers()
+    dead = getDeadAddress()
+    with createAlgodClient([dead, server.address], "") as client:
+        for _ in range(4):
+            client.status()
+
+        assert not client.nodes[0].isHealthy()
+        assert client.nodes[1].isHealthy()
+        assert client.checkHealth() == [False, True]
+    assert len(server.requests) == 5
+
+
+def test_fails_over_server_errors(servers):
+    failing = servers(failWith=503)
+    server = servers()
+    with createAlgodClient([failing.address, server.address], "") as client:
+        client.status()
+        client.status()
+
+        assert not client.nodes[0].isHealthy()
+    assert failing.requests == ["GET /status"]
+
+
+def test_raises_when_every_node_fails(servers):
+    failing = servers(failWith=500)
+    with createAlgodClient([failing.address, getDeadAddress()], "") as client:
+        with pytest.raises(AlgodHTTPError) as e:
+            client.status()
+        assert e.value.code == 500
+
+
+def test_client_errors_are_not_retried(servers):
+    first = servers()
+    second = servers()
+    with createAlgodClient([first.address, second.address], "") as client:
+        with pytest.raises(AlgodHTTPError) as e:
+            client.application_info(123456789)
+        assert e.value.code == 404
+        assert all(node.isHealthy() for node in client.nodes)
+    assert len(first.requests) + len(second.requests) == 1
+
+
+def test_submit_is_not_resent(network, servers):
+    failing = servers(failWith=503)
+    server = servers()
+    with createAlgodClient([failing.address, server.address], "") as client:
+        # the failing node answers first, after suggested_params went to the other
+        client.nextNode = 1
+        params = client.suggested_params()
+        assert client.nextNode == 0
+
+        sender = account.address_from_private_key(network.wallet[0])
+        txn = transaction.PaymentTxn(sender, params, account.generate_account()[1], 100_000)
+        with pytest.raises(AlgodHTTPError) as e:
+            client.send_transaction(txn.sign(network.wallet[0]))
+        assert e.value.code == 503
+    assert "POST /transactions" not in server.requests
+
+
+def test_pending_lookups_go_to_submitting_node(network, servers):
+    first = servers()
+    second = servers()
+    with createAlgodClient([first.address, second.address], "") as client:
+        txid = sendPayment(client, network)
+        submitter = first if "POST /transactions" in first.requests else second
+        assert client.pinned[txid] is client.nodes[[first, second].index(submitter)]
+
+        for _ in range(3):
+            client.pending_transaction_info(txid)
+        waitForTransaction(client, txid)
+
+    pendingPath = "GET /transactions/pending/" + txid
+    other = second if submitter is first else first
+    assert submitter.requests.count(pendingPath) >= 3
+    assert other.requests.count(pendingPath) == 0
+
+
+def test_group_members_go_to_submitting_node(network, servers):
+    first = servers()
+    second = servers()
+    with createAlgodClient([first.address, second.address], "") as client:
+        sender = account.address_from_private_key(network.wallet[0])
+        params = client.suggested_params()
+        txns = [
+            transaction.PaymentTxn(sender, params, account.generate_account()[1], 100_000 + i)
+            for i in range(2)
+        ]
+        transaction.assign_group_id(txns)
+        client.send_transactions([txn.sign(network.wallet[0]) for txn in txns])
+        last = txns[1].get_txid()
+
+        submitter = first if "POST /transactions" in first.requests else second
+        for txn in txns:
+            assert client.pinned[txn.get_txid()] is client.nodes[[first, second].index(submitter)]
+
+        for _ in range(3):
+            client.pending_transaction_info(last)
+        waitForTransaction(client, last)
+
+    pendingPath = "GET /transactions/pending/" + last
+    other = second if submitter is first else first
+    assert submitter.requests.count(pendingPath) >= 3
+    assert other.requests.count(pendingPath) == 0
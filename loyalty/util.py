@@ -1,12 +1,31 @@
-from typing import List, Tuple, Dict, Any, Optional, Union
-from base64 import b64decode
+from typing import List, Tuple, Dict, Any, Optional, Set, Union, Sequence, Callable, TYPE_CHECKING
+from base64 import b64decode, b64encode
+from concurrent.futures import Future
+import threading
+import weakref
 
+import msgpack
 from algosdk.v2client.algod import AlgodClient
+from algosdk.error import AlgodHTTPError
+from algosdk.future import transaction
 from algosdk import encoding
 
-from pyteal import compileTeal, Mode, Expr
-
+from . import metrics
 from .account import Account
+from .holdings import HoldingsCache, decodeBalances
+from .programcache import ProgramCache
+
+if TYPE_CHECKING:
+    from pyteal import Expr
+
+TEAL_VERSION = 5
+
+# the most rounds the confirmation tracker reads the blocks of after one wait;
+# if more have passed, it asks algod about each transaction instead
+MAX_SCANNED_ROUNDS = 8
+
+# transaction fields that hold an address, which algod returns in base32
+ADDRESS_FIELDS = {"snd", "rcv", "close", "asnd", "arcv", "aclose", "fadd", "rekey", "sgnr"}
 
 
 class PendingTxnResponse:
@@ -28,35 +47,331 @@ class PendingTxnResponse:
         self.logs: List[bytes] = [b64decode(l) for l in response.get("logs", [])]
 
 
+class ConfirmationTracker:
+    """Waits for many pending transactions by following rounds once.
+
+    A background thread waits for the next block with a single
+    status_after_block call and reads that block once to find every tracked
+    transaction it confirmed. Each transaction is only looked up with
+    pending_transaction_info when it starts being tracked, in case it is
+    already confirmed or was rejected, and when its timeout is reached. Each
+    tracked transaction gets a Future that resolves to its PendingTxnResponse,
+    or fails on a pool error or when its timeout in rounds has passed. The
+    thread exits when there is nothing left to track and is restarted on demand.
+    """
+
+    def __init__(self, client: AlgodClient) -> None:
+        self.client = client
+        # the last round whose block was read, while the thread is running
+        self.lastRound: Optional[int] = None
+        # txID -> list of [future, timeout, deadline round]
+        self.waiters: Dict[str, List[List[Any]]] = dict()
+        # tracked transactions that were not looked up yet
+        self.unchecked: Set[str] = set()
+        self.lock = threading.Lock()
+        self.thread: Optional[threading.Thread] = None
+        self.roundListeners: List["weakref.WeakMethod[Callable[[int], None]]"] = []
+
+    def addRoundListener(self, listener: Callable[[int], None]) -> None:
+        """Call a bound method with each new round seen by the tracker.
+        Only a weak reference to the method is kept.
+        """
+        with self.lock:
+            self.roundListeners.append(weakref.WeakMethod(listener))  # type: ignore
+
+    def notifyRound(self, round: int) -> None:
+        with self.lock:
+            listeners = [ref() for ref in self.roundListeners]
+            self.roundListeners = [
+                ref for ref, listener in zip(self.roundListeners, listeners) if listener is not None
+            ]
+
+        for listener in listeners:
+            if listener is not None:
+                listener(round)
+
+    def track(self, txID: str, timeout: int = 10) -> "Future[PendingTxnResponse]":
+        """Start waiting for a transaction.
+        Args:
+            txID: The ID of the transaction to wait for.
+            timeout: The number of rounds to wait before failing.
+        Returns:
+            A Future for the PendingTxnResponse of the confirmed transaction.
+        """
+        future: "Future[PendingTxnResponse]" = Future()
+
+        with self.lock:
+            deadline = self.lastRound + timeout if self.lastRound is not None else None
+            self.waiters.setdefault(txID, []).append([future, timeout, deadline])
+            self.unchecked.add(txID)
+
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self.run, name="loyalty-confirmation-tracker", daemon=True
+                )
+                self.thread.start()
+
+        return future
+
+    def run(self) -> None:
+        while True:
+            with self.lock:
+                if len(self.waiters) == 0:
+                    self.thread = None
+                    # rounds pass while idle, so the next waiter starts from a fresh status
+                    self.lastRound = None
+                    return
+
+            try:
+                self.step()
+            except Exception as e:
+                with self.lock:
+                    waiters, self.waiters = self.waiters, dict()
+                    self.unchecked.clear()
+                    self.lastRound = None
+                for entries in waiters.values():
+                    for entry in entries:
+                        entry[0].set_exception(e)
+
+    def step(self) -> None:
+        """Look up new and timed out transactions, then wait for the next block
+        and resolve the transactions it confirmed.
+        """
+        if self.lastRound is None:
+            lastRound = self.client.status()["last-round"]
+            with self.lock:
+                self.lastRound = lastRound
+            self.notifyRound(lastRound)
+
+        with self.lock:
+            lastRound = self.lastRound
+            unchecked, self.unchecked = self.unchecked, set()
+            for entries in self.waiters.values():
+                for entry in entries:
+                    if entry[2] is None:
+                        entry[2] = lastRound + entry[1]
+            timedOut = [
+                txID
+                for txID, entries in self.waiters.items()
+                if any(lastRound >= entry[2] for entry in entries)
+            ]
+
+        for txID in sorted(unchecked.union(timedOut)):
+            self.check(txID, lastRound)
+
+        with self.lock:
+            if len(self.waiters) == 0:
+                return
+
+        lastStatus = self.client.status_after_block(lastRound)
+        newRound = max(lastRound + 1, lastStatus["last-round"])
+
+        if newRound - lastRound > MAX_SCANNED_ROUNDS:
+            with self.lock:
+                self.unchecked.update(self.waiters.keys())
+        else:
+            for round in range(lastRound + 1, newRound + 1):
+                try:
+                    block = decodeBlock(self.client.block_info(round, response_format="msgpack"))
+                except AlgodHTTPError as e:
+                    if e.code != 404:
+                        raise
+                    # the node doesn't serve the block, so look the transactions up instead
+                    with self.lock:
+                        self.unchecked.update(self.waiters.keys())
+                    break
+                self.resolveBlock(block, round)
+
+        with self.lock:
+            self.lastRound = newRound
+        self.notifyRound(newRound)
+
+    def check(self, txID: str, lastRound: int) -> None:
+        """Look up a transaction, and fail its waiters whose timeout has passed
+        if it is neither confirmed nor rejected.
+        """
+        try:
+            pending_txn = self.client.pending_transaction_info(txID)
+        except Exception as e:
+            with self.lock:
+                entries = self.waiters.pop(txID, [])
+            for entry in entries:
+                entry[0].set_exception(e)
+            return
+
+        with self.lock:
+            entries = self.waiters.get(txID, [])
+
+            if pending_txn.get("confirmed-round", 0) > 0:
+                del self.waiters[txID]
+                response = PendingTxnResponse(pending_txn)
+                for entry in entries:
+                    notifyConfirmation(entry, lastRound, pending_txn["confirmed-round"])
+                    entry[0].set_result(response)
+                return
+
+            if pending_txn["pool-error"]:
+                del self.waiters[txID]
+                metrics.notify("poolError", pending_txn["pool-error"])
+                for entry in entries:
+                    entry[0].set_exception(
+                        Exception("Pool error: {}".format(pending_txn["pool-error"]))
+                    )
+                return
+
+            remaining = []
+            for entry in entries:
+                if lastRound >= entry[2]:
+                    entry[0].set_exception(
+                        Exception(
+                            "Transaction {} not confirmed after {} rounds".format(txID, entry[1])
+                        )
+                    )
+                else:
+                    remaining.append(entry)
+
+            if len(remaining) > 0:
+                self.waiters[txID] = remaining
+            else:
+                del self.waiters[txID]
+
+    def resolveBlock(self, block: Dict[str, Any], round: int) -> None:
+        """Resolve the waiters of every tracked transaction confirmed in a block."""
+        for entry in block.get("txns", []):
+            txID = getBlockTxID(entry, block)
+            with self.lock:
+                entries = self.waiters.pop(txID, None) if txID is not None else None
+                if entries is None:
+                    continue
+                self.unchecked.discard(txID)
+            response = PendingTxnResponse(blockTxnInfo(entry, block, round))
+            for waiter in entries:
+                notifyConfirmation(waiter, round, round)
+                waiter[0].set_result(response)
+
+
+def notifyConfirmation(entry: List[Any], lastRound: int, confirmedRound: int) -> None:
+    """Report the rounds a tracker entry of [future, timeout, deadline round] took to confirm."""
+    if len(metrics.hooks) == 0:
+        return
+    trackedRound = entry[2] - entry[1] if entry[2] is not None else lastRound
+    metrics.notify("confirmation", max(confirmedRound - trackedRound, 0))
+
+
+trackers: "weakref.WeakKeyDictionary[AlgodClient, ConfirmationTracker]" = (
+    weakref.WeakKeyDictionary()
+)
+trackersLock = threading.Lock()
+
+
+def getConfirmationTracker(client: AlgodClient) -> ConfirmationTracker:
+    """Get the confirmation tracker shared by all waiters on a client."""
+    with trackersLock:
+        tracker = trackers.get(client)
+        if tracker is None:
+            tracker = ConfirmationTracker(weakref.proxy(client))
+            trackers[client] = tracker
+        return tracker
+
+
 def waitForTransaction(
     client: AlgodClient, txID: str, timeout: int = 10
 ) -> PendingTxnResponse:
-    lastStatus = client.status()
-    lastRound = lastStatus["last-round"]
-    startRound = lastRound
-
-    while lastRound < startRound + timeout:
-        pending_txn = client.pending_transaction_info(txID)
-
-        if pending_txn.get("confirmed-round", 0) > 0:
-            return PendingTxnResponse(pending_txn)
+    return getConfirmationTracker(client).track(txID, timeout).result()
+
+
+def waitForTransactions(
+    client: AlgodClient, txIDs: Sequence[str], timeout: int = 10
+) -> List[PendingTxnResponse]:
+    tracker = getConfirmationTracker(client)
+    futures = [tracker.track(txID, timeout) for txID in txIDs]
+    return [future.result() for future in futures]
+
+
+def getGroupResponses(
+    client: AlgodClient,
+    tracked: PendingTxnResponse,
+    txIDs: Sequence[str],
+    trackIndex: int = 0,
+) -> List[PendingTxnResponse]:
+    """Get the responses of every transaction of a confirmed group.
+    The response of the tracked transaction is known already; the others are
+    read from the block the group was confirmed in, with one block_info call.
+    Any that aren't found there are looked up with pending_transaction_info.
+    Args:
+        client: An algod client.
+        tracked: The response of the tracked transaction.
+        txIDs: The IDs of the transactions of the group.
+        trackIndex: The index of the tracked transaction in txIDs.
+    Returns:
+        One response per transaction, in the same order as txIDs.
+    """
+    responses: Dict[str, PendingTxnResponse] = {txIDs[trackIndex]: tracked}
+    wanted = set(txIDs) - set(responses)
+
+    if len(wanted) > 0 and tracked.confirmedRound:
+        try:
+            raw = client.block_info(tracked.confirmedRound, response_format="msgpack")
+        except AlgodHTTPError:
+            # e.g. a node that is behind; the transactions are looked up instead
+            raw = None
+
+        block = decodeBlock(raw) if raw is not None else {}
+        for entry in block.get("txns", []):
+            txID = getBlockTxID(entry, block)
+            if txID in wanted:
+                wanted.discard(txID)
+                responses[txID] = PendingTxnResponse(
+                    blockTxnInfo(entry, block, tracked.confirmedRound)
+                )
+                if len(wanted) == 0:
+                    break
+
+    for txID in txIDs:
+        if txID not in responses:
+            responses[txID] = PendingTxnResponse(client.pending_transaction_info(txID))
+
+    return [responses[txID] for txID in txIDs]
+
+
+def fullyCompileContract(
+    client: Optional[AlgodClient],
+    contract: "Expr",
+    cache: Optional[ProgramCache] = None,
+    offline: bool = False,
+) -> bytes:
+    return compileProgram(client, contractTeal(contract), cache, offline)
+
+
+def contractTeal(contract: "Expr") -> str:
+    # PyTeal is slow to import and only needed to generate TEAL, which is
+    # normally loaded from loyalty.artifacts instead
+    from pyteal import compileTeal, Mode
+
+    return compileTeal(contract, mode=Mode.Application, version=TEAL_VERSION)
+
+
+def compileProgram(
+    client: Optional[AlgodClient],
+    teal: str,
+    cache: Optional[ProgramCache] = None,
+    offline: bool = False,
+) -> bytes:
+    if cache is not None:
+        program = cache.get(teal, TEAL_VERSION)
+        if program is not None:
+            return program
+
+    if offline or client is None:
+        raise Exception("Compiled program not found in cache and offline mode is enabled")
 
-        if pending_txn["pool-error"]:
-            raise Exception("Pool error: {}".format(pending_txn["pool-error"]))
-
-        lastStatus = client.status_after_block(lastRound + 1)
-
-        lastRound += 1
-
-    raise Exception(
-        "Transaction {} not confirmed after {} rounds".format(txID, timeout)
-    )
+    response = client.compile(teal)
+    program = b64decode(response["result"])
 
+    if cache is not None:
+        cache.put(teal, TEAL_VERSION, program)
 
-def fullyCompileContract(client: AlgodClient, contract: Expr) -> bytes:
-    teal = compileTeal(contract, mode=Mode.Application, version=5)
-    response = client.compile(teal)
-    return b64decode(response["result"])
+    return program
 
 
 def decodeState(stateArray: List[Any]) -> Dict[bytes, Union[int, bytes]]:
@@ -82,6 +397,198 @@ def decodeState(stateArray: List[Any]) -> Dict[bytes, Union[int, bytes]]:
     return state
 
 
+def decodeStateValue(stateArray: List[Any], encodedKey: str) -> Union[int, bytes]:
+    """Decode the value of a single key of a global state array.
+    Args:
+        stateArray: The global state array of an application_info response.
+        encodedKey: The key to look up, base64 encoded like the keys of the array.
+    Returns:
+        The decoded value. Raises KeyError if the key is not set.
+    """
+    for pair in stateArray:
+        if pair["key"] != encodedKey:
+            continue
+
+        value = pair["value"]
+        valueType = value["type"]
+
+        if valueType == 2:
+            return value.get("uint", 0)
+        if valueType == 1:
+            return b64decode(value.get("bytes", ""))
+        raise Exception(f"Unexpected state type: {valueType}")
+
+    raise KeyError(b64decode(encodedKey))
+
+
+def decodeStateDelta(
+    deltaArray: Optional[List[Any]],
+) -> Dict[bytes, Optional[Union[int, bytes]]]:
+    delta: Dict[bytes, Optional[Union[int, bytes]]] = dict()
+
+    for pair in deltaArray or []:
+        key = b64decode(pair["key"])
+
+        value = pair["value"]
+        action = value["action"]
+
+        if action == 1:
+            # set byte array
+            delta[key] = b64decode(value.get("bytes", ""))
+        elif action == 2:
+            # set uint64
+            delta[key] = value.get("uint", 0)
+        elif action == 3:
+            # delete
+            delta[key] = None
+        else:
+            raise Exception(f"Unexpected state delta action: {action}")
+
+    return delta
+
+
+def decodeBlock(raw: bytes) -> Dict[str, Any]:
+    """Decode a msgpack block_info response into its "block" field."""
+    # map keys and TEAL byte values are msgpack strings that may not be valid UTF-8
+    return msgpack.unpackb(
+        raw, raw=False, strict_map_key=False, unicode_errors="surrogateescape"
+    )["block"]
+
+
+def getBlockTxID(entry: Dict[str, Any], block: Dict[str, Any]) -> Optional[str]:
+    """Get the ID of a transaction in a block. Blocks leave out the genesis hash
+    of their transactions, and the genesis ID when hgi is set, so they are put
+    back before hashing.
+    """
+    txn = dict(entry["txn"])
+    txn.setdefault("gh", block.get("gh"))
+    if entry.get("hgi", False):
+        txn.setdefault("gen", block.get("gen"))
+    try:
+        return transaction.Transaction.undictify(txn).get_txid()
+    except Exception:
+        return None
+
+
+def blockTxnInfo(
+    entry: Dict[str, Any], block: Dict[str, Any], confirmedRound: Optional[int]
+) -> Dict[str, Any]:
+    """Build the pending_transaction_info response of a transaction from its
+    entry in a decoded block, so that it doesn't have to be looked up.
+    """
+    applyData = entry.get("dt", {})
+    stxn = {key: value for key, value in entry.items() if key in ("sig", "msig", "lsig", "sgnr")}
+    txn = dict(entry["txn"])
+    if confirmedRound is not None:
+        # inner transactions have no genesis fields
+        txn.setdefault("gh", block.get("gh"))
+        if entry.get("hgi", False):
+            txn.setdefault("gen", block.get("gen"))
+    stxn["txn"] = txn
+
+    info: Dict[str, Any] = {"pool-error": "", "txn": jsonifyBlockValue(stxn)}
+    if confirmedRound is not None:
+        info["confirmed-round"] = confirmedRound
+    for key, name in (
+        ("apid", "application-index"),
+        ("caid", "asset-index"),
+        ("ca", "closing-amount"),
+        ("aca", "asset-closing-amount"),
+        ("rc", "close-rewards"),
+        ("rs", "sender-rewards"),
+        ("rr", "receiver-rewards"),
+    ):
+        if key in entry:
+            info[name] = entry[key]
+
+    globalDelta = [
+        {"key": base64(rawBytes(key)), "value": encodeDeltaValue(value)}
+        for key, value in applyData.get("gd", {}).items()
+    ]
+    if len(globalDelta) > 0:
+        info["global-state-delta"] = globalDelta
+
+    localDelta = []
+    for index, delta in applyData.get("ld", {}).items():
+        accounts = [txn["snd"]] + list(txn.get("apat", []))
+        localDelta.append(
+            {
+                "address": encoding.encode_address(accounts[int(index)]),
+                "delta": [
+                    {"key": base64(rawBytes(key)), "value": encodeDeltaValue(value)}
+                    for key, value in delta.items()
+                ],
+            }
+        )
+    if len(localDelta) > 0:
+        info["local-state-delta"] = localDelta
+
+    if len(applyData.get("lg", [])) > 0:
+        info["logs"] = [base64(rawBytes(log)) for log in applyData["lg"]]
+    if len(applyData.get("itx", [])) > 0:
+        info["inner-txns"] = [blockTxnInfo(inner, block, None) for inner in applyData["itx"]]
+
+    return info
+
+
+def encodeDeltaValue(value: Dict[str, Any]) -> Dict[str, Any]:
+    encoded: Dict[str, Any] = {"action": value.get("at", 0)}
+    if "bs" in value:
+        encoded["bytes"] = base64(rawBytes(value["bs"]))
+    if "ui" in value:
+        encoded["uint"] = value["ui"]
+    return encoded
+
+
+def jsonifyBlockValue(value: Any, key: Optional[str] = None) -> Any:
+    """Convert a msgpack structure to the JSON form algod returns."""
+    if isinstance(value, dict):
+        return {str(k): jsonifyBlockValue(v, str(k)) for k, v in value.items()}
+    if isinstance(value, list):
+        return [jsonifyBlockValue(v, key) for v in value]
+    if isinstance(value, bytes):
+        if key in ADDRESS_FIELDS or (key == "apat" and len(value) == 32):
+            return encoding.encode_address(value)
+        return base64(value)
+    return value
+
+
+def base64(value: bytes) -> str:
+    return b64encode(value).decode()
+
+
+def decodeBlockStateDelta(
+    stateDelta: Optional[Dict[Any, Dict[str, Any]]],
+) -> Dict[bytes, Optional[Union[int, bytes]]]:
+    """Decode a global state delta as it appears in a msgpack block, where it
+    is a map from key to {"at": action, "bs": bytes, "ui": uint}.
+    Keys and byte values may be decoded as str by msgpack; they are turned back
+    into the original bytes.
+    """
+    delta: Dict[bytes, Optional[Union[int, bytes]]] = dict()
+
+    for key, value in (stateDelta or {}).items():
+        key = rawBytes(key)
+        action = value.get("at", 0)
+
+        if action == 1:
+            delta[key] = rawBytes(value.get("bs", b""))
+        elif action == 2:
+            delta[key] = value.get("ui", 0)
+        elif action == 3:
+            delta[key] = None
+        else:
+            raise Exception(f"Unexpected state delta action: {action}")
+
+    return delta
+
+
+def rawBytes(value: Union[str, bytes]) -> bytes:
+    if isinstance(value, str):
+        return value.encode("utf-8", errors="surrogateescape")
+    return value
+
+
 def getAppGlobalState(
     client: AlgodClient, appID: int
 ) -> Dict[bytes, Union[int, bytes]]:
@@ -89,27 +596,25 @@ def getAppGlobalState(
     return decodeState(appInfo["params"]["global-state"])
 
 
-def getBalances(client: AlgodClient, account: str) -> Dict[int, int]:
-    balances: Dict[int, int] = dict()
-
-    accountInfo = client.account_info(account)
-
-    # set key 0 to Algo balance
-    balances[0] = accountInfo["amount"]
-
-    assets: List[Dict[str, Any]] = accountInfo.get("assets", [])
-    for assetHolding in assets:
-        assetID = assetHolding["asset-id"]
-        amount = assetHolding["amount"]
-        balances[assetID] = amount
-
-    return balances
+def getBalances(
+    client: AlgodClient, account: str, holdings: Optional[HoldingsCache] = None
+) -> Dict[int, int]:
+    """Get the balances of an account, keyed by asset ID, with 0 for Algo.
+    Args:
+        client: An algod client.
+        account: The address of the account.
+        holdings: An optional holdings cache to serve the balances from. By
+            default they are read from algod.
+    """
+    if holdings is not None:
+        return holdings.getBalances(account)
+    return decodeBalances(client.account_info(account))
 
 
 def getLastBlockTimestamp(client: AlgodClient) -> Tuple[int, int]:
-    status = client.status()
-    lastRound = status["last-round"]
-    block = client.block_info(lastRound)
-    timestamp = block["block"]["ts"]
+    """Get the latest round and its timestamp from the client's timestamp oracle.
+    Only the block header of a round that isn't cached yet is read.
+    """
+    from .clock import getTimestampOracle
 
-    return block, timestamp
\ No newline at end of file
+    return getTimestampOracle(client).latest()
\ No newline at end of file
@@ -0,0 +1,139 @@
+from base64 import b64encode
+
+import msgpack
+import pytest
+from algosdk import account
+from algosdk.error import AlgodHTTPError
+from algosdk.future import transaction
+
+from .util import ConfirmationTracker, blockTxnInfo, waitForTransactions
+
+
+class RoundCounter:
+    """A minimal algod stand-in that confirms each transaction at a fixed round.
+    It serves no blocks, so the tracker looks every transaction up each round.
+    """
+
+    def __init__(self, confirmations) -> None:
+        self.round = 1
+        self.confirmations = confirmations
+        self.statusCalls = 0
+
+    def status(self):
+        self.statusCalls += 1
+        return {"last-round": self.round}
+
+    def status_after_block(self, block_num):
+        self.statusCalls += 1
+        self.round = block_num + 1
+        return {"last-round": self.round}
+
+    def block_info(self, block, response_format="json"):
+        raise AlgodHTTPError("failed to retrieve information from the ledger", 404)
+
+    def pending_transaction_info(self, txID):
+        confirmedRound = self.confirmations.get(txID)
+        if confirmedRound is None:
+            return {"pool-error": "transaction rejected", "txn": {}}
+        if confirmedRound <= self.round:
+            return {"pool-error": "", "txn": {}, "confirmed-round": confirmedRound}
+        return {"pool-error": "", "txn": {}}
+
+
+def test_tracker_shares_rounds():
+    client = RoundCounter({"tx{}".format(i): 2 + i % 3 for i in range(30)})
+    tracker = ConfirmationTracker(client)
+
+    futures = [tracker.track("tx{}".format(i)) for i in range(30)]
+    responses = [future.result(timeout=5) for future in futures]
+
+    assert [r.confirmedRound for r in responses] == [2 + i % 3 for i in range(30)]
+    # one status call to start, then one per round instead of one per transaction
+    assert client.statusCalls <= 4
+
+
+def test_tracker_errors():
+    client = RoundCounter({"late": 100})
+    tracker = ConfirmationTracker(client)
+
+    rejected = tracker.track("rejected")
+    late = tracker.track("late", timeout=3)
+
+    with pytest.raises(Exception, match="Pool error"):
+        rejected.result(timeout=5)
+
+    with pytest.raises(Exception, match="not confirmed after 3 rounds"):
+        late.result(timeout=5)
+
+
+def test_waitForTransactions():
+    client = RoundCounter({"a": 3, "b": 2})
+
+    responses = waitForTransactions(client, ["a", "b"])
+
+    assert [r.confirmedRound for r in responses] == [3, 2]
+
+
+def test_tracker_restarts_from_fresh_round():
+    client = RoundCounter({"a": 3})
+    tracker = ConfirmationTracker(client)
+
+    future = tracker.track("a")
+    thread = tracker.thread
+    assert future.result(timeout=5).confirmedRound == 3
+    thread.join(timeout=5)
+
+    # rounds pass while nothing is tracked
+    client.round += 15
+    client.confirmations["b"] = client.round + 5
+
+    assert tracker.track("b").result(timeout=5).confirmedRound == client.confirmations["b"]
+
+
+class BlockServer(RoundCounter):
+    """An algod stand-in that puts each transaction in the block of its round."""
+
+    def __init__(self, signedTxns) -> None:
+        super().__init__({stxn.get_txid(): 2 + i % 3 for i, stxn in enumerate(signedTxns)})
+        self.signedTxns = signedTxns
+        self.pendingCalls = 0
+        self.blockCalls = 0
+
+    def block_info(self, block, response_format="json"):
+        self.blockCalls += 1
+        txns = [
+            stxn.dictify()
+            for stxn in self.signedTxns
+            if self.confirmations[stxn.get_txid()] == block
+        ]
+        return msgpack.packb({"block": {"rnd": block, "txns": txns}}, use_bin_type=True)
+
+    def pending_transaction_info(self, txID):
+        self.pendingCalls += 1
+        info = super().pending_transaction_info(txID)
+        stxn = next(stxn for stxn in self.signedTxns if stxn.get_txid() == txID)
+        return dict(info, txn=blockTxnInfo(stxn.dictify(), {}, None)["txn"])
+
+
+def test_tracker_reads_blocks():
+    sender, address = account.generate_account()[1], account.generate_account()[1]
+    params = transaction.SuggestedParams(
+        fee=1000, first=1, last=100, gh=b64encode(bytes(32)).decode(), flat_fee=True
+    )
+    signedTxns = [
+        transaction.PaymentTxn(address, params, sender, i).sign(account.generate_account()[0])
+        for i in range(20)
+    ]
+    client = BlockServer(signedTxns)
+    tracker = ConfirmationTracker(client)
+
+    responses = [
+        future.result(timeout=5) for future in [tracker.track(s.get_txid()) for s in signedTxns]
+    ]
+
+    assert [r.confirmedRound for r in responses] == [2 + i % 3 for i in range(20)]
+    assert [r.txn["txn"]["amt"] for r in responses[1:]] == list(range(1, 20))
+    assert responses[0].txn["txn"]["snd"] == address
+    # each transaction is looked up at most once, when it is tracked, then found in the blocks
+    assert client.pendingCalls <= 20
+    assert client.blockCalls == 3